@@ -0,0 +1,481 @@
+"""
+Offline end-to-end benchmarks of the compiled workflow graph.
+
+Each scenario replays recorded requirement-breakdown and design responses
+(benchmarks/recordings/<scenario>.json) through FakeLLM, which also generates the
+code for exactly the components of every codegen batch, and deploys to a
+SimulatedTransport. No network, OpenAI key or Salesforce org is needed.
+
+Every scenario/mode pair runs in a fresh interpreter so peak RSS is its own:
+per-node and end-to-end latency over `--iterations` runs (after one warm-up run),
+peak RSS of the process, and the peak/retained Python allocations of one extra run
+under tracemalloc. Results are written as JSON and compared with baselines.json;
+a metric regresses when it exceeds its baseline by more than the relative threshold
+and by more than the absolute minimum delta (so sub-millisecond noise is ignored).
+
+The `mixed` scenario measures the run scheduler (src.jobs.scheduler) under load: a
+few large runs (the medium recording) and, just after them, several small runs (the
+small recording) share one process and an LLM endpoint that serves
+MIXED_LLM_CAPACITY calls at a time. Its latencies are those of the small runs, with
+the scheduler on (mode `scheduler_on`) and off (`scheduler_off`).
+
+Wall-clock times depend on the machine, so every run also times a fixed pure-Python
+workload (`reference_seconds`) and latencies are compared as multiples of it: a
+slower machine or a busy CI runner scales both. A baseline case may carry its own
+`tolerance` per metric kind; --update-baseline records one from the spread of its
+runs, so noisy cases are not held to the default threshold.
+
+    python -m benchmarks.run                                  # everything, check against baselines
+    python -m benchmarks.run --scenario large --mode pipelined --output results.json
+    python -m benchmarks.run --time-threshold 0.5 --memory-threshold 0.2
+    python -m benchmarks.run --scenario mixed                 # small-run latency, scheduler on and off
+    python -m benchmarks.run --update-baseline                # record this machine's numbers
+
+Exits with 1 when a metric regressed.
+"""
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import platform
+import resource
+import statistics
+import subprocess
+import tempfile
+import threading
+import tracemalloc
+from typing import Any, Dict, List, Optional
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+RECORDINGS_DIR = os.path.join(BENCH_DIR, "recordings")
+BASELINES_FILE = os.path.join(BENCH_DIR, "baselines.json")
+
+MIXED = "mixed"
+SCENARIOS = ["small", "medium", "large", MIXED]
+MODES = ["sequential", "pipelined"]
+MIXED_MODES = ["scheduler_on", "scheduler_off"]
+# mixed load: large runs submitted first, small runs MIXED_SMALL_DELAY seconds later
+MIXED_RECORDINGS = {"large": "medium", "small": "small"}
+MIXED_LARGE_RUNS = 4
+MIXED_SMALL_RUNS = 4
+MIXED_SMALL_DELAY = 0.05
+# concurrent calls the simulated LLM endpoint serves, and the least latency per call
+MIXED_LLM_CAPACITY = 2
+MIXED_LLM_LATENCY = 0.05
+DEFAULT_ITERATIONS = 5
+
+DEFAULT_THRESHOLDS = {"time": 0.30, "memory": 0.15}
+DEFAULT_MIN_DELTA = {"seconds": 0.02, "mb": 4.0}
+# timings of the reference workload; the median is the machine's speed
+REFERENCE_ROUNDS = 7
+
+
+# ---------------------------------------------------------
+# one scenario, in the child process
+# ---------------------------------------------------------
+
+def _quiet_environment(workdir: str):
+    """Settings for an isolated offline run; read by src.* at import time."""
+    os.environ["INSTAFORCE_CACHE_MODE"] = "off"
+    os.environ["INSTAFORCE_TRACE_DIR"] = os.path.join(workdir, "traces")
+    os.environ.pop("INSTAFORCE_METRICS_FILE", None)
+    os.environ.setdefault("INSTAFORCE_LOG_LEVEL", "WARNING")
+    os.environ.setdefault("SF_USERNAME_ALIAS", "simulated")
+
+
+def load_recording(scenario: str) -> Dict[str, Any]:
+    with open(os.path.join(RECORDINGS_DIR, f"{scenario}.json"), encoding="utf-8") as fh:
+        recording = json.load(fh)
+    # responses may be stored as JSON for readability; the LLM answers with text
+    recording["responses"] = {stage: text if isinstance(text, str) else json.dumps(text)
+                              for stage, text in recording["responses"].items()}
+    return recording
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct * len(ordered)) - 1)]
+
+
+def reference_seconds() -> float:
+    """Median time of a fixed JSON, regex and sorting workload, like the pipeline's own."""
+    import re
+    payload = [{"apiName": f"Component{i}", "type": "ApexClass", "fields": [f"Field{j}__c" for j in range(20)]}
+               for i in range(300)]
+    word = re.compile(r"[A-Za-z_]\w*")
+    timings = []
+    for _ in range(REFERENCE_ROUNDS):
+        start = time.perf_counter()
+        text = json.dumps(payload)
+        sorted(json.loads(text), key=lambda c: c["apiName"])
+        sum(1 for _ in word.finditer(text))
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def _run_once(graph, requirement: str, thread_id: str) -> Dict[str, Any]:
+    """Drive one run; node latency is the time between consecutive node updates."""
+    from src.state.checkpoint import thread_config
+
+    config = thread_config(thread_id)
+    nodes: Dict[str, float] = {}
+    start = last = time.perf_counter()
+    for update in graph.stream({"requirement": requirement, "run_id": thread_id}, config, stream_mode="updates"):
+        now = time.perf_counter()
+        for node in update:
+            if node != "__interrupt__":
+                nodes[node] = nodes.get(node, 0.0) + (now - last)
+        last = now
+    elapsed = time.perf_counter() - start
+
+    values = graph.get_state(config).values
+    deploy_status = values.get("deploy_status") or {}
+    if not deploy_status.get("success"):
+        raise RuntimeError(f"Benchmark run {thread_id} did not deploy: {deploy_status.get('message')}")
+    return {"seconds": elapsed, "nodes": nodes, "files": len(values.get("files") or [])}
+
+
+def _peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KiB on Linux
+
+
+def _results(name: str, mode: str, runs: List[Dict[str, Any]], llm_calls: Dict[str, Any], latency: float,
+             peak_rss_mb: float, alloc: tuple, extra: Dict[str, Any]) -> Dict[str, Any]:
+    seconds = [r["seconds"] for r in runs]
+    node_names = sorted({n for r in runs for n in r["nodes"]})
+    retained, alloc_peak = alloc
+    return dict({
+        "scenario": name,
+        "mode": mode,
+        "iterations": len(runs),
+        "llm_latency_seconds": latency,
+        "e2e_seconds": {
+            "median": statistics.median(seconds),
+            "p95": _percentile(seconds, 0.95),
+            "min": min(seconds),
+        },
+        "node_seconds": {n: statistics.median(r["nodes"].get(n, 0.0) for r in runs) for n in node_names},
+        "peak_rss_mb": round(peak_rss_mb, 2),
+        "alloc_peak_mb": round(alloc_peak / 2 ** 20, 3),
+        "alloc_retained_mb": round(retained / 2 ** 20, 3),
+        "llm_calls": llm_calls,
+        "reference_seconds": reference_seconds(),
+    }, **extra)
+
+
+def measure(scenario: str, mode: str, iterations: int, latency: float) -> Dict[str, Any]:
+    workdir = tempfile.mkdtemp(prefix=f"instaforce-bench-{scenario}-")
+    _quiet_environment(workdir)
+    sys.path.insert(0, REPO_ROOT)
+    os.chdir(workdir)  # per-run deploy roots and traces stay out of the repo
+
+    from src.llm.fake import FakeLLM
+    from src.deploy.transports import SimulatedTransport
+    from src.state.workflow import WorkflowBuilder
+    from src.state.checkpoint import get_checkpointer
+
+    recording = load_recording(scenario)
+    llm = FakeLLM(latency_seconds=latency, responses=recording["responses"])
+    builder = WorkflowBuilder(llm, transport=SimulatedTransport(latency_seconds=latency),
+                              pipelined=(mode == "pipelined"))
+    graph = builder.setup_graph(checkpointer=get_checkpointer(os.path.join(workdir, "checkpoints.sqlite")))
+    components = len(json.loads(recording["responses"]["design"]).get("components", []))
+
+    _run_once(graph, recording["requirement"], "bench-warmup")
+    runs = [_run_once(graph, recording["requirement"], f"bench-{i}") for i in range(iterations)]
+    peak_rss_mb = _peak_rss_mb()
+
+    tracemalloc.start()
+    _run_once(graph, recording["requirement"], "bench-tracemalloc")
+    alloc = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return _results(scenario, mode, runs, dict(llm.calls), latency, peak_rss_mb, alloc,
+                    {"components": components, "files": runs[-1]["files"]})
+
+
+class _EndpointLLM:
+    """An LLM endpoint serving `capacity` calls at a time; further calls queue in arrival order."""
+    def __init__(self, llm, capacity: threading.Semaphore):
+        self.llm = llm
+        self.capacity = capacity
+
+    def __getattr__(self, item):
+        return getattr(self.llm, item)
+
+    def invoke(self, messages, *args, **kwargs):
+        with self.capacity:
+            return self.llm.invoke(messages, *args, **kwargs)
+
+    def stream(self, messages, *args, **kwargs):
+        with self.capacity:
+            yield from self.llm.stream(messages, *args, **kwargs)
+
+
+def _mixed_round(graphs: Dict[str, Any], requirements: Dict[str, str], prefix: str) -> List[Dict[str, Any]]:
+    """One burst of large runs, then small runs; returns the small runs' results."""
+    small: List[Dict[str, Any]] = []
+    errors: List[BaseException] = []
+
+    def run(size: str, thread_id: str):
+        try:
+            result = _run_once(graphs[size], requirements[size], thread_id)
+            if size == "small":
+                small.append(result)
+        except BaseException as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=("large", f"{prefix}-large-{i}")) for i in range(MIXED_LARGE_RUNS)]
+    for t in threads:
+        t.start()
+    time.sleep(MIXED_SMALL_DELAY)
+    small_threads = [threading.Thread(target=run, args=("small", f"{prefix}-small-{i}"))
+                     for i in range(MIXED_SMALL_RUNS)]
+    for t in small_threads:
+        t.start()
+    for t in threads + small_threads:
+        t.join()
+    if errors:
+        raise errors[0]
+    return small
+
+
+def measure_mixed(mode: str, iterations: int, latency: float) -> Dict[str, Any]:
+    """Latency of small runs submitted right after large ones, in one process (see MIXED)."""
+    workdir = tempfile.mkdtemp(prefix=f"instaforce-bench-{MIXED}-")
+    _quiet_environment(workdir)
+    os.environ["INSTAFORCE_SCHEDULER"] = "on" if mode == "scheduler_on" else "off"
+    sys.path.insert(0, REPO_ROOT)
+    os.chdir(workdir)
+
+    from src.llm.fake import FakeLLM
+    from src.deploy.transports import SimulatedTransport
+    from src.jobs.scheduler import RunScheduler, DEPLOY_SLOTS
+    from src.state.workflow import WorkflowBuilder
+    from src.state.checkpoint import get_checkpointer
+
+    latency = max(latency, MIXED_LLM_LATENCY)
+    capacity = threading.Semaphore(MIXED_LLM_CAPACITY)
+    # one scheduler for both graphs, with as many LLM slots as the endpoint serves
+    scheduler = RunScheduler({"llm": MIXED_LLM_CAPACITY, "deploy": DEPLOY_SLOTS}) if mode == "scheduler_on" else None
+    checkpointer = get_checkpointer(os.path.join(workdir, "checkpoints.sqlite"))
+    transport = SimulatedTransport(latency_seconds=latency)
+    graphs, requirements, llms = {}, {}, {}
+    for size, scenario in MIXED_RECORDINGS.items():
+        recording = load_recording(scenario)
+        llms[size] = FakeLLM(latency_seconds=latency, responses=recording["responses"])
+        builder = WorkflowBuilder(_EndpointLLM(llms[size], capacity), transport=transport, scheduler=scheduler)
+        graphs[size] = builder.setup_graph(checkpointer=checkpointer)
+        requirements[size] = recording["requirement"]
+
+    for size in graphs:
+        _run_once(graphs[size], requirements[size], f"bench-warmup-{size}")
+    runs = [r for i in range(iterations) for r in _mixed_round(graphs, requirements, f"bench-{i}")]
+    peak_rss_mb = _peak_rss_mb()
+
+    tracemalloc.start()
+    _mixed_round(graphs, requirements, "bench-tracemalloc")
+    alloc = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    calls = {size: dict(llm.calls) for size, llm in llms.items()}
+    return _results(MIXED, mode, runs, calls, latency, peak_rss_mb, alloc,
+                    {"components": len(json.loads(load_recording(MIXED_RECORDINGS["small"])["responses"]["design"])
+                                       .get("components", [])),
+                     "files": runs[-1]["files"], "large_runs": MIXED_LARGE_RUNS, "small_runs": MIXED_SMALL_RUNS,
+                     "llm_capacity": MIXED_LLM_CAPACITY})
+
+
+# ---------------------------------------------------------
+# orchestration and baseline comparison, in the parent
+# ---------------------------------------------------------
+
+def scenario_modes(scenario: str, requested: Optional[List[str]] = None) -> List[str]:
+    """The requested modes (default: all) that apply to a scenario."""
+    valid = MIXED_MODES if scenario == MIXED else MODES
+    return [m for m in (requested or valid) if m in valid]
+
+
+def run_isolated(scenario: str, mode: str, iterations: int, latency: float) -> Dict[str, Any]:
+    cmd = [sys.executable, "-m", "benchmarks.run", "--child", "--scenario", scenario, "--mode", mode,
+           "--iterations", str(iterations), "--llm-latency", str(latency)]
+    proc = subprocess.run(cmd, cwd=REPO_ROOT, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"Benchmark {scenario}/{mode} failed:\n{proc.stderr.strip()}")
+    return json.loads(proc.stdout)
+
+
+def _key(result: Dict[str, Any]) -> str:
+    return f"{result['scenario']}/{result['mode']}"
+
+
+def compared_metrics(result: Dict[str, Any]) -> Dict[str, tuple]:
+    """metric name -> (value, kind) for every metric that has a threshold."""
+    metrics = {"e2e_seconds.median": (result["e2e_seconds"]["median"], "time")}
+    for node, value in result["node_seconds"].items():
+        metrics[f"node_seconds.{node}"] = (value, "time")
+    metrics["peak_rss_mb"] = (result["peak_rss_mb"], "memory")
+    metrics["alloc_peak_mb"] = (result["alloc_peak_mb"], "memory")
+    return metrics
+
+
+def _speed_ratio(result: Dict[str, Any], expected: Dict[str, Any]) -> float:
+    """How much slower this machine ran the reference workload than the baseline's; 1.0 when unknown."""
+    if result.get("reference_seconds") and expected.get("reference_seconds"):
+        return result["reference_seconds"] / expected["reference_seconds"]
+    return 1.0
+
+
+def case_tolerance(result: Dict[str, Any], thresholds: Dict[str, float]) -> Dict[str, float]:
+    """Per-case thresholds: at least the defaults, wider for a case whose runs spread more."""
+    spread = result["e2e_seconds"]["p95"] / result["e2e_seconds"]["min"] - 1 if result["e2e_seconds"]["min"] else 0.0
+    return {"time": round(max(thresholds["time"], 2 * spread), 2), "memory": thresholds["memory"]}
+
+
+def find_regressions(results: List[Dict[str, Any]], baseline: Dict[str, Any],
+                     thresholds: Dict[str, float], min_delta: Dict[str, float],
+                     case_tolerances: bool = True) -> List[Dict[str, Any]]:
+    """
+    Metrics over their baseline. Times are first scaled by the reference workload's
+    speed ratio; a case's own `tolerance` applies unless thresholds were given
+    explicitly (`case_tolerances=False`).
+    """
+    regressions = []
+    for result in results:
+        expected = baseline.get("results", {}).get(_key(result))
+        if not expected:
+            continue
+        expected_metrics = compared_metrics(expected)
+        ratio = _speed_ratio(result, expected)
+        allowed = dict(thresholds, **(expected.get("tolerance") or {})) if case_tolerances else thresholds
+        for name, (value, kind) in compared_metrics(result).items():
+            if name not in expected_metrics:
+                continue
+            base = expected_metrics[name][0]
+            if kind == "time":
+                # in baseline-machine seconds
+                value = value / ratio
+            floor = min_delta["seconds"] if kind == "time" else min_delta["mb"]
+            if value > base * (1 + allowed[kind]) and value - base > floor:
+                regressions.append({
+                    "benchmark": _key(result),
+                    "metric": name,
+                    "baseline": base,
+                    "value": value,
+                    "speed_ratio": round(ratio, 3),
+                    "change": round(value / base - 1, 3) if base else None,
+                    "threshold": allowed[kind],
+                })
+    return regressions
+
+
+def load_baseline(path: str) -> Dict[str, Any]:
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+def write_json(path: str, payload: Dict[str, Any]):
+    text = json.dumps(payload, indent=2, sort_keys=True) + "\n"
+    if path == "-":
+        sys.stdout.write(text)
+        return
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as fh:
+        fh.write(text)
+
+
+def summarize(results: List[Dict[str, Any]], regressions: List[Dict[str, Any]]):
+    out = sys.stderr
+    print(f"{'benchmark':<22} {'comps':>5} {'e2e med':>9} {'e2e p95':>9} {'rss MB':>8} {'alloc MB':>9}", file=out)
+    for r in results:
+        print(f"{_key(r):<22} {r['components']:>5} {r['e2e_seconds']['median']:>8.3f}s {r['e2e_seconds']['p95']:>8.3f}s "
+              f"{r['peak_rss_mb']:>8.1f} {r['alloc_peak_mb']:>9.2f}", file=out)
+        for node, value in r["node_seconds"].items():
+            print(f"    {node:<26} {value * 1000:>9.1f} ms", file=out)
+    mixed = {r["mode"]: r["e2e_seconds"]["median"] for r in results if r["scenario"] == MIXED}
+    if len(mixed) == len(MIXED_MODES):
+        print(f"mixed load: small-run median {mixed['scheduler_on']:.3f}s with the scheduler, "
+              f"{mixed['scheduler_off']:.3f}s without ({mixed['scheduler_off'] / mixed['scheduler_on']:.1f}x)", file=out)
+    for reg in regressions:
+        print(f"[REGRESSION] {reg['benchmark']} {reg['metric']}: {reg['value']:.4g} vs baseline "
+              f"{reg['baseline']:.4g} (+{(reg['change'] or 0) * 100:.0f}%, allowed {reg['threshold'] * 100:.0f}%, "
+              f"machine speed ratio {reg['speed_ratio']:.2f})", file=out)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Offline InstaForce pipeline benchmarks")
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS,
+                        help="scenario to run (repeatable; default: all)")
+    parser.add_argument("--mode", action="append", choices=MODES + MIXED_MODES,
+                        help="graph mode, or scheduler mode of the mixed scenario (repeatable; default: all)")
+    parser.add_argument("--iterations", type=int, default=DEFAULT_ITERATIONS, help="timed runs per benchmark")
+    parser.add_argument("--llm-latency", type=float, default=0.0,
+                        help="simulated seconds per LLM call and deploy (0 measures pipeline overhead only)")
+    parser.add_argument("--baseline", default=BASELINES_FILE)
+    parser.add_argument("--output", default="-", help="results JSON path ('-' for stdout)")
+    parser.add_argument("--time-threshold", type=float, default=None,
+                        help="allowed relative increase of latencies, for every case "
+                             "(default: each case's tolerance in the baseline file)")
+    parser.add_argument("--memory-threshold", type=float, default=None,
+                        help="allowed relative increase of RSS/allocations, for every case "
+                             "(default: each case's tolerance in the baseline file)")
+    parser.add_argument("--update-baseline", action="store_true", help="store these results as the baseline")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        if args.scenario[0] == MIXED:
+            result = measure_mixed(args.mode[0], args.iterations, args.llm_latency)
+        else:
+            result = measure(args.scenario[0], args.mode[0], args.iterations, args.llm_latency)
+        sys.stdout.write(json.dumps(result))
+        return 0
+
+    results = [run_isolated(scenario, mode, args.iterations, args.llm_latency)
+               for scenario in (args.scenario or SCENARIOS) for mode in scenario_modes(scenario, args.mode)]
+
+    baseline = load_baseline(args.baseline)
+    thresholds = dict(DEFAULT_THRESHOLDS, **baseline.get("thresholds", {}))
+    if args.time_threshold is not None:
+        thresholds["time"] = args.time_threshold
+    if args.memory_threshold is not None:
+        thresholds["memory"] = args.memory_threshold
+    min_delta = dict(DEFAULT_MIN_DELTA, **baseline.get("min_delta", {}))
+
+    explicit = args.time_threshold is not None or args.memory_threshold is not None
+    regressions = [] if args.update_baseline else find_regressions(results, baseline, thresholds, min_delta,
+                                                                   case_tolerances=not explicit)
+    summarize(results, regressions)
+    write_json(args.output, {
+        "generated_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "thresholds": thresholds,
+        "min_delta": min_delta,
+        "results": results,
+        "regressions": regressions,
+    })
+
+    if args.update_baseline:
+        baseline_results = baseline.get("results", {})
+        baseline_results.update({_key(r): dict(r, tolerance=case_tolerance(r, thresholds)) for r in results})
+        write_json(args.baseline, {
+            "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "thresholds": thresholds,
+            "min_delta": min_delta,
+            "results": baseline_results,
+        })
+        print(f"[OK] Baseline written to {args.baseline}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
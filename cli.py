@@ -0,0 +1,163 @@
+import argparse
+import json
+import sys
+
+from langgraph.types import Command
+
+from src.llm.model import LLMModel
+from src.cache.semantic_cache import get_requirement_cache
+from src.org.schema_cache import get_schema_cache
+from src.deploy.coalescer import get_coalescer
+from src.state.workflow import WorkflowBuilder
+from src.jobs.runner import JobRunner, WORKER_SLOTS
+from src.jobs.scheduler import parse_priority
+from src.utils.tracing import load_trace
+from src.state.checkpoint import (
+    get_checkpointer, thread_config, start_run, resume_run, replay_from, run_history
+)
+
+NODE_NAMES = ["decompose_agent", "req_agent", "design_agent", "merge_designs", "codegen_agent",
+              "design_codegen_agent", "deploy_agent"]
+
+
+def build_graph(db_path=None, requirement_cache=None, coalesce=False):
+    """The compiled workflow; with `coalesce` (worker), concurrent runs may share deployments."""
+    llm = LLMModel().get_llm()
+    builder = WorkflowBuilder(llm, requirement_cache=requirement_cache, schema_cache=get_schema_cache(),
+                              coalescer=get_coalescer() if coalesce else None)
+    return builder.setup_graph(checkpointer=get_checkpointer(db_path))
+
+
+def print_updates(stream):
+    for update in stream:
+        for node, output in update.items():
+            if node == "__interrupt__":
+                continue
+            keys = ", ".join(output.keys()) if isinstance(output, dict) else ""
+            print(f"[NODE] {node} completed ({keys})")
+
+
+def print_outcome(graph, thread_id):
+    snapshot = graph.get_state(thread_config(thread_id))
+    deploy_status = snapshot.values.get("deploy_status") or {}
+    print(f"\n[RUN] {thread_id}")
+    if deploy_status:
+        print(f"[DEPLOY] {deploy_status.get('message')}")
+        for alias, status in (deploy_status.get("orgs") or {}).items():
+            print(f"    {alias}: {status.get('message')}")
+        for unit in deploy_status.get("units") or []:
+            print(f"    {unit['name']}: {unit.get('message')}")
+        tests = deploy_status.get("tests")
+        if tests:
+            print(f"[TESTS] {tests['level']}: {tests['cache_misses']} test classes run, {tests['cache_hits']} cached green "
+                  f"(~{tests['seconds_saved']:.1f}s saved)")
+    if snapshot.next:
+        print(f"[PENDING] next node(s): {', '.join(snapshot.next)}  — resume with: python cli.py resume {thread_id}")
+
+
+def confirm_cache_reuse(request) -> bool:
+    print(f"\n[CACHE] Similar requirement found (score {request['score']:.3f}):")
+    print(f"    {request['cached_requirement']}")
+    answer = input("Reuse its breakdown and design instead of calling the LLM? [y/N] ")
+    return answer.strip().lower() in ("y", "yes")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="InstaForce pipeline runner with resumable runs")
+    parser.add_argument("--db", default=None, help="checkpoint database path")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run_p = sub.add_parser("run", help="start a new run")
+    run_p.add_argument("requirement", help="requirement text, or @path to read it from a file")
+    run_p.add_argument("--thread-id", default=None)
+    run_p.add_argument("--orgs", default=None,
+                       help="comma-separated org aliases to deploy to concurrently (default: SF_USERNAME_ALIAS)")
+    run_p.add_argument("--priority", default=None, type=parse_priority,
+                       help="integer or low|normal|high|urgent; higher runs get LLM and deploy slots first")
+
+    resume_p = sub.add_parser("resume", help="continue a run from its last completed node")
+    resume_p.add_argument("thread_id")
+
+    replay_p = sub.add_parser("replay", help="re-run a run starting at the given node")
+    replay_p.add_argument("thread_id")
+    replay_p.add_argument("--from-node", required=True, choices=NODE_NAMES)
+
+    history_p = sub.add_parser("history", help="list the checkpoints of a run")
+    history_p.add_argument("thread_id")
+
+    sub.add_parser("cache-stats", help="show requirement cache hit-rate metrics")
+
+    schema_p = sub.add_parser("schema-refresh", help="sync the local org schema cache")
+    schema_p.add_argument("--alias", default=None)
+    schema_p.add_argument("--all", action="store_true", help="describe every object's fields")
+    schema_p.add_argument("--force", action="store_true", help="ignore the cache TTL")
+
+    trace_p = sub.add_parser("trace", help="print the timing spans recorded for a run")
+    trace_p.add_argument("thread_id")
+
+    worker_p = sub.add_parser("worker", help="process jobs queued by the UI (INSTAFORCE_JOB_WORKER=external)")
+    worker_p.add_argument("--slots", type=int, default=WORKER_SLOTS, help="concurrent runs")
+
+    args = parser.parse_args(argv)
+    if args.command == "trace":
+        spans = load_trace(args.thread_id)
+        if not spans:
+            print(f"[ERROR] No trace recorded for {args.thread_id}")
+            return 1
+        for span in sorted(spans, key=lambda s: s["start"]):
+            print(f"{span['name']:<28} {span['duration_ms']:>10.1f} ms  {span['status']:<11} "
+                  f"{json.dumps(span['attributes'], default=str)}")
+        return 0
+
+    if args.command == "schema-refresh":
+        schema_cache = get_schema_cache(args.alias)
+        if schema_cache is None:
+            print("[ERROR] Set SF_USERNAME_ALIAS (or --alias) with its credentials and enable INSTAFORCE_REFERENCE_CHECK")
+            return 1
+        print(json.dumps(schema_cache.refresh(force=args.force, describe_all=args.all)))
+        return 0
+
+    requirement_cache = get_requirement_cache()
+    if args.command == "cache-stats":
+        print(json.dumps(requirement_cache.stats() if requirement_cache else {"mode": "off"}, indent=2))
+        return 0
+
+    graph = build_graph(args.db, requirement_cache, coalesce=args.command == "worker")
+
+    if args.command == "worker":
+        JobRunner(graph, slots=args.slots).serve()
+        return 0
+
+    if args.command == "run":
+        requirement = args.requirement
+        if requirement.startswith("@"):
+            with open(requirement[1:], encoding="utf-8") as fh:
+                requirement = fh.read()
+        orgs = [a.strip() for a in args.orgs.split(",") if a.strip()] if args.orgs else None
+        thread_id, stream = start_run(graph, requirement, args.thread_id, target_orgs=orgs,
+                                       priority=args.priority)
+        print(f"[RUN] started {thread_id}")
+    elif args.command == "resume":
+        thread_id, stream = args.thread_id, resume_run(graph, args.thread_id)
+    elif args.command == "replay":
+        thread_id, stream = args.thread_id, replay_from(graph, args.thread_id, args.from_node)
+    else:
+        print(json.dumps(run_history(graph, args.thread_id), indent=2))
+        return 0
+
+    try:
+        while True:
+            print_updates(stream)
+            # runs pause here when the requirement cache asks for confirmation
+            interrupts = graph.get_state(thread_config(thread_id)).interrupts
+            if not interrupts:
+                break
+            accepted = confirm_cache_reuse(interrupts[0].value)
+            stream = graph.stream(Command(resume=accepted), thread_config(thread_id), stream_mode="updates")
+    finally:
+        print_outcome(graph, thread_id)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
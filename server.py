@@ -0,0 +1,288 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+from typing import Any, Dict, Optional
+
+from langgraph.types import Command
+
+from src.llm.model import LLMModel
+from src.llm.fake import FakeLLM
+from src.cache.semantic_cache import get_requirement_cache
+from src.org.schema_cache import get_schema_cache
+from src.deploy.transports import SimulatedTransport
+from src.deploy.coalescer import get_coalescer
+from src.state.workflow import WorkflowBuilder
+from src.state.checkpoint import get_async_checkpointer, new_thread_id, thread_config
+from src.jobs.scheduler import get_scheduler, parse_priority
+from src.utils.log import get_logger
+from src.utils.metrics import REGISTRY
+from src.utils.tracing import load_trace
+
+MAX_BODY_BYTES = 1024 * 1024
+
+logger = get_logger("server")
+
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large"}
+
+
+class HttpError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def _json(obj: Any) -> str:
+    return json.dumps(obj, default=lambda o: getattr(o, "__dict__", str(o)))
+
+
+class PipelineServer:
+    """
+    Minimal HTTP/1.1 service over asyncio streams. Every connection is a task on one
+    event loop and the graph runs through astream, so concurrent runs share the
+    process without a thread each.
+
+      POST /runs               {"requirement": "...", "thread_id": optional, "target_orgs": optional [alias],
+                                "priority": optional int or low|normal|high|urgent}
+      POST /runs/<id>/resume   {"resume": true|false|null}   continue a paused/failed run
+      GET  /runs/<id>          latest checkpointed state of a run, and its scheduler waits
+      GET  /runs/<id>/trace    JSON spans of a run (nodes, LLM calls, deploys)
+      GET  /metrics            Prometheus text exposition
+      GET  /health
+
+    The two POST endpoints answer with server-sent events:
+      run        {"thread_id"}
+      update     {"node", "data"}     one per finished node
+      interrupt  {"thread_id", "value"}  run paused (requirement cache confirmation)
+      end        {"thread_id", "success", "message"}
+      error      {"thread_id", "message"}
+    A client that disconnects cancels its run; it can be continued with /resume.
+    """
+    def __init__(self, graph, host: str = "127.0.0.1", port: int = 8080):
+        self.graph = graph
+        self.host = host
+        self.port = port
+        self.active_runs = 0
+        # set once listening; self.port is then the bound port (port 0 picks a free one)
+        self.ready = asyncio.Event()
+
+    async def serve(self):
+        server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.port = server.sockets[0].getsockname()[1]
+        self.ready.set()
+        logger.info("InstaForce service listening on http://%s:%s", self.host, self.port)
+        async with server:
+            await server.serve_forever()
+
+    # ---------------------------------------------------------
+    # HTTP plumbing
+    # ---------------------------------------------------------
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            method, path, body = await self._read_request(reader)
+            await self.route(method, path, body, writer)
+        except HttpError as e:
+            await self._send_json(writer, e.status, {"error": str(e)})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            try:
+                writer.close()
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    @staticmethod
+    async def _read_request(reader: asyncio.StreamReader):
+        request_line = (await reader.readline()).decode("latin-1").strip()
+        parts = request_line.split(" ")
+        if len(parts) != 3:
+            raise HttpError(400, "Malformed request line")
+        method, path, _ = parts
+
+        headers: Dict[str, str] = {}
+        while True:
+            line = (await reader.readline()).decode("latin-1")
+            if line in ("\r\n", "\n", ""):
+                break
+            key, _, value = line.partition(":")
+            headers[key.strip().lower()] = value.strip()
+
+        try:
+            length = int(headers.get("content-length") or 0)
+        except ValueError:
+            raise HttpError(400, "Malformed Content-Length")
+        if length < 0:
+            raise HttpError(400, "Malformed Content-Length")
+        if length > MAX_BODY_BYTES:
+            raise HttpError(413, "Request body too large")
+        body: Dict[str, Any] = {}
+        if length:
+            try:
+                body = json.loads(await reader.readexactly(length))
+            except json.JSONDecodeError:
+                raise HttpError(400, "Body must be JSON")
+            if not isinstance(body, dict):
+                raise HttpError(400, "Body must be a JSON object")
+        return method, path.split("?", 1)[0].rstrip("/") or "/", body
+
+    @staticmethod
+    async def _send(writer: asyncio.StreamWriter, status: int, content_type: str, data: bytes):
+        writer.write(
+            f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+            f"Content-Type: {content_type}\r\nContent-Length: {len(data)}\r\nConnection: close\r\n\r\n"
+            .encode("latin-1") + data
+        )
+        await writer.drain()
+
+    async def _send_json(self, writer: asyncio.StreamWriter, status: int, payload: Any):
+        await self._send(writer, status, "application/json", _json(payload).encode("utf-8"))
+
+    @staticmethod
+    async def _send_event(writer: asyncio.StreamWriter, event: str, payload: Any):
+        writer.write(f"event: {event}\ndata: {_json(payload)}\n\n".encode("utf-8"))
+        await writer.drain()
+
+    # ---------------------------------------------------------
+    # routes
+    # ---------------------------------------------------------
+
+    async def route(self, method: str, path: str, body: Dict[str, Any], writer: asyncio.StreamWriter):
+        segments = [s for s in path.split("/") if s]
+
+        if segments == ["health"]:
+            scheduler = get_scheduler()
+            await self._send_json(writer, 200, {"status": "ok", "active_runs": self.active_runs,
+                                                "scheduler": scheduler.snapshot() if scheduler else None})
+        elif segments == ["metrics"]:
+            await self._send(writer, 200, "text/plain; version=0.0.4", REGISTRY.render().encode("utf-8"))
+        elif len(segments) == 3 and segments[0] == "runs" and segments[2] == "trace":
+            spans = await asyncio.to_thread(load_trace, segments[1])
+            if not spans:
+                raise HttpError(404, f"No trace for run {segments[1]}")
+            await self._send_json(writer, 200, {"thread_id": segments[1], "spans": spans})
+        elif segments == ["runs"]:
+            if method != "POST":
+                raise HttpError(405, "Use POST /runs")
+            requirement = body.get("requirement")
+            if not isinstance(requirement, str) or not requirement.strip():
+                raise HttpError(400, "'requirement' is required")
+            target_orgs = body.get("target_orgs")
+            if target_orgs is not None and (not isinstance(target_orgs, list)
+                                            or not all(isinstance(a, str) and a for a in target_orgs)):
+                raise HttpError(400, "'target_orgs' must be a list of org aliases")
+            try:
+                priority = parse_priority(body.get("priority"))
+            except ValueError as e:
+                raise HttpError(400, str(e))
+            thread_id = body.get("thread_id") or new_thread_id()
+            run_input = {"requirement": requirement, "run_id": thread_id}
+            if target_orgs:
+                run_input["target_orgs"] = target_orgs
+            if priority:
+                run_input["priority"] = priority
+            await self.stream_run(writer, thread_id, run_input)
+        elif len(segments) == 3 and segments[0] == "runs" and segments[2] == "resume":
+            if method != "POST":
+                raise HttpError(405, "Use POST /runs/<id>/resume")
+            await self._require_run(segments[1])
+            resume = body.get("resume")
+            await self.stream_run(writer, segments[1], Command(resume=resume) if resume is not None else None)
+        elif len(segments) == 2 and segments[0] == "runs":
+            snapshot = await self._require_run(segments[1])
+            scheduler = get_scheduler()
+            await self._send_json(writer, 200, {
+                "thread_id": segments[1],
+                "next": list(snapshot.next),
+                "values": snapshot.values,
+                "schedule": scheduler.run_stats(segments[1]) if scheduler else None,
+            })
+        else:
+            raise HttpError(404, f"No route for {method} {path}")
+
+    async def _require_run(self, thread_id: str):
+        snapshot = await self.graph.aget_state(thread_config(thread_id))
+        if not snapshot.values:
+            raise HttpError(404, f"Unknown run {thread_id}")
+        return snapshot
+
+    async def stream_run(self, writer: asyncio.StreamWriter, thread_id: str, run_input: Optional[Any]):
+        writer.write(
+            b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n"
+            b"Connection: close\r\n\r\n"
+        )
+        config = thread_config(thread_id)
+        self.active_runs += 1
+        try:
+            await self._send_event(writer, "run", {"thread_id": thread_id})
+            interrupt_value = None
+            async for update in self.graph.astream(run_input, config, stream_mode="updates"):
+                for node, output in update.items():
+                    if node == "__interrupt__":
+                        interrupt_value = output[0].value
+                        continue
+                    await self._send_event(writer, "update", {"node": node, "data": output})
+
+            if interrupt_value is not None:
+                await self._send_event(writer, "interrupt", {"thread_id": thread_id, "value": interrupt_value})
+                return
+            values = (await self.graph.aget_state(config)).values
+            deploy_status = values.get("deploy_status") or {}
+            await self._send_event(writer, "end", {
+                "thread_id": thread_id,
+                "success": bool(deploy_status.get("success")),
+                "message": deploy_status.get("message", ""),
+            })
+        except ConnectionError:
+            # client went away: the run stops here and stays resumable from its checkpoint
+            logger.warning("Client disconnected, run %s cancelled", thread_id)
+        except Exception as e:
+            logger.error("Run %s failed: %s", thread_id, e)
+            await self._send_event(writer, "error", {"thread_id": thread_id, "message": str(e)})
+        finally:
+            self.active_runs -= 1
+
+
+async def serve(args):
+    if args.fake_llm:
+        llm = FakeLLM(latency_seconds=args.fake_latency)
+    else:
+        llm = LLMModel().get_llm()
+
+    transport, schema_cache = None, None
+    if args.simulated_deploy:
+        # offline: no org, so no org schema either
+        transport = SimulatedTransport(latency_seconds=args.fake_latency)
+        os.environ.setdefault("SF_USERNAME_ALIAS", "simulated")
+    else:
+        schema_cache = get_schema_cache()
+
+    # concurrent runs share the process, so their deployments may be coalesced
+    builder = WorkflowBuilder(llm, requirement_cache=get_requirement_cache(), schema_cache=schema_cache,
+                              transport=transport, coalescer=get_coalescer(transport))
+    async with get_async_checkpointer(args.db) as checkpointer:
+        graph = builder.setup_graph(checkpointer=checkpointer)
+        await PipelineServer(graph, args.host, args.port).serve()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="InstaForce HTTP service streaming node updates as SSE")
+    parser.add_argument("--host", default=os.getenv("INSTAFORCE_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("INSTAFORCE_PORT", "8080")))
+    parser.add_argument("--db", default=None, help="checkpoint database path")
+    parser.add_argument("--fake-llm", action="store_true", help="answer with the offline stand-in LLM")
+    parser.add_argument("--simulated-deploy", action="store_true", help="report deploys as successful without an org")
+    parser.add_argument("--fake-latency", type=float, default=0.0, help="seconds per fake LLM call / deploy")
+    args = parser.parse_args(argv)
+
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
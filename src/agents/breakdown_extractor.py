@@ -0,0 +1,293 @@
+import os
+import re
+import math
+import threading
+from collections import Counter, defaultdict
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+
+from src.utils.log import get_logger
+
+logger = get_logger("breakdown_extractor")
+
+# opt-in: a wrong local breakdown is only noticed in the generated design
+LOCAL_BREAKDOWN = os.getenv("INSTAFORCE_LOCAL_BREAKDOWN", "off") == "on"
+# below this confidence the requirement goes to the LLM
+LOCAL_THRESHOLD = float(os.getenv("INSTAFORCE_LOCAL_BREAKDOWN_THRESHOLD", "0.75"))
+# longer requirements are rarely routine; they lose confidence
+LOCAL_MAX_CHARS = int(os.getenv("INSTAFORCE_LOCAL_BREAKDOWN_MAX_CHARS", "1500"))
+# past breakdowns needed before the learned action model is used
+MIN_TRAINING_EXAMPLES = 20
+# times an action must appear in past breakdowns to be predicted
+MIN_LABEL_EXAMPLES = 3
+# past breakdown actions no pattern describes; the requirement needs the LLM's own wording
+OTHER_ACTION = "other"
+
+# label -> API name; labels are matched as words, API names as well
+STANDARD_OBJECTS = {
+    "Account": "Account", "Contact": "Contact", "Lead": "Lead", "Opportunity": "Opportunity",
+    "Opportunity Line Item": "OpportunityLineItem", "Opportunity Product": "OpportunityLineItem",
+    "Opportunity Contact Role": "OpportunityContactRole", "Case": "Case", "Case Comment": "CaseComment",
+    "Quote": "Quote", "Quote Line Item": "QuoteLineItem", "Campaign": "Campaign",
+    "Campaign Member": "CampaignMember", "Order": "Order", "Order Product": "OrderItem", "Order Item": "OrderItem",
+    "Product": "Product2", "Price Book": "Pricebook2", "Pricebook": "Pricebook2",
+    "Price Book Entry": "PricebookEntry", "Contract": "Contract", "Asset": "Asset", "Task": "Task",
+    "Event": "Event", "User": "User", "Entitlement": "Entitlement", "Service Contract": "ServiceContract",
+    "Work Order": "WorkOrder", "Knowledge Article": "Knowledge__kav", "Email Message": "EmailMessage",
+    "Attachment": "Attachment", "Content Document": "ContentDocument",
+}
+# object names that are also everyday words ("in case", "take into account") count only when capitalized
+COMMON_WORDS = {"account", "case", "order", "event", "task", "user", "asset", "contract", "product", "quote",
+                "campaign", "attachment"}
+CUSTOM_OBJECT = re.compile(r"\b([A-Za-z][A-Za-z0-9_]*__(?:c|mdt|e))\b")
+FIELD_WORD = re.compile(r"\bfields?\b", re.I)
+# "a custom object called Invoice", "new object named Shipment"
+NAMED_OBJECT = re.compile(r"\b(?:custom|new)\s+object\s+(?:called|named)?\s*['\"]?([A-Z][A-Za-z0-9 ]{1,40}?)['\"]?(?=[\s.,;:]|$)")
+
+# (pattern, action) in breakdown wording; one requirement can match several
+ACTION_PATTERNS: List[Tuple[re.Pattern, str]] = [(re.compile(p, re.I), a) for p, a in [
+    (r"\bvalidat(?:e|ion|ing)\b|\bprevent\b.*\bsav(?:e|ing)\b|\bmust not\b|\bcannot be\b", "Add validation rule"),
+    (r"\bapproval\b", "Create approval process"),
+    (r"\btrigger\b|\bbefore (?:insert|update|delete)\b|\bafter (?:insert|update|delete)\b", "Create Apex trigger"),
+    (r"\bflow\b|\bautomat(?:e|ically|ion)\b|\bwhen(?:ever)?\b.*\b(?:created|updated|changes?|closed|set)\b",
+     "Automate record updates"),
+    (r"\b(?:new|custom|add(?:ed)?|create)\b[\w\s]{0,30}\bfield\b|\bpicklist\b|\bcheckbox\b|\bformula field\b",
+     "Add custom field"),
+    (r"\b(?:custom|new)\s+object\b", "Create custom object"),
+    (r"\bsen(?:d|ds|t)\b.{0,40}\bemails?\b|\bemail (?:alert|notification)s?\b|\bnotif(?:y|ies|ied|ication)\b|\balert\b",
+     "Send email notification"),
+    (r"\blwc\b|\blightning (?:web )?component\b|\bcomponent\b|\bscreen\b|\bpage layout\b|\bbutton\b",
+     "Build Lightning UI"),
+    (r"\breport\b|\bdashboard\b", "Create report"),
+    (r"\bpermission set\b|\bprofile\b|\bsharing rule\b|\baccess\b", "Configure access"),
+    (r"\bbatch\b|\bschedul(?:e|ed)\b|\bnightly\b|\bevery (?:day|hour|week)\b", "Create scheduled Apex"),
+    (r"\broll[- ]?up\b|\bsum of\b|\bcount of\b|\btotal\b", "Add roll-up summary"),
+    (r"\bassign(?:ment)?\b|\bround[- ]robin\b|\bqueue\b", "Configure assignment"),
+    (r"\bduplicate\b|\bdedupe\b", "Add duplicate rule"),
+]]
+INTEGRATION_PATTERNS = [(re.compile(p, re.I), i) for p, i in [
+    (r"\brest\b|\bapi\b|\bcallout\b|\bendpoint\b|\bwebhook\b", "REST API callout"),
+    (r"\bsap\b|\berp\b|\bnetsuite\b|\boracle\b", "ERP integration"),
+    (r"\bslack\b|\bteams\b", "Messaging integration"),
+    (r"\bplatform event\b|\bchange data capture\b|\bkafka\b|\bmiddleware\b|\bmulesoft\b", "Event-driven integration"),
+    (r"\bexternal system\b|\bthird[- ]party\b|\bsync(?:hroni[sz]e)?\b", "External system sync"),
+]]
+# wording that makes a requirement ambiguous enough for the LLM
+UNCERTAIN = re.compile(r"\?|\b(?:maybe|possibly|tbd|tbc|not sure|unclear|etc\.?|and so on|some kind of)\b", re.I)
+SENTENCE = re.compile(r"(?<=[.!?;])\s+|\n+")
+WORD = re.compile(r"[a-z][a-z0-9_]+")
+
+
+def _words(text: str) -> List[str]:
+    return WORD.findall(text.lower())
+
+
+def _pattern_actions(actions: Iterable[Any]) -> List[str]:
+    """Breakdown actions in pattern wording: each action's pattern actions, or OTHER_ACTION."""
+    labels: List[str] = []
+    for action in actions:
+        if not isinstance(action, str) or not action.strip():
+            continue
+        hits = [a for pattern, a in ACTION_PATTERNS if pattern.search(action)] or [OTHER_ACTION]
+        labels.extend(a for a in hits if a not in labels)
+    return labels
+
+
+class ActionModel:
+    """
+    Multi-label naive Bayes over the words of past requirements and the actions their
+    breakdowns listed: one Bernoulli model per action, trained incrementally.
+    """
+    def __init__(self):
+        self.examples = 0
+        self.label_counts: Counter = Counter()
+        self.word_counts: Counter = Counter()
+        self.label_word_counts: Dict[str, Counter] = defaultdict(Counter)
+
+    def learn(self, text: str, labels: Iterable[str]):
+        words = set(_words(text))
+        self.examples += 1
+        self.word_counts.update(words)
+        for label in {l.strip() for l in labels if isinstance(l, str) and l.strip()}:
+            self.label_counts[label] += 1
+            self.label_word_counts[label].update(words)
+
+    def predict(self, text: str) -> Dict[str, float]:
+        """P(action | requirement) for actions seen at least MIN_LABEL_EXAMPLES times."""
+        words = set(_words(text))
+        n = self.examples
+        result = {}
+        for label, count in self.label_counts.items():
+            if count < MIN_LABEL_EXAMPLES:
+                continue
+            if count >= n:
+                result[label] = 1.0
+                continue
+            log_odds = math.log(count / (n - count))
+            with_label = self.label_word_counts[label]
+            for w in words:
+                if w not in self.word_counts:
+                    continue
+                p_w_label = (with_label[w] + 1) / (count + 2)
+                p_w_other = (self.word_counts[w] - with_label[w] + 1) / (n - count + 2)
+                log_odds += math.log(p_w_label / p_w_other)
+            result[label] = 1.0 / (1.0 + math.exp(-max(min(log_odds, 50.0), -50.0)))
+        return result
+
+
+class BreakdownExtractor:
+    """
+    Local, CPU-only requirement breakdown for routine requirements, so ReqAgent can
+    skip the LLM round trip: objects come from the standard object vocabulary, custom
+    API names, the org's objects (OrgSchemaCache) and objects of past breakdowns;
+    actions and integration points from keyword patterns.
+
+    The patterns alone are not evidence enough (one keyword makes a one-sentence
+    requirement fully "matched"), so they are checked against an ActionModel trained
+    on past breakdowns (the requirement cache) and on every LLM breakdown seen since,
+    with the LLM's actions mapped to the pattern actions (OTHER_ACTION when none
+    fits). The confidence is the model's weakest agreement: its probability of each
+    pattern action, and of the absence of every action the patterns did not find.
+    Until MIN_TRAINING_EXAMPLES breakdowns are seen there is no model and no local
+    breakdown.
+
+    extract() returns a breakdown in the LLM's format, or None when its confidence is
+    below `threshold` (no object or action found, disagreement with the model,
+    uncertain wording, integrations, long documents); the LLM handles those.
+    """
+    def __init__(self, threshold: float = LOCAL_THRESHOLD, max_chars: int = LOCAL_MAX_CHARS,
+                 schema_cache=None, examples: Iterable[Tuple[str, Dict[str, Any]]] = ()):
+        self.threshold = threshold
+        self.max_chars = max_chars
+        self.schema_cache = schema_cache
+        self.model = ActionModel()
+        self._lock = threading.Lock()
+        self._objects: Dict[str, str] = {label.lower(): label for label in STANDARD_OBJECTS}
+        self._objects.update({api.lower(): label for label, api in STANDARD_OBJECTS.items()})
+        self._org_objects_loaded = False
+        for requirement, breakdown in examples:
+            self.learn(requirement, breakdown)
+
+    # ---------------------------------------------------------
+    # vocabulary and training
+    # ---------------------------------------------------------
+
+    def learn(self, requirement: str, breakdown: Dict[str, Any]):
+        """Add a requirement and its (LLM) breakdown to the vocabulary and the action model."""
+        if not requirement or not isinstance(breakdown, dict):
+            return
+        with self._lock:
+            for name in breakdown.get("objects") or []:
+                if isinstance(name, str) and 2 < len(name) <= 60:
+                    self._objects.setdefault(name.lower(), name)
+            self.model.learn(requirement, _pattern_actions(breakdown.get("actions") or []))
+
+    def _load_org_objects(self):
+        if self._org_objects_loaded or self.schema_cache is None:
+            return
+        self._org_objects_loaded = True
+        try:
+            names = self.schema_cache.object_names()
+        except Exception as e:
+            logger.debug("Org objects unavailable for local breakdowns: %s", e)
+            return
+        with self._lock:
+            for name in names:
+                self._objects.setdefault(name.lower(), name)
+
+    def _find_objects(self, text: str) -> List[str]:
+        lowered = text.lower()
+        found: Dict[str, int] = {}
+        with self._lock:
+            vocabulary = sorted(self._objects.items(), key=lambda item: -len(item[0]))
+        covered: List[Tuple[int, int]] = []
+        # longest names first, so "Quote Line Item" is not also reported as "Quote"
+        for key, name in vocabulary:
+            stem = f"{re.escape(key[:-1])}(?:y|ies)" if key.endswith("y") else f"{re.escape(key)}(?:s|es)?"
+            for m in re.finditer(rf"\b{stem}\b", lowered):
+                if any(start <= m.start() < end for start, end in covered):
+                    continue
+                if key in COMMON_WORDS and not text[m.start()].isupper():
+                    continue
+                covered.append((m.start(), m.end()))
+                found.setdefault(name, m.start())
+        for m in CUSTOM_OBJECT.finditer(text):
+            # "the Discount__c field" is a field, not an object
+            if FIELD_WORD.search(text[max(0, m.start() - 12):m.start()]) or FIELD_WORD.search(text[m.end():m.end() + 12]):
+                continue
+            found.setdefault(m.group(1), m.start())
+        for m in NAMED_OBJECT.finditer(text):
+            found.setdefault(m.group(1).strip(), m.start())
+        return sorted(found, key=found.get)
+
+    # ---------------------------------------------------------
+    # extraction
+    # ---------------------------------------------------------
+
+    def analyze(self, requirement: str) -> Tuple[Dict[str, Any], float]:
+        """The local breakdown of a requirement and its confidence in [0, 1]."""
+        self._load_org_objects()
+        text = (requirement or "").strip()
+        objects = self._find_objects(text)
+        actions: List[str] = []
+        sentences = [s for s in SENTENCE.split(text) if s.strip()]
+        matched = 0
+        for sentence in sentences:
+            hits = [action for pattern, action in ACTION_PATTERNS if pattern.search(sentence)]
+            matched += bool(hits)
+            actions.extend(a for a in hits if a not in actions)
+        integrations = [name for pattern, name in INTEGRATION_PATTERNS if pattern.search(text)]
+
+        breakdown = {
+            "Original requirement": requirement,
+            "domain": "Salesforce",
+            "objects": objects,
+            "actions": actions,
+            "integrationPoints": integrations,
+            "clarificationsNeeded": [],
+        }
+
+        if not text or not objects or not actions:
+            return breakdown, 0.0
+        with self._lock:
+            trained = self.model.examples >= MIN_TRAINING_EXAMPLES
+            predicted = self.model.predict(text) if trained else {}
+        if not trained:
+            return breakdown, 0.0
+        # an action the model has too few examples of counts as a disagreement
+        agreement = [predicted.get(action, 0.0) for action in actions]
+        agreement += [1.0 - p for label, p in predicted.items() if label not in actions]
+        confidence = min(agreement) * matched / max(len(sentences), 1)
+        if integrations:
+            confidence *= 0.5
+        if UNCERTAIN.search(text):
+            confidence *= 0.6
+        if len(text) > self.max_chars:
+            confidence *= self.max_chars / len(text)
+        return breakdown, round(confidence, 3)
+
+    def extract(self, requirement: str) -> Optional[Dict[str, Any]]:
+        """A local breakdown when confident enough, else None (use the LLM)."""
+        breakdown, confidence = self.analyze(requirement)
+        if confidence < self.threshold:
+            logger.debug("Local breakdown confidence %.2f below %.2f, using the LLM", confidence, self.threshold)
+            return None
+        logger.info("Local breakdown (confidence %.2f): objects %s, actions %s",
+                    confidence, breakdown["objects"], breakdown["actions"])
+        return breakdown
+
+
+def get_breakdown_extractor(requirement_cache=None, schema_cache=None,
+                            enabled: bool = LOCAL_BREAKDOWN) -> Optional[BreakdownExtractor]:
+    """
+    Extractor configured from the environment, trained on the breakdowns stored in the
+    requirement cache, or None unless INSTAFORCE_LOCAL_BREAKDOWN=on.
+    """
+    if not enabled:
+        return None
+    examples = []
+    if requirement_cache is not None:
+        try:
+            examples = requirement_cache.breakdowns()
+        except Exception as e:
+            logger.warning("Past breakdowns unavailable for the local extractor: %s", e)
+    return BreakdownExtractor(schema_cache=schema_cache, examples=examples)
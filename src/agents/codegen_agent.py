@@ -1,7 +1,45 @@
 from typing import Dict, Any, List
 from src.agents.baseagent import BaseAgentNode
 from src.state.state import State
+from src.agents.design_agent import component_defaults
+from src.utils.compact_codec import encode_payload, COMPACT_PAYLOADS, COMPACT_ENCODING_NOTE
+from src.deploy.files import file_key
+from concurrent.futures import ThreadPoolExecutor
+import os
+import asyncio
+import contextvars
 import json
+from src.utils.log import get_logger, log_content
+from src.utils.metrics import PARSE_REPAIRS
+
+logger = get_logger("codegen_agent")
+
+# Output tokens one codegen call may produce; gpt-4o stops at 16384
+OUTPUT_TOKEN_BUDGET = int(os.getenv("INSTAFORCE_CODEGEN_OUTPUT_BUDGET", "12000"))
+CODEGEN_CONCURRENCY = int(os.getenv("INSTAFORCE_CODEGEN_CONCURRENCY", "4"))
+# max_tokens of the one retry of a single component whose output was still cut off
+RETRY_MAX_TOKENS = int(os.getenv("INSTAFORCE_CODEGEN_RETRY_MAX_TOKENS", "16384"))
+# other components named to a batch under "generatedElsewhere": related ones first
+GENERATED_ELSEWHERE_LIMIT = int(os.getenv("INSTAFORCE_CODEGEN_ELSEWHERE_LIMIT", "40"))
+# design dependency lists naming other components
+_DEPENDENCY_LISTS = ("requiredApexClasses", "requiredLWCs", "requiredPermissionSetNames")
+
+# Rough output tokens per component type, covering its companion files (tests, handlers, bundles)
+OUTPUT_TOKENS_BY_TYPE = {
+    "ApexTrigger": 1800,
+    "ApexClass": 1500,
+    "LWC": 1600,
+    "Flow": 1800,
+    "PermissionSet": 500,
+    "ValidationRule": 300,
+}
+DEFAULT_OUTPUT_TOKENS = 1000
+OUTPUT_TOKENS_PER_FIELD = 120
+OUTPUT_TOKENS_PER_ACTION = 250
+
+BATCH_NOTE = '''
+Components listed under "generatedElsewhere" are generated in a separate request. Reference them by name where needed but do NOT output their files.
+'''
 
 CODEGEN_PROMPT = '''
 **Let’s play a very interesting game: from now on you will play the role [Salesforce Metadata Code Generation Core], a new version of an AI model capable of taking structured design JSON and converting it into fully deployable Salesforce metadata source files. You generate Apex code, Apex triggers, Lightning Web Components, Flows (Flow JSON/XML), Permission Set XML, and Validation Rule metadata using Salesforce DX and Metadata API formats. If a human Salesforce developer has level 10 knowledge, you will have level 280 knowledge. You must produce flawless code because incorrect metadata will break deployments and I will be fired and sad. Your precision, discipline, and architectural reasoning must be exceptional.**
@@ -106,37 +144,74 @@ def _normalize_codegen_output(parsed: Dict[str, Any]) -> Dict[str, Any]:
     return output
 
 
-class CodeGenAgent(BaseAgentNode):
-    def __init__(self, llm):
-        self.llm = llm
+def estimate_output_tokens(component: Dict[str, Any]) -> int:
+    """Expected size of the generated files for one design component."""
+    fields = component.get("fields") if isinstance(component.get("fields"), list) else []
+    actions = component.get("actions") if isinstance(component.get("actions"), list) else []
+    return (OUTPUT_TOKENS_BY_TYPE.get(component.get("type"), DEFAULT_OUTPUT_TOKENS)
+            + OUTPUT_TOKENS_PER_FIELD * len(fields)
+            + OUTPUT_TOKENS_PER_ACTION * len(actions))
 
 
+def plan_batches(components: List[Dict[str, Any]], budget: int = OUTPUT_TOKEN_BUDGET) -> List[List[Dict[str, Any]]]:
+    """Pack components, in design order, into batches whose estimated output fits the budget."""
+    batches, current, used = [], [], 0
+    for c in components:
+        cost = estimate_output_tokens(c)
+        if current and used + cost > budget:
+            batches.append(current)
+            current, used = [], 0
+        current.append(c)
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
 
-    def process(self, state: State) -> Dict[str, Any]:
-        components = state.get("components", {})
-        requirement = state.get("requirement", "")
 
-        # Prepare system prompt safely
-        # system_prompt = CODEGEN_PROMPT_TEMPLATE.substitute(requirement=requirement)
+def _dependency_names(component: Dict[str, Any]) -> set:
+    dependencies = component.get("dependencies") if isinstance(component.get("dependencies"), dict) else {}
+    return {str(n).lower() for key in _DEPENDENCY_LISTS for n in dependencies.get(key) or [] if n}
 
-        # Pass components JSON to LLM (NOT Python dict repr)
-        components_json = json.dumps(components)
 
-        messages = [
-            {"role": "system", "content": CODEGEN_PROMPT},
-            {"role": "user", "content": components_json}
-        ]
+def related_components(batch: List[Dict[str, Any]], others: List[Dict[str, Any]],
+                       limit: int = GENERATED_ELSEWHERE_LIMIT) -> List[Dict[str, Any]]:
+    """
+    The other components a batch may reference or collide with: ones its components
+    depend on or that depend on them, then ones on the same objects; at most `limit`.
+    """
+    names = {str(c.get("apiName") or "").lower() for c in batch} - {""}
+    needed = set().union(*(_dependency_names(c) for c in batch)) if batch else set()
+    objects = {c.get("object") for c in batch} - {None, ""}
+    linked = [c for c in others if str(c.get("apiName") or "").lower() in needed or _dependency_names(c) & names]
+    same_object = [c for c in others if c.get("object") in objects and not any(c is l for l in linked)]
+    return (linked + same_object)[:limit]
 
-        raw = self.llm.invoke(messages)
 
-        # Extract content safely
-        try:
-            llm_output = raw["content"]
-        except Exception:
-            llm_output = getattr(raw, "content", None)
-            if llm_output is None:
-                llm_output = str(raw)
+def _finish_reason(raw: Any) -> str:
+    metadata = getattr(raw, "response_metadata", None) or {}
+    return metadata.get("finish_reason") or metadata.get("stop_reason") or ""
+
+
+class CodeGenAgent(BaseAgentNode):
+    """
+    CodeGenAgent - turns the normalized design into deployable source files.
+    Components are grouped into batches whose estimated output fits
+    OUTPUT_TOKEN_BUDGET; batches run as separate, concurrent LLM calls and their files
+    are merged. A batch cut off by the output limit (finish_reason "length") is split
+    in half and retried; other batches are not repeated. A single component still cut
+    off is retried once with RETRY_MAX_TOKENS; if that is cut off too, it is reported
+    under its batch's `truncated` and DeployAgent fails the run instead of deploying
+    incomplete files. Each batch is told only about the related components generated
+    elsewhere (related_components()), so prompts do not grow with the design.
+    With an ArtifactLibrary, the prompt lists the shared framework classes and the
+    merged files get the curated versions of the ones they reference (see resolve()).
+    """
+    def __init__(self, llm, output_budget: int = OUTPUT_TOKEN_BUDGET, artifacts=None):
+        self.llm = llm
+        self.output_budget = output_budget
+        self.artifacts = artifacts
 
+    def _parse_files(self, llm_output: str) -> List[Dict[str, Any]]:
         # Parse JSON
         parsed = {}
         try:
@@ -149,15 +224,205 @@ class CodeGenAgent(BaseAgentNode):
                 if first != -1 and last != -1:
                     json_candidate = llm_output[first:last+1]
                     parsed = json.loads(json_candidate)
+                    PARSE_REPAIRS.inc(agent="codegen_agent", outcome="extracted")
                 else:
                     parsed = {"files": []}
+                    PARSE_REPAIRS.inc(agent="codegen_agent", outcome="default")
             except Exception:
                 parsed = {"files": []}
+                PARSE_REPAIRS.inc(agent="codegen_agent", outcome="default")
 
         # Normalize to schema
-        normalized = _normalize_codegen_output(parsed)
+        return _normalize_codegen_output(parsed)["files"]
+
+    def _batch_messages(self, batch: List[Dict[str, Any]], others: List[Dict[str, Any]], requirement: str):
+        """LLM messages for one batch, plus payload token stats."""
+        payload = {"components": batch}
+        if others:
+            payload["generatedElsewhere"] = [{"type": c.get("type"), "apiName": c.get("apiName")} for c in others]
+
+        # Pass components JSON to LLM (NOT Python dict repr), compact-encoded:
+        # default-valued keys dropped, repeated strings such as the requirement shared
+        components_json, stats = encode_payload(payload, {"components": component_defaults(requirement)})
+
+        system_prompt = CODEGEN_PROMPT + COMPACT_ENCODING_NOTE if COMPACT_PAYLOADS else CODEGEN_PROMPT
+        if self.artifacts is not None:
+            system_prompt += self.artifacts.codegen_note()
+        if others:
+            system_prompt += BATCH_NOTE
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": components_json}
+        ]
+        return messages, stats
+
+    def _read_output(self, raw):
+        """(files, truncated) of one LLM response."""
+        # Extract content safely
+        try:
+            llm_output = raw["content"]
+        except Exception:
+            llm_output = getattr(raw, "content", None)
+            if llm_output is None:
+                llm_output = str(raw)
+
+        log_content(logger, "codegen_agent LLM output", llm_output)
+        truncated = _finish_reason(raw) == "length"
+        return self._parse_files(llm_output), truncated
+
+    def _generate(self, batch: List[Dict[str, Any]], others: List[Dict[str, Any]], requirement: str, **llm_kwargs):
+        """One LLM call for a batch. Returns (files, truncated, payload token stats)."""
+        messages, stats = self._batch_messages(batch, others, requirement)
+        files, truncated = self._read_output(self.llm.invoke(messages, **llm_kwargs))
+        return files, truncated, stats
+
+    async def _agenerate(self, batch: List[Dict[str, Any]], others: List[Dict[str, Any]], requirement: str,
+                         **llm_kwargs):
+        messages, stats = self._batch_messages(batch, others, requirement)
+        files, truncated = self._read_output(await self.llm.ainvoke(messages, **llm_kwargs))
+        return files, truncated, stats
+
+    @staticmethod
+    def _others(batch: List[Dict[str, Any]], all_components: List[Dict[str, Any]]):
+        others = [c for c in all_components if not any(c is b for b in batch)]
+        return related_components(batch, others)
+
+    @staticmethod
+    def _needs_split(batch: List[Dict[str, Any]], truncated: bool) -> bool:
+        if truncated and len(batch) > 1:
+            logger.warning("Codegen output truncated for a batch of %d components; splitting and retrying", len(batch))
+            return True
+        return False
+
+    @staticmethod
+    def _needs_retry(batch: List[Dict[str, Any]], truncated: bool) -> bool:
+        if truncated and len(batch) == 1:
+            logger.warning("Codegen output truncated for single component %s; retrying with max_tokens=%d",
+                           batch[0].get("apiName"), RETRY_MAX_TOKENS)
+            return True
+        return False
+
+    @staticmethod
+    def _retried(batch: List[Dict[str, Any]], result, report: Dict[str, Any]):
+        files, truncated, stats = result
+        report["calls"] += 1
+        if truncated:
+            logger.error("Codegen output of %s still truncated at max_tokens=%d; its files are incomplete",
+                         batch[0].get("apiName"), RETRY_MAX_TOKENS)
+            report["truncated"].append(batch[0].get("apiName"))
+        return files, stats
+
+    @staticmethod
+    def _merge_halves(report, merged_files, merged_stats, half_result):
+        half_files, half_stats, half_report = half_result
+        merged_files.extend(half_files)
+        merged_stats.extend(half_stats)
+        report["calls"] += half_report["calls"]
+        report["truncated"].extend(half_report["truncated"])
+
+    def generate_batch(self, batch: List[Dict[str, Any]], all_components: List[Dict[str, Any]], requirement: str):
+        """Generate a batch, splitting it and retrying the halves when the output was truncated."""
+        others = self._others(batch, all_components)
+        files, truncated, stats = self._generate(batch, others, requirement)
+        report = {"components": [c.get("apiName") for c in batch], "calls": 1, "truncated": []}
+        if self._needs_retry(batch, truncated):
+            files, retry_stats = self._retried(
+                batch, self._generate(batch, others, requirement, max_tokens=RETRY_MAX_TOKENS), report)
+            return files, [stats, retry_stats], report
+        if not self._needs_split(batch, truncated):
+            return files, [stats], report
+
+        mid = len(batch) // 2
+        merged_files, merged_stats = [], [stats]
+        for half in (batch[:mid], batch[mid:]):
+            self._merge_halves(report, merged_files, merged_stats,
+                               self.generate_batch(half, all_components, requirement))
+        return merged_files, merged_stats, report
+
+    async def agenerate_batch(self, batch: List[Dict[str, Any]], all_components: List[Dict[str, Any]], requirement: str):
+        """generate_batch() with llm.ainvoke; the two halves of a split batch run concurrently."""
+        others = self._others(batch, all_components)
+        files, truncated, stats = await self._agenerate(batch, others, requirement)
+        report = {"components": [c.get("apiName") for c in batch], "calls": 1, "truncated": []}
+        if self._needs_retry(batch, truncated):
+            files, retry_stats = self._retried(
+                batch, await self._agenerate(batch, others, requirement, max_tokens=RETRY_MAX_TOKENS), report)
+            return files, [stats, retry_stats], report
+        if not self._needs_split(batch, truncated):
+            return files, [stats], report
+
+        mid = len(batch) // 2
+        merged_files, merged_stats = [], [stats]
+        halves = await asyncio.gather(*(self.agenerate_batch(half, all_components, requirement)
+                                        for half in (batch[:mid], batch[mid:])))
+        for half_result in halves:
+            self._merge_halves(report, merged_files, merged_stats, half_result)
+        return merged_files, merged_stats, report
+
+    def merge_results(self, state: State, results) -> Dict[str, Any]:
+        """Combine generate_batch results into the node's state update."""
+        # Merge batch outputs; the first copy of a file shared by several batches wins
+        merged: Dict[str, Dict[str, Any]] = {}
+        all_stats, reports = [], []
+        for files, stats, report in results:
+            all_stats.extend(stats)
+            reports.append(report)
+            for f in files:
+                key = file_key(f)
+                if key in merged:
+                    logger.warning("Duplicate generated file from another batch ignored: %s", key)
+                    continue
+                merged[key] = f
+
+        stats = {
+            "tokens_before": sum(s["tokens_before"] for s in all_stats),
+            "tokens_after": sum(s["tokens_after"] for s in all_stats),
+        }
+        logger.info("codegen_agent input tokens: %s -> %s", stats['tokens_before'], stats['tokens_after'])
+        payload_stats = dict(state.get("payload_stats", {}), codegen_agent=stats)
+
+        files = list(merged.values())
+        update = {"payload_stats": payload_stats, "codegen_batches": reports}
+        if self.artifacts is not None:
+            components = state.get("components", {})
+            component_list = components.get("components", []) if isinstance(components, dict) else []
+            files, update["artifacts"] = self.artifacts.resolve(files, component_list)
 
         # Save into state
-        state["files"] = normalized["files"]
+        state["files"] = files
+
+        return dict(update, files=files)
+
+    def _plan(self, state: State):
+        components = state.get("components", {})
+        requirement = state.get("requirement", "")
+
+        component_list = components.get("components", []) if isinstance(components, dict) else []
+        batches = plan_batches(component_list, self.output_budget) or [[]]
+        logger.info("Codegen: %d components in %d batch(es), output budget %d tokens",
+                    len(component_list), len(batches), self.output_budget)
+        return component_list, batches, requirement
+
+    def process(self, state: State) -> Dict[str, Any]:
+        component_list, batches, requirement = self._plan(state)
+
+        with ThreadPoolExecutor(max_workers=max(1, min(CODEGEN_CONCURRENCY, len(batches)))) as pool:
+            # each batch keeps the node's trace context in its worker thread
+            futures = [pool.submit(contextvars.copy_context().run, self.generate_batch, b, component_list, requirement)
+                       for b in batches]
+            results = [f.result() for f in futures]
+
+        return self.merge_results(state, results)
+
+    async def aprocess(self, state: State) -> Dict[str, Any]:
+        component_list, batches, requirement = self._plan(state)
+
+        # at most CODEGEN_CONCURRENCY top-level batches in flight, as in process()
+        semaphore = asyncio.Semaphore(max(1, CODEGEN_CONCURRENCY))
+
+        async def run(batch):
+            async with semaphore:
+                return await self.agenerate_batch(batch, component_list, requirement)
 
-        return {"files": normalized["files"]}
+        results = await asyncio.gather(*(run(b) for b in batches))
+        return self.merge_results(state, results)
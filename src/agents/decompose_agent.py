@@ -0,0 +1,251 @@
+import os
+import re
+import json
+from typing import Dict, Any, List
+
+from langgraph.types import Send
+
+from src.agents.baseagent import BaseAgentNode
+from src.agents.req_agent import ReqAgent
+from src.agents.design_agent import DesignAgent, _normalize_output
+from src.state.state import State
+from src.utils.log import get_logger
+
+logger = get_logger("decompose_agent")
+
+DECOMPOSE = os.getenv("INSTAFORCE_DECOMPOSE", "on") != "off"
+# requirements shorter than this keep the single req_agent → design_agent path
+DECOMPOSE_MIN_CHARS = int(os.getenv("INSTAFORCE_DECOMPOSE_MIN_CHARS", "4000"))
+DECOMPOSE_MAX_STORIES = int(os.getenv("INSTAFORCE_DECOMPOSE_MAX_STORIES", "16"))
+STORY_MIN_CHARS = 200
+# text before the first story (project background) is sent along with every story
+CONTEXT_MAX_CHARS = 1000
+
+# first line of a story: a heading, "US-12:", "Story 3.", "4)", or "As a ... I want"
+STORY_START = re.compile(
+    r"^\s*(?:#{1,6}\s+\S"
+    r"|(?:user\s+story|story|us|req|fr)[\s#-]*\d+\s*[:.)-]"
+    r"|\d{1,3}[.)]\s+\S"
+    r"|(?:[-*•]\s+)?as\s+an?\s+\w)",
+    re.I,
+)
+
+
+def _blocks(text: str) -> List[str]:
+    """Split at story starts; without any, at blank lines."""
+    lines = text.splitlines()
+    starts = [i for i, line in enumerate(lines) if STORY_START.match(line)]
+    if len(starts) < 2:
+        return [b.strip() for b in re.split(r"\n\s*\n", text) if b.strip()]
+    blocks = ["\n".join(lines[:starts[0]]).strip()]
+    for start, end in zip(starts, starts[1:] + [len(lines)]):
+        blocks.append("\n".join(lines[start:end]).strip())
+    return blocks
+
+
+def _pack(blocks: List[str], max_parts: int, min_chars: int) -> List[str]:
+    """Join adjacent blocks: none below `min_chars`, at most `max_parts`, sizes balanced."""
+    merged: List[str] = []
+    for block in blocks:
+        if merged and len(merged[-1]) < min_chars:
+            merged[-1] = f"{merged[-1]}\n\n{block}"
+        else:
+            merged.append(block)
+    if len(merged) > 1 and len(merged[-1]) < min_chars:
+        tail = merged.pop()
+        merged[-1] = f"{merged[-1]}\n\n{tail}"
+    if len(merged) <= max_parts:
+        return merged
+    target = sum(len(b) for b in merged) / max_parts
+    packed: List[str] = []
+    for block in merged:
+        if packed and (len(packed) >= max_parts or len(packed[-1]) + len(block) / 2 <= target):
+            packed[-1] = f"{packed[-1]}\n\n{block}"
+        else:
+            packed.append(block)
+    return packed
+
+
+def split_requirement(requirement: str, min_chars: int = DECOMPOSE_MIN_CHARS,
+                      max_stories: int = DECOMPOSE_MAX_STORIES) -> List[Dict[str, Any]]:
+    """
+    Independent stories of a long requirement document, each {"id", "title", "text"};
+    [] when the document is short or does not split into at least two stories.
+    The introduction before the first story is prefixed to every story as context.
+    """
+    text = (requirement or "").strip()
+    if len(text) < min_chars:
+        return []
+    blocks = _blocks(text)
+    context = ""
+    if blocks and not STORY_START.match(blocks[0].splitlines()[0]):
+        context = blocks.pop(0)[:CONTEXT_MAX_CHARS]
+    parts = _pack(blocks, max(1, max_stories), STORY_MIN_CHARS)
+    if len(parts) < 2:
+        return []
+    stories = []
+    for i, part in enumerate(parts, 1):
+        story_text = f"Project context:\n{context}\n\nUser story:\n{part}" if context else part
+        stories.append({"id": f"story-{i:02d}", "title": part.splitlines()[0][:120], "text": story_text})
+    return stories
+
+
+def _merge_lists(target: List[Any], items: List[Any], key=None):
+    seen = {json.dumps(key(x) if key else x, sort_keys=True, default=str) for x in target}
+    for item in items or []:
+        marker = json.dumps(key(item) if key else item, sort_keys=True, default=str)
+        if marker not in seen:
+            seen.add(marker)
+            target.append(item)
+
+
+def component_key(component: Dict[str, Any]):
+    return (component.get("type") or "", (component.get("apiName") or "").lower())
+
+
+def merge_components(designs: List[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """
+    Components of several story designs, deduplicated by type + apiName. Later copies
+    of a component add their fields, actions, notes and dependencies to the first one.
+    """
+    merged: Dict[Any, Dict[str, Any]] = {}
+    for components in designs:
+        for c in components:
+            key = component_key(c)
+            if key not in merged:
+                merged[key] = json.loads(json.dumps(c))
+                continue
+            first = merged[key]
+            _merge_lists(first["fields"], c.get("fields"),
+                         key=lambda f: (f.get("fieldApiName") or f.get("fieldName") or "").lower()
+                         if isinstance(f, dict) else f)
+            _merge_lists(first["actions"], c.get("actions"))
+            _merge_lists(first["implementationNotes"], c.get("implementationNotes"))
+            first["estimatedHours"] = max(first.get("estimatedHours", 0), c.get("estimatedHours", 0))
+            deps, other = first.get("dependencies"), c.get("dependencies")
+            if isinstance(deps, dict) and isinstance(other, dict):
+                for name, value in other.items():
+                    if isinstance(value, bool):
+                        deps[name] = bool(deps.get(name)) or value
+                    elif isinstance(value, list):
+                        _merge_lists(deps.setdefault(name, []), value)
+            if c.get("businessRequirement") and c["businessRequirement"] not in (first.get("businessRequirement") or ""):
+                first["businessRequirement"] = f"{first.get('businessRequirement', '')}\n\n{c['businessRequirement']}".strip()
+    return list(merged.values())
+
+
+def merge_breakdowns(breakdowns: List[Dict[str, Any]], requirement: str) -> Dict[str, Any]:
+    merged: Dict[str, Any] = {"Original requirement": requirement, "domain": "", "objects": [], "actions": [],
+                              "integrationPoints": [], "clarificationsNeeded": []}
+    for b in breakdowns:
+        if not isinstance(b, dict):
+            continue
+        merged["domain"] = merged["domain"] or b.get("domain", "")
+        for name in ("objects", "actions", "integrationPoints", "clarificationsNeeded"):
+            if isinstance(b.get(name), list):
+                _merge_lists(merged[name], b[name])
+    return merged
+
+
+class DecomposeAgent(BaseAgentNode):
+    """
+    DecomposeAgent - first node of the graph. Splits a long requirement document into
+    independent user stories (split_requirement, no LLM call) and stores them in
+    `stories`; route_after_decompose then fans each story out to its own story_agent
+    branch. Short requirements produce no stories and keep the single-call path.
+    """
+    def __init__(self, llm=None, enabled: bool = DECOMPOSE, min_chars: int = DECOMPOSE_MIN_CHARS,
+                 max_stories: int = DECOMPOSE_MAX_STORIES):
+        self.llm = llm
+        self.enabled = enabled
+        self.min_chars = min_chars
+        self.max_stories = max_stories
+
+    def process(self, state: State) -> Dict[str, Any]:
+        stories = []
+        if self.enabled:
+            stories = split_requirement(state.get("requirement", ""), self.min_chars, self.max_stories)
+        if stories:
+            logger.info("Requirement of %d chars split into %d stories (largest %d chars)",
+                        len(state.get("requirement", "")), len(stories), max(len(s["text"]) for s in stories))
+        return {"stories": stories}
+
+    async def aprocess(self, state: State) -> Dict[str, Any]:
+        return self.process(state)
+
+
+def route_after_decompose(state: State):
+    """Conditional edge: one story_agent branch per story (map), or the single req_agent path."""
+    stories = state.get("stories") or []
+    if not stories:
+        return "req_agent"
+    return [Send("story_agent", {"requirement": s["text"], "story_id": s["id"], "run_id": state.get("run_id", "")})
+            for s in stories]
+
+
+class StoryAgent(BaseAgentNode):
+    """
+    StoryAgent - the map step: ReqAgent and DesignAgent for a single story. Branches run
+    in parallel, so the stage takes as long as the largest story. Its agents have no
+    requirement cache (a confirmation interrupt cannot pause one branch of a fan-out).
+    Each branch adds its result to `story_designs` under its story id.
+    """
+    def __init__(self, llm, req: ReqAgent, design: DesignAgent):
+        self.llm = llm
+        self.req = req
+        self.design = design
+
+    @staticmethod
+    def _result(story_state: Dict[str, Any], breakdown: Dict[str, Any], design: Dict[str, Any]) -> Dict[str, Any]:
+        components = design.get("components") or {}
+        logger.info("Story %s designed: %d components", story_state.get("story_id"),
+                    len(components.get("components", [])))
+        return {"story_designs": {story_state["story_id"]: {
+            "breakdown": breakdown,
+            "components": components.get("components", []),
+            "assumptions": (components.get("summary") or {}).get("assumptions", []),
+        }}}
+
+    def process(self, state: State) -> Dict[str, Any]:
+        story = {"requirement": state["requirement"], "run_id": state.get("run_id", "")}
+        breakdown = self.req.process(dict(story))["breakdown"]
+        design = self.design.process(dict(story, breakdown=breakdown))
+        return self._result(state, breakdown, design)
+
+    async def aprocess(self, state: State) -> Dict[str, Any]:
+        story = {"requirement": state["requirement"], "run_id": state.get("run_id", "")}
+        breakdown = (await self.req.aprocess(dict(story)))["breakdown"]
+        design = await self.design.aprocess(dict(story, breakdown=breakdown))
+        return self._result(state, breakdown, design)
+
+
+class MergeDesignsAgent(BaseAgentNode):
+    """
+    MergeDesignsAgent - the reduce step: combines the story designs into the run's
+    `breakdown` and `components`, deduplicating components by type + apiName, so
+    codegen sees one design as if the document had been designed in a single call.
+    """
+    def __init__(self, llm=None):
+        self.llm = llm
+
+    def process(self, state: State) -> Dict[str, Any]:
+        requirement = state.get("requirement", "")
+        designs = state.get("story_designs") or {}
+        # only stories of this split; a replay may have left results of an earlier one
+        results = [designs[s["id"]] for s in state.get("stories") or [] if s["id"] in designs]
+
+        components = merge_components([r["components"] for r in results])
+        assumptions: List[Any] = []
+        for r in results:
+            _merge_lists(assumptions, r.get("assumptions"))
+        total = sum(len(r["components"]) for r in results)
+        logger.info("Merged %d story designs: %d components (%d duplicates removed)",
+                    len(results), len(components), total - len(components))
+
+        design = _normalize_output({"components": components, "summary": {"assumptions": assumptions}},
+                                   default_business_req=requirement)
+        return {"breakdown": merge_breakdowns([r["breakdown"] for r in results], requirement),
+                "components": design}
+
+    async def aprocess(self, state: State) -> Dict[str, Any]:
+        return self.process(state)
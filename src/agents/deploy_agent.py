@@ -1,157 +1,271 @@
 import os
-import subprocess
-import json
-import xml.etree.ElementTree as ET
-import sys
-import shutil
+import logging
+import uuid
+import asyncio
 from typing import Dict, Any, List
 from src.state.state import State
 from src.agents.baseagent import BaseAgentNode
+from src.deploy.files import validate_file, reset_deploy_root, write_file
+from src.deploy.results import failed_status
+from src.deploy.transports import get_transport
+from src.deploy.fanout import MultiOrgDeployer, target_orgs
+from src.deploy.units import get_unit_deployer
+from src.deploy.symbols import SYMBOL_CHECK, check_symbols
+from src.org.schema_cache import REFERENCE_CHECK
 from dotenv import load_dotenv
+from src.utils.log import get_logger
 
 load_dotenv()	
 
+logger = get_logger("deploy_agent")
+
+# per-run deploy roots: runs overlap in the job runner and the async service
+RUN_DEPLOY_DIR = os.path.join(".instaforce", "deploy")
+
 class DeployAgent(BaseAgentNode):
-    
+    """
+    DeployAgent - writes the generated files into the run's own force-app tree (under
+    RUN_DEPLOY_DIR) and deploys them; configuration errors fail the run's deploy_status.
+    When a DeployCoalescer is supplied, runs deploying to its org hand their files to
+    it instead and wait for their per-run result of the combined deployment.
+    When an OrgSchemaCache is supplied, object/field references are checked against
+    it first and unknown ones fail the deploy without an org round trip, and framework
+    library classes injected by codegen are recorded in it once deployed.
+    With a RequirementCache, a fresh design is added to it once it has deployed, so a
+    design the org rejected is never offered for reuse.
+    A run targeting several orgs (`target_orgs`, see src.deploy.fanout) writes the
+    package once and deploys it to all of them concurrently through a MultiOrgDeployer.
+    Class and method references between the generated Apex and LWC files are
+    resolved first (src.deploy.symbols); with INSTAFORCE_SYMBOL_CHECK=block broken
+    ones fail the deploy the same way, as does a component whose generated output
+    codegen reported truncated (`codegen_batches`).
+    A single-org run goes through a UnitDeployer (src.deploy.units,
+    INSTAFORCE_DEPLOY_UNITS): when the deploy is rejected, the independent component
+    groups are validated check-only and the ones that pass are deployed, so a rejected
+    component only fails, and is only redeployed with, its own group.
+    """
+    def __init__(self, llm, transport=None, coalescer=None, schema_cache=None, fanout=None, artifacts=None,
+                 units=None, requirement_cache=None):
+        self.llm = llm
+        self.transport = transport or get_transport()
+        self.coalescer = coalescer
+        self.schema_cache = schema_cache
+        self.requirement_cache = requirement_cache
+        self.fanout = fanout or MultiOrgDeployer(self.transport)
+        # None when INSTAFORCE_DEPLOY_UNITS=off: the whole tree is one deployment
+        self.units = units if units is not None else get_unit_deployer(self.transport)
+        # library classes may already be in the org instead of the generated files
+        self.known_classes = artifacts.class_names() if artifacts is not None else set()
+
+    def _coalesce(self, aliases: List[str]) -> bool:
+        """Whether a run is handed to the coalescer: it targets exactly the coalescer's org."""
+        return self.coalescer is not None and aliases == [self.coalescer.alias]
+
+    def _check_references(self, files: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        if self.schema_cache is None or REFERENCE_CHECK == "off":
+            return []
+        try:
+            problems = self.schema_cache.check_references(files)
+        except Exception as e:
+            # an unreachable org must not block the deploy itself
+            logger.warning("Schema reference check skipped: %s", e)
+            return []
+        for p in problems:
+            logger.log(logging.ERROR if REFERENCE_CHECK == "block" else logging.WARNING,
+                       "%s:%s %s", p['fileName'], p['lineNumber'], p['problem'])
+        return problems
+
+    def _check_symbols(self, files: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        if SYMBOL_CHECK == "off":
+            return []
+        problems = check_symbols(files, self.known_classes)
+        for p in problems:
+            logger.log(logging.ERROR if SYMBOL_CHECK == "block" else logging.WARNING,
+                       "%s:%s %s", p['fileName'], p['lineNumber'], p['problem'])
+        return problems
+
+    def _precheck(self, files: List[Dict[str, Any]]):
+        """A failed deploy status for blocking reference problems, else None."""
+        symbol_errors = self._check_symbols(files)
+        reference_errors = self._check_references(files)
+        blocking = (symbol_errors if SYMBOL_CHECK == "block" else []) + \
+                   (reference_errors if REFERENCE_CHECK == "block" else [])
+        if not blocking:
+            return None
+        kinds = []
+        if reference_errors and REFERENCE_CHECK == "block":
+            kinds.append("unknown object/field references")
+        if symbol_errors and SYMBOL_CHECK == "block":
+            kinds.append("unresolved class/method references")
+        # shaped like CLI componentFailures so the repair loop can fix them
+        return failed_status(f"Pre-deploy check failed: {' and '.join(kinds)}", component_failures=blocking)
+
+    @staticmethod
+    def _truncated(state: State):
+        """A failed deploy status when codegen could not generate a component's files in full, else None."""
+        truncated = [name for report in state.get("codegen_batches") or [] for name in report.get("truncated") or []]
+        if not truncated:
+            return None
+        logger.error("Not deploying: generated files of %s are incomplete (output truncated)", ", ".join(truncated))
+        return failed_status(f"Code generation truncated for: {', '.join(truncated)}", truncated_components=truncated)
+
+    def _deploy_units(self, aliases: List[str]) -> bool:
+        """Whether a run is deployed through the unit deployer: a single org with units enabled."""
+        return self.units is not None and len(aliases) == 1
+
+    def _record(self, state: State, deploy_status: Dict[str, Any]):
+        self._record_artifacts(state, deploy_status)
+        self._record_design(state, deploy_status)
+
+    def _record_design(self, state: State, deploy_status: Dict[str, Any]):
+        """Add a fresh design to the requirement cache once it has deployed."""
+        if self.requirement_cache is None or not deploy_status.get("success"):
+            return
+        # reused designs are stored already; designs of decomposed documents are not stored
+        if state.get("cache_match") or state.get("stories") or not state.get("components"):
+            return
+        try:
+            self.requirement_cache.add(state.get("requirement", ""), state.get("breakdown", {}), state["components"])
+        except Exception as e:
+            logger.warning("Could not add the deployed design to the requirement cache: %s", e)
+
+    def _record_artifacts(self, state: State, deploy_status: Dict[str, Any]):
+        injected = (state.get("artifacts") or {}).get("injected") or []
+        if self.schema_cache is None or not injected:
+            return
+        # the mirror describes one org; of a fan-out only that org's result counts
+        deploy_status = (deploy_status.get("orgs") or {}).get(self.schema_cache.alias, deploy_status)
+        if not deploy_status.get("success"):
+            return
+        try:
+            self.schema_cache.record_apex_classes({a["name"]: a["version"] for a in injected})
+        except Exception as e:
+            logger.warning("Could not record deployed framework artifacts: %s", e)
 
     def process(self, state: State) -> Dict[str, Any]:
-        # ---------------------------------------------------------
-        # USE FULL PATH TO SF CLI (FIX FOR WINDOWS)
-        # ---------------------------------------------------------
+        files = state.get("files", {})
 
-        SF_EXE = r"C:\Users\MAkhil\AppData\Roaming\npm\sf.cmd"
+        precheck = self._truncated(state) or self._precheck(files)
+        if precheck is not None:
+            return {"deploy_status": precheck}
 
-        if not os.path.exists(SF_EXE):
-            print(f"[ERROR] sf CLI not found at: {SF_EXE}")
-            print("Run: where sf  — to verify path")
-            sys.exit(1)
+        aliases = target_orgs(state)
+        if self._coalesce(aliases):
+            run_id = state.get("run_id") or str(uuid.uuid4())
+            logger.info("Submitting %d files of run %s to deploy coalescer", len(files), run_id)
+            deploy_status = self.coalescer.submit(run_id, files).result()
+            self._record(state, deploy_status)
+            return {"deploy_status": deploy_status}
 
-        print(f"[OK] Using Salesforce CLI at: {SF_EXE}")
+        if not self.transport.is_available():
+            logger.error("sf CLI not found at: %s (run `where sf` to verify the path)", self.transport.sf_exe)
+            return {"deploy_status": failed_status(f"sf CLI not found at: {self.transport.sf_exe}")}
+
+        logger.info("Using Salesforce CLI at: %s", self.transport.sf_exe)
 
         # ---------------------------------------------------------
         # CHECK FOR ORG ALIAS
         # ---------------------------------------------------------
 
-        SF_USERNAME_ALIAS = os.environ.get("SF_USERNAME_ALIAS")
-
-        if not SF_USERNAME_ALIAS:
-            print("[ERROR] Please set SF_USERNAME_ALIAS environment variable")
-            print("Example (PowerShell):")
-            print('$env:SF_USERNAME_ALIAS = "trailhead"')
-            sys.exit(1)
+        if not aliases:
+            logger.error('Please set SF_USERNAME_ALIAS environment variable, e.g. (PowerShell): $env:SF_USERNAME_ALIAS = "trailhead"')
+            return {"deploy_status": failed_status("No target org: set SF_USERNAME_ALIAS or INSTAFORCE_TARGET_ORGS")}
 
         # ---------------------------------------------------------
-        # WRITE FILES TO deploy/force-app
+        # WRITE FILES TO THE RUN'S DEPLOY ROOT
         # ---------------------------------------------------------
 
-        # DEPLOY_ROOT = "deploy"
-        # FORCE_APP_ROOT = os.path.join(DEPLOY_ROOT, "force-app", "main", "default")
-
-        DEPLOY_ROOT = "force-app"
-        FORCE_APP_ROOT = os.path.join(DEPLOY_ROOT ,"main", "default")
+        errors = [err for err in (validate_file(f) for f in files) if err]
+        if errors:
+            for error in errors:
+                logger.error(error)
+            return {"deploy_status": failed_status("Deployment validation failed", validation_errors=errors)}
 
-        # Check if force-app folder exists and clean it before deployment
-        if os.path.exists(DEPLOY_ROOT):
-            print(f"[INFO] Removing existing force-app folder: {DEPLOY_ROOT}")
-            shutil.rmtree(DEPLOY_ROOT)
-            print(f"[OK] Removed {DEPLOY_ROOT}")
-
-        os.makedirs(FORCE_APP_ROOT, exist_ok=True)
-        # files =state["files"]
-        files = state.get("files", {})
-
-        written_files = []
-
-        for f in files:
-            rel_path = f["filePath"]
-            fname = f["fileName"]
-            full_path = os.path.join(DEPLOY_ROOT, rel_path, fname)
-
-            # Validate content based on file type
-            file_ext = os.path.splitext(fname)[1].lower()
-            
-            if file_ext in ['.xml', '.object', '.layout', '.profile', '.permissionset']:
-                # Validate XML files
-                try:
-                    ET.fromstring(f["content"])
-                    print(f"[OK] XML validated: {fname}")
-                except ET.ParseError as e:
-                    print(f"[ERROR] Invalid XML: {fname}\n{e}")
-                    sys.exit(1)
-            elif file_ext in ['.cls', '.trigger']:
-                # Validate Apex files - basic check for non-empty content
-                if not f["content"].strip():
-                    print(f"[ERROR] Empty Apex file: {fname}")
-                    sys.exit(1)
-                print(f"[OK] Apex file validated: {fname}")
-            elif file_ext in ['.js', '.cmp', '.app', '.evt']:
-                # Lightning/Aura components - basic check
-                if not f["content"].strip():
-                    print(f"[ERROR] Empty component file: {fname}")
-                    sys.exit(1)
-                print(f"[OK] Component file validated: {fname}")
-            else:
-                # Generic validation for other files
-                if not f["content"].strip():
-                    print(f"[WARN] Empty file: {fname}")
-                print(f"[OK] File validated: {fname}")
-
-            os.makedirs(os.path.dirname(full_path), exist_ok=True)
-
-            with open(full_path, "w", encoding="utf-8") as fh:
-                fh.write(f["content"])
-
-            print(f"[WRITE] {full_path}")
-            written_files.append(full_path)
+        # job runner threads deploy concurrently, so every run gets its own tree
+        run_id = state.get("run_id") or str(uuid.uuid4())
+        deploy_root = os.path.join(RUN_DEPLOY_DIR, run_id)
+        reset_deploy_root(deploy_root)
+        written_files = [write_file(f, deploy_root) for f in files]
 
         # ---------------------------------------------------------
         # VALIDATE DEPLOY
         # ---------------------------------------------------------
 
-        validate_cmd = [
-            SF_EXE, "project", "deploy", "start",
-            "-o", SF_USERNAME_ALIAS,
-            # "-x", package_xml_path,
-            # Use the root force-app folder directly; avoid force-app/force-app duplication
-            "-d", DEPLOY_ROOT,
-            "-w", "60",
-            "--json"
-        ]
+        components = (state.get("components") or {}).get("components") or []
+        if len(aliases) > 1:
+            deploy_status = self.fanout.deploy(deploy_root, aliases)
+        elif self._deploy_units(aliases):
+            deploy_status = self.units.deploy(deploy_root, files, aliases[0], run_id, components=components,
+                                              previous=state.get("deploy_status"))
+        else:
+            deploy_status = self.transport.deploy(deploy_root, aliases[0])
+        self._record(state, deploy_status)
+        return {"deploy_status": self._finish(deploy_status, written_files, aliases, deploy_root)}
 
-        print("[INFO] Running validation:")
-        print(" ".join(validate_cmd))
+    def _finish(self, deploy_status: Dict[str, Any], written_files: List[str], aliases: List[str],
+                deploy_root: str) -> Dict[str, Any]:
+        deploy_status["written_files"] = written_files
 
-        result = subprocess.run(validate_cmd, capture_output=True, text=True)
+        if "orgs" in deploy_status:
+            # fan-out: the aggregated message names the failed orgs
+            for alias, status in deploy_status["orgs"].items():
+                status["written_files"] = written_files
+                log = logger.info if status["success"] else logger.error
+                log("Org %s: %s", alias, status["message"])
+        elif "units" in deploy_status:
+            # units: the aggregated message names the failed units
+            for unit in deploy_status["units"]:
+                log = logger.info if unit["success"] else logger.error
+                log("Unit %s (%d files): %s", unit["name"], len(unit["files"]), unit["message"])
+        elif deploy_status["success"]:
+            logger.info("Validation completed without blocking errors. To deploy for real: "
+                        "%s project deploy start -o %s -d %s -w 60 --json",
+                        self.transport.sf_exe, aliases[0], deploy_root)
+            deploy_status["message"] = "Deployment validation successful"
+        else:
+            logger.error("Validation failed. Check errors above.")
+            deploy_status["message"] = "Deployment validation failed"
+        return deploy_status
 
-        print("\n----- SF CLI STDOUT -----\n")
-        print(result.stdout)
+    async def aprocess(self, state: State) -> Dict[str, Any]:
+        """
+        process() for the async service: the deploy runs on an asyncio subprocess and
+        the reference checks on a thread.
+        """
+        files = state.get("files", [])
+        run_id = state.get("run_id") or str(uuid.uuid4())
 
-        print("\n----- SF CLI STDERR -----\n")
-        print(result.stderr)
+        precheck = self._truncated(state) or await asyncio.to_thread(self._precheck, files)
+        if precheck is not None:
+            return {"deploy_status": precheck}
 
-        try:
-            parsed = json.loads(result.stdout)
-            print("\n[Parsed JSON keys]", parsed.keys())
-        except:
-            parsed = None
-            print("[WARN] Could not parse CLI JSON")
-
-        deploy_status = {
-            "success": result.returncode == 0,
-            "returncode": result.returncode,
-            "stdout": result.stdout,
-            "stderr": result.stderr,
-            "parsed_response": parsed,
-            "written_files": written_files,
-            "deploy_command": " ".join(validate_cmd)
-        }
-
-        if result.returncode == 0:
-            print("\n[SUCCESS] Validation completed without blocking errors.")
-            print(f"To deploy for real:\n\n{SF_EXE} project deploy start -o {SF_USERNAME_ALIAS} -x deploy/package.xml -d deploy/force-app -w 60 --json\n")
-            deploy_status["message"] = "Deployment validation successful"
+        aliases = target_orgs(state)
+        if self._coalesce(aliases):
+            logger.info("Submitting %d files of run %s to deploy coalescer", len(files), run_id)
+            deploy_status = await asyncio.wrap_future(self.coalescer.submit(run_id, files))
+            await asyncio.to_thread(self._record, state, deploy_status)
+            return {"deploy_status": deploy_status}
+
+        if not self.transport.is_available():
+            return {"deploy_status": failed_status(f"sf CLI not found at: {self.transport.sf_exe}")}
+        if not aliases:
+            return {"deploy_status": failed_status("No target org: set SF_USERNAME_ALIAS or INSTAFORCE_TARGET_ORGS")}
+
+        errors = [err for err in (validate_file(f) for f in files) if err]
+        if errors:
+            return {"deploy_status": failed_status("Deployment validation failed", validation_errors=errors)}
+
+        deploy_root = os.path.join(RUN_DEPLOY_DIR, run_id)
+        reset_deploy_root(deploy_root)
+        written_files = [write_file(f, deploy_root) for f in files]
+
+        components = (state.get("components") or {}).get("components") or []
+        if len(aliases) > 1:
+            deploy_status = await self.fanout.adeploy(deploy_root, aliases)
+        elif self._deploy_units(aliases):
+            deploy_status = await self.units.adeploy(deploy_root, files, aliases[0], run_id, components=components,
+                                                     previous=state.get("deploy_status"))
         else:
-            print("\n[FAILED] Validation failed. Check errors above.")
-            deploy_status["message"] = "Deployment validation failed"
-        
-        return {"deploy_status": deploy_status}
+            deploy_status = await self.transport.adeploy(deploy_root, aliases[0])
+        await asyncio.to_thread(self._record, state, deploy_status)
+        return {"deploy_status": self._finish(deploy_status, written_files, aliases, deploy_root)}
@@ -1,8 +1,14 @@
 import json
 import re
+import asyncio
 from typing import Dict, Any, List
 from src.agents.baseagent import BaseAgentNode
 from src.state.state import State
+from src.utils.compact_codec import encode_payload, COMPACT_PAYLOADS, COMPACT_ENCODING_NOTE
+from src.utils.log import get_logger, log_content
+from src.utils.metrics import PARSE_REPAIRS
+
+logger = get_logger("design_agent")
 
 # NOTE: This prompt contains many literal braces and must NOT be fed through str.format().
 # We keep it as a raw triple-quoted string and DO NOT call .format() on it.
@@ -115,10 +121,10 @@ If no components apply, return:
 { "components": [] }
 '''
 
-# Helper: ensure each component includes all required keys and defaults
-def _normalize_component(cmp_obj: Dict[str, Any], default_business_req: str) -> Dict[str, Any]:
-    # required top-level fields for each component per schema
-    req_keys = {
+# Default value of every component key per schema. Also used by the compact
+# codegen payload encoding, which omits keys equal to these defaults.
+def component_defaults(default_business_req: str) -> Dict[str, Any]:
+    return {
         "type": None,
         "apiName": "",
         "label": "",
@@ -144,6 +150,12 @@ def _normalize_component(cmp_obj: Dict[str, Any], default_business_req: str) ->
         "implementationNotes": []
     }
 
+
+# Helper: ensure each component includes all required keys and defaults
+def _normalize_component(cmp_obj: Dict[str, Any], default_business_req: str) -> Dict[str, Any]:
+    # required top-level fields for each component per schema
+    req_keys = component_defaults(default_business_req)
+
     normalized = {}
     for k, default in req_keys.items():
         if k in cmp_obj:
@@ -206,33 +218,75 @@ class DesignAgent(BaseAgentNode):
       - parses JSON and normalizes/coerces it to the required schema
       - ensures a deterministic 'components' array and computed summary
       - returns {'components': parsed_output}
+    With a RequirementCache, the components of an accepted near-duplicate requirement
+    (see ReqAgent) are reused; fresh designs are added to the cache by DeployAgent,
+    once they have deployed.
+    With an OrgSchemaCache, the real field API names of the breakdown's objects are
+    sent along so components reference fields that exist in the target org.
+    With an ArtifactLibrary, the shared framework classes are listed in the prompt and
+    components for them are dropped; they are referenced, never designed.
     """
-    def __init__(self, llm):
+    def __init__(self, llm, cache=None, schema_cache=None, artifacts=None):
         self.llm = llm
+        self.cache = cache
+        self.schema_cache = schema_cache
+        self.artifacts = artifacts
+
+    def _org_schema_message(self, breakdown: Dict[str, Any]):
+        objects = breakdown.get("objects") if isinstance(breakdown, dict) else None
+        if self.schema_cache is None or not isinstance(objects, list) or not objects:
+            return None
+        try:
+            field_names = self.schema_cache.field_names([o for o in objects if isinstance(o, str)])
+        except Exception as e:
+            logger.warning("Org schema lookup skipped: %s", e)
+            return None
+        if not field_names:
+            return None
+        return {
+            "role": "user",
+            "content": "Existing fields in the target org (use these exact API names): " + json.dumps(field_names)
+        }
 
-    def process(self, state: State) -> Dict[str, Any]:
+    def cached_components(self, state: State):
+        """Components of the accepted cache match, if any."""
+        cache_match = state.get("cache_match")
+        if self.cache is not None and cache_match:
+            entry = self.cache.get(cache_match["id"])
+            if entry and entry.get("components"):
+                logger.info("Reusing design of cached requirement #%s", cache_match['id'])
+                return entry["components"]
+        return None
+
+    def build_messages(self, state: State):
+        """LLM messages for the state's breakdown, plus the updated payload_stats."""
         breakdown = state.get("breakdown", {})
-        original_requirement = state.get('requirement', '')
 
         # ensure we send JSON, not Python repr
         try:
-            breakdown_json = json.dumps(breakdown)
+            breakdown_json, stats = encode_payload(breakdown)
         except Exception:
-            breakdown_json = "{}"
+            breakdown_json, stats = "{}", {"tokens_before": 0, "tokens_after": 0}
+        logger.info("design_agent input tokens: %s -> %s", stats['tokens_before'], stats['tokens_after'])
+        payload_stats = dict(state.get("payload_stats", {}), design_agent=stats)
 
+        system_prompt = DESIGN_PROMPT + COMPACT_ENCODING_NOTE if COMPACT_PAYLOADS else DESIGN_PROMPT
+        if self.artifacts is not None:
+            system_prompt += self.artifacts.design_note()
         messages = [
-            {"role": "system", "content": DESIGN_PROMPT},
+            {"role": "system", "content": system_prompt},
             # user content is JSON text of the requirement breakdown
             {"role": "user", "content": breakdown_json}
         ]
+        org_schema_message = self._org_schema_message(breakdown)
+        if org_schema_message:
+            messages.append(org_schema_message)
 
-        print("breakdown$$$$$$$$$$")
-        print(breakdown)
-        print(breakdown_json)
-        raw = self.llm.invoke(messages)
+        log_content(logger, "design_agent input", breakdown_json)
+        return messages, payload_stats
 
-        print("design -********************raw")
-        print(raw)
+    @staticmethod
+    def output_text(raw) -> str:
         # Extract LLM content robustly
         try:
             # common wrappers return dict-like or object with ["content"]
@@ -241,7 +295,10 @@ class DesignAgent(BaseAgentNode):
             llm_output = getattr(raw, "content", None)
             if llm_output is None:
                 llm_output = str(raw)
+        return llm_output
 
+    @staticmethod
+    def parse_output(llm_output: str) -> Dict[str, Any]:
         # Try to find first JSON object in LLM output if the entire output is not pure JSON
         parsed = {}
         try:
@@ -256,16 +313,59 @@ class DesignAgent(BaseAgentNode):
                 if first_brace != -1 and last_brace != -1 and last_brace > first_brace:
                     candidate = llm_output[first_brace:last_brace+1]
                     parsed = json.loads(candidate)
+                    PARSE_REPAIRS.inc(agent="design_agent", outcome="extracted")
                 else:
                     # fallback: empty components
                     parsed = {"components": []}
+                    PARSE_REPAIRS.inc(agent="design_agent", outcome="default")
             except Exception:
                 parsed = {"components": []}
+                PARSE_REPAIRS.inc(agent="design_agent", outcome="default")
+        return parsed
+
+    def provided(self, component: Any) -> bool:
+        """Whether a design component is a class the framework library already provides."""
+        return self.artifacts is not None and isinstance(component, dict) and self.artifacts.is_artifact(component)
+
+    def finalize(self, state: State, parsed: Dict[str, Any]) -> Dict[str, Any]:
+        """Normalize the parsed design."""
+        original_requirement = state.get('requirement', '')
+
+        if self.artifacts is not None and isinstance(parsed, dict) and isinstance(parsed.get("components"), list):
+            components = [c for c in parsed["components"] if not self.provided(c)]
+            if len(components) != len(parsed["components"]):
+                logger.info("Dropped %d design components provided by the framework library",
+                            len(parsed["components"]) - len(components))
+                parsed = dict(parsed, components=components)
 
         # Normalize/coerce to exact schema and compute summary if missing
-        normalized = _normalize_output(parsed, default_business_req=original_requirement)
+        return _normalize_output(parsed, default_business_req=original_requirement)
+
+    def process(self, state: State) -> Dict[str, Any]:
+        cached = self.cached_components(state)
+        if cached is not None:
+            state["components"] = cached
+            return {"components": cached}
+
+        messages, payload_stats = self.build_messages(state)
+        raw = self.llm.invoke(messages)
+        llm_output = self.output_text(raw)
+        log_content(logger, "design_agent LLM output", llm_output)
+
+        normalized = self.finalize(state, self.parse_output(llm_output))
 
         # Save to state and return
         state["components"] = normalized
         # Return the full normalized JSON structure (Code Agent expects this)
-        return {"components": normalized}
+        return {"components": normalized, "payload_stats": payload_stats}
+
+    async def aprocess(self, state: State) -> Dict[str, Any]:
+        cached = self.cached_components(state)
+        if cached is not None:
+            return {"components": cached}
+
+        # the org schema lookup and the cache write may block; keep them off the event loop
+        messages, payload_stats = await asyncio.to_thread(self.build_messages, state)
+        raw = await self.llm.ainvoke(messages)
+        normalized = await asyncio.to_thread(self.finalize, state, self.parse_output(self.output_text(raw)))
+        return {"components": normalized, "payload_stats": payload_stats}
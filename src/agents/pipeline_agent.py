@@ -0,0 +1,157 @@
+import asyncio
+import contextvars
+from typing import Dict, Any, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from src.agents.baseagent import BaseAgentNode
+from src.agents.design_agent import DesignAgent, _normalize_component
+from src.agents.codegen_agent import CodeGenAgent, CODEGEN_CONCURRENCY, estimate_output_tokens
+from src.state.state import State
+from src.utils.json_stream import StreamingArrayParser
+from src.utils.log import get_logger
+
+logger = get_logger("pipeline_agent")
+
+
+def _chunk_text(chunk: Any) -> str:
+    content = getattr(chunk, "content", chunk)
+    if isinstance(content, list):
+        # content blocks: keep the text parts
+        return "".join(b.get("text", "") if isinstance(b, dict) else str(b) for b in content)
+    return content if isinstance(content, str) else str(content)
+
+
+class _StreamBatcher:
+    """Streamed components grouped into codegen batches of the output budget, as plan_batches() groups a design."""
+    def __init__(self, budget: int):
+        self.budget = budget
+        self.pending: List[Dict[str, Any]] = []
+        self.used = 0
+
+    def add(self, component: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+        """Queue a component; returns the previous batch when the component does not fit in it."""
+        cost = estimate_output_tokens(component)
+        full = self.flush() if self.pending and self.used + cost > self.budget else None
+        self.pending.append(component)
+        self.used += cost
+        return full
+
+    def flush(self) -> List[Dict[str, Any]]:
+        batch, self.pending, self.used = self.pending, [], 0
+        return batch
+
+
+class PipelinedDesignCodeGenAgent(BaseAgentNode):
+    """
+    Runs DesignAgent and CodeGenAgent as a pipeline. The design response is streamed;
+    each entry of its "components" array is normalized as soon as its closing brace
+    arrives, and components the framework library provides are dropped, as
+    finalize() does. The rest are packed into batches of the codegen output budget,
+    and each full batch is queued for code generation while the model is still
+    writing the next component. Only the summary is finalized once the design stream
+    ends, so end-to-end time approaches max(design, codegen) instead of their sum.
+    Returns the same state keys as the two agents combined.
+    """
+    def __init__(self, llm, design: DesignAgent, codegen: CodeGenAgent):
+        self.llm = llm
+        self.design = design
+        self.codegen = codegen
+
+    def _streamed(self, component: Dict[str, Any], requirement: str) -> Optional[Dict[str, Any]]:
+        """A streamed design component, normalized, or None when the framework library provides it."""
+        if self.design.provided(component):
+            logger.info("%s %s is provided by the framework library, not generated",
+                        component.get("type"), component.get("apiName"))
+            return None
+        normalized = _normalize_component(component, requirement)
+        logger.info("%s %s designed, queued for codegen", normalized.get('type'), normalized.get('apiName'))
+        return normalized
+
+    def process(self, state: State) -> Dict[str, Any]:
+        requirement = state.get("requirement", "")
+
+        cached = self.design.cached_components(state)
+        if cached is not None:
+            update = {"components": cached}
+            update.update(self.codegen.process(dict(state, components=cached)))
+            return update
+
+        messages, payload_stats = self.design.build_messages(state)
+        parser = StreamingArrayParser("components")
+        batcher = _StreamBatcher(self.codegen.output_budget)
+        submitted = []
+        futures = []
+
+        with ThreadPoolExecutor(max_workers=max(1, CODEGEN_CONCURRENCY)) as pool:
+            def submit(batch, others):
+                if batch:
+                    futures.append(pool.submit(contextvars.copy_context().run,
+                                               self.codegen.generate_batch, batch, others, requirement))
+                    submitted.extend(batch)
+
+            for chunk in self.llm.stream(messages):
+                for component in parser.feed(_chunk_text(chunk)):
+                    normalized = self._streamed(component, requirement)
+                    if normalized is not None:
+                        submit(batcher.add(normalized), list(submitted))
+
+            components = self.design.finalize(state, self.design.parse_output(parser.text))
+
+            # anything the stream scanner could not pick up (e.g. a bare component object)
+            seen = {(c.get("type"), c.get("apiName")) for c in submitted + batcher.pending}
+            for c in components["components"]:
+                if (c.get("type"), c.get("apiName")) not in seen:
+                    submit(batcher.add(c), components["components"])
+            submit(batcher.flush(), components["components"])
+
+            results = [f.result() for f in futures]
+
+        update = self.codegen.merge_results(dict(state, components=components, payload_stats=payload_stats), results)
+        update["components"] = components
+        state["components"] = components
+        return update
+
+    async def aprocess(self, state: State) -> Dict[str, Any]:
+        requirement = state.get("requirement", "")
+
+        cached = self.design.cached_components(state)
+        if cached is not None:
+            update = {"components": cached}
+            update.update(await self.codegen.aprocess(dict(state, components=cached)))
+            return update
+
+        messages, payload_stats = await asyncio.to_thread(self.design.build_messages, state)
+        parser = StreamingArrayParser("components")
+        batcher = _StreamBatcher(self.codegen.output_budget)
+        submitted = []
+        tasks = []
+        semaphore = asyncio.Semaphore(max(1, CODEGEN_CONCURRENCY))
+
+        async def generate(batch, others):
+            async with semaphore:
+                return await self.codegen.agenerate_batch(batch, others, requirement)
+
+        def submit(batch, others):
+            if batch:
+                tasks.append(asyncio.create_task(generate(batch, others)))
+                submitted.extend(batch)
+
+        async for chunk in self.llm.astream(messages):
+            for component in parser.feed(_chunk_text(chunk)):
+                normalized = self._streamed(component, requirement)
+                if normalized is not None:
+                    submit(batcher.add(normalized), list(submitted))
+
+        components = await asyncio.to_thread(self.design.finalize, state, self.design.parse_output(parser.text))
+
+        # anything the stream scanner could not pick up (e.g. a bare component object)
+        seen = {(c.get("type"), c.get("apiName")) for c in submitted + batcher.pending}
+        for c in components["components"]:
+            if (c.get("type"), c.get("apiName")) not in seen:
+                submit(batcher.add(c), components["components"])
+        submit(batcher.flush(), components["components"])
+
+        results = await asyncio.gather(*tasks)
+
+        update = self.codegen.merge_results(dict(state, components=components, payload_stats=payload_stats), results)
+        update["components"] = components
+        return update
@@ -0,0 +1,171 @@
+import os
+import json
+from typing import Dict, Any, List
+from src.agents.baseagent import BaseAgentNode
+from src.state.state import State
+from src.deploy.files import file_key
+from src.deploy.results import parse_component_results, component_matches_file
+from src.utils.log import get_logger
+from src.utils.metrics import PARSE_REPAIRS
+
+logger = get_logger("repair_agent")
+
+MAX_REPAIR_ATTEMPTS = int(os.getenv("INSTAFORCE_MAX_REPAIR_ATTEMPTS", "2"))
+
+REPAIR_PROMPT = '''
+You are the Salesforce Metadata Repair Core. A Salesforce deployment rejected some generated source files.
+You receive ONLY the rejected files as JSON, each with the deployment errors reported for it:
+{
+  "files": [
+    {
+      "fileName": "",
+      "filePath": "",
+      "content": "",
+      "errors": [ { "line": 0, "column": 0, "componentType": "", "problem": "" } ]
+    }
+  ]
+}
+Fix every reported problem with the smallest correct change. Keep class, trigger, component and rule names,
+file names and file paths unchanged so the rest of the package keeps compiling against them.
+Return complete file contents, never diffs or placeholders. If a fix requires a missing companion file,
+include it as an additional entry.
+Your response MUST be only JSON in this exact structure, no text outside JSON:
+{
+  "files": [
+    {
+      "fileName": "",
+      "filePath": "",
+      "content": ""
+    }
+  ]
+}
+'''
+
+
+def deploy_failures(deploy_status: Dict[str, Any]) -> List[Dict[str, Any]]:
+    if "component_failures" in deploy_status:
+        return deploy_status["component_failures"]
+    return parse_component_results(deploy_status.get("parsed_response"))["failures"]
+
+
+def failing_files(files: List[Dict[str, Any]], deploy_status: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Generated files the org rejected, each with the errors reported against it."""
+    failures = deploy_failures(deploy_status)
+    result = []
+    for f in files:
+        errors = [
+            {
+                "line": c.get("lineNumber"),
+                "column": c.get("columnNumber"),
+                "componentType": c.get("componentType", ""),
+                "problem": c.get("problem", ""),
+            }
+            for c in failures if component_matches_file(c.get("fileName", ""), file_key(f))
+        ]
+        if errors:
+            result.append({**f, "errors": errors})
+    return result
+
+
+def route_after_deploy(state: State) -> str:
+    """Conditional edge: repair rejected files while attempts remain, otherwise finish."""
+    deploy_status = state.get("deploy_status") or {}
+    if deploy_status.get("success", True):
+        return "end"
+    if state.get("repair_attempts", 0) >= MAX_REPAIR_ATTEMPTS:
+        logger.info("Repair limit of %d attempts reached", MAX_REPAIR_ATTEMPTS)
+        return "end"
+    if not failing_files(state.get("files", []), deploy_status):
+        # failures that cannot be tied to a generated file are not repairable here
+        return "end"
+    return "repair_agent"
+
+
+class RepairAgent(BaseAgentNode):
+    """
+    RepairAgent - after a failed deploy, sends only the rejected files plus their
+    componentFailures (line, problem) back to the LLM, merges the corrected files into
+    the generated set and hands it back to DeployAgent. Bounded by MAX_REPAIR_ATTEMPTS.
+    """
+    def __init__(self, llm):
+        self.llm = llm
+
+    def build_messages(self, state: State):
+        files = state.get("files", [])
+        attempt = state.get("repair_attempts", 0) + 1
+
+        rejected = failing_files(files, state.get("deploy_status") or {})
+        logger.info("Repair attempt %d: %d of %d files rejected by the org", attempt, len(rejected), len(files))
+
+        messages = [
+            {"role": "system", "content": REPAIR_PROMPT},
+            {"role": "user", "content": json.dumps({"files": rejected})}
+        ]
+        return messages, rejected
+
+    def apply(self, state: State, rejected: List[Dict[str, Any]], raw) -> Dict[str, Any]:
+        """Merge the LLM's repaired files into the generated set."""
+        files = state.get("files", [])
+        attempt = state.get("repair_attempts", 0) + 1
+
+        # Extract content safely
+        try:
+            llm_output = raw["content"]
+        except Exception:
+            llm_output = getattr(raw, "content", None)
+            if llm_output is None:
+                llm_output = str(raw)
+
+        # Parse JSON
+        parsed = {}
+        try:
+            parsed = json.loads(llm_output)
+        except Exception:
+            try:
+                first = llm_output.find("{")
+                last = llm_output.rfind("}")
+                if first != -1 and last != -1:
+                    parsed = json.loads(llm_output[first:last+1])
+                    PARSE_REPAIRS.inc(agent="repair_agent", outcome="extracted")
+                else:
+                    parsed = {"files": []}
+                    PARSE_REPAIRS.inc(agent="repair_agent", outcome="default")
+            except Exception:
+                parsed = {"files": []}
+                PARSE_REPAIRS.inc(agent="repair_agent", outcome="default")
+
+        repaired = [
+            {
+                "fileName": f.get("fileName", ""),
+                "filePath": f.get("filePath", ""),
+                "content": f.get("content", "")
+            }
+            for f in parsed.get("files", []) if isinstance(f, dict) and f.get("fileName")
+        ] if isinstance(parsed.get("files"), list) else []
+
+        # Replace rejected files in place, append any new companion files
+        merged = {file_key(f): f for f in files}
+        for f in repaired:
+            merged[file_key(f)] = f
+
+        history = list(state.get("repair_history", []))
+        history.append({
+            "attempt": attempt,
+            "rejected_files": [file_key(f) for f in rejected],
+            "errors": {file_key(f): f["errors"] for f in rejected},
+            "repaired_files": [file_key(f) for f in repaired],
+        })
+
+        return {
+            "files": list(merged.values()),
+            "repair_attempts": attempt,
+            "repair_history": history,
+        }
+
+    def process(self, state: State) -> Dict[str, Any]:
+        messages, rejected = self.build_messages(state)
+        return self.apply(state, rejected, self.llm.invoke(messages))
+
+    async def aprocess(self, state: State) -> Dict[str, Any]:
+        messages, rejected = self.build_messages(state)
+        return self.apply(state, rejected, await self.llm.ainvoke(messages))
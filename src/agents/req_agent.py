@@ -1,7 +1,14 @@
+import json
+import asyncio
 from typing import Dict, Any
 from src.agents.baseagent import BaseAgentNode
 from src.state.state import State
 from string import Template
+from langgraph.types import interrupt
+from src.utils.log import get_logger, log_content
+from src.utils.metrics import PARSE_REPAIRS, BREAKDOWNS
+
+logger = get_logger("req_agent")
 
 REQ_SYSTEM_PROMPT_TPL = Template('''
 You are a Salesforce Solution Architect. Read the following requirement carefully.
@@ -15,23 +22,78 @@ See Sample Example Output format below
 ''')
 
 class ReqAgent(BaseAgentNode):
-    def __init__(self, llm):
+    """
+    ReqAgent - breaks the requirement down into domain, objects, actions and
+    integration points. A near-duplicate in the requirement cache is reused; a routine
+    requirement the local extractor (src.agents.breakdown_extractor) is confident about
+    skips the LLM; every LLM breakdown is fed back to the extractor.
+    """
+    def __init__(self, llm, cache=None, extractor=None):
         self.llm = llm
+        self.cache = cache
+        self.extractor = extractor
 
-    def process(self, state: State) -> Dict[str, Any]:
-        requirement = state.get('requirement', '')
+    def _confirm(self, match: Dict[str, Any]):
+        """
+        In 'confirm' mode the run is interrupted so the user can accept or decline the
+        near-duplicate; the run is resumed with Command(resume=True/False). The node
+        runs again on resume, so the hit is only counted past the interrupt.
+        """
+        accepted = True
+        if self.cache.mode == "confirm":
+            accepted = bool(interrupt({
+                "type": "cache_confirm",
+                "score": match["score"],
+                "cached_requirement": match["requirement"],
+                "breakdown": match["breakdown"],
+            }))
+        self.cache.count_lookup(True)
+        self.cache.record_decision(accepted)
+        return match if accepted else None
+
+    def _lookup(self, requirement: str):
+        match = self.cache.lookup(requirement, count=False)
+        if match is None:
+            self.cache.count_lookup(False)
+        return match
+
+    def _cache_match(self, requirement: str):
+        """Look the requirement up in the semantic cache."""
+        match = self._lookup(requirement)
+        if match is None:
+            return None
+        return self._confirm(match)
+
+    def _local_breakdown(self, requirement: str):
+        if self.extractor is None:
+            return None
+        breakdown = self.extractor.extract(requirement)
+        if breakdown is not None:
+            BREAKDOWNS.inc(source="local")
+        return breakdown
+
+    def _learn(self, requirement: str, parsed: Dict[str, Any]):
+        BREAKDOWNS.inc(source="llm")
+        if self.extractor is not None and (parsed.get("objects") or parsed.get("actions")):
+            self.extractor.learn(requirement, parsed)
 
+    @staticmethod
+    def _cache_update(match: Dict[str, Any]) -> Dict[str, Any]:
+        BREAKDOWNS.inc(source="cache")
+        logger.info("Reusing breakdown of a similar requirement (score %.3f)", match['score'])
+        cache_match = {"id": match["id"], "score": match["score"], "requirement": match["requirement"]}
+        return {'breakdown': match["breakdown"], 'cache_match': cache_match}
+
+    @staticmethod
+    def build_messages(requirement: str):
         prompt = REQ_SYSTEM_PROMPT_TPL.substitute(requirement=requirement)
-        messages = [
+        return [
             {'role': 'system', 'content': prompt},
             {'role': 'user', 'content': requirement}
         ]
 
-        # Call LLM
-        raw = self.llm.invoke(messages)
-        print("raw*******************")
-        print(raw)
-
+    @staticmethod
+    def parse_output(raw) -> Dict[str, Any]:
         # Extract actual text content
         try:
             # for LangChain & most LLM wrappers
@@ -40,15 +102,14 @@ class ReqAgent(BaseAgentNode):
             # fallback
             llm_output = raw.content if hasattr(raw, "content") else str(raw)
 
-        print("llm_output -----------")
-        print(llm_output)
+        log_content(logger, "req_agent LLM output", llm_output)
 
         # Parse JSON
-        import json
         try:
             parsed = json.loads(llm_output)
         except Exception as e:
-            print("JSON parse error:", e)
+            logger.warning("Breakdown is not valid JSON, using an empty breakdown: %s", e)
+            PARSE_REPAIRS.inc(agent="req_agent", outcome="default")
             parsed = {
                 "domain": "",
                 "objects": [],
@@ -56,6 +117,48 @@ class ReqAgent(BaseAgentNode):
                 "integrationPoints": [],
                 "clarificationsNeeded": []
             }
+        return parsed
+
+    def process(self, state: State) -> Dict[str, Any]:
+        requirement = state.get('requirement', '')
+
+        if self.cache is not None:
+            match = self._cache_match(requirement)
+            if match is not None:
+                update = self._cache_update(match)
+                state['breakdown'] = update['breakdown']
+                return update
+
+        local = self._local_breakdown(requirement)
+        if local is not None:
+            state['breakdown'] = local
+            return {'breakdown': local}
+
+        messages = self.build_messages(requirement)
+
+        # Call LLM
+        raw = self.llm.invoke(messages)
+
+        parsed = self.parse_output(raw)
+        self._learn(requirement, parsed)
 
         state['breakdown'] = parsed
         return {'breakdown': parsed}
+
+    async def aprocess(self, state: State) -> Dict[str, Any]:
+        requirement = state.get('requirement', '')
+
+        if self.cache is not None:
+            # the embedding lookup is CPU-bound; the interrupt must run in the node itself
+            match = await asyncio.to_thread(self._lookup, requirement)
+            if match is not None and self._confirm(match) is not None:
+                return self._cache_update(match)
+
+        local = self._local_breakdown(requirement)
+        if local is not None:
+            return {'breakdown': local}
+
+        raw = await self.llm.ainvoke(self.build_messages(requirement))
+        parsed = self.parse_output(raw)
+        self._learn(requirement, parsed)
+        return {'breakdown': parsed}
@@ -0,0 +1,200 @@
+import os
+import re
+import json
+from typing import Dict, Any, Iterable, List, Optional, Set
+
+from src.deploy.files import file_key
+from src.utils.log import get_logger
+
+logger = get_logger("artifacts")
+
+ARTIFACTS_MODE = os.getenv("INSTAFORCE_ARTIFACTS", "on")  # on | off
+LIBRARY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "framework")
+SOURCE_ROOT = "force-app/main/default"
+
+# first line of every library class; tells the org mirror which version is deployed
+MARKER = "// instaforce-artifact {name} {version}"
+MARKER_RE = re.compile(r"//\s*instaforce-artifact\s+([A-Za-z_][A-Za-z0-9_]*)\s+([0-9][0-9.]*)")
+
+META_XML = {
+    ".cls": "ApexClass",
+    ".trigger": "ApexTrigger",
+}
+
+LIBRARY_NOTE = '''
+### **SHARED FRAMEWORK LIBRARY (ALREADY IN THE PROJECT)**
+The classes below are provided by the project. Use and extend them; NEVER output files for them, and never generate alternative versions (e.g. another trigger handler base class or test data factory):
+'''
+
+DESIGN_LIBRARY_NOTE = '''
+The target project already contains the shared framework classes below. Do NOT add components for them; name them in dependencies.requiredApexClasses of the components that use them:
+'''
+
+
+def artifact_version(body: str) -> Optional[str]:
+    """Library version recorded in a class body, or None when it is not a library class."""
+    m = MARKER_RE.search(body or "")
+    return m.group(2) if m else None
+
+
+def _class_stem(file_name: str) -> Optional[str]:
+    """Lower-cased class name of an Apex class or its -meta.xml, else None."""
+    for suffix in (".cls", ".cls-meta.xml"):
+        if file_name.endswith(suffix):
+            return file_name[:-len(suffix)].lower()
+    return None
+
+
+def _version_tuple(version: Optional[str]):
+    try:
+        return tuple(int(p) for p in (version or "").split(".") if p)
+    except ValueError:
+        return ()
+
+
+class ArtifactLibrary:
+    """
+    Curated, versioned framework classes (src/artifacts/framework) shared by every
+    generated package, such as the trigger handler base and a test data factory.
+
+    The prompts tell design and codegen to reference the artifacts by name instead of
+    generating them. After codegen, resolve() drops any generated copies, then adds
+    the files of every artifact the output references. Artifacts the org already has
+    at this version or newer, per the org mirror (OrgSchemaCache), are skipped. A class
+    of the same name that the library did not deploy is never overwritten.
+    """
+    def __init__(self, path: str = LIBRARY_DIR, schema_cache=None):
+        self.path = path
+        self.schema_cache = schema_cache
+        with open(os.path.join(path, "manifest.json"), encoding="utf-8") as fh:
+            self.manifest = json.load(fh)
+        self.version = self.manifest["version"]
+        self.api_version = self.manifest["apiVersion"]
+        self.artifacts: Dict[str, Dict[str, Any]] = {a["name"]: a for a in self.manifest["artifacts"]}
+        self._files: Dict[str, List[Dict[str, str]]] = {}
+        self._reference = re.compile(r"\b(" + "|".join(map(re.escape, self.artifacts)) + r")\b")
+
+    # ---------------------------------------------------------
+    # prompts
+    # ---------------------------------------------------------
+
+    def _listing(self) -> str:
+        return "\n".join(f"* `{name}` (v{a['version']}): {a['usage']}" for name, a in self.artifacts.items())
+
+    def codegen_note(self) -> str:
+        return LIBRARY_NOTE + self._listing() + "\n"
+
+    def design_note(self) -> str:
+        return DESIGN_LIBRARY_NOTE + self._listing() + "\n"
+
+    # ---------------------------------------------------------
+    # files
+    # ---------------------------------------------------------
+
+    def files(self, name: str) -> List[Dict[str, str]]:
+        """Source and -meta.xml files of one artifact, versioned with MARKER."""
+        if name not in self._files:
+            artifact = self.artifacts[name]
+            files = []
+            for source in artifact["sources"]:
+                with open(os.path.join(self.path, source), encoding="utf-8") as fh:
+                    body = fh.read()
+                directory, file_name = os.path.split(source)
+                class_name, ext = os.path.splitext(file_name)
+                marker = MARKER.format(name=class_name, version=artifact["version"])
+                file_path = f"{SOURCE_ROOT}/{directory}"
+                files.append({"fileName": file_name, "filePath": file_path, "content": f"{marker}\n{body}"})
+                files.append({"fileName": f"{file_name}-meta.xml", "filePath": file_path,
+                              "content": self._meta_xml(META_XML[ext])})
+            self._files[name] = files
+        return [dict(f) for f in self._files[name]]
+
+    def _meta_xml(self, tag: str) -> str:
+        return (f'<?xml version="1.0" encoding="UTF-8"?>\n<{tag} xmlns="http://soap.sforce.com/2006/04/metadata">\n'
+                f"    <apiVersion>{self.api_version}</apiVersion>\n    <status>Active</status>\n</{tag}>\n")
+
+    def _class_names(self) -> Dict[str, str]:
+        """Lower-cased class name of every library source -> its artifact."""
+        return {os.path.splitext(os.path.basename(s))[0].lower(): name
+                for name, a in self.artifacts.items() for s in a["sources"]}
+
+    def class_names(self) -> Set[str]:
+        """Lower-cased names of the library's classes."""
+        return set(self._class_names())
+
+    def referenced(self, files: List[Dict[str, Any]], components: Iterable[Dict[str, Any]] = ()) -> Set[str]:
+        """Artifacts named in generated code or design dependencies, with what they require."""
+        names: Set[str] = set()
+        for f in files:
+            names.update(self._reference.findall(f.get("content") or ""))
+        for c in components:
+            deps = c.get("dependencies") if isinstance(c, dict) else None
+            if isinstance(deps, dict):
+                names.update(n for n in deps.get("requiredApexClasses") or [] if n in self.artifacts)
+        pending = list(names)
+        while pending:
+            for required in self.artifacts[pending.pop()].get("requires", []):
+                if required not in names:
+                    names.add(required)
+                    pending.append(required)
+        return names
+
+    def _org_versions(self, names: Set[str]) -> Dict[str, Optional[str]]:
+        if self.schema_cache is None or not names:
+            return {}
+        try:
+            return self.schema_cache.apex_class_versions(names)
+        except Exception as e:
+            # without the mirror the artifacts are simply deployed again
+            logger.warning("Org artifact lookup skipped: %s", e)
+            return {}
+
+    def resolve(self, files: List[Dict[str, Any]], components: Iterable[Dict[str, Any]] = ()):
+        """
+        (files, report): generated copies of library classes replaced by the curated
+        files of the referenced artifacts that the org does not have yet.
+        """
+        class_names = self._class_names()
+        kept, replaced = [], []
+        for f in files:
+            if _class_stem(f.get("fileName") or "") in class_names:
+                replaced.append(file_key(f))
+                continue
+            kept.append(f)
+
+        needed = self.referenced(kept, components)
+        org_versions = self._org_versions(needed)
+        report = {"library": self.version, "injected": [], "deployed": [], "conflicts": [], "replaced": replaced}
+        present = {file_key(f) for f in kept}
+        for name in sorted(needed):
+            artifact = self.artifacts[name]
+            if name in org_versions:
+                org_version = org_versions[name]
+                if org_version is None:
+                    logger.warning("Org has its own %s class; the library version is not deployed over it", name)
+                    report["conflicts"].append(name)
+                    continue
+                if _version_tuple(org_version) >= _version_tuple(artifact["version"]):
+                    report["deployed"].append({"name": name, "version": org_version})
+                    continue
+            report["injected"].append({"name": name, "version": artifact["version"]})
+            kept.extend(f for f in self.files(name) if file_key(f) not in present)
+
+        if replaced:
+            logger.info("Dropped %d generated copies of library classes", len(replaced))
+        if report["injected"] or report["deployed"]:
+            logger.info("Framework artifacts: injected %s, already in org %s",
+                        [a["name"] for a in report["injected"]], [a["name"] for a in report["deployed"]])
+        return kept, report
+
+    def is_artifact(self, component: Dict[str, Any]) -> bool:
+        """True for a design component that is one of the library classes."""
+        return (component.get("type") == "ApexClass"
+                and (component.get("apiName") or "").lower() in self._class_names())
+
+
+def get_artifact_library(schema_cache=None, mode: str = ARTIFACTS_MODE) -> Optional[ArtifactLibrary]:
+    """Library configured from the environment, or None when INSTAFORCE_ARTIFACTS=off."""
+    if mode == "off":
+        return None
+    return ArtifactLibrary(schema_cache=schema_cache)
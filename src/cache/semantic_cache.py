@@ -0,0 +1,190 @@
+import os
+import json
+import threading
+from typing import Dict, Any, List, Optional, Tuple
+
+from src.utils.log import get_logger
+
+logger = get_logger("cache")
+
+CACHE_DIR = os.getenv("INSTAFORCE_CACHE_DIR", os.path.join(".instaforce", "requirement_cache"))
+CACHE_MODE = os.getenv("INSTAFORCE_CACHE_MODE", "direct")  # direct | confirm | off
+SIMILARITY_THRESHOLD = float(os.getenv("INSTAFORCE_CACHE_THRESHOLD", "0.92"))
+EMBEDDING_MODEL = os.getenv("INSTAFORCE_EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+
+
+class RequirementCache:
+    """
+    Local vector index of past requirements and the `breakdown` / `components` the
+    pipeline produced for them. A new requirement whose cosine similarity to a stored
+    one reaches `threshold` can reuse those outputs instead of calling the LLM.
+
+    Layout of `cache_dir`:
+      index.faiss   - inner-product index over normalized sentence embeddings
+      entries.jsonl - one stored result per line, line number == vector id
+      metrics.json  - lookup / hit / reuse counters
+    New entries are appended to both files, so the index is updated incrementally.
+    """
+    def __init__(self, cache_dir: str = CACHE_DIR, threshold: float = SIMILARITY_THRESHOLD,
+                 model_name: str = EMBEDDING_MODEL, mode: str = CACHE_MODE):
+        self.cache_dir = cache_dir
+        self.threshold = threshold
+        self.model_name = model_name
+        self.mode = mode
+        self._lock = threading.Lock()
+        self._model = None
+        self._index = None
+        self._entries: List[Dict[str, Any]] = []
+        self._metrics = {"lookups": 0, "hits": 0, "misses": 0, "reused": 0, "declined": 0}
+        self._loaded = False
+
+    # ---------------------------------------------------------
+    # persistence
+    # ---------------------------------------------------------
+
+    @property
+    def _index_path(self) -> str:
+        return os.path.join(self.cache_dir, "index.faiss")
+
+    @property
+    def _entries_path(self) -> str:
+        return os.path.join(self.cache_dir, "entries.jsonl")
+
+    @property
+    def _metrics_path(self) -> str:
+        return os.path.join(self.cache_dir, "metrics.json")
+
+    def _load(self):
+        if self._loaded:
+            return
+        import faiss
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        if os.path.exists(self._entries_path):
+            with open(self._entries_path, encoding="utf-8") as fh:
+                self._entries = [json.loads(line) for line in fh if line.strip()]
+        if os.path.exists(self._index_path):
+            self._index = faiss.read_index(self._index_path)
+        if os.path.exists(self._metrics_path):
+            with open(self._metrics_path, encoding="utf-8") as fh:
+                self._metrics.update(json.load(fh))
+
+        if self._index is not None and self._index.ntotal != len(self._entries):
+            # a crash between the two writes; rebuild from the entries file
+            logger.warning("Requirement cache index out of sync, rebuilding")
+            self._index = None
+            if self._entries:
+                self._index = faiss.IndexFlatIP(self._embed(self._entries[0]["requirement"]).shape[1])
+                self._index.add(self._embed_many([e["requirement"] for e in self._entries]))
+                faiss.write_index(self._index, self._index_path)
+        self._loaded = True
+
+    def _save_metrics(self):
+        with open(self._metrics_path, "w", encoding="utf-8") as fh:
+            json.dump(self._metrics, fh)
+
+    # ---------------------------------------------------------
+    # embeddings
+    # ---------------------------------------------------------
+
+    def _embed_many(self, texts: List[str]):
+        if self._model is None:
+            from sentence_transformers import SentenceTransformer
+            self._model = SentenceTransformer(self.model_name)
+        return self._model.encode(texts, normalize_embeddings=True, convert_to_numpy=True).astype("float32")
+
+    def _embed(self, text: str):
+        return self._embed_many([text.strip()])
+
+    # ---------------------------------------------------------
+    # public API
+    # ---------------------------------------------------------
+
+    def lookup(self, requirement: str, count: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        Best stored match at or above the threshold, with its `score`, else None.
+        With `count` off the lookup is not counted; the caller counts it with
+        count_lookup() once (e.g. a node re-run on resume looks up again).
+        """
+        if not requirement.strip():
+            return None
+        with self._lock:
+            self._load()
+            match = None
+            if self._index is not None and self._index.ntotal:
+                scores, ids = self._index.search(self._embed(requirement), 1)
+                score, idx = float(scores[0][0]), int(ids[0][0])
+                if idx >= 0 and score >= self.threshold:
+                    match = dict(self._entries[idx], id=idx, score=score)
+            if count:
+                self._count(match is not None)
+            return match
+
+    def _count(self, hit: bool):
+        self._metrics["lookups"] += 1
+        self._metrics["hits" if hit else "misses"] += 1
+        self._save_metrics()
+
+    def count_lookup(self, hit: bool):
+        with self._lock:
+            self._load()
+            self._count(hit)
+
+    def get(self, entry_id: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            self._load()
+            if 0 <= entry_id < len(self._entries):
+                return dict(self._entries[entry_id], id=entry_id)
+            return None
+
+    def add(self, requirement: str, breakdown: Dict[str, Any], components: Dict[str, Any]) -> int:
+        """Store a finished requirement → breakdown/components result. Returns its id."""
+        import faiss
+
+        with self._lock:
+            self._load()
+            vector = self._embed(requirement)
+            if self._index is None:
+                self._index = faiss.IndexFlatIP(vector.shape[1])
+            entry = {"requirement": requirement, "breakdown": breakdown, "components": components}
+            with open(self._entries_path, "a", encoding="utf-8") as fh:
+                fh.write(json.dumps(entry) + "\n")
+            self._entries.append(entry)
+            self._index.add(vector)
+            faiss.write_index(self._index, self._index_path)
+            return len(self._entries) - 1
+
+    def breakdowns(self) -> List[Tuple[str, Dict[str, Any]]]:
+        """(requirement, breakdown) of every stored result; reads the entries file only, no embeddings."""
+        with self._lock:
+            if self._loaded:
+                entries = list(self._entries)
+            elif os.path.exists(self._entries_path):
+                with open(self._entries_path, encoding="utf-8") as fh:
+                    entries = [json.loads(line) for line in fh if line.strip()]
+            else:
+                entries = []
+        return [(e["requirement"], e["breakdown"]) for e in entries if isinstance(e.get("breakdown"), dict)]
+
+    def record_decision(self, reused: bool):
+        with self._lock:
+            self._load()
+            self._metrics["reused" if reused else "declined"] += 1
+            self._save_metrics()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._load()
+            lookups = self._metrics["lookups"]
+            return dict(
+                self._metrics,
+                entries=len(self._entries),
+                hit_rate=(self._metrics["hits"] / lookups) if lookups else 0.0,
+            )
+
+
+def get_requirement_cache(mode: str = CACHE_MODE) -> Optional[RequirementCache]:
+    """Cache configured from the environment, or None when INSTAFORCE_CACHE_MODE=off."""
+    if mode == "off":
+        return None
+    return RequirementCache(mode=mode)
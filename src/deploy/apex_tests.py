@@ -0,0 +1,279 @@
+import os
+import re
+import json
+import time
+import asyncio
+import hashlib
+import threading
+from typing import Dict, Any, List, Optional
+
+from src.deploy.results import parse_test_results
+from src.utils.log import get_logger
+from src.utils.metrics import TEST_CACHE_LOOKUPS, TEST_SECONDS_SAVED
+
+logger = get_logger("deploy.apex_tests")
+
+TEST_CACHE = os.getenv("INSTAFORCE_TEST_CACHE", "on")  # on | off
+# org: leave the test level to the org default; RunSpecifiedTests: run the generated test classes of a
+# deploy to a sandbox (production orgs always keep their own level)
+TEST_LEVEL = os.getenv("INSTAFORCE_TEST_LEVEL", "org")
+TEST_LEVELS = ("RunSpecifiedTests", "org")
+TEST_CACHE_DIR = os.getenv("INSTAFORCE_TEST_CACHE_DIR", os.path.join(".instaforce", "test_cache"))
+# production orgs beyond those Organization.IsSandbox reports, e.g. ones only the sf CLI can log in to
+PRODUCTION_ORGS = [a.strip() for a in os.getenv("INSTAFORCE_PRODUCTION_ORGS", "").split(",") if a.strip()]
+
+_WORD = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+_TEST_CLASS = re.compile(
+    r"@isTest(?:\s*\([^)]*\))?\s+(?:(?:public|private|global|with|without|inherited|sharing|virtual|abstract)\s+)*class\b",
+    re.IGNORECASE)
+_TEST_METHOD = re.compile(
+    r"@isTest(?:\s*\([^)]*\))?\s+(?:(?:public|private|global|static)\s+)*void\s+\w+\s*\(|\btestMethod\b", re.IGNORECASE)
+TRIGGER_OBJECT = re.compile(r"\btrigger\s+\w+\s+on\s+(\w+)", re.IGNORECASE)
+
+
+def apex_sources(deploy_root: str) -> Dict[str, Dict[str, Any]]:
+    """Apex classes and triggers under a deploy root, by lower-cased name."""
+    sources = {}
+    for dirpath, _, filenames in os.walk(deploy_root):
+        for name in filenames:
+            stem, ext = os.path.splitext(name)
+            if ext not in (".cls", ".trigger"):
+                continue
+            with open(os.path.join(dirpath, name), encoding="utf-8", errors="replace") as fh:
+                content = fh.read()
+            trigger = TRIGGER_OBJECT.search(content) if ext == ".trigger" else None
+            sources[stem.lower()] = {
+                "name": stem,
+                "content": content,
+                "sobject": trigger.group(1).lower() if trigger else None,
+                "test": ext == ".cls" and bool(_TEST_CLASS.search(content)) and bool(_TEST_METHOD.search(content)),
+                "words": {w.lower() for w in _WORD.findall(content)},
+            }
+    return sources
+
+
+def exercised_apex(test: str, sources: Dict[str, Dict[str, Any]]) -> List[str]:
+    """
+    Lower-cased names of the Apex a test class exercises: the classes it names, the
+    triggers on objects it names, and theirs in turn.
+    """
+    seen, stack = {test}, [test]
+    while stack:
+        words = sources[stack.pop()]["words"]
+        for name, source in sources.items():
+            if name in seen:
+                continue
+            if name in words or (source["sobject"] and source["sobject"] in words):
+                seen.add(name)
+                stack.append(name)
+    return sorted(seen - {test})
+
+
+def result_key(test: str, sources: Dict[str, Dict[str, Any]], dependencies: List[str]) -> str:
+    """Hash of a test class, the Apex it exercises, and the names it references outside the deploy."""
+    digest = hashlib.sha256()
+    for name in [test] + dependencies:
+        digest.update(name.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(sources[name]["content"].encode("utf-8"))
+        digest.update(b"\0")
+    # classes already in the org (e.g. framework library classes) are only known by name
+    digest.update(" ".join(sorted(sources[test]["words"] - sources.keys())).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class ApexTestCache:
+    """
+    Outcomes of the Apex test classes deployed to one org, keyed by result_key(): a hash
+    of the test class, every generated class and trigger it exercises, and the names it
+    references outside the deploy. An entry holds whether all of its methods passed,
+    their run time and the coverage of the classes under test.
+
+    Kept as a JSON file per org under TEST_CACHE_DIR.
+    """
+    def __init__(self, alias: str, path: str = TEST_CACHE_DIR):
+        self.alias = alias
+        self.file = os.path.join(path, f"{re.sub(r'[^A-Za-z0-9_.-]', '_', alias)}.json")
+        self._lock = threading.Lock()
+        self._entries: Optional[Dict[str, Dict[str, Any]]] = None
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        if self._entries is None:
+            try:
+                with open(self.file, encoding="utf-8") as fh:
+                    self._entries = json.load(fh)
+            except FileNotFoundError:
+                self._entries = {}
+            except (OSError, ValueError) as e:
+                logger.warning("Ignoring unreadable test cache %s: %s", self.file, e)
+                self._entries = {}
+        return self._entries
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._load().get(key)
+
+    def record(self, entries: Dict[str, Dict[str, Any]]):
+        if not entries:
+            return
+        with self._lock:
+            self._load().update(entries)
+            os.makedirs(os.path.dirname(self.file), exist_ok=True)
+            tmp = f"{self.file}.tmp"
+            with open(tmp, "w", encoding="utf-8") as fh:
+                json.dump(self._entries, fh, indent=1)
+            os.replace(tmp, self.file)
+
+
+class ApexTestTransport:
+    """
+    Deploy transport wrapper that runs the generated Apex test classes of each deploy
+    (RunSpecifiedTests), leaving out those whose outcome is already known for the org.
+
+    The deploy root's test classes are keyed with result_key(). Those cached green for
+    the org are left out of the RunSpecifiedTests list; when all of them are, the deploy
+    runs with NoTestRun. Production orgs run their org's tests on every Apex deploy, so
+    there the test level is left to the org: an org is production when it is listed in
+    INSTAFORCE_PRODUCTION_ORGS, or when Organization.IsSandbox is false or cannot be
+    queried (checked once per org). Test outcomes and coverage of each deploy are
+    recorded for the next one. With `use_cache` off every generated test class runs.
+
+    The outcome gets a `tests` entry: level, classes run and cached, cache hits and
+    misses, and the seconds of test time the hits saved (their last recorded run time).
+    """
+    def __init__(self, transport, path: str = TEST_CACHE_DIR, production_orgs=None, use_cache: bool = True):
+        self.transport = transport
+        self.use_cache = use_cache
+        self.path = path
+        self.production_orgs = set(PRODUCTION_ORGS if production_orgs is None else production_orgs)
+        self._caches: Dict[str, ApexTestCache] = {}
+        self._sandboxes: Dict[str, bool] = {}
+        self._lock = threading.Lock()
+
+    def __getattr__(self, item):
+        return getattr(self.transport, item)
+
+    def cache(self, alias: str) -> ApexTestCache:
+        with self._lock:
+            if alias not in self._caches:
+                self._caches[alias] = ApexTestCache(alias, self.path)
+            return self._caches[alias]
+
+    def is_production(self, alias: str) -> bool:
+        if alias in self.production_orgs:
+            return True
+        with self._lock:
+            if alias in self._sandboxes:
+                return not self._sandboxes[alias]
+        try:
+            from src.org.connection import get_salesforce
+            records = get_salesforce(alias).query("SELECT IsSandbox FROM Organization LIMIT 1")["records"]
+            sandbox = bool(records and records[0].get("IsSandbox"))
+        except Exception as e:
+            logger.warning("Cannot tell whether org %s is a sandbox, leaving its tests to the org: %s", alias, e)
+            sandbox = False
+        with self._lock:
+            self._sandboxes[alias] = sandbox
+        return not sandbox
+
+    def plan(self, deploy_root: str, alias: str) -> Optional[Dict[str, Any]]:
+        """The deploy's tests: which to run, which are cached green; None when it has none or is to production."""
+        sources = apex_sources(deploy_root)
+        tests = sorted(name for name, source in sources.items() if source["test"])
+        if not tests or self.is_production(alias):
+            return None
+        cache = self.cache(alias)
+        plan = {"keys": {}, "covers": {}, "run": [], "cached": [], "seconds_saved": 0.0}
+        for test in tests:
+            dependencies = exercised_apex(test, sources)
+            key = result_key(test, sources, dependencies)
+            name = sources[test]["name"]
+            plan["keys"][name] = key
+            plan["covers"][name] = [sources[d]["name"] for d in dependencies if not sources[d]["test"]]
+            entry = cache.get(key) if self.use_cache else None
+            if entry and entry.get("passed"):
+                plan["cached"].append(name)
+                plan["seconds_saved"] += entry.get("seconds", 0.0)
+            else:
+                plan["run"].append(name)
+        plan["level"] = "RunSpecifiedTests" if plan["run"] else "NoTestRun"
+        TEST_CACHE_LOOKUPS.inc(len(plan["cached"]), result="hit")
+        TEST_CACHE_LOOKUPS.inc(len(plan["run"]), result="miss")
+        TEST_SECONDS_SAVED.inc(plan["seconds_saved"])
+        return plan
+
+    def record(self, plan: Dict[str, Any], outcome: Dict[str, Any], alias: str):
+        """Cache the outcome of the tests that ran and attach the test report to the outcome."""
+        results = parse_test_results(outcome.get("parsed_response"))
+        entries, passed, failed = {}, [], []
+        for name in plan["run"]:
+            result = results["classes"].get(name)
+            if result is None:
+                continue
+            ok = bool(result["passed"]) and not result["failed"]
+            (passed if ok else failed).append(name)
+            entries[plan["keys"][name]] = {
+                "test_class": name,
+                "passed": ok,
+                "methods": len(result["passed"]) + len(result["failed"]),
+                "seconds": round(result["time_ms"] / 1000.0, 3),
+                "coverage": {c: results["coverage"][c] for c in plan["covers"][name] if c in results["coverage"]},
+                "recorded_at": time.time(),
+            }
+        self.cache(alias).record(entries)
+
+        outcome["tests"] = {
+            "level": plan["level"],
+            "run": plan["run"],
+            "cached": plan["cached"],
+            "passed": passed,
+            "failed": failed,
+            "cache_hits": len(plan["cached"]),
+            "cache_misses": len(plan["run"]),
+            "seconds_saved": round(plan["seconds_saved"], 3),
+            "coverage": results["coverage"],
+        }
+        if plan["cached"]:
+            logger.info("Test cache: %d of %d test classes cached green on %s, ~%.1fs of tests saved (%s)",
+                        len(plan["cached"]), len(plan["cached"]) + len(plan["run"]), alias,
+                        plan["seconds_saved"], plan["level"])
+        return outcome
+
+    @staticmethod
+    def _request(plan: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        return {"level": plan["level"], "classes": plan["run"]} if plan else None
+
+    def deploy(self, deploy_root: str, alias: str, tests=None, check_only: bool = False) -> Dict[str, Any]:
+        plan = self.plan(deploy_root, alias)
+        outcome = self.transport.deploy(deploy_root, alias, tests=self._request(plan), check_only=check_only)
+        return self.record(plan, outcome, alias) if plan else outcome
+
+    async def adeploy(self, deploy_root: str, alias: str, tests=None, check_only: bool = False) -> Dict[str, Any]:
+        plan = await asyncio.to_thread(self.plan, deploy_root, alias)
+        outcome = await self.transport.adeploy(deploy_root, alias, tests=self._request(plan), check_only=check_only)
+        return await asyncio.to_thread(self.record, plan, outcome, alias) if plan else outcome
+
+
+def merge_test_reports(reports: List[Optional[Dict[str, Any]]]) -> Optional[Dict[str, Any]]:
+    """One `tests` report for several deployments (units), or None when none of them had tests."""
+    reports = [r for r in reports if r]
+    if not reports:
+        return None
+    merged = {"level": ", ".join(sorted({r["level"] for r in reports})), "coverage": {}}
+    for key in ("run", "cached", "passed", "failed"):
+        merged[key] = sorted({name for r in reports for name in r[key]})
+    for key in ("cache_hits", "cache_misses"):
+        merged[key] = sum(r[key] for r in reports)
+    merged["seconds_saved"] = round(sum(r["seconds_saved"] for r in reports), 3)
+    for r in reports:
+        merged["coverage"].update(r["coverage"])
+    return merged
+
+
+def with_apex_tests(transport, level: str = TEST_LEVEL, cache: str = TEST_CACHE):
+    """`transport` behind an ApexTestTransport, unless the org's default test level is wanted."""
+    if level not in TEST_LEVELS:
+        raise ValueError(f"Unknown INSTAFORCE_TEST_LEVEL '{level}', expected one of {', '.join(TEST_LEVELS)}")
+    if level == "org":
+        return transport
+    return ApexTestTransport(transport, use_cache=cache != "off")
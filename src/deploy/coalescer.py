@@ -0,0 +1,183 @@
+import os
+import threading
+import uuid
+from concurrent.futures import Future
+from typing import Dict, Any, List, Optional, Tuple
+
+from src.deploy.files import file_key, validate_file, reset_deploy_root, write_file
+from src.deploy.results import parse_component_results, component_matches_file, failed_status
+from src.deploy.transports import get_transport
+from src.utils.log import get_logger
+
+logger = get_logger("deploy.coalescer")
+
+DEPLOY_COALESCE = os.getenv("INSTAFORCE_DEPLOY_COALESCE", "off") == "on"
+COALESCE_WINDOW_SECONDS = float(os.getenv("INSTAFORCE_COALESCE_WINDOW_SECONDS", "5"))
+# batch deploy roots, one directory per batch
+BATCH_DEPLOY_DIR = os.path.join(".instaforce", "batches")
+
+
+class DeployCoalescer:
+    """
+    Collects the `files` output of several pipeline runs and pushes them to the org
+    as one deployment, since orgs process deployments one at a time.
+
+    A batch is flushed when the first submission is `window_seconds` old, or as soon
+    as it holds `max_runs` runs or `max_files` files. Runs whose files collide with an
+    already batched file of the same filePath/fileName but different content are
+    rejected without deploying. Per-component results of the combined deployment are
+    attributed back to every run that contributed the file.
+
+        coalescer = DeployCoalescer(window_seconds=30)
+        status = coalescer.submit("run-1", files).result()
+    """
+    def __init__(self, transport=None, alias: Optional[str] = None,
+                 window_seconds: float = 30.0, max_runs: int = 20, max_files: int = 500,
+                 deploy_dir: str = BATCH_DEPLOY_DIR):
+        self.transport = transport or get_transport()
+        self.alias = alias or os.environ.get("SF_USERNAME_ALIAS")
+        self.window_seconds = window_seconds
+        self.max_runs = max_runs
+        self.max_files = max_files
+        self.deploy_dir = deploy_dir
+
+        self._lock = threading.Lock()
+        # deploys must not overlap: the org processes one deployment at a time
+        self._deploy_lock = threading.Lock()
+        self._pending: List[Tuple[str, List[Dict[str, Any]], Future]] = []
+        self._timer: Optional[threading.Timer] = None
+
+    def submit(self, run_id: str, files: List[Dict[str, Any]]) -> Future:
+        """Queue a run's files; the returned future resolves to that run's deploy_status."""
+        future: Future = Future()
+        flush_now = False
+        with self._lock:
+            self._pending.append((run_id, list(files or []), future))
+            if len(self._pending) == 1:
+                self._timer = threading.Timer(self.window_seconds, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+            pending_files = sum(len(f) for _, f, _ in self._pending)
+            if len(self._pending) >= self.max_runs or pending_files >= self.max_files:
+                flush_now = True
+        if flush_now:
+            self.flush()
+        return future
+
+    def pending_runs(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self) -> Dict[str, Dict[str, Any]]:
+        """Deploy everything queued so far. Returns deploy_status keyed by run id."""
+        with self._lock:
+            batch, self._pending = self._pending, []
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not batch:
+            return {}
+
+        try:
+            with self._deploy_lock:
+                statuses = self._deploy_batch([(run_id, files) for run_id, files, _ in batch])
+        except Exception as e:
+            statuses = {run_id: failed_status(f"Coalesced deployment failed: {e}") for run_id, _, _ in batch}
+
+        for run_id, _, future in batch:
+            future.set_result(statuses[run_id])
+        return statuses
+
+    # ---------------------------------------------------------
+    # internals
+    # ---------------------------------------------------------
+
+    def _merge(self, batch: List[Tuple[str, List[Dict[str, Any]]]]):
+        """
+        Merge file sets in submission order. Identical files are shared; a differing
+        file with the same key rejects the later run as a whole.
+        """
+        merged: Dict[str, Dict[str, Any]] = {}
+        owners: Dict[str, List[str]] = {}
+        rejected: Dict[str, Dict[str, Any]] = {}
+
+        for run_id, files in batch:
+            invalid = [err for err in (validate_file(f) for f in files) if err]
+            if invalid:
+                rejected[run_id] = failed_status("Deployment validation failed", validation_errors=invalid)
+                continue
+
+            conflicts = []
+            for f in files:
+                key = file_key(f)
+                if key in merged and merged[key]["content"] != f["content"]:
+                    conflicts.append({"file": key, "conflictsWith": owners[key]})
+            if conflicts:
+                logger.warning("Run %s conflicts with batched files: %s", run_id, [c['file'] for c in conflicts])
+                rejected[run_id] = failed_status(
+                    "Run excluded from coalesced deployment: conflicting file content", conflicts=conflicts)
+                continue
+
+            for f in files:
+                key = file_key(f)
+                merged.setdefault(key, f)
+                run_owners = owners.setdefault(key, [])
+                if run_id not in run_owners:
+                    run_owners.append(run_id)
+
+        return merged, owners, rejected
+
+    def _deploy_batch(self, batch: List[Tuple[str, List[Dict[str, Any]]]]) -> Dict[str, Dict[str, Any]]:
+        merged, owners, rejected = self._merge(batch)
+        statuses: Dict[str, Dict[str, Any]] = dict(rejected)
+        accepted = [run_id for run_id, _ in batch if run_id not in rejected]
+        if not accepted:
+            return statuses
+
+        batch_id = str(uuid.uuid4())
+        logger.info("Coalesced deployment %s: %d runs, %d files", batch_id, len(accepted), len(merged))
+
+        deploy_root = os.path.join(self.deploy_dir, batch_id)
+        reset_deploy_root(deploy_root)
+        written: Dict[str, str] = {key: write_file(f, deploy_root) for key, f in merged.items()}
+
+        outcome = self.transport.deploy(deploy_root, self.alias)
+        components = parse_component_results(outcome.get("parsed_response"))
+
+        for run_id in accepted:
+            run_paths = [written[key] for key, run_owners in owners.items() if run_id in run_owners]
+            run_failures = _attribute(components["failures"], run_paths)
+            run_successes = _attribute(components["successes"], run_paths)
+
+            status = dict(outcome)
+            status.update({
+                "written_files": run_paths,
+                "batch_id": batch_id,
+                "batch_runs": accepted,
+                "component_successes": run_successes,
+                "component_failures": run_failures,
+            })
+            if outcome["success"]:
+                status["message"] = f"Deployment validation successful (coalesced batch of {len(accepted)} runs)"
+            elif run_failures:
+                status["message"] = "Deployment validation failed"
+            else:
+                status["message"] = "Deployment validation failed: batch rejected by components of other runs"
+            statuses[run_id] = status
+
+        return statuses
+
+
+def _attribute(components: List[Dict[str, Any]], paths: List[str]) -> List[Dict[str, Any]]:
+    return [c for c in components if any(component_matches_file(c["fileName"], p) for p in paths)]
+
+
+
+def get_coalescer(transport=None, enabled: bool = DEPLOY_COALESCE) -> Optional[DeployCoalescer]:
+    """
+    A DeployCoalescer for INSTAFORCE_DEPLOY_COALESCE=on, or None when it is off. Meant
+    for processes where several runs deploy at once (job runner, HTTP service).
+    """
+    if not enabled:
+        return None
+    return DeployCoalescer(transport, window_seconds=COALESCE_WINDOW_SECONDS)
@@ -0,0 +1,192 @@
+import io
+import base64
+import argparse
+import threading
+import uuid
+import zipfile
+import xml.etree.ElementTree as ET
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, Iterable, List, Optional
+from xml.sax.saxutils import escape
+
+from src.deploy.metadata_api import MDAPI_NS, SOAP_NS, API_VERSION, _local
+
+FAULT = '''<?xml version="1.0" encoding="UTF-8"?>
+<soapenv:Envelope xmlns:soapenv="{soap}" xmlns:sf="urn:fault.partner.soap.sforce.com"><soapenv:Body>
+<soapenv:Fault><faultcode>sf:{code}</faultcode><faultstring>{message}</faultstring></soapenv:Fault>
+</soapenv:Body></soapenv:Envelope>'''
+
+RESPONSE = '''<?xml version="1.0" encoding="UTF-8"?>
+<soapenv:Envelope xmlns:soapenv="{soap}" xmlns="{mdapi}"><soapenv:Body>
+<{call}Response><result>{result}</result></{call}Response>
+</soapenv:Body></soapenv:Envelope>'''
+
+
+def _xml(data: Dict[str, Any]) -> str:
+    parts = []
+    for key, value in data.items():
+        for item in value if isinstance(value, list) else [value]:
+            if isinstance(item, dict):
+                parts.append(f"<{key}>{_xml(item)}</{key}>")
+            elif item is not None:
+                text = str(item).lower() if isinstance(item, bool) else escape(str(item))
+                parts.append(f"<{key}>{text}</{key}>")
+    return "".join(parts)
+
+
+class FakeMetadataApi:
+    """
+    Local stand-in for the Metadata SOAP API, for offline runs of MetadataApiTransport:
+
+        with FakeMetadataApi(fail={"AccountService"}) as fake:
+            transport = MetadataApiTransport(MetadataApiClient(fake.endpoint, fake.session_id))
+
+    `deploy` unpacks the zip and reads its package.xml; `checkDeployStatus` answers
+    InProgress for `polls` calls, then reports every package member as a component
+    success, except members (or file names) in `fail`, which fail with a compile error.
+    A session id other than `session_id` gets an INVALID_SESSION_ID fault.
+    """
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, session_id: str = "00Dfake!session",
+                 polls: int = 1, fail: Iterable[str] = ()):
+        self.session_id = session_id
+        self.polls = polls
+        self.fail = set(fail)
+        self.deployments: Dict[str, Dict[str, Any]] = {}
+        self.calls: List[str] = []
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def endpoint(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/services/Soap/m/{API_VERSION}"
+
+    def start(self) -> "FakeMetadataApi":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "FakeMetadataApi":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # ---------------------------------------------------------
+    # SOAP calls
+    # ---------------------------------------------------------
+
+    def handle(self, envelope: bytes):
+        """(http status, response body) of one SOAP request."""
+        try:
+            root = ET.fromstring(envelope)
+        except ET.ParseError as e:
+            return 500, FAULT.format(soap=SOAP_NS, code="INVALID_XML", message=escape(str(e)))
+        session = next((el.text for el in root.iter() if _local(el.tag) == "sessionId"), None)
+        body = next((el for el in root if _local(el.tag) == "Body"), None)
+        call = _local(body[0].tag) if body is not None and len(body) else ""
+        with self._lock:
+            self.calls.append(call)
+        if session != self.session_id:
+            return 500, FAULT.format(soap=SOAP_NS, code="INVALID_SESSION_ID",
+                                     message="INVALID_SESSION_ID: Invalid Session ID found in SessionHeader")
+        args = {_local(el.tag): el for el in body[0]}
+        if call == "deploy":
+            result = self._deploy(base64.b64decode(args["ZipFile"].text or ""))
+        elif call == "checkDeployStatus":
+            deployment = self.deployments.get(args["asyncProcessId"].text or "")
+            if deployment is None:
+                return 500, FAULT.format(soap=SOAP_NS, code="INVALID_ID_FIELD", message="Unknown deployment id")
+            result = self._status(deployment)
+        else:
+            return 500, FAULT.format(soap=SOAP_NS, code="UNKNOWN_OPERATION", message=escape(call or "no call"))
+        return 200, RESPONSE.format(soap=SOAP_NS, mdapi=MDAPI_NS, call=call, result=_xml(result))
+
+    def _deploy(self, zip_bytes: bytes) -> Dict[str, Any]:
+        with zipfile.ZipFile(io.BytesIO(zip_bytes)) as zf:
+            names = zf.namelist()
+            package = ET.fromstring(zf.read("package.xml"))
+        members = []
+        for types in package:
+            if _local(types.tag) != "types":
+                continue
+            kind = next(el.text for el in types if _local(el.tag) == "name")
+            members.extend((kind, el.text) for el in types if _local(el.tag) == "members")
+        deploy_id = "0Af" + uuid.uuid4().hex[:15]
+        with self._lock:
+            self.deployments[deploy_id] = {"id": deploy_id, "files": names, "members": members, "polls": 0}
+        return {"id": deploy_id, "done": False, "state": "Queued"}
+
+    @staticmethod
+    def _file_of(kind: str, member: str, files: List[str]) -> str:
+        stem = member.split(".")[0]
+        for name in files:
+            base = name.rsplit("/", 1)[-1]
+            if base.split(".")[0] == stem and not name.endswith("-meta.xml"):
+                return name
+        return ""
+
+    def _status(self, deployment: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            deployment["polls"] += 1
+            if deployment["polls"] <= self.polls:
+                return {"id": deployment["id"], "done": False, "status": "InProgress", "success": False}
+        successes, failures = [], []
+        for kind, member in deployment["members"]:
+            file_name = self._file_of(kind, member, deployment["files"])
+            entry = {"componentType": kind, "fullName": member, "fileName": file_name}
+            if member in self.fail or file_name.rsplit("/", 1)[-1] in self.fail:
+                failures.append(dict(entry, success=False, problemType="Error", lineNumber=1, columnNumber=1,
+                                     problem=f"Fake compile error in {member}"))
+            else:
+                successes.append(dict(entry, success=True, created=True))
+        successes.append({"componentType": "", "fullName": "package.xml", "fileName": "package.xml", "success": True})
+        return {
+            "id": deployment["id"], "done": True, "success": not failures,
+            "status": "Failed" if failures else "Succeeded",
+            "numberComponentsTotal": len(deployment["members"]),
+            "numberComponentErrors": len(failures),
+            "details": {"componentSuccesses": successes, "componentFailures": failures},
+        }
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                status, body = fake.handle(self.rfile.read(int(self.headers.get("Content-Length") or 0)))
+                data = body.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "text/xml; charset=UTF-8")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fake Metadata SOAP API for offline deploys")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--polls", type=int, default=1, help="checkDeployStatus calls answered InProgress")
+    parser.add_argument("--fail", action="append", default=[], help="member or file name to fail (repeatable)")
+    args = parser.parse_args(argv)
+    fake = FakeMetadataApi(port=args.port, polls=args.polls, fail=args.fail)
+    print(f"Fake Metadata API at {fake.endpoint} (session id {fake.session_id})")
+    try:
+        fake._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,160 @@
+import os
+import time
+import asyncio
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Iterable, List, Optional
+
+from src.deploy.results import parse_component_results, failed_status
+from src.utils.log import get_logger
+from src.utils.tracing import span
+
+logger = get_logger("deploy.fanout")
+
+FANOUT_PARALLELISM = int(os.getenv("INSTAFORCE_FANOUT_PARALLELISM", "4"))
+FANOUT_POLICY = os.getenv("INSTAFORCE_FANOUT_POLICY", "continue")  # continue | fail_fast
+POLICIES = ("continue", "fail_fast")
+
+
+def _split(value: Any) -> List[str]:
+    if isinstance(value, str):
+        value = value.split(",")
+    aliases = []
+    for alias in value or []:
+        alias = str(alias).strip()
+        if alias and alias not in aliases:
+            aliases.append(alias)
+    return aliases
+
+
+def target_orgs(state: Optional[Dict[str, Any]] = None) -> List[str]:
+    """
+    Org aliases a run deploys to: the run's `target_orgs`, else INSTAFORCE_TARGET_ORGS
+    (comma-separated), else the single SF_USERNAME_ALIAS.
+    """
+    for value in ((state or {}).get("target_orgs"), os.environ.get("INSTAFORCE_TARGET_ORGS"),
+                  os.environ.get("SF_USERNAME_ALIAS")):
+        aliases = _split(value)
+        if aliases:
+            return aliases
+    return []
+
+
+class MultiOrgDeployer:
+    """
+    Deploys one written deploy root to several orgs at once, at most `max_parallel` at a
+    time, through the same transport a single-org run uses. Codegen is paid once per
+    run and the rollout takes as long as the slowest org.
+
+    With policy "continue" every org is deployed whatever the others report. With
+    "fail_fast" no further org is started once one has failed; deploys already under way
+    finish, the rest are reported as skipped.
+
+    The aggregated deploy_status holds every org's own status under `orgs`, and the
+    component failures of all orgs (each tagged with the orgs reporting it) under
+    `component_failures`, so the repair loop fixes them for all targets at once.
+    """
+    def __init__(self, transport, max_parallel: int = FANOUT_PARALLELISM, policy: str = FANOUT_POLICY):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown fan-out policy '{policy}', expected one of {', '.join(POLICIES)}")
+        self.transport = transport
+        self.max_parallel = max(1, max_parallel)
+        self.policy = policy
+
+    def _skipped(self, alias: str, failed: List[str]) -> Dict[str, Any]:
+        return failed_status(f"Skipped: deployment to {', '.join(failed)} failed (fail_fast)", skipped=True, org=alias)
+
+    def deploy(self, deploy_root: str, aliases: Iterable[str]) -> Dict[str, Any]:
+        aliases = list(aliases)
+        started = time.perf_counter()
+        stop = threading.Event()
+        failed: List[str] = []
+
+        def deploy_one(alias: str) -> Dict[str, Any]:
+            if stop.is_set():
+                return self._skipped(alias, failed)
+            with span("deploy_org", org=alias) as org_span:
+                try:
+                    status = self.transport.deploy(deploy_root, alias)
+                except Exception as e:
+                    status = failed_status(f"Deployment to {alias} failed: {e}")
+                org_span.set(success=bool(status.get("success")))
+            if not status.get("success"):
+                failed.append(alias)
+                if self.policy == "fail_fast":
+                    stop.set()
+            return status
+
+        with ThreadPoolExecutor(max_workers=min(self.max_parallel, len(aliases)) or 1) as pool:
+            futures = {alias: pool.submit(contextvars.copy_context().run, deploy_one, alias) for alias in aliases}
+            statuses = {alias: future.result() for alias, future in futures.items()}
+        return self.aggregate(statuses, time.perf_counter() - started)
+
+    async def adeploy(self, deploy_root: str, aliases: Iterable[str]) -> Dict[str, Any]:
+        """deploy() on the event loop: one task per org, bounded by a semaphore."""
+        aliases = list(aliases)
+        started = time.perf_counter()
+        gate = asyncio.Semaphore(self.max_parallel)
+        failed: List[str] = []
+
+        async def deploy_one(alias: str) -> Dict[str, Any]:
+            async with gate:
+                if failed and self.policy == "fail_fast":
+                    return self._skipped(alias, failed)
+                with span("deploy_org", org=alias) as org_span:
+                    try:
+                        status = await self.transport.adeploy(deploy_root, alias)
+                    except Exception as e:
+                        status = failed_status(f"Deployment to {alias} failed: {e}")
+                    org_span.set(success=bool(status.get("success")))
+            if not status.get("success"):
+                failed.append(alias)
+            return status
+
+        results = await asyncio.gather(*(deploy_one(alias) for alias in aliases))
+        return self.aggregate(dict(zip(aliases, results)), time.perf_counter() - started)
+
+    def aggregate(self, statuses: Dict[str, Dict[str, Any]], seconds: float) -> Dict[str, Any]:
+        """One deploy_status for the whole rollout, with each org's status under `orgs`."""
+        for status in statuses.values():
+            status.setdefault("message", "Deployment validation successful" if status.get("success")
+                              else "Deployment validation failed")
+        failed = [alias for alias, s in statuses.items() if not s.get("success") and not s.get("skipped")]
+        skipped = [alias for alias, s in statuses.items() if s.get("skipped")]
+
+        failures: Dict[tuple, Dict[str, Any]] = {}
+        for alias in failed:
+            status = statuses[alias]
+            org_failures = status.get("component_failures")
+            if org_failures is None:
+                org_failures = parse_component_results(status.get("parsed_response"))["failures"]
+            for c in org_failures:
+                key = (c.get("fileName"), c.get("lineNumber"), c.get("problem"))
+                failures.setdefault(key, dict(c, orgs=[]))["orgs"].append(alias)
+
+        first_failure = statuses[failed[0]] if failed else {}
+        if not failed and not skipped:
+            message = f"Deployment validation successful on {len(statuses)} orgs"
+        else:
+            message = f"Deployment validation failed on {', '.join(failed) or 'none'}"
+            if skipped:
+                message += f" ({len(skipped)} skipped)"
+        logger.info("Fan-out to %d orgs finished in %.1fs: %s", len(statuses), seconds, message)
+
+        return {
+            "success": not failed and not skipped,
+            "returncode": first_failure.get("returncode", 0),
+            "stdout": "",
+            "stderr": "",
+            "parsed_response": first_failure.get("parsed_response"),
+            "written_files": [],
+            "deploy_command": first_failure.get("deploy_command"),
+            "message": message,
+            "policy": self.policy,
+            "orgs": statuses,
+            "failed_orgs": failed,
+            "skipped_orgs": skipped,
+            "component_failures": list(failures.values()),
+            "fanout_seconds": round(seconds, 3),
+        }
@@ -0,0 +1,82 @@
+import io
+import os
+import shutil
+import zipfile
+import xml.etree.ElementTree as ET
+from typing import Dict, Any, List, Optional
+
+from src.utils.log import get_logger
+
+logger = get_logger("deploy")
+
+DEPLOY_ROOT = "force-app"
+
+XML_EXTENSIONS = ['.xml', '.object', '.layout', '.profile', '.permissionset']
+APEX_EXTENSIONS = ['.cls', '.trigger']
+COMPONENT_EXTENSIONS = ['.js', '.cmp', '.app', '.evt']
+
+
+def file_key(f: Dict[str, Any]) -> str:
+    """Identity of a generated file: its SFDX path plus file name, slash-normalized."""
+    rel_path = (f.get("filePath") or "").replace("\\", "/").strip("/")
+    fname = f.get("fileName") or ""
+    return f"{rel_path}/{fname}" if rel_path else fname
+
+
+def validate_file(f: Dict[str, Any]) -> Optional[str]:
+    """
+    Validate a generated file based on its extension.
+    Returns an error message for blocking problems, None otherwise.
+    """
+    fname = f["fileName"]
+    content = f["content"]
+    file_ext = os.path.splitext(fname)[1].lower()
+
+    if file_ext in XML_EXTENSIONS:
+        try:
+            ET.fromstring(content)
+            logger.debug("XML validated: %s", fname)
+        except ET.ParseError as e:
+            return f"Invalid XML: {fname}\n{e}"
+    elif file_ext in APEX_EXTENSIONS:
+        if not content.strip():
+            return f"Empty Apex file: {fname}"
+        logger.debug("Apex file validated: %s", fname)
+    elif file_ext in COMPONENT_EXTENSIONS:
+        if not content.strip():
+            return f"Empty component file: {fname}"
+        logger.debug("Component file validated: %s", fname)
+    else:
+        if not content.strip():
+            logger.warning("Empty file: %s", fname)
+        logger.debug("File validated: %s", fname)
+    return None
+
+
+def reset_deploy_root(deploy_root: str = DEPLOY_ROOT) -> None:
+    """Remove a previous deploy tree and recreate the main/default skeleton."""
+    if os.path.exists(deploy_root):
+        logger.info("Removing existing force-app folder: %s", deploy_root)
+        shutil.rmtree(deploy_root)
+    os.makedirs(os.path.join(deploy_root, "main", "default"), exist_ok=True)
+
+
+def files_zip(files: List[Dict[str, Any]], deploy_root: str = DEPLOY_ROOT) -> bytes:
+    """Generated files as a zip laid out like the deploy tree; a later file with the same path wins."""
+    by_key = {file_key(f): f for f in files}
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zf:
+        for key, f in by_key.items():
+            zf.writestr(f"{deploy_root}/{key}", f.get("content") or "")
+    return buffer.getvalue()
+
+
+def write_file(f: Dict[str, Any], deploy_root: str = DEPLOY_ROOT) -> str:
+    full_path = os.path.join(deploy_root, f["filePath"], f["fileName"])
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+
+    with open(full_path, "w", encoding="utf-8") as fh:
+        fh.write(f["content"])
+
+    logger.debug("Wrote %s", full_path)
+    return full_path
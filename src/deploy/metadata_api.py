@@ -0,0 +1,474 @@
+import os
+import io
+import time
+import json
+import base64
+import asyncio
+import zipfile
+import xml.etree.ElementTree as ET
+from typing import Dict, Any, List, Optional, Tuple
+from xml.sax.saxutils import escape
+
+import requests
+
+from src.deploy.results import failed_status
+from src.utils.log import get_logger
+from src.utils.tracing import deploy_span
+
+logger = get_logger("deploy")
+
+MDAPI_NS = "http://soap.sforce.com/2006/04/metadata"
+SOAP_NS = "http://schemas.xmlsoap.org/soap/envelope/"
+API_VERSION = os.getenv("INSTAFORCE_SF_API_VERSION", "59.0")
+POLL_SECONDS = float(os.getenv("INSTAFORCE_METADATA_POLL_SECONDS", "2"))
+MAX_POLL_SECONDS = 10.0
+WAIT_MINUTES = 60
+REQUEST_TIMEOUT_SECONDS = 120
+# SOAP endpoint and session of a non-org target, e.g. `python -m src.deploy.fake_metadata_api`
+METADATA_API_ENDPOINT = os.getenv("INSTAFORCE_METADATA_API_ENDPOINT", "")
+METADATA_API_SESSION_ID = os.getenv("INSTAFORCE_METADATA_API_SESSION_ID", "00Dfake!session")
+
+# source directory -> (metadata type, file suffix); files are `<Name>.<suffix>` plus `-meta.xml`
+CODE_TYPES = {
+    "classes": ("ApexClass", "cls"),
+    "triggers": ("ApexTrigger", "trigger"),
+    "pages": ("ApexPage", "page"),
+    "components": ("ApexComponent", "component"),
+}
+# source directory -> metadata type of a bundle directory (lwc/<bundle>/...)
+BUNDLE_TYPES = {
+    "lwc": "LightningComponentBundle",
+    "aura": "AuraDefinitionBundle",
+}
+# source directory -> (metadata type, suffix) of types that are a single `<Name>.<suffix>-meta.xml`
+XML_TYPES = {
+    "layouts": ("Layout", "layout"),
+    "flows": ("Flow", "flow"),
+    "flexipages": ("FlexiPage", "flexipage"),
+    "permissionsets": ("PermissionSet", "permissionset"),
+    "profiles": ("Profile", "profile"),
+    "tabs": ("CustomTab", "tab"),
+    "applications": ("CustomApplication", "app"),
+    "approvalProcesses": ("ApprovalProcess", "approvalProcess"),
+    "quickActions": ("QuickAction", "quickAction"),
+    "customMetadata": ("CustomMetadata", "md"),
+    "globalValueSets": ("GlobalValueSet", "globalValueSet"),
+    "remoteSiteSettings": ("RemoteSiteSetting", "remoteSite"),
+    "workflows": ("Workflow", "workflow"),
+    "labels": ("CustomLabels", "labels"),
+}
+# objects/<Object>/<directory>/<Name>.<suffix>-meta.xml -> (element in the .object file, metadata type)
+OBJECT_CHILDREN = {
+    "fields": ("fields", "CustomField", "field"),
+    "validationRules": ("validationRules", "ValidationRule", "validationRule"),
+    "listViews": ("listViews", "ListView", "listView"),
+    "recordTypes": ("recordTypes", "RecordType", "recordType"),
+    "webLinks": ("webLinks", "WebLink", "webLink"),
+    "compactLayouts": ("compactLayouts", "CompactLayout", "compactLayout"),
+    "fieldSets": ("fieldSets", "FieldSet", "fieldSet"),
+    "businessProcesses": ("businessProcesses", "BusinessProcess", "businessProcess"),
+}
+# DeployOptions is an xsd:sequence: its elements must be sent in this order
+DEPLOY_OPTIONS = ("allowMissingFiles", "autoUpdatePackage", "checkOnly", "ignoreWarnings", "performRetrieve",
+                  "purgeOnDelete", "rollbackOnError", "runAllTests", "runTests", "singlePackage", "testLevel")
+INT_FIELDS = {"lineNumber", "columnNumber", "numberComponentsTotal", "numberComponentsDeployed",
+              "numberComponentErrors", "numberTestsTotal", "numberTestsCompleted", "numberTestErrors"}
+
+ET.register_namespace("", MDAPI_NS)
+
+
+class MetadataApiError(Exception):
+    """A failed Metadata API request or SOAP fault; `code` is the fault code (e.g. INVALID_SESSION_ID)."""
+    def __init__(self, message: str, code: str = ""):
+        super().__init__(message)
+        self.code = code
+
+
+class UnsupportedMetadataError(MetadataApiError):
+    """The deploy root holds metadata MetadataPackage cannot convert; nothing was submitted."""
+
+
+# ---------------------------------------------------------
+# source format -> deployable zip
+# ---------------------------------------------------------
+
+class MetadataPackage:
+    """
+    Converts a source-format deploy root (force-app/main/default/...) into the Metadata
+    API layout: one directory per type, decomposed objects recomposed into a single
+    `<Object>.object`, and a package.xml listing every member. Keeps where each
+    component came from, so results can be reported against the source files.
+    """
+    def __init__(self, deploy_root: str, api_version: str = API_VERSION):
+        self.deploy_root = deploy_root
+        self.api_version = api_version
+        self.entries: Dict[str, bytes] = {}           # zip path -> content
+        self.members: Dict[str, List[str]] = {}       # metadata type -> members
+        self.sources: Dict[Tuple[str, str], str] = {}  # (type, fullName) -> source path
+        self.zip_sources: Dict[str, str] = {}          # zip path -> source path
+        self._objects: Dict[str, Dict[str, Any]] = {}
+        self._convert()
+
+    def _add_member(self, kind: str, name: str, source: str, zip_path: Optional[str] = None):
+        if name not in self.members.setdefault(kind, []):
+            self.members[kind].append(name)
+        self.sources.setdefault((kind, name), source)
+        if zip_path:
+            self.zip_sources.setdefault(zip_path, source)
+
+    def _convert(self):
+        for dirpath, _, filenames in os.walk(self.deploy_root):
+            for file_name in sorted(filenames):
+                path = os.path.join(dirpath, file_name)
+                source = os.path.relpath(path, self.deploy_root).replace("\\", "/")
+                with open(path, "rb") as fh:
+                    self._convert_file(source, fh.read())
+        for name, obj in self._objects.items():
+            self._compose_object(name, obj)
+        if not self.members:
+            raise UnsupportedMetadataError("Nothing to deploy under " + self.deploy_root)
+        self.entries["package.xml"] = self.package_xml().encode("utf-8")
+
+    @staticmethod
+    def _type_dir(parts: List[str]) -> int:
+        known = set(CODE_TYPES) | set(BUNDLE_TYPES) | set(XML_TYPES) | {"objects"}
+        for i in range(len(parts) - 1):
+            if parts[i] in known:
+                return i
+        return -1
+
+    def _convert_file(self, source: str, content: bytes):
+        parts = source.split("/")
+        i = self._type_dir(parts)
+        if i < 0:
+            raise UnsupportedMetadataError(f"Unsupported metadata location: {source}")
+        directory, rest = parts[i], parts[i + 1:]
+        file_name = rest[-1]
+
+        if directory in BUNDLE_TYPES:
+            zip_path = "/".join([directory] + rest)
+            self.entries[zip_path] = content
+            self._add_member(BUNDLE_TYPES[directory], rest[0], source, zip_path)
+        elif directory in CODE_TYPES:
+            kind, suffix = CODE_TYPES[directory]
+            zip_path = f"{directory}/{file_name}"
+            self.entries[zip_path] = content
+            if file_name.endswith(f".{suffix}"):
+                self._add_member(kind, file_name[:-len(suffix) - 1], source, zip_path)
+        elif directory in XML_TYPES:
+            kind, suffix = XML_TYPES[directory]
+            meta = f".{suffix}-meta.xml"
+            if not file_name.endswith(meta):
+                raise UnsupportedMetadataError(f"Unsupported {kind} file: {source}")
+            name = file_name[:-len(meta)]
+            zip_path = f"{directory}/{name}.{suffix}"
+            self.entries[zip_path] = content
+            self._add_member(kind, name, source, zip_path)
+        else:
+            self._collect_object_part(source, rest, content)
+
+    def _collect_object_part(self, source: str, rest: List[str], content: bytes):
+        obj = self._objects.setdefault(rest[0], {"root": None, "source": None, "children": []})
+        if len(rest) == 2 and rest[1] == f"{rest[0]}.object-meta.xml":
+            obj["root"], obj["source"] = content, source
+            return
+        if len(rest) == 3 and rest[1] in OBJECT_CHILDREN:
+            tag, kind, suffix = OBJECT_CHILDREN[rest[1]]
+            meta = f".{suffix}-meta.xml"
+            if rest[2].endswith(meta):
+                obj["children"].append((tag, kind, rest[2][:-len(meta)], content, source))
+                return
+        raise UnsupportedMetadataError(f"Unsupported object metadata: {source}")
+
+    def _compose_object(self, name: str, obj: Dict[str, Any]):
+        zip_path = f"objects/{name}.object"
+        try:
+            root = ET.fromstring(obj["root"]) if obj["root"] else ET.Element(f"{{{MDAPI_NS}}}CustomObject")
+            for tag, kind, child_name, content, source in obj["children"]:
+                child = ET.fromstring(content)
+                child.tag = f"{{{MDAPI_NS}}}{tag}"
+                if child.find(f"{{{MDAPI_NS}}}fullName") is None:
+                    full_name = ET.Element(f"{{{MDAPI_NS}}}fullName")
+                    full_name.text = child_name
+                    child.insert(0, full_name)
+                root.append(child)
+                self._add_member(kind, f"{name}.{child_name}", source, zip_path)
+        except ET.ParseError as e:
+            raise UnsupportedMetadataError(f"Invalid XML in object {name}: {e}") from e
+        if obj["root"]:
+            self._add_member("CustomObject", name, obj["source"], zip_path)
+        self.zip_sources.setdefault(zip_path, obj["source"] or obj["children"][0][4])
+        self.entries[zip_path] = b'<?xml version="1.0" encoding="UTF-8"?>\n' + ET.tostring(root, encoding="utf-8")
+
+    def package_xml(self) -> str:
+        types = "".join(
+            "    <types>\n" + "".join(f"        <members>{escape(m)}</members>\n" for m in sorted(members))
+            + f"        <name>{kind}</name>\n    </types>\n"
+            for kind, members in sorted(self.members.items()))
+        return (f'<?xml version="1.0" encoding="UTF-8"?>\n<Package xmlns="{MDAPI_NS}">\n{types}'
+                f"    <version>{self.api_version}</version>\n</Package>\n")
+
+    def zip_bytes(self) -> bytes:
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zf:
+            for path, content in sorted(self.entries.items()):
+                zf.writestr(path, content)
+        return buffer.getvalue()
+
+    def source_of(self, component: Dict[str, Any]) -> str:
+        """Source path of a component reported by checkDeployStatus, else its own fileName."""
+        key = (component.get("componentType") or "", component.get("fullName") or "")
+        file_name = (component.get("fileName") or "").replace("\\", "/")
+        return self.sources.get(key) or self.zip_sources.get(file_name) or file_name
+
+    def component_count(self) -> int:
+        return sum(len(m) for m in self.members.values())
+
+
+# ---------------------------------------------------------
+# SOAP client
+# ---------------------------------------------------------
+
+def _local(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+
+def _element_dict(element: ET.Element) -> Any:
+    """SOAP result element as plain data; repeated children become lists."""
+    children = list(element)
+    if not children:
+        text = element.text or ""
+        if text in ("true", "false"):
+            return text == "true"
+        if _local(element.tag) in INT_FIELDS and text.lstrip("-").isdigit():
+            return int(text)
+        return text
+    data: Dict[str, Any] = {}
+    for child in children:
+        key, value = _local(child.tag), _element_dict(child)
+        if key in data:
+            if not isinstance(data[key], list):
+                data[key] = [data[key]]
+            data[key].append(value)
+        else:
+            data[key] = value
+    return data
+
+
+class MetadataApiClient:
+    """
+    deploy / checkDeployStatus calls of the Metadata SOAP API over plain HTTP.
+
+    With `endpoint` (or INSTAFORCE_METADATA_API_ENDPOINT) the client talks to that
+    endpoint with `session_id`, e.g. the fake server in src.deploy.fake_metadata_api;
+    otherwise both come from the org's cached
+    session (src.org.sessions), whose pooled HTTP connections are reused, and a call
+    rejected with INVALID_SESSION_ID logs in again and is retried once.
+    """
+    def __init__(self, endpoint: Optional[str] = None, session_id: Optional[str] = None,
+                 api_version: str = API_VERSION, timeout_seconds: float = REQUEST_TIMEOUT_SECONDS):
+        self.endpoint = endpoint or METADATA_API_ENDPOINT or None
+        self.session_id = session_id or METADATA_API_SESSION_ID
+        self.api_version = api_version
+        self.timeout_seconds = timeout_seconds
+        self._http = requests.Session() if self.endpoint else None
+
+    def is_available(self, alias: Optional[str] = None) -> bool:
+        if self.endpoint:
+            return True
+        from src.org.connection import org_credentials
+        return bool(org_credentials(alias)["username"])
+
+    def _target(self, alias: str, stale_session_id: Optional[str] = None):
+        if self.endpoint:
+            return self.endpoint, self.session_id or "", self._http
+        from src.org.sessions import SESSIONS
+        session = SESSIONS.session(alias, stale_session_id=stale_session_id)
+        endpoint = f"https://{session.instance}/services/Soap/m/{self.api_version}"
+        return endpoint, session.session_id, session.client.session
+
+    def _envelope(self, session_id: str, body: str) -> str:
+        return (f'<?xml version="1.0" encoding="UTF-8"?>\n'
+                f'<soapenv:Envelope xmlns:soapenv="{SOAP_NS}" xmlns:met="{MDAPI_NS}">'
+                f"<soapenv:Header><met:SessionHeader><met:sessionId>{escape(session_id)}</met:sessionId>"
+                f"</met:SessionHeader></soapenv:Header><soapenv:Body>{body}</soapenv:Body></soapenv:Envelope>")
+
+    def _post(self, endpoint: str, session_id: str, http: requests.Session, body: str) -> Dict[str, Any]:
+        try:
+            response = http.post(endpoint, data=self._envelope(session_id, body).encode("utf-8"),
+                                 headers={"Content-Type": "text/xml; charset=UTF-8", "SOAPAction": '""'},
+                                 timeout=self.timeout_seconds)
+            root = ET.fromstring(response.content)
+        except (requests.RequestException, ET.ParseError) as e:
+            raise MetadataApiError(f"Metadata API request failed: {e}") from e
+        soap_body = next((el for el in root if _local(el.tag) == "Body"), None)
+        if soap_body is None or not len(soap_body):
+            raise MetadataApiError(f"Malformed SOAP response (HTTP {response.status_code})")
+        payload = soap_body[0]
+        if _local(payload.tag) == "Fault":
+            fault = _element_dict(payload)
+            code = str(fault.get("faultcode", "")).split(":")[-1]
+            raise MetadataApiError(fault.get("faultstring") or code or "SOAP fault", code)
+        result = next((el for el in payload if _local(el.tag) == "result"), None)
+        return _element_dict(result) if result is not None else {}
+
+    def call(self, alias: str, body: str) -> Dict[str, Any]:
+        endpoint, session_id, http = self._target(alias)
+        try:
+            return self._post(endpoint, session_id, http, body)
+        except MetadataApiError as e:
+            if e.code != "INVALID_SESSION_ID" or self.endpoint:
+                raise
+            logger.warning("Session of org %s expired; logging in again", alias)
+            endpoint, session_id, http = self._target(alias, stale_session_id=session_id)
+            return self._post(endpoint, session_id, http, body)
+
+    def deploy(self, alias: str, zip_bytes: bytes, options: Dict[str, Any]) -> str:
+        """Submit a deployment; returns its async process id."""
+        unknown = sorted(set(options) - set(DEPLOY_OPTIONS))
+        if unknown:
+            raise MetadataApiError(f"Unknown DeployOptions: {', '.join(unknown)}")
+        opts = "".join(f"<met:{k}>{str(v).lower() if isinstance(v, bool) else escape(str(v))}</met:{k}>"
+                       for k in DEPLOY_OPTIONS if k in options
+                       for v in (options[k] if isinstance(options[k], list) else [options[k]]))
+        body = (f"<met:deploy><met:ZipFile>{base64.b64encode(zip_bytes).decode('ascii')}</met:ZipFile>"
+                f"<met:DeployOptions>{opts}</met:DeployOptions></met:deploy>")
+        result = self.call(alias, body)
+        if not result.get("id"):
+            raise MetadataApiError("deploy returned no async process id")
+        return result["id"]
+
+    def check_deploy_status(self, alias: str, deploy_id: str, include_details: bool = True) -> Dict[str, Any]:
+        body = (f"<met:checkDeployStatus><met:asyncProcessId>{escape(deploy_id)}</met:asyncProcessId>"
+                f"<met:includeDetails>{str(include_details).lower()}</met:includeDetails></met:checkDeployStatus>")
+        return self.call(alias, body)
+
+
+# ---------------------------------------------------------
+# transport
+# ---------------------------------------------------------
+
+class MetadataApiTransport:
+    """
+    Deploys from Python with the Metadata API deploy / checkDeployStatus calls instead
+    of spawning the sf CLI, saving its process start, plugin load and auth lookup and
+    needing no executable path. The deploy root is converted to a Metadata API zip
+    (MetadataPackage), submitted, and polled with a growing interval until done.
+
+    Results come back in the CLI's JSON shape (result.details.componentFailures with
+    source file names), so deploy_status, the repair loop and the coalescer work
+    unchanged. A tree the converter does not support goes to `fallback` (the CLI)
+    when one is configured; once submitted, a deployment is never repeated there.
+    """
+    sf_exe = "metadata-api"
+    strategy = "metadata_api"
+
+    def __init__(self, client: Optional[MetadataApiClient] = None, fallback=None,
+                 options: Optional[Dict[str, Any]] = None, poll_seconds: float = POLL_SECONDS,
+                 wait_minutes: int = WAIT_MINUTES):
+        self.client = client or MetadataApiClient()
+        self.fallback = fallback
+        self.options = {"rollbackOnError": True, "singlePackage": True, **(options or {})}
+        self.poll_seconds = poll_seconds
+        self.wait_minutes = wait_minutes
+
+    def is_available(self) -> bool:
+        return self.client.is_available() or bool(self.fallback and self.fallback.is_available())
+
+    def _poll(self, alias: str, deploy_id: str) -> Dict[str, Any]:
+        deadline = time.monotonic() + self.wait_minutes * 60
+        interval = self.poll_seconds
+        while True:
+            result = self.client.check_deploy_status(alias, deploy_id)
+            if result.get("done"):
+                return result
+            if time.monotonic() > deadline:
+                raise MetadataApiError(f"Deployment {deploy_id} still {result.get('status')} "
+                                       f"after {self.wait_minutes} minutes")
+            time.sleep(interval)
+            interval = min(interval * 1.5, MAX_POLL_SECONDS)
+
+    @staticmethod
+    def _outcome(package: MetadataPackage, deploy_id: str, result: Dict[str, Any]) -> Dict[str, Any]:
+        details = result.get("details") if isinstance(result.get("details"), dict) else {}
+
+        def components(key: str) -> List[Dict[str, Any]]:
+            entries = details.get(key) or []
+            entries = entries if isinstance(entries, list) else [entries]
+            return [dict(e, fileName=package.source_of(e)) for e in entries if isinstance(e, dict)]
+
+        failures = components("componentFailures")
+        success = bool(result.get("success")) and result.get("status") == "Succeeded"
+        if not success and not failures and result.get("errorMessage"):
+            failures = [{"fileName": "", "fullName": "", "componentType": "", "problem": result["errorMessage"],
+                         "problemType": "Error", "lineNumber": None, "columnNumber": None}]
+        parsed = {
+            "status": 0 if success else 1,
+            "result": {
+                "id": deploy_id,
+                "status": result.get("status"),
+                "success": success,
+                "numberComponentsTotal": result.get("numberComponentsTotal"),
+                "numberComponentErrors": result.get("numberComponentErrors"),
+                "details": {"componentSuccesses": components("componentSuccesses"),
+                            "componentFailures": failures,
+                            "runTestResult": details.get("runTestResult")},
+            },
+        }
+        return {
+            "success": success,
+            "returncode": 0 if success else 1,
+            "stdout": json.dumps(parsed),
+            "stderr": "",
+            "parsed_response": parsed,
+            "deploy_command": f"metadata-api deploy {deploy_id} ({package.component_count()} components)",
+        }
+
+    def _options(self, tests: Optional[Dict[str, Any]], check_only: bool = False) -> Dict[str, Any]:
+        options = dict(self.options, checkOnly=True) if check_only else self.options
+        if not tests:
+            return options
+        options = dict(options, testLevel=tests["level"])
+        if tests.get("classes"):
+            options["runTests"] = list(tests["classes"])
+        return options
+
+    def _deploy(self, deploy_root: str, alias: str, tests: Optional[Dict[str, Any]] = None,
+                check_only: bool = False) -> Dict[str, Any]:
+        with deploy_span("metadata_api", deploy_root) as span:
+            try:
+                package = MetadataPackage(deploy_root, self.client.api_version)
+                deploy_id = self.client.deploy(alias, package.zip_bytes(), self._options(tests, check_only))
+                logger.info("Metadata API deployment %s submitted to %s (%d components)",
+                            deploy_id, alias, package.component_count())
+                outcome = self._outcome(package, deploy_id, self._poll(alias, deploy_id))
+            except MetadataApiError:
+                span.set(success=False)
+                raise
+            span.set(success=outcome["success"], components=package.component_count())
+        return outcome
+
+    def deploy(self, deploy_root: str, alias: str, tests: Optional[Dict[str, Any]] = None,
+               check_only: bool = False) -> Dict[str, Any]:
+        try:
+            return self._deploy(deploy_root, alias, tests, check_only)
+        except MetadataApiError as e:
+            return self._failed(e, deploy_root, alias) or self.fallback.deploy(deploy_root, alias, tests=tests,
+                                                                                check_only=check_only)
+
+    async def adeploy(self, deploy_root: str, alias: str, tests: Optional[Dict[str, Any]] = None,
+                      check_only: bool = False) -> Dict[str, Any]:
+        """deploy() for the event loop: the SOAP calls and polling run on a thread."""
+        try:
+            return await asyncio.to_thread(self._deploy, deploy_root, alias, tests, check_only)
+        except MetadataApiError as e:
+            return self._failed(e, deploy_root, alias) or await self.fallback.adeploy(deploy_root, alias, tests=tests,
+                                                                                      check_only=check_only)
+
+    def _failed(self, error: MetadataApiError, deploy_root: str, alias: str) -> Optional[Dict[str, Any]]:
+        """failed deploy_status, or None when `fallback` should deploy instead."""
+        if isinstance(error, UnsupportedMetadataError) and self.fallback is not None and self.fallback.is_available():
+            logger.warning("Metadata API cannot deploy this tree to %s, using %s: %s", alias, self.fallback.sf_exe, error)
+            return None
+        logger.error("Metadata API deploy to %s failed: %s", alias, error)
+        return failed_status(f"Metadata API deploy failed: {error}", deploy_command=f"metadata-api deploy {deploy_root}")
@@ -0,0 +1,122 @@
+from typing import Dict, Any, List, Optional
+
+
+def _as_list(value: Any) -> List[Dict[str, Any]]:
+    # the CLI collapses single-element arrays into a bare object
+    if isinstance(value, list):
+        return [v for v in value if isinstance(v, dict)]
+    if isinstance(value, dict):
+        return [value]
+    return []
+
+
+def _deploy_result(parsed: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    if not isinstance(parsed, dict):
+        return {}
+    for key in ("result", "data"):
+        if isinstance(parsed.get(key), dict):
+            return parsed[key]
+    return {}
+
+
+def _normalize_component(entry: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "fileName": (entry.get("fileName") or entry.get("filePath") or "").replace("\\", "/"),
+        "fullName": entry.get("fullName", ""),
+        "componentType": entry.get("componentType") or entry.get("type", ""),
+        "problem": entry.get("problem") or entry.get("error", ""),
+        "problemType": entry.get("problemType", ""),
+        "lineNumber": entry.get("lineNumber"),
+        "columnNumber": entry.get("columnNumber"),
+    }
+
+
+def parse_component_results(parsed: Optional[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Extract per-component successes and failures from `sf project deploy start --json` output.
+    Prefers result.details; falls back to the flattened result.files list.
+    """
+    result = _deploy_result(parsed)
+    details = result.get("details") if isinstance(result.get("details"), dict) else {}
+
+    successes = [_normalize_component(c) for c in _as_list(details.get("componentSuccesses"))]
+    failures = [_normalize_component(c) for c in _as_list(details.get("componentFailures"))]
+
+    if not successes and not failures:
+        for entry in _as_list(result.get("files")):
+            if entry.get("state") == "Failed":
+                failures.append(_normalize_component(entry))
+            else:
+                successes.append(_normalize_component(entry))
+
+    # package.xml is reported as a pseudo component; it belongs to no generated file
+    successes = [c for c in successes if c["fileName"] and c["fileName"] != "package.xml"]
+    return {"successes": successes, "failures": failures}
+
+
+def _number(value: Any) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def parse_test_results(parsed: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Apex test outcomes from result.details.runTestResult: per test class the passed and
+    failed methods and their time in ms, and per class under test its coverage (0-100).
+    """
+    details = _deploy_result(parsed).get("details")
+    run = details.get("runTestResult") if isinstance(details, dict) else None
+    if not isinstance(run, dict):
+        return {"classes": {}, "coverage": {}}
+
+    classes: Dict[str, Dict[str, Any]] = {}
+    for key, outcome in (("successes", "passed"), ("failures", "failed")):
+        for entry in _as_list(run.get(key)):
+            c = classes.setdefault(entry.get("name") or "", {"passed": [], "failed": [], "time_ms": 0.0})
+            c[outcome].append(entry.get("methodName", ""))
+            c["time_ms"] += _number(entry.get("time"))
+
+    coverage = {}
+    for entry in _as_list(run.get("codeCoverage")):
+        locations = _number(entry.get("numLocations"))
+        if entry.get("name") and locations:
+            coverage[entry["name"]] = round(100.0 * (locations - _number(entry.get("numLocationsNotCovered"))) / locations, 1)
+    return {"classes": classes, "coverage": coverage}
+
+
+def component_matches_file(component_file: str, written_path: str) -> bool:
+    """True when a CLI-reported file name refers to a file we wrote (or its -meta.xml twin)."""
+    if not component_file:
+        return False
+    written = written_path.replace("\\", "/")
+    if written.endswith("-meta.xml"):
+        written_base = written[:-len("-meta.xml")]
+    else:
+        written_base = written
+    reported = component_file.replace("\\", "/")
+    if reported.endswith("-meta.xml"):
+        reported = reported[:-len("-meta.xml")]
+    return _path_endswith(written_base, reported) or _path_endswith(reported, written_base)
+
+
+def _path_endswith(path: str, tail: str) -> bool:
+    """`path` ends with the whole path segments of `tail` (classes/Foo.cls is not in classes/MyFoo.cls)."""
+    return path == tail or path.endswith("/" + tail.lstrip("/"))
+
+
+def failed_status(message: str, **extra) -> Dict[str, Any]:
+    """deploy_status for a deployment that was stopped before reaching the org."""
+    status = {
+        "success": False,
+        "returncode": None,
+        "stdout": "",
+        "stderr": "",
+        "parsed_response": None,
+        "written_files": [],
+        "deploy_command": None,
+        "message": message,
+    }
+    status.update(extra)
+    return status
@@ -0,0 +1,309 @@
+import os
+import re
+import difflib
+from typing import Dict, Any, Iterable, List, Optional, Set
+
+from src.deploy.files import file_key
+from src.utils.log import get_logger
+
+logger = get_logger("symbols")
+
+SYMBOL_CHECK = os.getenv("INSTAFORCE_SYMBOL_CHECK", "block")  # block | warn | off
+
+# comments and string literals, blanked before scanning (lengths kept for line numbers)
+_NOISE = re.compile(r"//[^\n]*|/\*.*?\*/|'(?:\\.|[^'\\\n])*'", re.S)
+# patterns start with a literal where possible; the regex engine skips ahead to it
+_TYPE_DECL = re.compile(
+    r"(class|interface|enum)\s+([A-Za-z]\w*)(?:\s+extends\s+([\w.]+(?:\s*,\s*[\w.]+)*))?"
+    r"(?:\s+implements\s+([^{]+?))?\s*\{")
+# end of a parameter list opening a body, or ending a body-less (interface or abstract)
+# declaration; the method name precedes the "(", and its declaration (annotations,
+# modifiers, return type) reaches back to the previous ; { or }
+_DECL_END = re.compile(r"\)\s*(?:throws\s[\w.,\s]+)?([{;])")
+_ANNOTATION = re.compile(r"@\w+(?:\s*\([^)]*\))?")
+_MODIFIERS = {"public", "private", "protected", "global", "static", "override", "virtual", "abstract",
+              "webservice", "testmethod", "final"}
+# `.method(`; the receiver before the dot is read backwards (_receiver)
+_MEMBER_CALL = re.compile(r"\.\s*([A-Za-z_]\w*)\s*\(")
+# `new X(...)`, optionally followed by `.method(`
+_NEW = re.compile(r"new\s+([A-Z]\w*)\s*\([^()]*\)(?:\s*\.\s*([A-Za-z_]\w*)\s*\()?")
+_VAR_DECL = re.compile(r"([A-Z]\w*)\s+([a-z_]\w*)\s*(?=[;=,)])")
+_IDENT = re.compile(r"[A-Za-z_]\w*")
+_PARAMS = re.compile(r"[^;{}()]*")
+_APEX_IMPORT = re.compile(r"""import\s+\w+\s+from\s+['"]@salesforce/apex/(?:\w+\.)?(\w+)\.(\w+)['"]""")
+_LWC_PATH = re.compile(r"(?:^|/)lwc/[^/]+/[^/]+\.js$")
+
+_KEYWORDS = {"if", "for", "while", "catch", "switch", "when", "return", "new", "else", "do", "try", "on"}
+# methods every Apex object has
+_OBJECT_METHODS = {"tostring", "equals", "hashcode", "clone"}
+# built-in methods of every enum: Status.values(), Status.valueOf('OPEN'), s.name(), s.ordinal()
+_ENUM_METHODS = {"values": True, "valueOf": True, "name": False, "ordinal": False}
+_CLOSE_MATCH_CUTOFF = 0.8
+# short names (Test, Math, Date) are too close to too many generated names to suggest
+_MIN_SUGGEST_CHARS = 6
+_SYSTEM_CLASSES = {
+    "system", "database", "test", "math", "string", "integer", "decimal", "double", "long", "boolean", "date",
+    "datetime", "time", "blob", "id", "json", "jsonparser", "limits", "userinfo", "trigger", "messaging",
+    "http", "httprequest", "httpresponse", "label", "url", "crypto", "encodingutil", "pattern", "matcher",
+    "type", "schema", "search", "approval", "eventbus", "apexpages", "pagereference", "assert", "map", "list",
+    "set", "object", "exception", "queueable", "auth", "connectapi", "flow", "cache", "sobject", "sobjecttype",
+    "dmlexception", "queryexception", "restcontext", "restrequest", "restresponse", "site", "network",
+}
+
+
+def _word_start(code: str, pos: int) -> bool:
+    return pos == 0 or not (code[pos - 1].isalnum() or code[pos - 1] in "_.")
+
+
+def _identifier_before(code: str, pos: int):
+    """(identifier, its start) ending at `pos`, skipping whitespace; ("", pos) when there is none."""
+    end = pos
+    while end > 0 and code[end - 1].isspace():
+        end -= 1
+    start = end
+    while start > 0 and (code[start - 1].isalnum() or code[start - 1] == "_"):
+        start -= 1
+    return code[start:end], start
+
+
+def _blank(match: re.Match) -> str:
+    return re.sub(r"[^\n]", " ", match.group(0))
+
+
+def _line_of(content: str, pos: int) -> int:
+    return content.count("\n", 0, pos) + 1
+
+
+def _type_names(names: Optional[str]) -> List[str]:
+    """Simple names of an extends / implements list (`Outer.IHandler, Database.Batchable<SObject>`)."""
+    names = re.sub(r"<[^{]*>", "", names or "")
+    return [n.strip().split(".")[-1] for n in names.split(",") if n.strip()]
+
+
+def _body_end(code: str, open_brace: int) -> int:
+    depth = 0
+    for pos in range(open_brace, len(code)):
+        if code[pos] == "{":
+            depth += 1
+        elif code[pos] == "}":
+            depth -= 1
+            if not depth:
+                return pos
+    return len(code)
+
+
+class _Type:
+    def __init__(self, name: str, file: Dict[str, Any], base: Optional[str], interfaces: Iterable[str] = ()):
+        self.name = name
+        self.file = file
+        self.base = base
+        # implemented interfaces, or the interfaces an interface extends
+        self.interfaces = list(interfaces)
+        self.enum = False
+        self.methods: Dict[str, Dict[str, Any]] = {}
+        self.inner: Set[str] = set()
+
+
+class SymbolIndex:
+    """
+    In-memory index of the generated Apex classes, triggers and LWC modules, to find
+    references the org would reject before paying for a deploy:
+
+      - static calls (`AccountService.handle(...)`), `new X()` and `new X().run()`
+      - calls on variables declared with a generated class type
+      - LWC imports of Apex methods (`@salesforce/apex/Class.method`), which must be
+        static @AuraEnabled methods
+
+    Reported: a method a generated class (or its generated base classes and
+    interfaces) does not have, and an unknown class whose name closely resembles a
+    generated one (typos like AccountTriggerHandlr). Interface methods, abstract
+    methods and the enum built-ins (values, valueOf, name, ordinal) count as declared. Other unknown classes are system classes or already
+    in the org and are not reported; nor are methods of classes extending a base or
+    implementing an interface that is not generated.
+    Apex is case-insensitive, and so is the index. One regex pass per file.
+
+        problems = SymbolIndex(files, known_classes={"triggerhandler"}).unresolved()
+    """
+    def __init__(self, files: Iterable[Dict[str, Any]], known_classes: Iterable[str] = ()):
+        self.files = [f for f in files if isinstance(f, dict)]
+        self.known_classes = {c.lower() for c in known_classes}
+        self.types: Dict[str, _Type] = {}
+        self._code: Dict[int, str] = {}
+        for f in self.files:
+            if (f.get("fileName") or "").endswith(".cls"):
+                self._index_class(f)
+
+    def _stripped(self, f: Dict[str, Any]) -> str:
+        key = id(f)
+        if key not in self._code:
+            self._code[key] = _NOISE.sub(_blank, f.get("content") or "")
+        return self._code[key]
+
+    def _index_class(self, f: Dict[str, Any]):
+        code = self._stripped(f)
+        declarations = [m for m in _TYPE_DECL.finditer(code) if _word_start(code, m.start())]
+        if not declarations:
+            return
+        outer_decl = declarations[0]
+        extends, implements = _type_names(outer_decl.group(3)), _type_names(outer_decl.group(4))
+        if outer_decl.group(1) == "interface":
+            outer = _Type(outer_decl.group(2), f, None, extends)
+        else:
+            outer = _Type(outer_decl.group(2), f, extends[0] if extends else None, implements)
+        self.types[outer.name.lower()] = outer
+        if outer_decl.group(1) == "enum":
+            outer.enum = True
+            for name, static in _ENUM_METHODS.items():
+                outer.methods[name.lower()] = {"name": name, "static": static, "aura": False}
+        for decl in declarations[1:]:
+            outer.inner.add(decl.group(2).lower())
+        # in an interface body every `name(...);` declares a method
+        interfaces = [(d.end(), _body_end(code, d.end() - 1)) for d in declarations if d.group(1) == "interface"]
+        for m in _DECL_END.finditer(code):
+            open_paren = code.rfind("(", 0, m.start())
+            if open_paren < 0 or not _PARAMS.fullmatch(code, open_paren + 1, m.start()):
+                continue
+            name, name_start = _identifier_before(code, open_paren)
+            if not _IDENT.fullmatch(name) or name.lower() in _KEYWORDS:
+                continue
+            start = max(code.rfind(";", 0, name_start), code.rfind("{", 0, name_start), code.rfind("}", 0, name_start))
+            head = code[start + 1:name_start]
+            annotations = " ".join(_ANNOTATION.findall(head)).lower()
+            words = _ANNOTATION.sub(" ", head).lower().split()
+            # a return type is required: `new Foo() {`, `else if (x) {` and constructors have none
+            if not [w for w in words if w not in _MODIFIERS] or set(words) & (_KEYWORDS | {"class", "interface", "enum"}):
+                continue
+            # without a body only interface and abstract methods; `Integer n = count(x);` is a call
+            if m.group(1) == ";" and "abstract" not in words and \
+                    not any(start < m.start() < end for start, end in interfaces):
+                continue
+            outer.methods.setdefault(name.lower(), {
+                "name": name,
+                "static": "static" in words,
+                "aura": "@auraenabled" in annotations,
+            })
+
+    # ---------------------------------------------------------
+    # resolution
+    # ---------------------------------------------------------
+
+    def _method(self, class_lc: str, method_lc: str):
+        """(method or None, fully checked): False when a base class or interface is not in the index."""
+        complete = True
+        for t in self._chain(class_lc):
+            if method_lc in t.methods:
+                return t.methods[method_lc], True
+            if method_lc in t.inner:
+                return {"name": method_lc, "static": True, "aura": False}, True
+            # a base class or interface outside the index (org, system class) may define it
+            complete = complete and all(p.lower() in self.types for p in [t.base] + t.interfaces if p)
+        return None, complete
+
+    def _suggest(self, name: str, candidates: Iterable[str]) -> Optional[str]:
+        match = difflib.get_close_matches(name.lower(), list(candidates), n=1, cutoff=_CLOSE_MATCH_CUTOFF)
+        return match[0] if match else None
+
+    def _unknown_class(self, name: str):
+        """(problem text, problemType) for a likely misspelled generated class, else None."""
+        lc = name.lower()
+        if lc in self.types or lc in self.known_classes or lc in _SYSTEM_CLASSES or len(lc) < _MIN_SUGGEST_CHARS:
+            return None
+        suggestion = self._suggest(lc, self.types)
+        if suggestion:
+            return f"Unknown class {name} (did you mean {self.types[suggestion].name}?)", "Error"
+        return None
+
+    def _check_member(self, class_name: str, method: str, aura: bool = False):
+        lc = class_name.lower()
+        if lc not in self.types:
+            return self._unknown_class(class_name)
+        found, complete = self._method(lc, method.lower())
+        if found is None:
+            if not complete or method.lower() in _OBJECT_METHODS:
+                return None
+            names = {m for t in self._chain(lc) for m in t.methods}
+            suggestion = self._suggest(method, names)
+            hint = f" (did you mean {self._method(lc, suggestion)[0]['name']}?)" if suggestion else ""
+            return f"Method {self.types[lc].name}.{method} does not exist{hint}", "Error"
+        if aura and not (found["aura"] and found["static"]):
+            return f"{self.types[lc].name}.{found['name']} must be static and @AuraEnabled to be imported by LWC", "Error"
+        return None
+
+    def _chain(self, class_lc: str) -> List[_Type]:
+        """The type, then its generated base classes and interfaces, each once."""
+        chain, seen, todo = [], set(), [class_lc]
+        while todo:
+            class_lc = todo.pop(0)
+            if class_lc not in self.types or class_lc in seen:
+                continue
+            seen.add(class_lc)
+            t = self.types[class_lc]
+            chain.append(t)
+            todo.extend(p.lower() for p in [t.base] + t.interfaces if p)
+        return chain
+
+    def _apex_refs(self, f: Dict[str, Any]):
+        """(class, method or None, position, aura) references in one Apex class or trigger."""
+        code = self._stripped(f)
+        variables = {}
+        for m in _VAR_DECL.finditer(code):
+            if _word_start(code, m.start()) and m.group(1).lower() in self.types:
+                variables[m.group(2).lower()] = m.group(1)
+        for m in _NEW.finditer(code):
+            if _word_start(code, m.start()):
+                yield m.group(1), m.group(2), m.start(), False
+        for m in _MEMBER_CALL.finditer(code):
+            receiver, start = _identifier_before(code, m.start())
+            if not receiver or not _word_start(code, start):
+                continue
+            if receiver[0].isupper():
+                yield receiver, m.group(1), start, False
+            elif receiver.lower() in variables:
+                yield variables[receiver.lower()], m.group(1), start, False
+
+    def _lwc_refs(self, f: Dict[str, Any]):
+        content = f.get("content") or ""
+        for m in _APEX_IMPORT.finditer(content):
+            yield m.group(1), m.group(2), m.start(), True
+
+    def unresolved(self) -> List[Dict[str, Any]]:
+        """Broken references as componentFailures-shaped dicts."""
+        problems = []
+        for f in self.files:
+            name = f.get("fileName") or ""
+            if name.endswith((".cls", ".trigger")):
+                refs, kind = self._apex_refs(f), "ApexTrigger" if name.endswith(".trigger") else "ApexClass"
+            elif _LWC_PATH.search(file_key(f)):
+                refs, kind = self._lwc_refs(f), "LightningComponentBundle"
+            else:
+                continue
+            own = self.types.get(os.path.splitext(name)[0].lower())
+            seen: Set[Any] = set()
+            for class_name, method, pos, aura in refs:
+                ref = (class_name.lower(), method.lower() if method else None)
+                if ref in seen or (own is not None and ref[0] in own.inner):
+                    continue
+                seen.add(ref)
+                result = self._check_member(class_name, method, aura) if method else self._unknown_class(class_name)
+                # `new Handlr().run()` is one misspelled class, not two problems
+                if result and result not in seen:
+                    seen.add(result)
+                    problems.append(_problem(f, kind, _line_of(f.get("content") or "", pos), *result))
+        return problems
+
+
+def _problem(f: Dict[str, Any], kind: str, line: int, problem: str, problem_type: str) -> Dict[str, Any]:
+    return {
+        "fileName": file_key(f),
+        "fullName": os.path.splitext(f.get("fileName", ""))[0],
+        "componentType": kind,
+        "problem": problem,
+        "problemType": problem_type,
+        "lineNumber": line,
+        "columnNumber": None,
+    }
+
+
+def check_symbols(files: List[Dict[str, Any]], known_classes: Iterable[str] = ()) -> List[Dict[str, Any]]:
+    """Unresolved class / method references across the generated files (see SymbolIndex)."""
+    return SymbolIndex(files, known_classes).unresolved()
@@ -0,0 +1,352 @@
+import os
+import re
+import time
+import uuid
+import json
+import asyncio
+from typing import Dict, Any, List, Optional, Tuple
+from urllib.parse import quote
+
+from src.deploy.results import failed_status
+from src.utils.log import get_logger
+from src.utils.tracing import deploy_span
+
+logger = get_logger("deploy")
+
+TOOLING_FAST_PATH = os.getenv("INSTAFORCE_TOOLING_FAST_PATH", "on") != "off"
+# Apex-only change sets up to this size skip the CLI; one composite call holds
+# the container, one member per file and the async request (25 subrequests max)
+TOOLING_MAX_FILES = min(int(os.getenv("INSTAFORCE_TOOLING_MAX_FILES", "10")), 23)
+TOOLING_MAX_BYTES = int(os.getenv("INSTAFORCE_TOOLING_MAX_BYTES", str(256 * 1024)))
+COMPOSITE_LIMIT = 25
+POLL_SECONDS = 1.0
+POLL_TIMEOUT_SECONDS = 600.0
+
+APEX_KINDS = {".cls": "ApexClass", ".trigger": "ApexTrigger"}
+APEX_NAME = re.compile(r"^[A-Za-z][A-Za-z0-9_]*$")
+TRIGGER_HEADER = re.compile(r"^\s*trigger\s+\w+\s+on\s+(\w+)\s*\(", re.I | re.M)
+FINAL_STATES = {"Completed", "Failed", "Error", "Aborted", "Invalidated"}
+
+
+class ToolingApiError(Exception):
+    """The Tooling API refused the change set itself (not a compile error); use the CLI."""
+
+
+def apex_change_set(deploy_root: str, max_files: int = TOOLING_MAX_FILES,
+                    max_bytes: int = TOOLING_MAX_BYTES) -> Tuple[Optional[List[Dict[str, Any]]], str]:
+    """
+    (changes, reason): the Apex classes and triggers under `deploy_root` when the tree
+    holds nothing else and is small enough for the Tooling API, else (None, why not).
+    """
+    changes, total = [], 0
+    for dirpath, _, filenames in os.walk(deploy_root):
+        for name in sorted(filenames):
+            path = os.path.join(dirpath, name)
+            if name.endswith("-meta.xml"):
+                if os.path.splitext(name[:-len("-meta.xml")])[1] in APEX_KINDS:
+                    continue
+                return None, f"non-Apex metadata: {name}"
+            stem, ext = os.path.splitext(name)
+            if ext not in APEX_KINDS:
+                return None, f"non-Apex metadata: {name}"
+            with open(path, encoding="utf-8") as fh:
+                body = fh.read()
+            total += len(body.encode("utf-8"))
+            change = {"kind": APEX_KINDS[ext], "name": stem, "body": body,
+                      "fileName": os.path.relpath(path, deploy_root).replace("\\", "/")}
+            if change["kind"] == "ApexTrigger":
+                m = TRIGGER_HEADER.search(body)
+                if not m:
+                    return None, f"cannot read the trigger object of {name}"
+                change["object"] = m.group(1)
+            changes.append(change)
+    if not changes:
+        return None, "no Apex files"
+    if len(changes) > max_files:
+        return None, f"{len(changes)} Apex files (fast path limit {max_files})"
+    if total > max_bytes:
+        return None, f"{total} bytes of Apex (fast path limit {max_bytes})"
+    return changes, f"{len(changes)} Apex file(s), {total} bytes"
+
+
+class ToolingApiClient:
+    """
+    Saves Apex classes and triggers through the Tooling API instead of a metadata
+    deploy. Classes and triggers the org does not have yet are first created as empty
+    stubs; then one composite request creates a MetadataContainer with a member per
+    file and a ContainerAsyncRequest, which compiles everything together and is polled
+    to completion. Stubs of a failed save are deleted again.
+    Compile errors come back in the CLI's componentFailures shape, so the repair loop
+    works unchanged; a refused request raises ToolingApiError.
+    """
+    def __init__(self, sf=None, poll_seconds: float = POLL_SECONDS, timeout_seconds: float = POLL_TIMEOUT_SECONDS):
+        self._sf = sf
+        self.poll_seconds = poll_seconds
+        self.timeout_seconds = timeout_seconds
+
+    def is_available(self, alias: Optional[str] = None) -> bool:
+        if self._sf is not None:
+            return True
+        from src.org.connection import org_credentials
+        return bool(org_credentials(alias)["username"])
+
+    def _connection(self, alias: str):
+        if self._sf is not None:
+            return self._sf
+        from src.org.connection import get_salesforce
+        return get_salesforce(alias)
+
+    # ---------------------------------------------------------
+    # Tooling REST calls
+    # ---------------------------------------------------------
+
+    @staticmethod
+    def _sobject_url(sf, sobject: str, record_id: str = "") -> str:
+        url = f"/services/data/v{sf.sf_version}/tooling/sobjects/{sobject}"
+        return f"{url}/{record_id}" if record_id else url
+
+    @staticmethod
+    def _existing(sf, kind: str, names: List[str]) -> Dict[str, str]:
+        if not names:
+            return {}
+        # names come from file names and go into the SOQL literal list unquoted
+        invalid = [n for n in names if not APEX_NAME.match(n)]
+        if invalid:
+            raise ToolingApiError(f"invalid {kind} name: {', '.join(invalid)}")
+        quoted = ", ".join(f"'{n}'" for n in names)
+        soql = f"SELECT Id, Name FROM {kind} WHERE NamespacePrefix = null AND Name IN ({quoted})"
+        records = sf.toolingexecute("query/?q=" + quote(soql))["records"]
+        return {r["Name"].lower(): r["Id"] for r in records}
+
+    @staticmethod
+    def _composite(sf, subrequests: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Run subrequests all-or-none; returns referenceId -> body."""
+        try:
+            response = sf.toolingexecute("composite", method="POST",
+                                         data={"allOrNone": True, "compositeRequest": subrequests})
+        except Exception as e:
+            raise ToolingApiError(str(e)) from e
+        bodies, errors = {}, []
+        for entry in response.get("compositeResponse", []):
+            if entry.get("httpStatusCode", 500) >= 400:
+                body = entry.get("body")
+                messages = [b.get("message", "") for b in body] if isinstance(body, list) else [str(body)]
+                errors.extend(m for m in messages if m and "rolled back" not in m)
+            bodies[entry.get("referenceId")] = entry.get("body")
+        if errors:
+            raise ToolingApiError("; ".join(errors))
+        return bodies
+
+    def _create_stubs(self, sf, new: List[Dict[str, Any]]) -> Dict[str, str]:
+        """Empty versions of new classes/triggers, so the container can hold them all."""
+        ids = {}
+        for start in range(0, len(new), COMPOSITE_LIMIT):
+            subrequests = []
+            for i, change in enumerate(new[start:start + COMPOSITE_LIMIT]):
+                if change["kind"] == "ApexClass":
+                    body = {"Name": change["name"], "Body": f"public class {change['name']} {{}}"}
+                else:
+                    body = {"Name": change["name"], "TableEnumOrId": change["object"],
+                            "Body": f"trigger {change['name']} on {change['object']} (before insert) {{}}"}
+                subrequests.append({"method": "POST", "url": self._sobject_url(sf, change["kind"]),
+                                    "referenceId": f"stub{start + i}", "body": body})
+            bodies = self._composite(sf, subrequests)
+            for i, change in enumerate(new[start:start + COMPOSITE_LIMIT]):
+                ids[change["name"].lower()] = bodies[f"stub{start + i}"]["id"]
+        return ids
+
+    def _delete(self, sf, records: List[Tuple[str, str]]):
+        for start in range(0, len(records), COMPOSITE_LIMIT):
+            subrequests = [{"method": "DELETE", "url": self._sobject_url(sf, sobject, record_id),
+                            "referenceId": f"del{start + i}"}
+                           for i, (sobject, record_id) in enumerate(records[start:start + COMPOSITE_LIMIT])]
+            try:
+                sf.toolingexecute("composite", method="POST",
+                                  data={"allOrNone": False, "compositeRequest": subrequests})
+            except Exception as e:
+                logger.warning("Tooling API cleanup failed: %s", e)
+
+    def _poll(self, sf, request_id: str) -> Dict[str, Any]:
+        deadline = time.monotonic() + self.timeout_seconds
+        while True:
+            request = sf.toolingexecute(f"sobjects/ContainerAsyncRequest/{request_id}")
+            if request.get("State") in FINAL_STATES:
+                return request
+            if time.monotonic() > deadline:
+                raise ToolingApiError(f"ContainerAsyncRequest {request_id} still {request.get('State')}")
+            time.sleep(self.poll_seconds)
+
+    # ---------------------------------------------------------
+    # deploy
+    # ---------------------------------------------------------
+
+    def save(self, changes: List[Dict[str, Any]], alias: str) -> Dict[str, Any]:
+        """Compile and save `changes` (see apex_change_set); returns the CLI-shaped outcome."""
+        try:
+            sf = self._connection(alias)
+            existing = {}
+            for kind in APEX_KINDS.values():
+                existing.update(self._existing(sf, kind, [c["name"] for c in changes if c["kind"] == kind]))
+        except Exception as e:
+            raise ToolingApiError(str(e)) from e
+
+        new = [c for c in changes if c["name"].lower() not in existing]
+        stubs = self._create_stubs(sf, new) if new else {}
+        entity_ids = dict(existing, **stubs)
+
+        subrequests = [{"method": "POST", "url": self._sobject_url(sf, "MetadataContainer"),
+                        "referenceId": "container", "body": {"Name": f"instaforce{uuid.uuid4().hex[:20]}"}}]
+        for i, change in enumerate(changes):
+            subrequests.append({
+                "method": "POST", "url": self._sobject_url(sf, f"{change['kind']}Member"), "referenceId": f"member{i}",
+                "body": {"MetadataContainerId": "@{container.id}", "ContentEntityId": entity_ids[change["name"].lower()],
+                         "Body": change["body"]},
+            })
+        subrequests.append({"method": "POST", "url": self._sobject_url(sf, "ContainerAsyncRequest"),
+                            "referenceId": "request",
+                            "body": {"MetadataContainerId": "@{container.id}", "IsCheckOnly": False}})
+
+        container_id = None
+        try:
+            bodies = self._composite(sf, subrequests)
+            container_id = bodies["container"]["id"]
+            request = self._poll(sf, bodies["request"]["id"])
+        except Exception as e:
+            self._delete(sf, [(c["kind"], stubs[c["name"].lower()]) for c in new])
+            if isinstance(e, ToolingApiError):
+                raise
+            raise ToolingApiError(str(e)) from e
+        finally:
+            if container_id:
+                self._delete(sf, [("MetadataContainer", container_id)])
+
+        outcome = self._outcome(changes, request)
+        if not outcome["success"]:
+            self._delete(sf, [(c["kind"], stubs[c["name"].lower()]) for c in new])
+        return outcome
+
+    @staticmethod
+    def _outcome(changes: List[Dict[str, Any]], request: Dict[str, Any]) -> Dict[str, Any]:
+        by_name = {c["name"].lower(): c for c in changes}
+        details = request.get("DeployDetails") or {}
+
+        def component(entry: Dict[str, Any]) -> Dict[str, Any]:
+            change = by_name.get((entry.get("fullName") or "").lower(), {})
+            return dict(entry, fileName=change.get("fileName") or entry.get("fileName", ""),
+                        componentType=entry.get("componentType") or change.get("kind", ""))
+
+        failures = [component(e) for e in details.get("componentFailures") or []]
+        success = request.get("State") == "Completed" and not failures
+        if not success and not failures:
+            failures = [{"fileName": c["fileName"], "fullName": c["name"], "componentType": c["kind"],
+                         "problem": request.get("ErrorMsg") or f"Tooling API save {request.get('State')}",
+                         "problemType": "Error", "lineNumber": None, "columnNumber": None} for c in changes]
+        successes = [] if not success else (
+            [component(e) for e in details.get("componentSuccesses") or []]
+            or [{"fileName": c["fileName"], "fullName": c["name"], "componentType": c["kind"]} for c in changes])
+        parsed = {
+            "status": 0 if success else 1,
+            "result": {"success": success,
+                       "details": {"componentSuccesses": successes, "componentFailures": failures}},
+        }
+        return {
+            "success": success,
+            "returncode": 0 if success else 1,
+            "stdout": json.dumps(parsed),
+            "stderr": "",
+            "parsed_response": parsed,
+            "deploy_command": f"tooling-api ContainerAsyncRequest ({len(changes)} Apex file(s))",
+        }
+
+
+class FastPathTransport:
+    """
+    Deploy strategy: small Apex-only change sets (TOOLING_MAX_FILES, TOOLING_MAX_BYTES)
+    are saved through the Tooling API, which skips the Node CLI start-up and the
+    metadata deploy round trip; anything else, or a change set the Tooling API refuses
+    (e.g. a production org), goes to `fallback` (the CLI or the Metadata API), as does a
+    deploy that has to run tests or only validate, which the fast path does not do. The
+    outcome gets a `strategy` entry with the chosen path, why, and its duration.
+    """
+    def __init__(self, fallback, tooling: Optional[ToolingApiClient] = None,
+                 max_files: int = TOOLING_MAX_FILES, max_bytes: int = TOOLING_MAX_BYTES):
+        self.fallback = fallback
+        self.tooling = tooling or ToolingApiClient()
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+
+    @property
+    def sf_exe(self) -> str:
+        return self.fallback.sf_exe
+
+    @property
+    def fallback_name(self) -> str:
+        return getattr(self.fallback, "strategy", "sf_cli")
+
+    def is_available(self) -> bool:
+        # the fast path only takes some change sets; everything else needs the fallback
+        return self.fallback.is_available()
+
+    def _tooling_changes(self, deploy_root: str, alias: str, tests: Optional[Dict[str, Any]] = None,
+                         check_only: bool = False):
+        if check_only:
+            # a check-only save still creates stub classes for new names
+            return None, "check-only validation"
+        if tests and tests.get("classes"):
+            return None, f"{len(tests['classes'])} test classes to run"
+        changes, reason = apex_change_set(deploy_root, self.max_files, self.max_bytes)
+        if changes is not None and not self.tooling.is_available(alias):
+            return None, f"no API credentials for {alias}"
+        return changes, reason
+
+    @staticmethod
+    def _strategy(outcome: Dict[str, Any], name: str, reason: str, started: float,
+                  fallback_from: Optional[str] = None) -> Dict[str, Any]:
+        outcome["strategy"] = {"name": name, "reason": reason, "seconds": round(time.perf_counter() - started, 3),
+                               "fallback_from": fallback_from}
+        logger.info("Deploy strategy %s (%s) took %.2fs", name, reason, outcome["strategy"]["seconds"])
+        return outcome
+
+    def _fallback_unavailable(self) -> Dict[str, Any]:
+        return failed_status(f"Deploy transport not available: {self.fallback.sf_exe}")
+
+    def _save(self, deploy_root: str, changes: List[Dict[str, Any]], alias: str) -> Dict[str, Any]:
+        with deploy_span("tooling_api", deploy_root) as span:
+            outcome = self.tooling.save(changes, alias)
+            span.set(success=outcome["success"], files=len(changes))
+        return outcome
+
+    def deploy(self, deploy_root: str, alias: str, tests: Optional[Dict[str, Any]] = None,
+               check_only: bool = False) -> Dict[str, Any]:
+        started = time.perf_counter()
+        changes, reason = self._tooling_changes(deploy_root, alias, tests, check_only)
+        fallback_from = None
+        if changes is not None:
+            try:
+                outcome = self._save(deploy_root, changes, alias)
+                return self._strategy(outcome, "tooling_api", reason, started)
+            except ToolingApiError as e:
+                logger.warning("Tooling API fast path refused, deploying with the CLI: %s", e)
+                reason, fallback_from = f"tooling api refused: {e}", "tooling_api"
+        if not self.fallback.is_available():
+            return self._strategy(self._fallback_unavailable(), self.fallback_name, reason, started, fallback_from)
+        outcome = self.fallback.deploy(deploy_root, alias, tests=tests, check_only=check_only)
+        return self._strategy(outcome, self.fallback_name, reason, started, fallback_from)
+
+    async def adeploy(self, deploy_root: str, alias: str, tests: Optional[Dict[str, Any]] = None,
+                      check_only: bool = False) -> Dict[str, Any]:
+        """deploy() for the event loop: the Tooling calls run on a thread, the CLI on a subprocess."""
+        started = time.perf_counter()
+        changes, reason = await asyncio.to_thread(self._tooling_changes, deploy_root, alias, tests, check_only)
+        fallback_from = None
+        if changes is not None:
+            try:
+                outcome = await asyncio.to_thread(self._save, deploy_root, changes, alias)
+                return self._strategy(outcome, "tooling_api", reason, started)
+            except ToolingApiError as e:
+                logger.warning("Tooling API fast path refused, deploying with the CLI: %s", e)
+                reason, fallback_from = f"tooling api refused: {e}", "tooling_api"
+        if not self.fallback.is_available():
+            return self._strategy(self._fallback_unavailable(), self.fallback_name, reason, started, fallback_from)
+        outcome = await self.fallback.adeploy(deploy_root, alias, tests=tests, check_only=check_only)
+        return self._strategy(outcome, self.fallback_name, reason, started, fallback_from)
@@ -0,0 +1,481 @@
+import os
+import re
+import time
+import shutil
+import asyncio
+import hashlib
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Iterable, List, Optional, Set
+
+from src.deploy.files import file_key, reset_deploy_root, write_file
+from src.deploy.results import parse_component_results, failed_status
+from src.deploy.apex_tests import merge_test_reports, TRIGGER_OBJECT
+from src.utils.log import get_logger
+from src.utils.tracing import span
+
+logger = get_logger("deploy.units")
+
+DEPLOY_UNITS = os.getenv("INSTAFORCE_DEPLOY_UNITS", "on")  # off | on | atomic
+UNITS_PARALLELISM = int(os.getenv("INSTAFORCE_UNITS_PARALLELISM", "4"))
+MODES = ("off", "on", "atomic")
+# unit deploy roots, one directory per run and unit
+UNITS_DIR = os.path.join(".instaforce", "units")
+
+_BUNDLE = re.compile(r"(?:^|/)(lwc|aura)/([^/]+)/")
+_OBJECT = re.compile(r"(?:^|/)objects/([^/]+)/")
+_WORD = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+# design dependency lists naming other generated components
+_DEPENDENCY_LISTS = ("requiredApexClasses", "requiredLWCs", "requiredPermissionSetNames")
+
+
+def _node(key: str) -> str:
+    """Deployable component a file belongs to: an LWC/Aura bundle, an object with its children, or the file and its -meta.xml."""
+    bundle = _BUNDLE.search(key)
+    if bundle:
+        return f"{bundle.group(1)}:{bundle.group(2)}"
+    obj = _OBJECT.search(key)
+    if obj:
+        return f"object:{obj.group(1)}"
+    if key.endswith("-meta.xml"):
+        key = key[:-len("-meta.xml")]
+    return os.path.splitext(key)[0]
+
+
+def _provided_names(node: str, keys: List[str]) -> Set[str]:
+    """Lower-case names other files use to refer to a component: class/bundle/object names, field API names."""
+    if ":" in node:
+        names = {node.split(":", 1)[1].lower()}
+    else:
+        names = {os.path.basename(node).split(".")[0].lower()}
+    if node.startswith("object:"):
+        for key in keys:
+            if "/fields/" in key:
+                names.add(os.path.basename(key).split(".")[0].lower())
+    return names
+
+
+class _UnionFind:
+    def __init__(self, items: Iterable[str]):
+        self.parent = {item: item for item in items}
+
+    def find(self, item: str) -> str:
+        while self.parent[item] != item:
+            self.parent[item] = self.parent[self.parent[item]]
+            item = self.parent[item]
+        return item
+
+    def union(self, a: str, b: str):
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            self.parent[max(ra, rb)] = min(ra, rb)
+
+
+def _unit_id(files: List[Dict[str, Any]]) -> str:
+    digest = hashlib.sha256()
+    for f in sorted(files, key=file_key):
+        digest.update(file_key(f).encode("utf-8"))
+        digest.update(b"\0")
+        digest.update((f.get("content") or "").encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()[:12]
+
+
+def plan_units(files: List[Dict[str, Any]], components: Optional[List[Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+    """
+    Splits the generated files into independently deployable units.
+
+    Files are grouped into components (bundles, objects with their fields and rules,
+    class or trigger plus its -meta.xml). A component depends on another when the
+    design lists it under `dependencies` (requiredApexClasses, requiredLWCs,
+    requiredPermissionSetNames) or when its content names it (class, bundle, object
+    or field API name; case-insensitive like Apex), and a test class on the triggers of
+    the objects it names. Connected components form a unit.
+
+    Hubs do not merge their neighbours: a shared component that depends on nothing
+    generated but is used by several others (a trigger handler base class, a test data
+    factory), and an aggregate nobody depends on that uses several others (a
+    permission set). A hub gets a unit of its own, and whatever a unit depends on
+    outside itself is packaged into it as `support` files, since a unit is validated on
+    its own against an org that may not hold its dependencies yet.
+
+    Each unit: id (hash of everything it deploys), name, files (the unit's own files),
+    support (file keys packaged alongside), package (all files to deploy).
+    """
+    by_key: Dict[str, Dict[str, Any]] = {}
+    for f in files:
+        by_key[file_key(f)] = f
+    nodes: Dict[str, List[str]] = {}
+    for key in by_key:
+        nodes.setdefault(_node(key), []).append(key)
+    if not nodes:
+        return []
+
+    providers: Dict[str, Set[str]] = {}
+    for node, keys in nodes.items():
+        for name in _provided_names(node, keys):
+            providers.setdefault(name, set()).add(node)
+
+    # tests exercise the triggers on the objects they name
+    triggers: Dict[str, Set[str]] = {}
+    for key, f in by_key.items():
+        trigger = TRIGGER_OBJECT.search(f.get("content") or "") if key.endswith(".trigger") else None
+        if trigger:
+            triggers.setdefault(trigger.group(1).lower(), set()).add(_node(key))
+
+    edges: Dict[str, Set[str]] = {node: set() for node in nodes}
+    for node, keys in nodes.items():
+        words = set()
+        for key in keys:
+            words.update(w.lower() for w in _WORD.findall(by_key[key].get("content") or ""))
+        for word in words & providers.keys():
+            edges[node].update(providers[word] - {node})
+        if "istest" in words:
+            for word in words & triggers.keys():
+                edges[node].update(triggers[word] - {node})
+
+    for component in components or []:
+        own = providers.get((component.get("apiName") or "").lower(), set())
+        dependencies = component.get("dependencies") if isinstance(component.get("dependencies"), dict) else {}
+        for list_name in _DEPENDENCY_LISTS:
+            for name in dependencies.get(list_name) or []:
+                if not isinstance(name, str):
+                    continue
+                for node in own:
+                    edges[node].update(providers.get(name.lower(), set()) - {node})
+
+    users: Dict[str, Set[str]] = {node: set() for node in nodes}
+    for node, targets in edges.items():
+        for target in targets:
+            users[target].add(node)
+    # hubs do not merge the components around them into one unit
+    shared = {node for node in nodes if not edges[node] and len(users[node]) >= 2}
+    aggregators = {node for node in nodes if not users[node] and len(edges[node]) >= 2}
+
+    groups = _UnionFind(nodes)
+    for node, targets in edges.items():
+        if node in aggregators:
+            continue
+        for target in targets:
+            if target not in shared:
+                groups.union(node, target)
+
+    members: Dict[str, List[str]] = {}
+    for node in sorted(nodes):
+        members.setdefault(groups.find(node), []).append(node)
+
+    units = []
+    for root in sorted(members):
+        group = members[root]
+        own_keys = sorted(key for node in group for key in nodes[node])
+        needed, stack = set(), [t for node in group for t in edges[node]]
+        while stack:
+            target = stack.pop()
+            if target not in needed and target not in group:
+                needed.add(target)
+                stack.extend(edges[target])
+        support = sorted(key for node in needed for key in nodes[node])
+        package = [by_key[key] for key in own_keys + support]
+        names = [n.split(":", 1)[-1] if ":" in n else os.path.basename(n).split(".")[0] for n in group]
+        units.append({
+            "id": _unit_id(package),
+            "name": names[0] if len(names) == 1 else f"{names[0]} (+{len(names) - 1})",
+            "files": own_keys,
+            "support": support,
+            "package": package,
+        })
+    return units
+
+
+class UnitDeployer:
+    """
+    Deploys a change so that one rejected component does not hold back the rest.
+
+    The whole change is deployed first, as before (the transports deploy
+    all-or-nothing, so a failure leaves the org unchanged). Only when that fails is it
+    split with plan_units(): every unit is validated check-only, at most
+    `max_parallel` at a time, and the units that pass are deployed together in one
+    more deployment. A unit's status says whether it `validated` and whether it is
+    `deployed`; the rejected ones carry their component failures.
+
+    On the repair loop's next attempt (`previous` deploy_status), units already
+    deployed are left out; the rest are deployed, and split again if that fails.
+
+    With `atomic`, nothing is deployed unless every unit validates: the validation
+    results are reported per unit, but no partial deployment is made.
+
+    The aggregated deploy_status holds each unit's status under `units` and the
+    component failures of all units (each tagged with its units) under
+    `component_failures`, so the repair loop works on it unchanged. A change that
+    deploys at the first attempt gets the transport's plain outcome.
+    """
+    def __init__(self, transport, max_parallel: int = UNITS_PARALLELISM, atomic: bool = False,
+                 units_dir: str = UNITS_DIR):
+        self.transport = transport
+        self.max_parallel = max(1, max_parallel)
+        self.atomic = atomic
+        self.units_dir = units_dir
+
+    # ---------------------------------------------------------
+    # planning and packaging
+    # ---------------------------------------------------------
+
+    def _deployed(self, previous: Optional[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """Units the previous attempt deployed, by id."""
+        if not isinstance(previous, dict):
+            return {}
+        return {u["id"]: u for u in previous.get("units") or [] if u.get("deployed") and u.get("id")}
+
+    def _write(self, units: List[Dict[str, Any]], run_id: str, name: str) -> str:
+        deploy_root = os.path.join(self.units_dir, run_id, name)
+        reset_deploy_root(deploy_root)
+        written = set()
+        for unit in units:
+            for f in unit["package"]:
+                if file_key(f) not in written:
+                    written.add(file_key(f))
+                    write_file(f, deploy_root)
+        return deploy_root
+
+    def _start(self, deploy_root: str, files, run_id: str, components, previous):
+        """(units or None when not planned yet, units already deployed, root of the first deployment)."""
+        deployed = self._deployed(previous)
+        if not deployed:
+            return None, {}, deploy_root
+        units = plan_units(files, components)
+        pending = [u for u in units if u["id"] not in deployed]
+        return units, deployed, self._write(pending, run_id, "pending") if pending else None
+
+    # ---------------------------------------------------------
+    # unit statuses
+    # ---------------------------------------------------------
+
+    @staticmethod
+    def _failures(status: Dict[str, Any], unit: Dict[str, Any]) -> List[Dict[str, Any]]:
+        failures = status.get("component_failures")
+        if failures is None:
+            failures = parse_component_results(status.get("parsed_response"))["failures"]
+        if not status.get("success") and not failures:
+            # a rejected package without per-file results: blame the unit's own files
+            problem = (status.get("stderr") or status.get("message") or "Deployment failed").strip()[:500]
+            failures = [{"fileName": key, "fullName": "", "componentType": "", "problem": problem,
+                         "problemType": "Error", "lineNumber": None, "columnNumber": None}
+                        for key in unit["files"]]
+        return failures
+
+    def _unit_status(self, unit: Dict[str, Any], status: Dict[str, Any], validated: bool, deployed: bool,
+                     message: str) -> Dict[str, Any]:
+        return {
+            "id": unit["id"],
+            "name": unit["name"],
+            "files": unit["files"],
+            "support": unit["support"],
+            "validated": validated,
+            "deployed": deployed,
+            "success": deployed,
+            "message": message,
+            "returncode": status.get("returncode"),
+            "deploy_command": status.get("deploy_command"),
+            "parsed_response": status.get("parsed_response"),
+            "component_failures": [] if validated else self._failures(status, unit),
+            "tests": status.get("tests"),
+        }
+
+    @staticmethod
+    def _reused(previous: Dict[str, Any]) -> Dict[str, Any]:
+        return dict(previous, reused=True, tests=None, message="Deployed in an earlier attempt")
+
+    def _split(self, units, deployed, validations: Dict[str, Dict[str, Any]],
+               landing: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Unit statuses after the check-only validations and the deployment of the passing units."""
+        statuses = []
+        for unit in units:
+            if unit["id"] in deployed:
+                statuses.append(self._reused(deployed[unit["id"]]))
+                continue
+            status = validations.get(unit["id"])
+            if status is None or not status.get("success"):
+                statuses.append(self._unit_status(unit, status or {}, False, False, "Validation failed"))
+            elif landing is None:
+                statuses.append(self._unit_status(unit, status, True, False,
+                                                  "Validated; not deployed (atomic, other units failed)"))
+            elif landing.get("success"):
+                statuses.append(self._unit_status(unit, landing, True, True, "Deployed"))
+            else:
+                statuses.append(self._unit_status(unit, landing, False, False,
+                                                  "Validated alone, but failed when deployed with the other units"))
+        return statuses
+
+    def _landing(self, pending, validations) -> List[Dict[str, Any]]:
+        """Units to deploy after the validations, or [] when nothing is deployed."""
+        passing = [u for u in pending if validations.get(u["id"], {}).get("success")]
+        if self.atomic and len(passing) < len(pending):
+            return []
+        return passing
+
+    # ---------------------------------------------------------
+    # deploy
+    # ---------------------------------------------------------
+
+    def deploy(self, deploy_root: str, files: List[Dict[str, Any]], alias: str, run_id: str,
+               components: Optional[List[Dict[str, Any]]] = None,
+               previous: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Deploy the run's tree written at `deploy_root` (its `files`), split into units if it is rejected."""
+        started = time.perf_counter()
+        units, deployed, first_root = self._start(deploy_root, files, run_id, components, previous)
+        first = self._call(first_root, alias) if first_root else None
+        if first is not None and first.get("success") and units is None:
+            return first
+        if first is None or first.get("success"):
+            return self._done(units, deployed, first, {}, None, started, run_id)
+
+        units = units if units is not None else plan_units(files, components)
+        pending = [u for u in units if u["id"] not in deployed]
+        if len(pending) < 2:
+            return self._done(units, deployed, first, {u["id"]: first for u in pending}, None, started, run_id,
+                              combined=True)
+
+        with ThreadPoolExecutor(max_workers=min(self.max_parallel, len(pending))) as pool:
+            futures = {u["id"]: pool.submit(contextvars.copy_context().run, self._validate, u, alias, run_id)
+                       for u in pending}
+            validations = {unit_id: future.result() for unit_id, future in futures.items()}
+
+        landing_units = self._landing(pending, validations)
+        landing = self._call(self._write(landing_units, run_id, "landing"), alias) if landing_units else None
+        return self._done(units, deployed, first, validations, landing, started, run_id)
+
+    async def adeploy(self, deploy_root: str, files: List[Dict[str, Any]], alias: str, run_id: str,
+                      components: Optional[List[Dict[str, Any]]] = None,
+                      previous: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """deploy() on the event loop: the unit validations run as tasks bounded by a semaphore."""
+        started = time.perf_counter()
+        units, deployed, first_root = await asyncio.to_thread(self._start, deploy_root, files, run_id,
+                                                              components, previous)
+        first = await self._acall(first_root, alias) if first_root else None
+        if first is not None and first.get("success") and units is None:
+            return first
+        if first is None or first.get("success"):
+            return self._done(units, deployed, first, {}, None, started, run_id)
+
+        units = units if units is not None else await asyncio.to_thread(plan_units, files, components)
+        pending = [u for u in units if u["id"] not in deployed]
+        if len(pending) < 2:
+            return self._done(units, deployed, first, {u["id"]: first for u in pending}, None, started, run_id,
+                              combined=True)
+
+        gate = asyncio.Semaphore(self.max_parallel)
+
+        async def validate(unit: Dict[str, Any]) -> Dict[str, Any]:
+            async with gate:
+                return await self._avalidate(unit, alias, run_id)
+
+        results = await asyncio.gather(*(validate(u) for u in pending))
+        validations = {u["id"]: status for u, status in zip(pending, results)}
+
+        landing_units = self._landing(pending, validations)
+        landing = None
+        if landing_units:
+            landing_root = await asyncio.to_thread(self._write, landing_units, run_id, "landing")
+            landing = await self._acall(landing_root, alias)
+        return self._done(units, deployed, first, validations, landing, started, run_id)
+
+    def _call(self, deploy_root: str, alias: str, check_only: bool = False) -> Dict[str, Any]:
+        try:
+            return self.transport.deploy(deploy_root, alias, check_only=check_only)
+        except Exception as e:
+            return failed_status(f"Deployment to {alias} failed: {e}")
+
+    async def _acall(self, deploy_root: str, alias: str, check_only: bool = False) -> Dict[str, Any]:
+        try:
+            return await self.transport.adeploy(deploy_root, alias, check_only=check_only)
+        except Exception as e:
+            return failed_status(f"Deployment to {alias} failed: {e}")
+
+    def _validate(self, unit: Dict[str, Any], alias: str, run_id: str) -> Dict[str, Any]:
+        with span("validate_unit", unit=unit["id"], files=len(unit["package"])) as unit_span:
+            status = self._call(self._write([unit], run_id, unit["id"]), alias, check_only=True)
+            unit_span.set(success=bool(status.get("success")))
+        return status
+
+    async def _avalidate(self, unit: Dict[str, Any], alias: str, run_id: str) -> Dict[str, Any]:
+        with span("validate_unit", unit=unit["id"], files=len(unit["package"])) as unit_span:
+            root = await asyncio.to_thread(self._write, [unit], run_id, unit["id"])
+            status = await self._acall(root, alias, check_only=True)
+            unit_span.set(success=bool(status.get("success")))
+        return status
+
+    # ---------------------------------------------------------
+    # aggregation
+    # ---------------------------------------------------------
+
+    def _done(self, units, deployed, first, validations, landing, started: float, run_id: str,
+              combined: bool = False) -> Dict[str, Any]:
+        if combined:
+            # too few units left to split: the first deployment is the units' result
+            statuses = [self._reused(deployed[u["id"]]) if u["id"] in deployed
+                        else self._unit_status(u, first, False, False, "Deployment failed") for u in units]
+        elif first is None or first.get("success"):
+            statuses = [self._reused(deployed[u["id"]]) if u["id"] in deployed
+                        else self._unit_status(u, first or {}, True, True, "Deployed") for u in units]
+        else:
+            statuses = self._split(units, deployed, validations, landing)
+        reports = [first, landing] + [validations[u] for u in validations if validations[u] is not first]
+        return self.aggregate(statuses, time.perf_counter() - started, run_id,
+                              tests=merge_test_reports([r.get("tests") for r in reports if r]))
+
+    def aggregate(self, statuses: List[Dict[str, Any]], seconds: float, run_id: str = "",
+                  tests: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """One deploy_status for the whole change, with each unit's status under `units`."""
+        failed = [s["id"] for s in statuses if not s["deployed"]]
+        reused = [s["id"] for s in statuses if s.get("reused")]
+
+        failures: Dict[tuple, Dict[str, Any]] = {}
+        for status in statuses:
+            for c in status.get("component_failures") or []:
+                key = (c.get("fileName"), c.get("lineNumber"), c.get("problem"))
+                failures.setdefault(key, dict(c, units=[]))["units"].append(status["id"])
+
+        first_failure = next((s for s in statuses if not s["deployed"]), {})
+        deployed = len(statuses) - len(failed)
+        if not failed:
+            message = f"Deployment successful ({len(statuses)} units"
+            message += f", {len(reused)} deployed earlier)" if reused else ")"
+        else:
+            names = ", ".join(s["name"] for s in statuses if not s["validated"] and not s["deployed"]) or "none"
+            if self.atomic:
+                message = f"Deployment failed, nothing deployed (atomic); units failing validation: {names}"
+            else:
+                message = f"Deployed {deployed} of {len(statuses)} units; failed: {names}"
+        logger.info("Deployed %d of %d units in %.1fs (%d earlier): %s",
+                    deployed, len(statuses), seconds, len(reused), message)
+
+        # the unit roots are only needed while their deploys run
+        if run_id:
+            shutil.rmtree(os.path.join(self.units_dir, run_id), ignore_errors=True)
+
+        return {
+            "success": not failed,
+            "returncode": first_failure.get("returncode", 0),
+            "stdout": "",
+            "stderr": "",
+            "parsed_response": first_failure.get("parsed_response"),
+            "written_files": [],
+            "deploy_command": first_failure.get("deploy_command"),
+            "message": message,
+            "atomic": self.atomic,
+            "units": statuses,
+            "failed_units": failed,
+            "reused_units": reused,
+            "component_failures": list(failures.values()),
+            "tests": tests,
+            "units_seconds": round(seconds, 3),
+        }
+
+
+def get_unit_deployer(transport, mode: str = DEPLOY_UNITS) -> Optional[UnitDeployer]:
+    """A UnitDeployer for INSTAFORCE_DEPLOY_UNITS (on | atomic), or None when it is off."""
+    if mode not in MODES:
+        raise ValueError(f"Unknown deploy unit mode '{mode}', expected one of {', '.join(MODES)}")
+    if mode == "off":
+        return None
+    return UnitDeployer(transport, atomic=mode == "atomic")
@@ -0,0 +1,266 @@
+import os
+import json
+import time
+import socket
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Set
+
+from langgraph.types import Command
+
+from src.jobs.store import JobStore
+from src.jobs.scheduler import get_scheduler, parse_priority, estimate_cost, rank
+from src.state.checkpoint import new_thread_id, thread_config, find_checkpoint_before
+from src.utils.log import get_logger
+from src.utils.metrics import JOB_QUEUE_SECONDS
+
+WORKER_SLOTS = int(os.getenv("INSTAFORCE_WORKER_SLOTS", "2"))
+JOB_WORKER = os.getenv("INSTAFORCE_JOB_WORKER", "inprocess")  # inprocess | external
+POLL_SECONDS = 5.0
+STALE_SECONDS = 60.0
+
+logger = get_logger("jobs")
+
+
+# strings up to this length are kept in event summaries
+EVENT_TEXT_CHARS = 200
+
+
+def _size(obj: Any) -> int:
+    try:
+        return len(json.dumps(obj, default=str))
+    except Exception:
+        return len(str(obj))
+
+
+def _summary(value: Any, depth: int = 0) -> Any:
+    """Short values as they are; long strings, lists and deeper dicts as their size."""
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if isinstance(value, str):
+        return value if len(value) <= EVENT_TEXT_CHARS else f"<{len(value)} chars>"
+    if isinstance(value, dict) and depth < 2:
+        return {k: _summary(v, depth + 1) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return f"<{len(value)} items, {_size(value)} bytes>"
+    if isinstance(value, dict):
+        return f"<{len(value)} keys, {_size(value)} bytes>"
+    return f"<{type(value).__name__}, {_size(value)} bytes>"
+
+
+def _serialize(obj: Any) -> str:
+    """
+    A node update for the event log: its keys with short values (status flags,
+    messages) as they are and everything else as its size. The full update is in
+    the run's checkpoints; file bodies would make every event row as big as the run.
+    """
+    try:
+        return json.dumps(_summary(obj), separators=(",", ":"))
+    except Exception:
+        return str(obj)[:EVENT_TEXT_CHARS]
+
+
+class JobRunner:
+    """
+    Runs pipeline jobs on a pool of `slots` worker threads, off the caller's thread.
+
+    Jobs are queued in a JobStore; a job id is the LangGraph thread id of its run, so
+    a job can be resumed, replayed and inspected with the checkpoint helpers. Each
+    node update is appended to the job's event log as it happens, summarized to keys
+    and sizes (see _serialize), which is what the UI polls. A job paused on an interrupt (requirement cache confirmation) ends in
+    status "waiting" with the interrupt payload and is continued with resume().
+
+    With dispatch=False the runner only enqueues; a separate worker process
+    (`python cli.py worker`) picks the jobs up from the shared store. A running
+    worker heartbeats its jobs; jobs of a worker that died are queued again and
+    continue from their last checkpoint.
+
+        runner = JobRunner(graph, slots=4)
+        job_id = runner.submit("As a sales manager I want ...")
+        runner.store.get(job_id)["status"]
+    """
+    def __init__(self, graph, store: Optional[JobStore] = None, slots: int = WORKER_SLOTS,
+                 dispatch: bool = True, poll_seconds: float = POLL_SECONDS):
+        self.graph = graph
+        self.store = store or JobStore()
+        self.slots = slots
+        self.dispatch = dispatch
+        self.poll_seconds = poll_seconds
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+
+        self._lock = threading.Lock()
+        self._dispatched: Set[str] = set()
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._stop = threading.Event()
+        self._ticker: Optional[threading.Thread] = None
+        if dispatch:
+            self._pool = ThreadPoolExecutor(max_workers=slots, thread_name_prefix="instaforce-job")
+            self._ticker = threading.Thread(target=self._tick_loop, daemon=True)
+            self._ticker.start()
+
+    # ---------------------------------------------------------
+    # submission
+    # ---------------------------------------------------------
+
+    def submit(self, requirement: str, job_id: Optional[str] = None, target_orgs: Optional[List[str]] = None,
+               priority: Any = None) -> str:
+        """
+        Queue a new run, deployed to `target_orgs` when given. `priority` (an int or
+        low/normal/high/urgent) moves it ahead of other queued runs. Returns its job id.
+        """
+        job_id = job_id or new_thread_id()
+        payload = {"target_orgs": list(target_orgs)} if target_orgs else {}
+        if priority is not None:
+            payload["priority"] = parse_priority(priority)
+        self.store.enqueue(job_id, "run", payload, requirement=requirement)
+        self.store.add_event(job_id, "system", "Queued")
+        self._fill()
+        return job_id
+
+    def resume(self, job_id: str, resume_value: Any = None) -> str:
+        """Continue a job from its last checkpoint; `resume_value` answers a pending interrupt."""
+        payload = {"resume": resume_value} if resume_value is not None else None
+        self.store.enqueue(job_id, "resume", payload)
+        self.store.add_event(job_id, "system", "Queued for resume")
+        self._fill()
+        return job_id
+
+    def replay(self, job_id: str, node: str) -> str:
+        """Re-run a job from the checkpoint before `node`."""
+        self.store.enqueue(job_id, "replay", {"node": node})
+        self.store.add_event(job_id, "system", f"Queued for replay from {node}")
+        self._fill()
+        return job_id
+
+    def queue_depth(self) -> Dict[str, int]:
+        return dict(self.store.queue_depth(), slots=self.slots)
+
+    # ---------------------------------------------------------
+    # worker side
+    # ---------------------------------------------------------
+
+    def serve(self):
+        """Block and process jobs until interrupted (separate worker process mode)."""
+        logger.info("Job worker %s serving with %d slots", self.worker_id, self.slots)
+        try:
+            self._stop.wait()
+        except KeyboardInterrupt:
+            pass
+        self.shutdown()
+
+    def shutdown(self, wait: bool = True):
+        self._stop.set()
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait)
+
+    def _tick_loop(self):
+        while not self._stop.wait(self.poll_seconds):
+            try:
+                self._tick()
+            except Exception as e:
+                logger.warning("Job runner tick failed: %s", e)
+
+    def _tick(self):
+        with self._lock:
+            active = list(self._dispatched)
+        if active:
+            self.store.heartbeat(active)
+        for job_id in self.store.requeue_stale(STALE_SECONDS):
+            self.store.add_event(job_id, "system", "Worker lost; re-queued to continue from the last checkpoint", level="warning")
+        self._fill()
+
+    def _fill(self):
+        """
+        Hand queued jobs to free worker slots: highest priority, then smallest
+        requirement first, with waiting time aging large runs forward (see
+        src.jobs.scheduler.rank).
+        """
+        if not self.dispatch or self._stop.is_set():
+            return
+        with self._lock:
+            free = self.slots - len(self._dispatched)
+            if free <= 0:
+                return
+            now = time.time()
+            entries = sorted(self.store.queued_entries(), key=lambda e: (rank(
+                estimate_cost(e["requirement_chars"] or 0), (e["payload"] or {}).get("priority", 0),
+                now - (e["submitted_at"] or now)), e["submitted_at"] or 0))
+            for job_id in (e["job_id"] for e in entries):
+                if free <= 0:
+                    break
+                if job_id in self._dispatched:
+                    continue
+                self._dispatched.add(job_id)
+                self._pool.submit(self._run, job_id)
+                free -= 1
+
+    def _run(self, job_id: str):
+        try:
+            if self.store.claim(job_id, f"{self.worker_id}:{threading.current_thread().name}"):
+                self._execute(job_id)
+        finally:
+            with self._lock:
+                self._dispatched.discard(job_id)
+            self._fill()
+
+    def _execute(self, job_id: str):
+        job = self.store.get(job_id)
+        JOB_QUEUE_SECONDS.observe(max(0.0, (job["started_at"] or 0) - (job["submitted_at"] or 0)))
+        config = thread_config(job_id)
+        payload = job["payload"] or {}
+
+        try:
+            if job["kind"] == "run":
+                run_input = {"requirement": job["requirement"], "run_id": job_id}
+                if payload.get("target_orgs"):
+                    run_input["target_orgs"] = payload["target_orgs"]
+                if payload.get("priority"):
+                    run_input["priority"] = payload["priority"]
+            elif job["kind"] == "replay":
+                snapshot = find_checkpoint_before(self.graph, job_id, payload["node"])
+                if snapshot is None:
+                    raise ValueError(f"No checkpoint before node '{payload['node']}' for run {job_id}")
+                run_input, config = None, snapshot.config
+            else:
+                run_input = Command(resume=payload["resume"]) if "resume" in payload else None
+
+            self.store.add_event(job_id, "system", f"Started ({job['kind']}) on {self.worker_id}")
+            interrupt = None
+            for update in self.graph.stream(run_input, config, stream_mode="updates"):
+                for node, output in update.items():
+                    if node == "__interrupt__":
+                        interrupt = output[0].value
+                        continue
+                    self.store.add_event(job_id, node, _serialize(output))
+
+            # the checkpoint already holds the final state; nothing is executed again
+            final_state = self.graph.get_state(thread_config(job_id)).values
+            self._log_schedule(job_id)
+            if interrupt is not None:
+                self.store.add_event(job_id, "system", "Waiting for input")
+                self.store.finish(job_id, "waiting", final_state=final_state, interrupt=interrupt)
+            else:
+                self.store.add_event(job_id, "system", "Completed")
+                self.store.finish(job_id, "completed", final_state=final_state)
+        except BaseException as e:
+            # SystemExit and the like too: a job left "running" would be re-queued forever
+            self.store.add_event(job_id, "system", traceback.format_exc(), level="error")
+            self.store.finish(job_id, "failed", error=str(e) if isinstance(e, Exception) else f"{type(e).__name__}({e})")
+            if not isinstance(e, (Exception, SystemExit)):
+                raise
+
+    def _log_schedule(self, job_id: str):
+        scheduler = get_scheduler()
+        stats = scheduler.run_stats(job_id) if scheduler is not None else None
+        if stats and stats["queue_wait_seconds"]:
+            waits = ", ".join(f"{r} {s:.1f}s" for r, s in stats["queue_wait_seconds"].items())
+            self.store.add_event(job_id, "system", f"Waited for scheduler slots: {waits}")
+
+
+def get_job_runner(graph, mode: str = JOB_WORKER) -> JobRunner:
+    """
+    Runner configured from the environment. With INSTAFORCE_JOB_WORKER=external the
+    caller only enqueues and `python cli.py worker` executes the jobs.
+    """
+    return JobRunner(graph, dispatch=(mode != "external"))
@@ -0,0 +1,304 @@
+import os
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager, asynccontextmanager
+from contextvars import ContextVar
+from typing import Dict, Any, Iterator, List, Optional
+
+from src.utils.log import get_logger
+from src.utils.metrics import SCHEDULER_WAIT_SECONDS
+
+logger = get_logger("scheduler")
+
+SCHEDULER = os.getenv("INSTAFORCE_SCHEDULER", "on") != "off"
+LLM_SLOTS = int(os.getenv("INSTAFORCE_LLM_SLOTS", "8"))
+DEPLOY_SLOTS = int(os.getenv("INSTAFORCE_DEPLOY_SLOTS", "4"))
+# seconds of waiting that outweigh one unit of estimated cost (one component)
+AGING_SECONDS = float(os.getenv("INSTAFORCE_SCHEDULER_AGING_SECONDS", "5"))
+# cost units one priority level is worth
+PRIORITY_WEIGHT = 10.0
+# requirement characters per expected component, for the cost estimate before design
+CHARS_PER_COMPONENT = 400
+PRIORITIES = {"low": -1, "normal": 0, "high": 1, "urgent": 2}
+_RUNS_LIMIT = 10000
+
+_current_run: ContextVar[str] = ContextVar("instaforce_run", default="")
+
+
+def parse_priority(value: Any) -> int:
+    """Run priority from an int or one of PRIORITIES; higher runs first."""
+    if value is None or value == "":
+        return 0
+    if isinstance(value, str) and value.strip().lower() in PRIORITIES:
+        return PRIORITIES[value.strip().lower()]
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Unknown priority '{value}', expected an integer or one of {', '.join(PRIORITIES)}")
+
+
+def estimate_cost(requirement_chars: int, components: Optional[int] = None) -> float:
+    """Work of a run in component units: the designed component count once known."""
+    if components is not None:
+        return 1.0 + components
+    return 1.0 + requirement_chars / CHARS_PER_COMPONENT
+
+
+def rank(cost: float, priority: int, waited_seconds: float,
+         priority_weight: float = PRIORITY_WEIGHT, aging_seconds: float = AGING_SECONDS) -> float:
+    """Scheduling order, lowest first: shortest job, raised by priority and by time waited."""
+    return cost - priority_weight * priority - waited_seconds / max(aging_seconds, 1e-9)
+
+
+class _Run:
+    def __init__(self, run_id: str):
+        self.run_id = run_id
+        self.priority = 0
+        self.requirement_chars = 0
+        self.components: Optional[int] = None
+        self.waits: Dict[str, float] = {}
+        self.grants: Dict[str, int] = {}
+
+    @property
+    def cost(self) -> float:
+        return estimate_cost(self.requirement_chars, self.components)
+
+
+class _Waiter:
+    def __init__(self, run: _Run, resource: str, wake):
+        self.run = run
+        self.resource = resource
+        self.enqueued = time.monotonic()
+        self.wake = wake
+        self.granted = False
+
+
+class RunScheduler:
+    """
+    Hands out LLM and deploy slots to the runs sharing a process (service, job
+    runner), so a one-line urgent fix does not queue behind a batch of large
+    requirements.
+
+    Each resource has a fixed number of slots. When a slot frees up it goes to the
+    waiter with the lowest rank(): the run's estimated cost (requirement length, then
+    the designed component count), minus PRIORITY_WEIGHT per priority level, minus one
+    unit per `aging_seconds` waited, so large runs still progress under steady load.
+
+    Runs are identified by the run id bound to the current context (bind()); time
+    spent waiting is kept per run and resource (run_stats) and exported as
+    instaforce_scheduler_wait_seconds.
+
+        with scheduler.bind(state):
+            with scheduler.slot("llm"):
+                llm.invoke(messages)
+    """
+    def __init__(self, slots: Optional[Dict[str, int]] = None, aging_seconds: float = AGING_SECONDS,
+                 priority_weight: float = PRIORITY_WEIGHT):
+        self.slots = dict(slots or {"llm": LLM_SLOTS, "deploy": DEPLOY_SLOTS})
+        self.aging_seconds = aging_seconds
+        self.priority_weight = priority_weight
+        self._lock = threading.Lock()
+        self._in_use: Dict[str, int] = {name: 0 for name in self.slots}
+        self._waiters: Dict[str, List[_Waiter]] = {name: [] for name in self.slots}
+        self._runs: "OrderedDict[str, _Run]" = OrderedDict()
+
+    # ---------------------------------------------------------
+    # runs
+    # ---------------------------------------------------------
+
+    def _run(self, run_id: str) -> _Run:
+        run = self._runs.get(run_id)
+        if run is None:
+            run = self._runs[run_id] = _Run(run_id)
+            while len(self._runs) > _RUNS_LIMIT:
+                self._runs.popitem(last=False)
+        return run
+
+    def observe(self, state: Optional[Dict[str, Any]], update: Any = None):
+        """Update a run's estimate from its state (priority, requirement) or a node's update (components)."""
+        run_id = (state or {}).get("run_id")
+        if not run_id:
+            return
+        with self._lock:
+            run = self._run(run_id)
+            if state.get("priority") is not None:
+                run.priority = parse_priority(state["priority"])
+            if state.get("requirement") and not state.get("story_id"):
+                run.requirement_chars = len(state["requirement"])
+            for source in (update, state):
+                components = source.get("components") if isinstance(source, dict) else None
+                if isinstance(components, dict) and isinstance(components.get("components"), list):
+                    run.components = len(components["components"])
+                    break
+
+    @contextmanager
+    def bind(self, state: Optional[Dict[str, Any]]) -> Iterator[None]:
+        """Attribute slot requests made in this context (and its threads' copies) to the state's run."""
+        self.observe(state)
+        token = _current_run.set((state or {}).get("run_id") or "")
+        try:
+            yield
+        finally:
+            _current_run.reset(token)
+
+    def run_stats(self, run_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            run = self._runs.get(run_id)
+            if run is None:
+                return None
+            return {"priority": run.priority, "estimated_cost": round(run.cost, 2),
+                    "queue_wait_seconds": {r: round(s, 3) for r, s in run.waits.items()},
+                    "slots_granted": dict(run.grants)}
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {name: {"slots": self.slots[name], "in_use": self._in_use[name],
+                           "waiting": len(self._waiters[name])} for name in self.slots}
+
+    # ---------------------------------------------------------
+    # slots
+    # ---------------------------------------------------------
+
+    def _rank(self, waiter: _Waiter, now: float) -> float:
+        return rank(waiter.run.cost, waiter.run.priority, now - waiter.enqueued,
+                    self.priority_weight, self.aging_seconds)
+
+    def _grant(self, resource: str):
+        """Wake the best-ranked waiters while slots are free. Caller holds the lock."""
+        waiters = self._waiters[resource]
+        now = time.monotonic()
+        while waiters and self._in_use[resource] < self.slots[resource]:
+            best = min(waiters, key=lambda w: (self._rank(w, now), w.enqueued))
+            waiters.remove(best)
+            self._in_use[resource] += 1
+            best.granted = True
+            best.wake()
+
+    def _enqueue(self, resource: str, wake) -> _Waiter:
+        if resource not in self.slots:
+            raise KeyError(f"Unknown scheduler resource '{resource}'")
+        with self._lock:
+            waiter = _Waiter(self._run(_current_run.get() or "unbound"), resource, wake)
+            self._waiters[resource].append(waiter)
+            self._grant(resource)
+            return waiter
+
+    def _granted(self, waiter: _Waiter):
+        waited = time.monotonic() - waiter.enqueued
+        with self._lock:
+            run = waiter.run
+            run.waits[waiter.resource] = run.waits.get(waiter.resource, 0.0) + waited
+            run.grants[waiter.resource] = run.grants.get(waiter.resource, 0) + 1
+        SCHEDULER_WAIT_SECONDS.observe(waited, resource=waiter.resource, priority=str(waiter.run.priority))
+        if waited > 1.0:
+            logger.debug("Run %s waited %.1fs for a %s slot", waiter.run.run_id, waited, waiter.resource)
+
+    def _cancel(self, waiter: _Waiter):
+        with self._lock:
+            if waiter in self._waiters[waiter.resource]:
+                self._waiters[waiter.resource].remove(waiter)
+                return
+        if waiter.granted:
+            self.release(waiter.resource)
+
+    def release(self, resource: str):
+        with self._lock:
+            self._in_use[resource] -= 1
+            self._grant(resource)
+
+    @contextmanager
+    def slot(self, resource: str) -> Iterator[None]:
+        event = threading.Event()
+        waiter = self._enqueue(resource, event.set)
+        try:
+            event.wait()
+        except BaseException:
+            self._cancel(waiter)
+            raise
+        self._granted(waiter)
+        try:
+            yield
+        finally:
+            self.release(resource)
+
+    @asynccontextmanager
+    async def aslot(self, resource: str):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+
+        waiter = self._enqueue(resource, wake)
+        try:
+            await future
+        except BaseException:
+            self._cancel(waiter)
+            raise
+        self._granted(waiter)
+        try:
+            yield
+        finally:
+            self.release(resource)
+
+
+class ScheduledLLM:
+    """Chat model wrapper whose calls each hold an "llm" slot of the scheduler; streams hold it until exhausted."""
+    def __init__(self, llm, scheduler: RunScheduler):
+        self.llm = llm
+        self.scheduler = scheduler
+
+    def __getattr__(self, item):
+        return getattr(self.llm, item)
+
+    def invoke(self, messages, *args, **kwargs):
+        with self.scheduler.slot("llm"):
+            return self.llm.invoke(messages, *args, **kwargs)
+
+    async def ainvoke(self, messages, *args, **kwargs):
+        async with self.scheduler.aslot("llm"):
+            return await self.llm.ainvoke(messages, *args, **kwargs)
+
+    def stream(self, messages, *args, **kwargs):
+        with self.scheduler.slot("llm"):
+            yield from self.llm.stream(messages, *args, **kwargs)
+
+    async def astream(self, messages, *args, **kwargs):
+        async with self.scheduler.aslot("llm"):
+            async for chunk in self.llm.astream(messages, *args, **kwargs):
+                yield chunk
+
+
+class ScheduledTransport:
+    """Deploy transport wrapper whose deploys each hold a "deploy" slot of the scheduler."""
+    def __init__(self, transport, scheduler: RunScheduler):
+        self.transport = transport
+        self.scheduler = scheduler
+
+    def __getattr__(self, item):
+        return getattr(self.transport, item)
+
+    def deploy(self, deploy_root: str, alias: str, tests: Optional[Dict[str, Any]] = None,
+               check_only: bool = False) -> Dict[str, Any]:
+        with self.scheduler.slot("deploy"):
+            return self.transport.deploy(deploy_root, alias, tests=tests, check_only=check_only)
+
+    async def adeploy(self, deploy_root: str, alias: str, tests: Optional[Dict[str, Any]] = None,
+                      check_only: bool = False) -> Dict[str, Any]:
+        async with self.scheduler.aslot("deploy"):
+            return await self.transport.adeploy(deploy_root, alias, tests=tests, check_only=check_only)
+
+
+_scheduler: Optional[RunScheduler] = None
+
+
+def get_scheduler(enabled: bool = SCHEDULER) -> Optional[RunScheduler]:
+    """The process-wide scheduler, or None when INSTAFORCE_SCHEDULER=off."""
+    global _scheduler
+    if not enabled:
+        return None
+    if _scheduler is None:
+        _scheduler = RunScheduler()
+    return _scheduler
@@ -0,0 +1,207 @@
+import os
+import json
+import time
+import sqlite3
+from contextlib import contextmanager
+from typing import Dict, Any, Iterator, List, Optional
+
+JOBS_DB = os.getenv("INSTAFORCE_JOBS_DB", os.path.join(".instaforce", "jobs.sqlite"))
+
+# queued -> running -> completed | failed | waiting (paused on an interrupt, resumable)
+ACTIVE_STATUSES = ("queued", "running")
+JOB_COLUMNS = ("job_id", "kind", "payload", "requirement", "status", "submitted_at", "started_at", "finished_at",
+               "worker", "heartbeat_at", "error", "interrupt", "final_state")
+
+
+class JobStore:
+    """
+    Persisted job queue and per-node progress log shared by the UI and the workers.
+
+    Every call opens its own short-lived connection, so the store can be used from
+    worker threads and from a separate worker process at the same time.
+
+      jobs   - one row per job; job_id is the LangGraph thread id of the run
+      events - node updates and log lines of a job, in emission order
+    """
+    def __init__(self, path: str = JOBS_DB):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    payload TEXT,
+                    requirement TEXT,
+                    status TEXT NOT NULL,
+                    submitted_at REAL,
+                    started_at REAL,
+                    finished_at REAL,
+                    worker TEXT,
+                    heartbeat_at REAL,
+                    error TEXT,
+                    interrupt TEXT,
+                    final_state TEXT
+                );
+                CREATE TABLE IF NOT EXISTS events (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    job_id TEXT NOT NULL,
+                    t REAL NOT NULL,
+                    node TEXT NOT NULL,
+                    level TEXT NOT NULL,
+                    message TEXT
+                );
+                CREATE INDEX IF NOT EXISTS events_job ON events (job_id, id);
+                CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, submitted_at);
+                """
+            )
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    # ---------------------------------------------------------
+    # queue
+    # ---------------------------------------------------------
+
+    def enqueue(self, job_id: str, kind: str, payload: Dict[str, Any], requirement: Optional[str] = None):
+        """
+        Queue a job. Re-queuing an existing job (resume / replay of the same run) keeps
+        its requirement and event log.
+        """
+        with self._connect() as conn:
+            conn.execute(
+                """
+                INSERT INTO jobs (job_id, kind, payload, requirement, status, submitted_at)
+                VALUES (?, ?, ?, ?, 'queued', ?)
+                ON CONFLICT(job_id) DO UPDATE SET
+                    kind = excluded.kind, payload = excluded.payload, status = 'queued',
+                    requirement = COALESCE(excluded.requirement, jobs.requirement),
+                    submitted_at = excluded.submitted_at, started_at = NULL, finished_at = NULL,
+                    worker = NULL, heartbeat_at = NULL, error = NULL, interrupt = NULL
+                """,
+                (job_id, kind, json.dumps(payload), requirement, time.time()),
+            )
+
+    def claim(self, job_id: str, worker: str) -> bool:
+        """Atomically move a queued job to running. False if another worker took it."""
+        with self._connect() as conn:
+            cur = conn.execute(
+                "UPDATE jobs SET status = 'running', started_at = ?, heartbeat_at = ?, worker = ? "
+                "WHERE job_id = ? AND status = 'queued'",
+                (time.time(), time.time(), worker, job_id),
+            )
+            return cur.rowcount == 1
+
+    def finish(self, job_id: str, status: str, final_state: Optional[Dict[str, Any]] = None,
+               error: Optional[str] = None, interrupt: Optional[Dict[str, Any]] = None):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, final_state = ?, error = ?, interrupt = ? WHERE job_id = ?",
+                (
+                    status,
+                    time.time(),
+                    json.dumps(final_state, default=str) if final_state is not None else None,
+                    error,
+                    json.dumps(interrupt, default=str) if interrupt is not None else None,
+                    job_id,
+                ),
+            )
+
+    def heartbeat(self, job_ids: List[str]):
+        """Mark running jobs as alive; see requeue_stale."""
+        with self._connect() as conn:
+            conn.executemany(
+                "UPDATE jobs SET heartbeat_at = ? WHERE job_id = ? AND status = 'running'",
+                [(time.time(), job_id) for job_id in job_ids],
+            )
+
+    def requeue_stale(self, stale_seconds: float) -> List[str]:
+        """
+        Put jobs whose worker stopped sending heartbeats (process killed, host
+        restarted) back on the queue. The checkpoint holds their finished nodes,
+        so they continue as a resume.
+        """
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT job_id FROM jobs WHERE status = 'running' AND heartbeat_at < ?",
+                (time.time() - stale_seconds,),
+            ).fetchall()
+            ids = [r["job_id"] for r in rows]
+            for job_id in ids:
+                conn.execute(
+                    "UPDATE jobs SET status = 'queued', kind = 'resume', payload = 'null', worker = NULL "
+                    "WHERE job_id = ? AND status = 'running'",
+                    (job_id,),
+                )
+            return ids
+
+    def queued_entries(self) -> List[Dict[str, Any]]:
+        """Queued jobs, oldest first, with what the scheduler ranks them by."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT job_id, kind, payload, LENGTH(requirement) AS requirement_chars, submitted_at "
+                "FROM jobs WHERE status = 'queued' ORDER BY submitted_at"
+            ).fetchall()
+        return [dict(r, payload=json.loads(r["payload"]) if r["payload"] else None) for r in rows]
+
+    def queue_depth(self) -> Dict[str, int]:
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT status, COUNT(*) AS n FROM jobs WHERE status IN (?, ?) GROUP BY status", ACTIVE_STATUSES
+            ).fetchall()
+        depth = {status: 0 for status in ACTIVE_STATUSES}
+        depth.update({r["status"]: r["n"] for r in rows})
+        return depth
+
+    # ---------------------------------------------------------
+    # progress
+    # ---------------------------------------------------------
+
+    def add_event(self, job_id: str, node: str, message: str, level: str = "info"):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO events (job_id, t, node, level, message) VALUES (?, ?, ?, ?, ?)",
+                (job_id, time.time(), node, level, message),
+            )
+
+    def events(self, job_id: str, after_id: int = 0) -> List[Dict[str, Any]]:
+        """Events of a job newer than `after_id`, oldest first."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, t, node, level, message FROM events WHERE job_id = ? AND id > ? ORDER BY id",
+                (job_id, after_id),
+            ).fetchall()
+            return [dict(r) for r in rows]
+
+    def get(self, job_id: str, with_state: bool = True) -> Optional[Dict[str, Any]]:
+        """A job row; with_state=False skips loading the (possibly large) final state, for polling."""
+        columns = "*" if with_state else ", ".join(c for c in JOB_COLUMNS if c != "final_state")
+        with self._connect() as conn:
+            row = conn.execute(f"SELECT {columns} FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job.setdefault("final_state", None)
+        for key in ("payload", "final_state", "interrupt"):
+            if job[key] is not None:
+                job[key] = json.loads(job[key])
+        return job
+
+    def recent(self, limit: int = 20) -> List[Dict[str, Any]]:
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT job_id, status, requirement, submitted_at, finished_at FROM jobs "
+                "ORDER BY submitted_at DESC LIMIT ?",
+                (limit,),
+            ).fetchall()
+            return [dict(r) for r in rows]
@@ -0,0 +1,157 @@
+import re
+import json
+import time
+import asyncio
+from collections import Counter
+from typing import Dict, Any, List, Optional
+
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+from src.utils.compact_codec import decode
+
+# system prompt marker -> pipeline stage
+STAGE_MARKERS = {
+    "Salesforce Solution Architect": "req",
+    "Technical Architect Intelligence Core": "design",
+    "Metadata Code Generation Core": "codegen",
+    "Metadata Repair Core": "repair",
+}
+KNOWN_OBJECTS = ["Account", "Contact", "Opportunity", "Case", "Lead", "Quote", "Campaign", "Order"]
+API_VERSION = "59.0"
+STREAM_CHUNK_CHARS = 40
+
+
+def _stage(messages: List[Dict[str, Any]]) -> str:
+    system = next((m.get("content", "") for m in messages if m.get("role") == "system"), "")
+    for marker, stage in STAGE_MARKERS.items():
+        if marker in system:
+            return stage
+    return "unknown"
+
+
+def _user_json(messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+    user = next((m.get("content", "") for m in messages if m.get("role") == "user"), "{}")
+    try:
+        payload = json.loads(user)
+    except Exception:
+        return {"text": user}
+    return decode(payload) if isinstance(payload, dict) else {"value": payload}
+
+
+def _meta_xml(tag: str, extra: str = "") -> str:
+    return (f'<?xml version="1.0" encoding="UTF-8"?>\n<{tag} xmlns="http://soap.sforce.com/2006/04/metadata">\n'
+            f"    <apiVersion>{API_VERSION}</apiVersion>\n{extra}    <status>Active</status>\n</{tag}>\n")
+
+
+class FakeLLM:
+    """
+    Offline stand-in for the chat model, for local runs of the service and benchmarks.
+
+    Recognizes the pipeline stage from the system prompt and answers with a small,
+    deterministic, deployable result derived from the request: a breakdown naming the
+    standard objects mentioned in the requirement, one service class and one trigger
+    per object, and source files for exactly the components it is asked to generate.
+    `responses` maps a stage ("req", "design", "codegen", "repair") to a recorded
+    response text that is returned instead. Supports invoke/ainvoke/stream/astream
+    with an optional simulated `latency_seconds` per call.
+    """
+    def __init__(self, latency_seconds: float = 0.0, responses: Optional[Dict[str, str]] = None):
+        self.latency_seconds = latency_seconds
+        self.responses = responses or {}
+        self.calls: Counter = Counter()
+
+    @classmethod
+    def from_file(cls, path: str, latency_seconds: float = 0.0) -> "FakeLLM":
+        """Recorded responses from a JSON file of {stage: response text}."""
+        with open(path, encoding="utf-8") as fh:
+            return cls(latency_seconds=latency_seconds, responses=json.load(fh))
+
+    # ---------------------------------------------------------
+    # responses
+    # ---------------------------------------------------------
+
+    def respond(self, messages: List[Dict[str, Any]]) -> str:
+        stage = _stage(messages)
+        self.calls[stage] += 1
+        if stage in self.responses:
+            return self.responses[stage]
+        payload = _user_json(messages)
+        if stage == "req":
+            return json.dumps(self._breakdown(payload.get("text", "")))
+        if stage == "design":
+            return json.dumps(self._design(payload))
+        if stage == "codegen":
+            return json.dumps({"files": self._files(payload.get("components", []))})
+        if stage == "repair":
+            return json.dumps({"files": [{k: f.get(k, "") for k in ("fileName", "filePath", "content")}
+                                         for f in payload.get("files", [])]})
+        return "{}"
+
+    @staticmethod
+    def _breakdown(requirement: str) -> Dict[str, Any]:
+        objects = [o for o in KNOWN_OBJECTS if re.search(rf"\b{o}", requirement, re.IGNORECASE)] or ["Account"]
+        return {
+            "Original requirement": requirement,
+            "domain": "Salesforce",
+            "objects": objects,
+            "actions": ["automate"],
+            "integrationPoints": [],
+            "clarificationsNeeded": [],
+        }
+
+    @staticmethod
+    def _design(breakdown: Dict[str, Any]) -> Dict[str, Any]:
+        components = []
+        for obj in breakdown.get("objects") or ["Account"]:
+            components.append({"type": "ApexClass", "apiName": f"{obj}Service", "label": f"{obj} Service",
+                               "object": obj, "estimatedHours": 2})
+            components.append({"type": "ApexTrigger", "apiName": f"{obj}Trigger", "label": f"{obj} Trigger",
+                               "object": obj, "estimatedHours": 1,
+                               "dependencies": {"requiresApex": True, "requiredApexClasses": [f"{obj}Service"]}})
+        return {"components": components, "summary": {"assumptions": []}}
+
+    @staticmethod
+    def _files(components: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+        files = []
+        for c in components:
+            name = c.get("apiName") or "Generated"
+            if c.get("type") == "ApexClass":
+                files.append({"fileName": f"{name}.cls", "filePath": "force-app/main/default/classes",
+                              "content": f"public with sharing class {name} {{\n    public static void handle(List<SObject> records) {{\n    }}\n}}\n"})
+                files.append({"fileName": f"{name}.cls-meta.xml", "filePath": "force-app/main/default/classes",
+                              "content": _meta_xml("ApexClass")})
+            elif c.get("type") == "ApexTrigger":
+                obj = c.get("object") or "Account"
+                service = (c.get("dependencies") or {}).get("requiredApexClasses") or []
+                body = f"    {service[0]}.handle(Trigger.new);\n" if service else ""
+                files.append({"fileName": f"{name}.trigger", "filePath": "force-app/main/default/triggers",
+                              "content": f"trigger {name} on {obj} (before insert, before update) {{\n{body}}}\n"})
+                files.append({"fileName": f"{name}.trigger-meta.xml", "filePath": "force-app/main/default/triggers",
+                              "content": _meta_xml("ApexTrigger")})
+        return files
+
+    # ---------------------------------------------------------
+    # chat model interface
+    # ---------------------------------------------------------
+
+    def invoke(self, messages, **kwargs) -> AIMessage:
+        time.sleep(self.latency_seconds)
+        return AIMessage(content=self.respond(messages), response_metadata={"finish_reason": "stop"})
+
+    async def ainvoke(self, messages, **kwargs) -> AIMessage:
+        await asyncio.sleep(self.latency_seconds)
+        return AIMessage(content=self.respond(messages), response_metadata={"finish_reason": "stop"})
+
+    def stream(self, messages, **kwargs):
+        text = self.respond(messages)
+        pieces = [text[i:i + STREAM_CHUNK_CHARS] for i in range(0, len(text), STREAM_CHUNK_CHARS)]
+        for piece in pieces:
+            time.sleep(self.latency_seconds / max(len(pieces), 1))
+            yield AIMessageChunk(content=piece)
+
+    async def astream(self, messages, **kwargs):
+        text = self.respond(messages)
+        pieces = [text[i:i + STREAM_CHUNK_CHARS] for i in range(0, len(text), STREAM_CHUNK_CHARS)]
+        for piece in pieces:
+            await asyncio.sleep(self.latency_seconds / max(len(pieces), 1))
+            yield AIMessageChunk(content=piece)
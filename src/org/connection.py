@@ -0,0 +1,44 @@
+import os
+import re
+from typing import Dict, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def _env_prefix(alias: str) -> str:
+    return "SF_" + re.sub(r"[^A-Za-z0-9]", "_", alias).upper() + "_"
+
+
+def org_credentials(alias: Optional[str] = None) -> Dict[str, str]:
+    """
+    Username / password / token for an org alias. Alias-specific variables
+    (SF_<ALIAS>_USERNAME, SF_<ALIAS>_PASSWORD, SF_<ALIAS>_SECURITY_TOKEN, SF_<ALIAS>_DOMAIN)
+    win over the shared SF_USERNAME, SF_PASSWORD, SF_SECURITY_TOKEN, SF_DOMAIN.
+    """
+    alias = alias or os.environ.get("SF_USERNAME_ALIAS", "")
+    prefix = _env_prefix(alias) if alias else "SF_"
+
+    def lookup(name: str, default: str = "") -> str:
+        return os.environ.get(prefix + name) or os.environ.get("SF_" + name, default)
+
+    return {
+        "username": lookup("USERNAME"),
+        "password": lookup("PASSWORD"),
+        "security_token": lookup("SECURITY_TOKEN"),
+        "domain": lookup("DOMAIN", "login"),
+    }
+
+
+def get_salesforce(alias: Optional[str] = None):
+    """
+    API client for an org alias on the process-wide session cache (src.org.sessions):
+    no login per call or run, pooled connections, expired sessions retried.
+    """
+    from src.org.sessions import SESSIONS
+
+    alias = alias or os.environ.get("SF_USERNAME_ALIAS", "")
+    credentials = org_credentials(alias)
+    if not credentials["username"]:
+        raise EnvironmentError(f"No Salesforce credentials configured for org alias '{alias}'")
+    return SESSIONS.client(alias)
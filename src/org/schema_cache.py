@@ -0,0 +1,366 @@
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Dict, Any, Iterable, List, Optional, Set
+
+import duckdb
+
+from src.deploy.files import file_key
+
+SCHEMA_DB = os.getenv("INSTAFORCE_SCHEMA_DB", os.path.join(".instaforce", "org_schema.duckdb"))
+SCHEMA_TTL_HOURS = float(os.getenv("INSTAFORCE_SCHEMA_TTL_HOURS", "24"))
+REFERENCE_CHECK = os.getenv("INSTAFORCE_REFERENCE_CHECK", "block")  # block | warn | off
+# how long to wait for another process (UI, `cli.py worker`) to release the file lock
+SCHEMA_LOCK_TIMEOUT = float(os.getenv("INSTAFORCE_SCHEMA_LOCK_TIMEOUT", "10"))
+
+# Object.Field__c, Obj__c.Field__c, also inside permission set <field> tags and SOQL
+QUALIFIED_REF = re.compile(r"\b([A-Za-z][A-Za-z0-9_]*)\.([A-Za-z][A-Za-z0-9_]*__c)\b")
+CUSTOM_NAME = re.compile(r"(?<![.\w])([A-Za-z][A-Za-z0-9_]*__c)\b")
+OBJECT_PATH = re.compile(r"(?:^|/)objects/([A-Za-z][A-Za-z0-9_]*)/")
+FIELD_FILE = re.compile(r"(?:^|/)objects/([A-Za-z][A-Za-z0-9_]*)/fields/([A-Za-z][A-Za-z0-9_]*)\.field-meta\.xml$")
+OBJECT_FILE = re.compile(r"(?:^|/)objects/([A-Za-z][A-Za-z0-9_]*)/\1\.object-meta\.xml$")
+PERMSET_OBJECT = re.compile(r"<object>\s*([A-Za-z][A-Za-z0-9_]*)\s*</object>")
+SOQL_FROM = re.compile(r"\bFROM\s+([A-Za-z][A-Za-z0-9_]*__c)\b", re.I)
+FORMULA = re.compile(r"<errorConditionFormula>(.*?)</errorConditionFormula>", re.S)
+
+_SCHEMA_DDL = [
+    """CREATE TABLE IF NOT EXISTS sobjects (
+        org VARCHAR, name VARCHAR, name_lc VARCHAR, label VARCHAR, custom BOOLEAN,
+        described_at TIMESTAMP, PRIMARY KEY (org, name_lc))""",
+    """CREATE TABLE IF NOT EXISTS fields (
+        org VARCHAR, object_lc VARCHAR, name VARCHAR, name_lc VARCHAR, label VARCHAR,
+        type VARCHAR, custom BOOLEAN, reference_to VARCHAR, PRIMARY KEY (org, object_lc, name_lc))""",
+    """CREATE TABLE IF NOT EXISTS sync_state (org VARCHAR PRIMARY KEY, objects_synced_at TIMESTAMP)""",
+    # Apex classes looked up by name; artifact_version is the framework library marker
+    """CREATE TABLE IF NOT EXISTS apex_classes (
+        org VARCHAR, name VARCHAR, name_lc VARCHAR, present BOOLEAN, artifact_version VARCHAR,
+        synced_at TIMESTAMP, PRIMARY KEY (org, name_lc))""",
+]
+
+# DuckDB refuses a second connection to a file with a different read_only setting
+# within one process, so every cache instance shares one lock
+_DB_LOCK = threading.RLock()
+
+
+class OrgSchemaCache:
+    """
+    Local DuckDB mirror of an org's describe metadata.
+
+    The sObject list comes from one global describe per TTL; field lists are described
+    on demand, per object, and re-described once older than the TTL. Lookups after the
+    first sync are local queries, so generated files can be checked for references to
+    objects and fields the org does not have before a deploy round trip is paid.
+
+    The file is shared by the UI, the server and `cli.py worker` processes, and DuckDB
+    lets only one process hold it read-write. No connection is kept open: reads take a
+    short read-only connection, writes a short read-write one after the org call that
+    produced the rows, and a connection that hits another process's lock is retried
+    for up to SCHEMA_LOCK_TIMEOUT seconds.
+    """
+    def __init__(self, alias: str, path: str = SCHEMA_DB, sf=None, ttl_hours: float = SCHEMA_TTL_HOURS):
+        self.alias = alias
+        self.path = path
+        self.ttl = timedelta(hours=ttl_hours)
+        self._sf = sf
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect(write=True) as conn:
+            for ddl in _SCHEMA_DDL:
+                conn.execute(ddl)
+
+    @contextmanager
+    def _connect(self, write: bool = False):
+        """A connection for one read or write, retried while another process holds the file."""
+        deadline = time.monotonic() + SCHEMA_LOCK_TIMEOUT
+        with _DB_LOCK:
+            while True:
+                try:
+                    conn = duckdb.connect(self.path, read_only=not write)
+                    break
+                except duckdb.IOException:
+                    if time.monotonic() >= deadline:
+                        raise
+                    time.sleep(0.05)
+            try:
+                yield conn
+            finally:
+                conn.close()
+
+    @property
+    def sf(self):
+        if self._sf is None:
+            from src.org.connection import get_salesforce
+            self._sf = get_salesforce(self.alias)
+        return self._sf
+
+    # ---------------------------------------------------------
+    # sync
+    # ---------------------------------------------------------
+
+    def _is_stale(self, synced_at: Optional[datetime]) -> bool:
+        return synced_at is None or datetime.now() - synced_at > self.ttl
+
+    def refresh(self, force: bool = False, describe_all: bool = False) -> Dict[str, int]:
+        """
+        Sync the sObject list (when stale or forced), dropping objects the org no
+        longer has. With describe_all, also describe every object's fields.
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT objects_synced_at FROM sync_state WHERE org = ?", [self.alias]).fetchone()
+        synced = 0
+        if force or self._is_stale(row[0] if row else None):
+            sobjects = self.sf.describe()["sobjects"]
+            names = {s["name"].lower() for s in sobjects}
+            with self._connect(write=True) as conn:
+                cached = {r[0] for r in conn.execute(
+                    "SELECT name_lc FROM sobjects WHERE org = ?", [self.alias]).fetchall()}
+                for removed in cached - names:
+                    conn.execute("DELETE FROM sobjects WHERE org = ? AND name_lc = ?", [self.alias, removed])
+                    conn.execute("DELETE FROM fields WHERE org = ? AND object_lc = ?", [self.alias, removed])
+                new_rows = [
+                    [self.alias, s["name"], s["name"].lower(), s.get("label", ""), bool(s.get("custom"))]
+                    for s in sobjects if s["name"].lower() not in cached
+                ]
+                if new_rows:
+                    conn.executemany(
+                        "INSERT INTO sobjects (org, name, name_lc, label, custom, described_at) "
+                        "VALUES (?, ?, ?, ?, ?, NULL)", new_rows)
+                conn.execute(
+                    "INSERT OR REPLACE INTO sync_state VALUES (?, ?)", [self.alias, datetime.now()])
+            synced = len(new_rows)
+        described = 0
+        if describe_all:
+            described = self.ensure_described(self.object_names(), force=force)
+        return {"new_objects": synced, "described_objects": described}
+
+    def ensure_described(self, objects: Iterable[str], force: bool = False) -> int:
+        """Describe the given objects' fields if missing or older than the TTL."""
+        wanted = {o.lower() for o in objects}
+        if not wanted:
+            return 0
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT name, name_lc, described_at FROM sobjects WHERE org = ?", [self.alias]).fetchall()
+        todo = [name for name, name_lc, described_at in rows
+                if name_lc in wanted and (force or self._is_stale(described_at))]
+        described = {name: getattr(self.sf, name).describe()["fields"] for name in todo}
+        if described:
+            with self._connect(write=True) as conn:
+                for name, fields in described.items():
+                    conn.execute("DELETE FROM fields WHERE org = ? AND object_lc = ?", [self.alias, name.lower()])
+                    conn.executemany(
+                        "INSERT INTO fields VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        [[self.alias, name.lower(), f["name"], f["name"].lower(), f.get("label", ""),
+                          f.get("type", ""), bool(f.get("custom")), ",".join(f.get("referenceTo") or [])]
+                         for f in fields])
+                    conn.execute(
+                        "UPDATE sobjects SET described_at = ? WHERE org = ? AND name_lc = ?",
+                        [datetime.now(), self.alias, name.lower()])
+        return len(todo)
+
+    # ---------------------------------------------------------
+    # lookups
+    # ---------------------------------------------------------
+
+    def object_names(self) -> List[str]:
+        with self._connect() as conn:
+            return [r[0] for r in conn.execute(
+                "SELECT name FROM sobjects WHERE org = ? ORDER BY name", [self.alias]).fetchall()]
+
+    def resolve_objects(self, names: Iterable[str]) -> Dict[str, str]:
+        """Map object API names or labels ("Quote Line Item") to API names the org knows."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT name, name_lc, lower(label) FROM sobjects WHERE org = ?", [self.alias]).fetchall()
+        by_name = {name_lc: name for name, name_lc, _ in rows}
+        by_label = {label: name for name, _, label in rows}
+        resolved = {}
+        for n in names:
+            key = (n or "").strip().lower()
+            api = by_name.get(key) or by_name.get(key.replace(" ", "")) or by_label.get(key)
+            if api:
+                resolved[n] = api
+        return resolved
+
+    def fields_for(self, objects: Iterable[str]) -> Dict[str, Set[str]]:
+        """Lower-cased field API names per lower-cased object name (described objects only)."""
+        objects_lc = [o.lower() for o in objects]
+        if not objects_lc:
+            return {}
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT object_lc, name_lc FROM fields WHERE org = ? AND object_lc IN "
+                f"({', '.join('?' for _ in objects_lc)})", [self.alias, *objects_lc]).fetchall()
+        result: Dict[str, Set[str]] = {}
+        for object_lc, name_lc in rows:
+            result.setdefault(object_lc, set()).add(name_lc)
+        return result
+
+    def field_names(self, objects: Iterable[str]) -> Dict[str, List[str]]:
+        """Real field API names for objects given by API name or label, for DesignAgent prompts."""
+        self.refresh()
+        resolved = self.resolve_objects(objects)
+        self.ensure_described(resolved.values())
+        with self._connect() as conn:
+            result = {}
+            for api in set(resolved.values()):
+                rows = conn.execute(
+                    "SELECT name FROM fields WHERE org = ? AND object_lc = ? ORDER BY name",
+                    [self.alias, api.lower()]).fetchall()
+                result[api] = [r[0] for r in rows]
+        return result
+
+    def apex_class_versions(self, names: Iterable[str]) -> Dict[str, Optional[str]]:
+        """
+        Which of the named Apex classes the org has: name -> framework library version
+        (src.artifacts), or None for a class the library did not deploy. Absent classes
+        are left out. Names not looked up within the TTL are queried in one SOQL call.
+        """
+        from src.artifacts.library import artifact_version
+
+        wanted = {n.lower(): n for n in names}
+        if not wanted:
+            return {}
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT name_lc, synced_at FROM apex_classes WHERE org = ?", [self.alias]).fetchall()
+        fresh = {name_lc for name_lc, synced_at in rows if not self._is_stale(synced_at)}
+        todo = [wanted[n] for n in wanted if n not in fresh]
+        if todo:
+            quoted = ", ".join("'" + n.replace("'", "\\'") + "'" for n in todo)
+            records = self.sf.query_all(f"SELECT Name, Body FROM ApexClass WHERE Name IN ({quoted})")["records"]
+            found = {r["Name"].lower(): r for r in records}
+            now = datetime.now()
+            with self._connect(write=True) as conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO apex_classes VALUES (?, ?, ?, ?, ?, ?)",
+                    [[self.alias, n, n.lower(), n.lower() in found,
+                      artifact_version(found[n.lower()].get("Body", "")) if n.lower() in found else None, now]
+                     for n in todo])
+        with self._connect() as conn:
+            result = conn.execute(
+                "SELECT name, name_lc, artifact_version FROM apex_classes WHERE org = ? AND present AND name_lc IN "
+                f"({', '.join('?' for _ in wanted)})", [self.alias, *wanted]).fetchall()
+        return {wanted[name_lc]: version for _, name_lc, version in result}
+
+    def record_apex_classes(self, versions: Dict[str, str]):
+        """Mirror classes just deployed by the library, so later runs skip them."""
+        if not versions:
+            return
+        now = datetime.now()
+        with self._connect(write=True) as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO apex_classes VALUES (?, ?, ?, ?, ?, ?)",
+                [[self.alias, name, name.lower(), True, version, now] for name, version in versions.items()])
+
+    # ---------------------------------------------------------
+    # reference checking
+    # ---------------------------------------------------------
+
+    def check_references(self, files: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Unknown object / custom field references in generated files, as
+        componentFailures-shaped dicts (fileName, problem, lineNumber).
+        Objects and fields created by the generated files themselves count as known.
+        """
+        self.refresh()
+        generated_objects, generated_fields = _generated_schema(files)
+        refs = [(f, ref) for f in files for ref in _references(f)]
+
+        known_objects = {o.lower() for o in self.object_names()} | generated_objects
+        self.ensure_described({obj.lower() for _, (obj, _, _) in refs if obj.lower() in known_objects})
+        org_fields = self.fields_for({obj.lower() for _, (obj, _, _) in refs})
+
+        problems = []
+        for f, (obj, field, line) in refs:
+            obj_lc = obj.lower()
+            if obj_lc not in known_objects:
+                # lower-case or non-custom prefixes are usually Apex variables, not objects
+                if obj_lc.endswith("__c"):
+                    problems.append(_problem(f, line, f"Unknown object {obj}"))
+                continue
+            if field is None:
+                continue
+            field_lc = field.lower()
+            if field_lc in org_fields.get(obj_lc, set()) or (obj_lc, field_lc) in generated_fields:
+                continue
+            if obj_lc not in org_fields and obj_lc not in generated_objects:
+                continue
+            problems.append(_problem(f, line, f"Unknown field {field} on {obj}"))
+        return problems
+
+
+def _problem(f: Dict[str, Any], line: int, problem: str) -> Dict[str, Any]:
+    return {
+        "fileName": file_key(f),
+        "fullName": os.path.splitext(f.get("fileName", ""))[0],
+        "componentType": "",
+        "problem": problem,
+        "problemType": "Error",
+        "lineNumber": line,
+        "columnNumber": None,
+    }
+
+
+def _generated_schema(files: List[Dict[str, Any]]):
+    objects, fields = set(), set()
+    for f in files:
+        key = file_key(f)
+        m = FIELD_FILE.search(key)
+        if m:
+            objects.add(m.group(1).lower())
+            fields.add((m.group(1).lower(), m.group(2).lower()))
+        m = OBJECT_FILE.search(key)
+        if m:
+            objects.add(m.group(1).lower())
+    return objects, fields
+
+
+def _line_of(content: str, pos: int) -> int:
+    return content.count("\n", 0, pos) + 1
+
+
+def _references(f: Dict[str, Any]):
+    """(object, field or None, line) references found in one generated file."""
+    key = file_key(f)
+    content = f.get("content", "")
+    seen = set()
+
+    def emit(obj, field, line):
+        ref = (obj.lower(), field.lower() if field else None)
+        if ref not in seen:
+            seen.add(ref)
+            yield obj, field, line
+
+    m = OBJECT_PATH.search(key)
+    path_object = m.group(1) if m else None
+    if path_object:
+        yield from emit(path_object, None, 1)
+        # unqualified custom fields in validation rule formulas belong to the path object
+        for formula in FORMULA.finditer(content):
+            for name in CUSTOM_NAME.finditer(formula.group(1)):
+                yield from emit(path_object, name.group(1), _line_of(content, formula.start(1) + name.start()))
+
+    for m in QUALIFIED_REF.finditer(content):
+        yield from emit(m.group(1), m.group(2), _line_of(content, m.start()))
+    for pattern in (PERMSET_OBJECT, SOQL_FROM):
+        for m in pattern.finditer(content):
+            yield from emit(m.group(1), None, _line_of(content, m.start()))
+
+
+def get_schema_cache(alias: Optional[str] = None) -> Optional[OrgSchemaCache]:
+    """
+    Schema cache for the configured org, or None when checking is off, no org is set or
+    the org has no API credentials: such a cache could never sync, so every check would
+    fail on login while the DuckDB file is opened for nothing.
+    """
+    from src.org.connection import org_credentials
+
+    alias = alias or os.environ.get("SF_USERNAME_ALIAS")
+    if REFERENCE_CHECK == "off" or not alias or not org_credentials(alias)["username"]:
+        return None
+    return OrgSchemaCache(alias)
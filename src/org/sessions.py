@@ -0,0 +1,167 @@
+import os
+import time
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from simple_salesforce import Salesforce
+from simple_salesforce.exceptions import SalesforceExpiredSession
+from simple_salesforce.login import SalesforceLogin
+
+from src.utils.log import get_logger
+
+logger = get_logger("sessions")
+
+API_VERSION = os.getenv("INSTAFORCE_SF_API_VERSION", "59.0")
+# Salesforce's default session timeout is 2 hours; re-login well before it
+SESSION_TTL_SECONDS = float(os.getenv("INSTAFORCE_SESSION_TTL_MINUTES", "90")) * 60
+REFRESH_MARGIN_SECONDS = float(os.getenv("INSTAFORCE_SESSION_REFRESH_MARGIN_MINUTES", "10")) * 60
+HTTP_POOL_SIZE = int(os.getenv("INSTAFORCE_HTTP_POOL_SIZE", "16"))
+
+
+class _Session:
+    def __init__(self, session_id: str, instance: str, client: Salesforce, ttl: float):
+        self.session_id = session_id
+        self.instance = instance
+        self.client = client
+        self.obtained_at = time.time()
+        self.expires_at = self.obtained_at + ttl
+
+
+class SessionManager:
+    """
+    One logged-in Salesforce session per org alias, shared by every run in the process.
+
+    The session id and instance URL of a login are kept until `ttl` seconds have passed,
+    and a session within `refresh_margin` of that is renewed on its next use, so runs
+    rarely see an expired session and the org's login rate limit is not spent per run.
+    Logins for one alias are single-flight: concurrent runs wait for the same login.
+    All clients of an alias share one requests.Session with a connection pool of
+    `pool_size`, so concurrent API calls reuse TLS connections.
+
+    client(alias) returns a proxy of simple_salesforce.Salesforce; a call rejected with
+    an expired session (INVALID_SESSION_ID) logs in again and is retried once.
+    """
+    def __init__(self, ttl: float = SESSION_TTL_SECONDS, refresh_margin: float = REFRESH_MARGIN_SECONDS,
+                 pool_size: int = HTTP_POOL_SIZE, api_version: str = API_VERSION):
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
+        self.pool_size = pool_size
+        self.api_version = api_version
+        self._sessions: Dict[str, _Session] = {}
+        self._http: Dict[str, requests.Session] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._guard = threading.Lock()
+        self.logins = 0
+
+    def _lock(self, alias: str) -> threading.Lock:
+        with self._guard:
+            return self._locks.setdefault(alias, threading.Lock())
+
+    def _http_session(self, alias: str) -> requests.Session:
+        with self._guard:
+            if alias not in self._http:
+                http = requests.Session()
+                adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+                http.mount("https://", adapter)
+                http.mount("http://", adapter)
+                self._http[alias] = http
+            return self._http[alias]
+
+    def _login(self, alias: str) -> _Session:
+        from src.org.connection import org_credentials
+
+        credentials = org_credentials(alias)
+        if not credentials["username"]:
+            raise EnvironmentError(f"No Salesforce credentials configured for org alias '{alias}'")
+        http = self._http_session(alias)
+        started = time.perf_counter()
+        session_id, instance = SalesforceLogin(sf_version=self.api_version, session=http, **credentials)
+        self.logins += 1
+        logger.info("Logged in to org %s (%s) in %.2fs", alias, instance, time.perf_counter() - started)
+        client = Salesforce(session_id=session_id, instance=instance, session=http, version=self.api_version)
+        return _Session(session_id, instance, client, self.ttl)
+
+    def session(self, alias: str, stale_session_id: Optional[str] = None) -> _Session:
+        """
+        Current session of `alias`, logging in when there is none, it is due for refresh,
+        or it is `stale_session_id` (the one a request was just rejected with).
+        """
+        current = self._sessions.get(alias)
+        if current is not None and not self._needs_login(current, stale_session_id):
+            return current
+        with self._lock(alias):
+            current = self._sessions.get(alias)
+            if current is None or self._needs_login(current, stale_session_id):
+                current = self._login(alias)
+                self._sessions[alias] = current
+            return current
+
+    def _needs_login(self, current: _Session, stale_session_id: Optional[str]) -> bool:
+        if stale_session_id is not None and current.session_id == stale_session_id:
+            return True
+        return time.time() >= current.expires_at - self.refresh_margin
+
+    def client(self, alias: str) -> "ManagedSalesforce":
+        self.session(alias)  # fail fast on missing credentials
+        return ManagedSalesforce(self, alias)
+
+    def invalidate(self, alias: Optional[str] = None):
+        """Forget cached sessions (all aliases when None); the next call logs in again."""
+        with self._guard:
+            if alias is None:
+                self._sessions.clear()
+            else:
+                self._sessions.pop(alias, None)
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.time()
+        return {
+            "logins": self.logins,
+            "sessions": {alias: {"instance": s.instance, "age_seconds": round(now - s.obtained_at),
+                                 "expires_in_seconds": round(s.expires_at - now)}
+                         for alias, s in self._sessions.items()},
+        }
+
+
+class ManagedSalesforce:
+    """
+    Stand-in for simple_salesforce.Salesforce bound to a SessionManager alias. Attribute
+    paths (sf.Account.describe, sf.toolingexecute, ...) are resolved against the
+    alias's current client at call time, so a refreshed session is picked up by
+    objects held across runs (e.g. the org schema cache).
+    """
+    def __init__(self, manager: SessionManager, alias: str, path: Tuple[str, ...] = ()):
+        self._manager = manager
+        self._alias = alias
+        self._path = path
+
+    def _resolve(self, session: _Session):
+        target = session.client
+        for name in self._path:
+            target = getattr(target, name)
+        return target
+
+    def __getattr__(self, name: str):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        value = getattr(self._resolve(self._manager.session(self._alias)), name)
+        if callable(value) or type(value).__module__.startswith("simple_salesforce"):
+            return ManagedSalesforce(self._manager, self._alias, self._path + (name,))
+        return value
+
+    def __call__(self, *args, **kwargs):
+        session = self._manager.session(self._alias)
+        try:
+            return self._resolve(session)(*args, **kwargs)
+        except SalesforceExpiredSession:
+            logger.warning("Session of org %s expired; logging in again", self._alias)
+            session = self._manager.session(self._alias, stale_session_id=session.session_id)
+            return self._resolve(session)(*args, **kwargs)
+
+    def __repr__(self) -> str:
+        return f"ManagedSalesforce({self._alias!r}, {'.'.join(self._path) or '<org>'})"
+
+
+SESSIONS = SessionManager()
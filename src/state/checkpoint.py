@@ -0,0 +1,124 @@
+import os
+import sqlite3
+import uuid
+import zlib
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+from langgraph.checkpoint.serde.base import SerializerProtocol
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+CHECKPOINT_DB = os.getenv("INSTAFORCE_CHECKPOINT_DB", os.path.join(".instaforce", "checkpoints.sqlite"))
+
+
+class CompressedSerializer(SerializerProtocol):
+    """
+    Wraps the default LangGraph serializer and zlib-compresses blobs above `min_size`.
+    Generated files and CLI output make the state large and highly repetitive, so this
+    keeps the checkpoint database small. Uncompressed blobs written earlier still load.
+    """
+    PREFIX = "zlib:"
+
+    def __init__(self, serde: Optional[SerializerProtocol] = None, level: int = 6, min_size: int = 512):
+        self.serde = serde or JsonPlusSerializer()
+        self.level = level
+        self.min_size = min_size
+
+    def dumps_typed(self, obj: Any) -> Tuple[str, bytes]:
+        type_, data = self.serde.dumps_typed(obj)
+        if len(data) < self.min_size:
+            return type_, data
+        return self.PREFIX + type_, zlib.compress(data, self.level)
+
+    def loads_typed(self, data: Tuple[str, bytes]) -> Any:
+        type_, blob = data
+        if type_.startswith(self.PREFIX):
+            return self.serde.loads_typed((type_[len(self.PREFIX):], zlib.decompress(blob)))
+        return self.serde.loads_typed((type_, blob))
+
+
+def get_checkpointer(path: Optional[str] = None) -> SqliteSaver:
+    """SQLite-backed checkpointer with compressed state blobs, safe to share across threads."""
+    path = path or CHECKPOINT_DB
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path, check_same_thread=False)
+    return SqliteSaver(conn, serde=CompressedSerializer())
+
+
+@asynccontextmanager
+async def get_async_checkpointer(path: Optional[str] = None) -> AsyncIterator[Any]:
+    """get_checkpointer() for graphs driven through astream/ainvoke (the async service)."""
+    import aiosqlite
+    from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+    path = path or CHECKPOINT_DB
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    async with aiosqlite.connect(path) as conn:
+        yield AsyncSqliteSaver(conn, serde=CompressedSerializer())
+
+
+def new_thread_id() -> str:
+    return str(uuid.uuid4())
+
+
+def thread_config(thread_id: str) -> Dict[str, Any]:
+    return {"configurable": {"thread_id": thread_id}}
+
+
+def start_run(graph, requirement: str, thread_id: Optional[str] = None,
+              target_orgs: Optional[List[str]] = None,
+              priority: Optional[int] = None) -> Tuple[str, Iterator[Dict[str, Any]]]:
+    """
+    Start a new checkpointed run. Returns its thread id and the update stream.
+    `target_orgs` deploys the run to several org aliases (see src.deploy.fanout);
+    `priority` ranks its LLM calls and deploys against other runs (src.jobs.scheduler).
+    """
+    thread_id = thread_id or new_thread_id()
+    initial_state = {"requirement": requirement, "run_id": thread_id}
+    if target_orgs:
+        initial_state["target_orgs"] = list(target_orgs)
+    if priority:
+        initial_state["priority"] = priority
+    return thread_id, graph.stream(initial_state, thread_config(thread_id), stream_mode="updates")
+
+
+def resume_run(graph, thread_id: str) -> Iterator[Dict[str, Any]]:
+    """
+    Continue a run from its last completed node. A node that raised is re-executed;
+    nodes that already finished are not.
+    """
+    return graph.stream(None, thread_config(thread_id), stream_mode="updates")
+
+
+def run_history(graph, thread_id: str) -> List[Dict[str, Any]]:
+    """Checkpoints of a run, newest first, as {checkpoint_id, next, step} dicts."""
+    history = []
+    for snapshot in graph.get_state_history(thread_config(thread_id)):
+        history.append({
+            "checkpoint_id": snapshot.config["configurable"].get("checkpoint_id"),
+            "next": list(snapshot.next),
+            "step": (snapshot.metadata or {}).get("step"),
+        })
+    return history
+
+
+def find_checkpoint_before(graph, thread_id: str, node: str):
+    """Most recent snapshot of the run that is about to execute `node`."""
+    for snapshot in graph.get_state_history(thread_config(thread_id)):
+        if node in snapshot.next:
+            return snapshot
+    return None
+
+
+def replay_from(graph, thread_id: str, node: str) -> Iterator[Dict[str, Any]]:
+    """
+    Re-run a finished or failed run starting at `node`, reusing the stored outputs of
+    every node before it. The replay forks the run's history under the same thread id.
+    """
+    snapshot = find_checkpoint_before(graph, thread_id, node)
+    if snapshot is None:
+        raise ValueError(f"No checkpoint before node '{node}' for run {thread_id}")
+    return graph.stream(None, snapshot.config, stream_mode="updates")
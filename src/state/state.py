@@ -1,12 +1,29 @@
 # src/state/state.py
 
-from typing import TypedDict, List, Optional, Dict
+from typing import Annotated, TypedDict, List, Optional, Dict
+
+
+def merge_story_designs(left: Optional[Dict], right: Optional[Dict]) -> Dict:
+    """Reducer of `story_designs`: parallel story_agent branches each add their own story id."""
+    return {**(left or {}), **(right or {})}
+
 
 class State(TypedDict, total=False):
     messages: List[Dict]
+    run_id: str
+    target_orgs: List[str]
+    priority: int
     requirement: str
+    stories: List[Dict]
+    story_designs: Annotated[Dict[str, Dict], merge_story_designs]
     breakdown: Dict
+    cache_match: Dict
     components: Dict
     files: List[Dict]
+    artifacts: Dict
+    codegen_batches: List[Dict]
     package_zip: bytes
     deploy_status: Dict
+    payload_stats: Dict
+    repair_attempts: int
+    repair_history: List[Dict]
@@ -1,13 +1,49 @@
+import os
+from langchain_core.runnables import RunnableLambda
 from langgraph.graph import StateGraph, START, END
 
 from src.state.state import State
+from src.utils.tracing import traced_node, InstrumentedLLM
 from src.llm.model import LLMModel
+from src.artifacts.library import get_artifact_library
+from src.deploy.transports import get_transport
+from src.jobs.scheduler import get_scheduler, ScheduledLLM, ScheduledTransport
 
 from src.agents.req_agent import ReqAgent
+from src.agents.breakdown_extractor import get_breakdown_extractor
+from src.agents.decompose_agent import DecomposeAgent, StoryAgent, MergeDesignsAgent, route_after_decompose
 from src.agents.design_agent import DesignAgent
 from src.agents.codegen_agent import CodeGenAgent
 from src.agents.deploy_agent import DeployAgent
+from src.agents.repair_agent import RepairAgent, route_after_deploy
+from src.agents.pipeline_agent import PipelinedDesignCodeGenAgent
 
+PIPELINED = os.getenv("INSTAFORCE_PIPELINED", "off") == "on"
+
+
+def agent_node(name: str, agent, scheduler=None) -> RunnableLambda:
+    """
+    An agent as a graph node: `process` serves invoke/stream, `aprocess` (llm.ainvoke)
+    serves ainvoke/astream, so the async service needs no thread per run. Both are
+    traced and timed (src.utils.tracing). With a scheduler, the node's LLM and deploy
+    slot requests are attributed to its run, and its output updates the run's cost.
+    """
+    process, aprocess = agent.process, agent.aprocess
+    if scheduler is not None:
+        def process(state, _process=agent.process):
+            with scheduler.bind(state):
+                update = _process(state)
+            scheduler.observe(state, update)
+            return update
+
+        async def aprocess(state, _aprocess=agent.aprocess):
+            with scheduler.bind(state):
+                update = await _aprocess(state)
+            scheduler.observe(state, update)
+            return update
+
+    func, afunc = traced_node(name, process, aprocess)
+    return RunnableLambda(func, afunc=afunc, name=name)
 
 
 class WorkflowBuilder:
@@ -15,11 +51,42 @@ class WorkflowBuilder:
     Builds the AI-in-Pipeline LangGraph workflow.
     For now the flow is:
     
-    START → req_agent → design_agent → codegen_agent → END
+    START → decompose_agent → req_agent → design_agent → codegen_agent → deploy_agent → END
+    deploy_agent → repair_agent → deploy_agent   (while the org rejects files, bounded)
+
+    Long requirement documents are split into stories by decompose_agent and mapped
+    onto parallel story_agent branches (req + design per story), then reduced:
+
+    decompose_agent → story_agent × N → merge_designs → codegen_agent
+
+    In pipelined mode design and codegen overlap in a single node:
+
+    START → decompose_agent → req_agent → design_codegen_agent → deploy_agent → END
+
+    Every node has a sync and an async implementation; see agent_node. LLM calls and
+    deploys go through the process-wide run scheduler (src.jobs.scheduler) unless it
+    is off, so concurrent runs share the slots by priority and size.
     """
 
-    def __init__(self, llm):
-        self.llm = llm
+    def __init__(self, llm, coalescer=None, requirement_cache=None, schema_cache=None, pipelined=PIPELINED,
+                 transport=None, artifacts=None, scheduler=None, extractor=None):
+        # every LLM call is timed and token-counted under the calling node
+        self.llm = llm if isinstance(llm, (InstrumentedLLM, ScheduledLLM)) else InstrumentedLLM(llm)
+        self.transport = transport
+        self.scheduler = scheduler if scheduler is not None else get_scheduler()
+        if self.scheduler is not None:
+            if not isinstance(self.llm, ScheduledLLM):
+                self.llm = ScheduledLLM(self.llm, self.scheduler)
+            if not isinstance(self.transport, ScheduledTransport):
+                self.transport = ScheduledTransport(self.transport or get_transport(), self.scheduler)
+        self.coalescer = coalescer
+        self.requirement_cache = requirement_cache
+        self.schema_cache = schema_cache
+        # shared framework classes (trigger handler base, test data factory); None when off
+        self.artifacts = artifacts if artifacts is not None else get_artifact_library(schema_cache)
+        # local breakdowns of routine requirements; None when off
+        self.extractor = extractor if extractor is not None else get_breakdown_extractor(requirement_cache, schema_cache)
+        self.pipelined = pipelined
         self.graph = StateGraph(State)
 
     def build_graph(self):
@@ -28,35 +95,73 @@ class WorkflowBuilder:
         """
 
         # Agent instances
-        req = ReqAgent(self.llm)
-        design = DesignAgent(self.llm)
-        codegen = CodeGenAgent(self.llm)
-        deployagent = DeployAgent(self.llm)
+        req = ReqAgent(self.llm, cache=self.requirement_cache, extractor=self.extractor)
+        design = DesignAgent(self.llm, cache=self.requirement_cache, schema_cache=self.schema_cache,
+                             artifacts=self.artifacts)
+        codegen = CodeGenAgent(self.llm, artifacts=self.artifacts)
+        deployagent = DeployAgent(self.llm, transport=self.transport, coalescer=self.coalescer,
+                                  schema_cache=self.schema_cache, artifacts=self.artifacts,
+                                  requirement_cache=self.requirement_cache)
+        repair = RepairAgent(self.llm)
+        # per-story agents of decomposed documents: no requirement cache in parallel branches
+        story = StoryAgent(self.llm, ReqAgent(self.llm, extractor=self.extractor),
+                           DesignAgent(self.llm, schema_cache=self.schema_cache, artifacts=self.artifacts))
 
         # Register nodes
-        self.graph.add_node("req_agent", req.process)
-        self.graph.add_node("design_agent", design.process)
-        self.graph.add_node("codegen_agent", codegen.process)
-        self.graph.add_node("deploy_agent", deployagent.process)
+        sched = self.scheduler
+        self.graph.add_node("decompose_agent", agent_node("decompose_agent", DecomposeAgent(self.llm), sched))
+        self.graph.add_node("story_agent", agent_node("story_agent", story, sched))
+        self.graph.add_node("merge_designs", agent_node("merge_designs", MergeDesignsAgent(self.llm), sched))
+        self.graph.add_node("req_agent", agent_node("req_agent", req, sched))
+        if self.pipelined:
+            pipeline = PipelinedDesignCodeGenAgent(self.llm, design, codegen)
+            self.graph.add_node("design_codegen_agent", agent_node("design_codegen_agent", pipeline, sched))
+        else:
+            self.graph.add_node("design_agent", agent_node("design_agent", design, sched))
+        self.graph.add_node("codegen_agent", agent_node("codegen_agent", codegen, sched))
+        self.graph.add_node("deploy_agent", agent_node("deploy_agent", deployagent, sched))
+        self.graph.add_node("repair_agent", agent_node("repair_agent", repair, sched))
 
 
         # Edges
-        self.graph.add_edge(START, "req_agent")
-        self.graph.add_edge("req_agent", "design_agent")
-        self.graph.add_edge("design_agent", "codegen_agent")
+        self.graph.add_edge(START, "decompose_agent")
+        self.graph.add_conditional_edges("decompose_agent", route_after_decompose, ["req_agent", "story_agent"])
+        self.graph.add_edge("story_agent", "merge_designs")
+        self.graph.add_edge("merge_designs", "codegen_agent")
+        if self.pipelined:
+            self.graph.add_edge("req_agent", "design_codegen_agent")
+            self.graph.add_edge("design_codegen_agent", "deploy_agent")
+        else:
+            self.graph.add_edge("req_agent", "design_agent")
+            self.graph.add_edge("design_agent", "codegen_agent")
         self.graph.add_edge("codegen_agent", "deploy_agent")
-        self.graph.add_edge("deploy_agent", END)
+        self.graph.add_conditional_edges(
+            "deploy_agent",
+            route_after_deploy,
+            {"repair_agent": "repair_agent", "end": END},
+        )
+        self.graph.add_edge("repair_agent", "deploy_agent")
 
         return self.graph
-    def setup_graph(self):
-            
+    def setup_graph(self, checkpointer=None):
+        """
+        Build and compile the graph. With a checkpointer (see src.state.checkpoint)
+        every node's output is persisted per thread id, so runs can be resumed or
+        replayed without repeating the LLM stages.
+        """
         self.build_graph()
 
-        return self.graph.compile()
-
+        return self.graph.compile(checkpointer=checkpointer)
 
 
-llm=LLMModel().get_llm()
 
-graph_builder=WorkflowBuilder(llm)
-graph=graph_builder.build_graph().compile()
\ No newline at end of file
+def __getattr__(name):
+    # module-level `graph` (LangGraph tooling) is built on first access, so importing
+    # WorkflowBuilder does not require an OpenAI key (e.g. the service with a fake LLM)
+    if name == "graph":
+        global graph
+        llm = LLMModel().get_llm()
+        graph_builder = WorkflowBuilder(llm)
+        graph = graph_builder.build_graph().compile()
+        return graph
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,204 @@
+import os
+import json
+import copy
+from collections import Counter
+from typing import Dict, Any, Optional, Tuple
+
+COMPACT_PAYLOADS = os.getenv("INSTAFORCE_COMPACT_PAYLOADS", "on") != "off"
+MIN_SHARED_STRING_LEN = 16
+
+# Appended to a system prompt whose user message is compact-encoded
+COMPACT_ENCODING_NOTE = '''
+INPUT ENCODING: the user JSON is compact-encoded.
+* "$defaults" maps a list key (e.g. "components") to default values; any key missing from an item of that list takes its default (nested objects merge key by key).
+* A string "$N" (N a number) stands for the string "$strings"[N]. A string or key starting with "$$" is a literal one starting with "$".
+* Keys listed in an item's "$absent" are genuinely missing from that item.
+'''
+
+_ENCODER = None
+
+
+def count_tokens(text: str) -> int:
+    """Tokens for gpt-4o via tiktoken; ~4 characters per token when the encoding is unavailable."""
+    global _ENCODER
+    if _ENCODER is None:
+        try:
+            import tiktoken
+            _ENCODER = tiktoken.encoding_for_model("gpt-4o")
+        except Exception:
+            _ENCODER = False
+    if _ENCODER:
+        return len(_ENCODER.encode(text))
+    return (len(text) + 3) // 4
+
+
+def dumps_minimal(obj: Any) -> str:
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
+
+
+# ---------------------------------------------------------
+# keys
+# ---------------------------------------------------------
+
+def _escape_keys(obj: Any) -> Any:
+    """Payload keys starting with "$" get another "$", so they never collide with "$absent" and the headers."""
+    if isinstance(obj, dict):
+        return {("$" + k if k.startswith("$") else k): _escape_keys(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [_escape_keys(v) for v in obj]
+    return obj
+
+
+def _unescape_keys(obj: Any) -> Any:
+    if isinstance(obj, dict):
+        return {(k[1:] if k.startswith("$$") else k): _unescape_keys(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [_unescape_keys(v) for v in obj]
+    return obj
+
+
+# ---------------------------------------------------------
+# default stripping
+# ---------------------------------------------------------
+
+def _strip_defaults(item: Dict[str, Any], defaults: Dict[str, Any]) -> Dict[str, Any]:
+    out = {}
+    for k, v in item.items():
+        if k not in defaults:
+            out[k] = v
+        elif v == defaults[k]:
+            continue
+        elif isinstance(v, dict) and isinstance(defaults[k], dict):
+            out[k] = _strip_defaults(v, defaults[k])
+        else:
+            out[k] = v
+    absent = [k for k in defaults if k not in item]
+    if absent:
+        out["$absent"] = absent
+    return out
+
+
+def _restore_defaults(item: Dict[str, Any], defaults: Dict[str, Any]) -> Dict[str, Any]:
+    absent = set(item.get("$absent", []))
+    out = {}
+    for k, default in defaults.items():
+        if k in absent:
+            continue
+        if k not in item:
+            out[k] = copy.deepcopy(default)
+        elif isinstance(item[k], dict) and isinstance(default, dict):
+            out[k] = _restore_defaults(item[k], default)
+        else:
+            out[k] = item[k]
+    for k, v in item.items():
+        if k not in defaults and k != "$absent":
+            out[k] = v
+    return out
+
+
+def _apply_list_defaults(obj: Any, list_defaults: Dict[str, Dict[str, Any]], fn) -> Any:
+    if isinstance(obj, dict):
+        result = {}
+        for k, v in obj.items():
+            if k in list_defaults and isinstance(v, list):
+                result[k] = [fn(i, list_defaults[k]) if isinstance(i, dict) else i for i in v]
+            else:
+                result[k] = _apply_list_defaults(v, list_defaults, fn)
+        return result
+    if isinstance(obj, list):
+        return [_apply_list_defaults(i, list_defaults, fn) for i in obj]
+    return obj
+
+
+# ---------------------------------------------------------
+# shared strings
+# ---------------------------------------------------------
+
+def _count_strings(obj: Any, counter: Counter):
+    if isinstance(obj, dict):
+        for v in obj.values():
+            _count_strings(v, counter)
+    elif isinstance(obj, list):
+        for v in obj:
+            _count_strings(v, counter)
+    elif isinstance(obj, str):
+        counter[obj] += 1
+
+
+def _replace_strings(obj: Any, table: Dict[str, int]) -> Any:
+    if isinstance(obj, dict):
+        return {k: _replace_strings(v, table) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [_replace_strings(v, table) for v in obj]
+    if isinstance(obj, str):
+        if obj in table:
+            return f"${table[obj]}"
+        if obj.startswith("$"):
+            return "$" + obj
+    return obj
+
+
+def _expand_strings(obj: Any, strings) -> Any:
+    if isinstance(obj, dict):
+        return {k: _expand_strings(v, strings) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [_expand_strings(v, strings) for v in obj]
+    if isinstance(obj, str) and obj.startswith("$"):
+        if obj.startswith("$$"):
+            return obj[1:]
+        return strings[int(obj[1:])]
+    return obj
+
+
+# ---------------------------------------------------------
+# public API
+# ---------------------------------------------------------
+
+def encode(obj: Dict[str, Any], list_defaults: Optional[Dict[str, Dict[str, Any]]] = None,
+           min_len: int = MIN_SHARED_STRING_LEN) -> Dict[str, Any]:
+    """
+    Compact, reversible encoding of an agent-to-LLM payload:
+      - items of the lists named in `list_defaults` drop keys equal to the default
+        (the defaults travel once, in "$defaults")
+      - string values of at least `min_len` characters that occur more than once move
+        into a shared "$strings" header and are referenced as "$N"
+    decode(encode(obj, d)) == obj for any JSON-compatible dict.
+    """
+    list_defaults = _escape_keys(list_defaults or {})
+    body = _apply_list_defaults(_escape_keys(obj), list_defaults, _strip_defaults)
+
+    counter: Counter = Counter()
+    _count_strings(body, counter)
+    _count_strings(list_defaults, counter)
+    shared = [s for s, n in counter.most_common() if n > 1 and len(s) >= min_len]
+    table = {s: i for i, s in enumerate(shared)}
+
+    encoded: Dict[str, Any] = {}
+    if shared:
+        encoded["$strings"] = shared
+    if list_defaults:
+        encoded["$defaults"] = _replace_strings(list_defaults, table)
+    encoded.update(_replace_strings(body, table))
+    return encoded
+
+
+def decode(encoded: Dict[str, Any]) -> Dict[str, Any]:
+    strings = encoded.get("$strings", [])
+    list_defaults = _expand_strings(encoded.get("$defaults", {}), strings)
+    body = {k: v for k, v in encoded.items() if k not in ("$strings", "$defaults")}
+    body = _expand_strings(body, strings)
+    return _unescape_keys(_apply_list_defaults(body, list_defaults, _restore_defaults))
+
+
+def encode_payload(obj: Dict[str, Any], list_defaults: Optional[Dict[str, Dict[str, Any]]] = None) -> Tuple[str, Dict[str, int]]:
+    """
+    Serialize a payload for an LLM call. Returns the text and token counts of the
+    plain json.dumps form and of the text actually sent.
+    """
+    plain = json.dumps(obj)
+    if COMPACT_PAYLOADS and isinstance(obj, dict):
+        text = dumps_minimal(encode(obj, list_defaults))
+    else:
+        text = plain
+    stats = {"tokens_before": count_tokens(plain), "tokens_after": count_tokens(text)}
+    return text, stats
@@ -0,0 +1,70 @@
+import json
+from typing import Any, Dict, List, Optional
+
+
+class StreamingArrayParser:
+    """
+    Incremental scanner for streamed LLM JSON output. Feed it text chunks and it
+    returns each object of the top-level array under `key` as soon as that object's
+    closing brace has arrived, e.g. every component of {"components": [...], ...}
+    while the model is still writing the next one. Text around the JSON (code fences,
+    prose) is ignored. The whole text stays available in `text` for a final parse.
+    """
+    def __init__(self, key: str):
+        self.key = key
+        self.text = ""
+        self._pos = 0
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._last_string: Optional[str] = None
+        self._value_key: Optional[str] = None
+        self._array_depth: Optional[int] = None
+        self._item_start: Optional[int] = None
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        self.text += chunk
+        items = []
+        text = self.text
+        for i in range(self._pos, len(text)):
+            c = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    self._last_string = text[self._string_start + 1:i]
+                continue
+
+            if c == '"':
+                self._in_string = True
+                self._string_start = i
+            elif c == ":":
+                # remember which top-level key the next value belongs to
+                self._value_key = self._last_string if self._stack == ["{"] else None
+            elif c == ",":
+                self._value_key = None
+            elif c in "{[":
+                if c == "[" and self._array_depth is None and self._stack == ["{"] and self._value_key == self.key:
+                    self._array_depth = len(self._stack) + 1
+                elif c == "{" and self._array_depth is not None and len(self._stack) == self._array_depth:
+                    self._item_start = i
+                self._stack.append(c)
+            elif c in "}]" and self._stack:
+                self._stack.pop()
+                if (c == "}" and self._array_depth is not None and self._item_start is not None
+                        and len(self._stack) == self._array_depth):
+                    try:
+                        item = json.loads(text[self._item_start:i + 1])
+                        if isinstance(item, dict):
+                            items.append(item)
+                    except ValueError:
+                        pass
+                    self._item_start = None
+                elif c == "]" and self._array_depth is not None and len(self._stack) < self._array_depth:
+                    self._array_depth = None
+        self._pos = len(text)
+        return items
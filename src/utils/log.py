@@ -0,0 +1,34 @@
+import os
+import logging
+
+LOG_LEVEL = os.getenv("INSTAFORCE_LOG_LEVEL", "INFO").upper()
+# full LLM responses, breakdowns and CLI output are only logged when asked for
+VERBOSE_CONTENT = os.getenv("INSTAFORCE_VERBOSE_CONTENT", "off") == "on"
+
+_configured = False
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Logger under the 'instaforce' hierarchy; the first call installs a stderr handler."""
+    global _configured
+    root = logging.getLogger("instaforce")
+    if not _configured:
+        if not root.handlers:
+            handler = logging.StreamHandler()
+            handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(name)s: %(message)s"))
+            root.addHandler(handler)
+        root.setLevel(LOG_LEVEL)
+        _configured = True
+    return root.getChild(name)
+
+
+def log_content(logger: logging.Logger, label: str, content) -> None:
+    """
+    Log a potentially large payload. Without INSTAFORCE_VERBOSE_CONTENT=on only its size
+    is logged (at DEBUG), and the payload is never converted to text.
+    """
+    if VERBOSE_CONTENT:
+        logger.info("%s:\n%s", label, content)
+    elif logger.isEnabledFor(logging.DEBUG):
+        size = len(content) if isinstance(content, (str, bytes, list, dict)) else "?"
+        logger.debug("%s: %s chars/items (INSTAFORCE_VERBOSE_CONTENT=on logs the content)", label, size)
@@ -0,0 +1,171 @@
+import os
+import math
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# when set, the Prometheus text exposition is rewritten here after every node
+METRICS_FILE = os.getenv("INSTAFORCE_METRICS_FILE", "")
+
+DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: Iterable[str] = (), registry: "Registry" = None):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], object] = {}
+        (registry or REGISTRY).register(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.label_names)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.label_names, k)} {_format_value(v)}" for k, v in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: Iterable[str] = (),
+                 buckets: Iterable[float] = DURATION_BUCKETS, registry: "Registry" = None):
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        super().__init__(name, help_text, labels, registry)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    def count(self, **labels) -> int:
+        entry = self._values.get(self._key(labels))
+        return entry[0][-1] if entry else 0
+
+    def sum(self, **labels) -> float:
+        entry = self._values.get(self._key(labels))
+        return entry[1] if entry else 0.0
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, (list(c), s)) for k, (c, s) in self._values.items())
+        lines = []
+        for key, (counts, total) in items:
+            for bound, n in zip(self.buckets, counts):
+                le = _format_value(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, ('le', le))} {n}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {counts[-1]}")
+        return lines
+
+
+class Registry:
+    """Process-wide set of metrics rendered in the Prometheus text exposition format."""
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._write_lock = threading.Lock()
+
+    def register(self, metric: _Metric):
+        self._metrics.append(metric)
+
+    def render(self) -> str:
+        return "\n".join(m.render() for m in self._metrics) + "\n"
+
+    def write(self, path: str):
+        """Atomically replace `path` (e.g. for the node_exporter textfile collector)."""
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._write_lock:
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as fh:
+                fh.write(self.render())
+            os.replace(tmp, path)
+
+
+REGISTRY = Registry()
+
+NODE_SECONDS = Histogram("instaforce_node_duration_seconds", "Wall time of a graph node", ["node"])
+NODE_QUEUE_SECONDS = Histogram(
+    "instaforce_node_queue_seconds", "Time between a run becoming ready for a node and the node starting", ["node"])
+NODE_ERRORS = Counter("instaforce_node_errors_total", "Graph nodes that raised", ["node"])
+NODE_OUTPUT_BYTES = Histogram(
+    "instaforce_node_output_bytes", "Serialized size of a node's state update", ["node"], SIZE_BUCKETS)
+
+LLM_SECONDS = Histogram("instaforce_llm_call_duration_seconds", "Wall time of an LLM call", ["node", "mode"])
+LLM_TOKENS = Counter("instaforce_llm_tokens_total", "LLM tokens by node and kind (prompt|completion)", ["node", "kind"])
+LLM_PAYLOAD_BYTES = Histogram(
+    "instaforce_llm_payload_bytes", "Characters sent to (request) and received from (response) the LLM",
+    ["node", "direction"], SIZE_BUCKETS)
+PARSE_REPAIRS = Counter(
+    "instaforce_parse_repairs_total",
+    "LLM responses that were not plain JSON: extracted from surrounding text, or replaced by a default",
+    ["agent", "outcome"])
+
+DEPLOY_SECONDS = Histogram("instaforce_deploy_duration_seconds", "Wall time of a deploy", ["transport", "success"])
+BREAKDOWNS = Counter("instaforce_breakdowns_total", "Requirement breakdowns by source (local|llm|cache)", ["source"])
+JOB_QUEUE_SECONDS = Histogram("instaforce_job_queue_seconds", "Time a background job waited for a worker slot")
+SCHEDULER_WAIT_SECONDS = Histogram(
+    "instaforce_scheduler_wait_seconds", "Time a run waited for an LLM or deploy slot", ["resource", "priority"])
+TEST_CACHE_LOOKUPS = Counter(
+    "instaforce_apex_test_cache_total", "Generated Apex test classes by cache result (hit|miss)", ["result"])
+TEST_SECONDS_SAVED = Counter(
+    "instaforce_apex_test_seconds_saved_total", "Apex test time not spent thanks to cached results")
+
+
+def write_metrics_file():
+    if METRICS_FILE:
+        REGISTRY.write(METRICS_FILE)
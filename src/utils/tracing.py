@@ -0,0 +1,324 @@
+import os
+import json
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+from src.utils import metrics
+from src.utils.compact_codec import count_tokens
+from src.utils.log import get_logger
+
+TRACE_DIR = os.getenv("INSTAFORCE_TRACE_DIR", os.path.join(".instaforce", "traces"))
+TRACING = os.getenv("INSTAFORCE_TRACING", "on") != "off"
+
+logger = get_logger("tracing")
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("instaforce_span", default=None)
+_current_node: ContextVar[str] = ContextVar("instaforce_node", default="")
+_export_lock = threading.Lock()
+
+# run id -> time its last node finished, for node queue time
+_ready_at: "OrderedDict[str, float]" = OrderedDict()
+_READY_AT_LIMIT = 10000
+
+
+class Span:
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.attributes = dict(attributes)
+        self.start = time.time()
+        self.status = "ok"
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def to_dict(self, end: float) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "end": end,
+            "duration_ms": round((end - self.start) * 1000, 3),
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+def _trace_path(trace_id: str) -> str:
+    return os.path.join(TRACE_DIR, f"{trace_id}.jsonl")
+
+
+def _export(record: Dict[str, Any]):
+    if not TRACING:
+        return
+    try:
+        os.makedirs(TRACE_DIR, exist_ok=True)
+        with _export_lock, open(_trace_path(record["trace_id"]), "a", encoding="utf-8") as fh:
+            fh.write(json.dumps(record, default=str) + "\n")
+    except OSError as e:
+        logger.warning("Could not write trace span: %s", e)
+
+
+def _is_control_flow(exc: BaseException) -> bool:
+    # interrupts and Command bubbling are how LangGraph pauses a run, not failures
+    try:
+        from langgraph.errors import GraphBubbleUp
+    except ImportError:
+        return False
+    return isinstance(exc, GraphBubbleUp)
+
+
+def start_span(name: str, trace_id: Optional[str] = None, **attributes) -> Span:
+    """A span under the current one that is not made current (see span())."""
+    parent = _current_span.get()
+    trace_id = trace_id or (parent.trace_id if parent else uuid.uuid4().hex)
+    return Span(name, trace_id, parent.span_id if parent else None, attributes)
+
+
+def end_span(current: Span, exc: Optional[BaseException] = None):
+    if exc is not None:
+        if _is_control_flow(exc):
+            current.status = "interrupted"
+        else:
+            current.status = "error"
+            current.set(error=repr(exc))
+    _export(current.to_dict(time.time()))
+
+
+@contextmanager
+def span(name: str, trace_id: Optional[str] = None, **attributes):
+    """
+    Time a block as a span of the current trace (the run id). Spans nest through
+    contextvars, so LLM calls made inside a node become its children. Finished spans
+    are appended as JSON lines to TRACE_DIR/<trace_id>.jsonl.
+    """
+    current = start_span(name, trace_id, **attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        _current_span.reset(token)
+        token = None
+        end_span(current, e)
+        raise
+    finally:
+        if token is not None:
+            _current_span.reset(token)
+            end_span(current)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def load_trace(trace_id: str) -> List[Dict[str, Any]]:
+    """Spans of a run, in the order they finished."""
+    path = _trace_path(trace_id)
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as fh:
+        return [json.loads(line) for line in fh if line.strip()]
+
+
+# ---------------------------------------------------------
+# graph nodes
+# ---------------------------------------------------------
+
+class _NodeTimer:
+    """Shared bookkeeping of the sync and async node wrappers."""
+    def __init__(self, name: str, state: Dict[str, Any]):
+        self.name = name
+        self.run_id = (state or {}).get("run_id") or ""
+        self.start = time.perf_counter()
+        self.queued = 0.0
+        ready = _ready_at.get(self.run_id)
+        if ready is not None:
+            self.queued = max(0.0, time.time() - ready)
+        metrics.NODE_QUEUE_SECONDS.observe(self.queued, node=name)
+
+    def done(self, node_span: Span, update: Any):
+        try:
+            size = len(json.dumps(update, default=str))
+        except Exception:
+            size = 0
+        metrics.NODE_OUTPUT_BYTES.observe(size, node=self.name)
+        node_span.set(output_bytes=size)
+
+    def close(self, node_span: Span, failed: bool):
+        elapsed = time.perf_counter() - self.start
+        metrics.NODE_SECONDS.observe(elapsed, node=self.name)
+        if failed:
+            metrics.NODE_ERRORS.inc(node=self.name)
+        node_span.set(queue_ms=round(self.queued * 1000, 3))
+        if self.run_id:
+            _ready_at[self.run_id] = time.time()
+            _ready_at.move_to_end(self.run_id)
+            while len(_ready_at) > _READY_AT_LIMIT:
+                _ready_at.popitem(last=False)
+        metrics.write_metrics_file()
+
+
+def traced_node(name: str, func, afunc=None):
+    """
+    Wrap a node's sync (and async) implementation: a span per execution, wall and queue
+    time, errors and output size per node. Returns (func, afunc) with the same signatures.
+    """
+    def run(state):
+        timer = _NodeTimer(name, state)
+        node_token = _current_node.set(name)
+        failed = False
+        try:
+            with span(f"node:{name}", trace_id=timer.run_id or None, node=name) as node_span:
+                try:
+                    update = func(state)
+                except BaseException as e:
+                    failed = not _is_control_flow(e)
+                    raise
+                finally:
+                    timer.close(node_span, failed)
+                timer.done(node_span, update)
+                return update
+        finally:
+            _current_node.reset(node_token)
+
+    async def arun(state):
+        timer = _NodeTimer(name, state)
+        node_token = _current_node.set(name)
+        failed = False
+        try:
+            with span(f"node:{name}", trace_id=timer.run_id or None, node=name) as node_span:
+                try:
+                    update = await afunc(state)
+                except BaseException as e:
+                    failed = not _is_control_flow(e)
+                    raise
+                finally:
+                    timer.close(node_span, failed)
+                timer.done(node_span, update)
+                return update
+        finally:
+            _current_node.reset(node_token)
+
+    return run, (arun if afunc is not None else None)
+
+
+# ---------------------------------------------------------
+# LLM calls
+# ---------------------------------------------------------
+
+def _text(message: Any) -> str:
+    content = getattr(message, "content", message)
+    if isinstance(content, list):
+        return "".join(b.get("text", "") if isinstance(b, dict) else str(b) for b in content)
+    return content if isinstance(content, str) else str(content)
+
+
+def _prompt_text(messages: Any) -> str:
+    if isinstance(messages, list):
+        return "\n".join(_text(m.get("content", "")) if isinstance(m, dict) else _text(m) for m in messages)
+    return _text(messages)
+
+
+class InstrumentedLLM:
+    """
+    Transparent wrapper of a chat model: every invoke/ainvoke/stream/astream call is a
+    span under the calling node, with wall time, prompt/completion tokens (the
+    provider's usage metadata when reported, else a tiktoken count) and payload sizes.
+    Any other attribute is delegated to the wrapped model.
+    """
+    def __init__(self, llm):
+        self.llm = llm
+
+    def __getattr__(self, item):
+        return getattr(self.llm, item)
+
+    @staticmethod
+    def _record(llm_span: Span, mode: str, prompt: str, response_text: str, usage: Optional[Dict[str, Any]], started: float):
+        node = _current_node.get() or "unknown"
+        elapsed = time.perf_counter() - started
+        usage = usage or {}
+        prompt_tokens = usage.get("input_tokens") or count_tokens(prompt)
+        completion_tokens = usage.get("output_tokens") or count_tokens(response_text)
+
+        metrics.LLM_SECONDS.observe(elapsed, node=node, mode=mode)
+        metrics.LLM_TOKENS.inc(prompt_tokens, node=node, kind="prompt")
+        metrics.LLM_TOKENS.inc(completion_tokens, node=node, kind="completion")
+        metrics.LLM_PAYLOAD_BYTES.observe(len(prompt), node=node, direction="request")
+        metrics.LLM_PAYLOAD_BYTES.observe(len(response_text), node=node, direction="response")
+        llm_span.set(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                     request_chars=len(prompt), response_chars=len(response_text),
+                     usage_reported=bool(usage))
+
+    def invoke(self, messages, *args, **kwargs):
+        started = time.perf_counter()
+        with span("llm", mode="invoke") as llm_span:
+            result = self.llm.invoke(messages, *args, **kwargs)
+            self._record(llm_span, "invoke", _prompt_text(messages), _text(result),
+                         getattr(result, "usage_metadata", None), started)
+            return result
+
+    async def ainvoke(self, messages, *args, **kwargs):
+        started = time.perf_counter()
+        with span("llm", mode="ainvoke") as llm_span:
+            result = await self.llm.ainvoke(messages, *args, **kwargs)
+            self._record(llm_span, "ainvoke", _prompt_text(messages), _text(result),
+                         getattr(result, "usage_metadata", None), started)
+            return result
+
+    # streamed calls must not make their span current: the consumer runs between chunks
+    # (e.g. the pipelined agent queues codegen calls) and would inherit it
+
+    def stream(self, messages, *args, **kwargs):
+        started = time.perf_counter()
+        llm_span = start_span("llm", mode="stream")
+        parts, usage = [], None
+        try:
+            for chunk in self.llm.stream(messages, *args, **kwargs):
+                if not parts:
+                    llm_span.set(first_chunk_ms=round((time.perf_counter() - started) * 1000, 3))
+                parts.append(_text(chunk))
+                usage = getattr(chunk, "usage_metadata", None) or usage
+                yield chunk
+        except BaseException as e:
+            end_span(llm_span, e)
+            raise
+        self._record(llm_span, "stream", _prompt_text(messages), "".join(parts), usage, started)
+        end_span(llm_span)
+
+    async def astream(self, messages, *args, **kwargs):
+        started = time.perf_counter()
+        llm_span = start_span("llm", mode="astream")
+        parts, usage = [], None
+        try:
+            async for chunk in self.llm.astream(messages, *args, **kwargs):
+                if not parts:
+                    llm_span.set(first_chunk_ms=round((time.perf_counter() - started) * 1000, 3))
+                parts.append(_text(chunk))
+                usage = getattr(chunk, "usage_metadata", None) or usage
+                yield chunk
+        except BaseException as e:
+            end_span(llm_span, e)
+            raise
+        self._record(llm_span, "astream", _prompt_text(messages), "".join(parts), usage, started)
+        end_span(llm_span)
+
+
+@contextmanager
+def deploy_span(transport: str, deploy_root: str):
+    """Span and duration metric of one deploy; set `success` on the yielded span."""
+    started = time.perf_counter()
+    with span("deploy", transport=transport, deploy_root=deploy_root) as deploy:
+        try:
+            yield deploy
+        finally:
+            metrics.DEPLOY_SECONDS.observe(time.perf_counter() - started, transport=transport,
+                                           success=str(bool(deploy.attributes.get("success"))).lower())
@@ -0,0 +1,132 @@
+import asyncio
+
+from src.deploy.apex_tests import ApexTestTransport
+from src.deploy.files import write_file
+from src.deploy.transports import SimulatedTransport
+
+CLASSES = "force-app/main/default/classes"
+TEST_SECONDS = 0.01
+
+
+class RecordingTransport(SimulatedTransport):
+    """SimulatedTransport that remembers the test request of every deployment."""
+
+    def __init__(self, **kwargs):
+        super().__init__(test_seconds=TEST_SECONDS, **kwargs)
+        self.requests = []
+
+    def deploy(self, deploy_root, alias, tests=None, check_only=False):
+        self.requests.append(tests)
+        return super().deploy(deploy_root, alias, tests, check_only)
+
+    async def adeploy(self, deploy_root, alias, tests=None, check_only=False):
+        self.requests.append(tests)
+        return await super().adeploy(deploy_root, alias, tests, check_only)
+
+
+def _sources(test="", invoice="", trigger="", unrelated=""):
+    """A test class naming a class and an object with a trigger, next to a class it does not exercise."""
+    return [
+        {"fileName": "Invoice.cls", "filePath": CLASSES,
+         "content": f"public class Invoice {{ public Decimal total() {{ return 0; }} {invoice} }}"},
+        {"fileName": "InvoiceTest.cls", "filePath": CLASSES,
+         "content": "@isTest\nprivate class InvoiceTest {\n"
+                    "    @isTest static void totals() {\n"
+                    "        insert new Order__c();\n"
+                    f"        System.assertEquals(0, new Invoice().total()); {test}\n"
+                    "    }\n}"},
+        {"fileName": "OrderTrigger.trigger", "filePath": "force-app/main/default/triggers",
+         "content": f"trigger OrderTrigger on Order__c (before insert) {{ {trigger} }}"},
+        {"fileName": "Unrelated.cls", "filePath": CLASSES,
+         "content": f"public class Unrelated {{ {unrelated} }}"},
+    ]
+
+
+def _root(tmp_path, files, name="root"):
+    root = tmp_path / name
+    for f in files:
+        write_file(f, str(root))
+    return str(root)
+
+
+def _sandbox(transport, alias="sim"):
+    # the org is known to be a sandbox, so no Organization query is made
+    transport._sandboxes[alias] = True
+    return transport
+
+
+def _key(tmp_path, name, **changes):
+    transport = _sandbox(ApexTestTransport(SimulatedTransport(), path=str(tmp_path / "cache")))
+    return transport.plan(_root(tmp_path, _sources(**changes), name), "sim")["keys"]["InvoiceTest"]
+
+
+def test_result_key_follows_the_exercised_apex(tmp_path):
+    base = _key(tmp_path, "base")
+    assert _key(tmp_path, "same") == base
+    assert _key(tmp_path, "unrelated", unrelated="Integer x;") == base
+    assert _key(tmp_path, "test", test="System.assert(true);") != base
+    assert _key(tmp_path, "class", invoice="Integer x;") != base
+    assert _key(tmp_path, "trigger", trigger="System.debug('x');") != base
+
+
+def test_plan_covers_exercised_classes_and_triggers(tmp_path):
+    transport = _sandbox(ApexTestTransport(SimulatedTransport(), path=str(tmp_path / "cache")))
+    plan = transport.plan(_root(tmp_path, _sources()), "sim")
+    assert plan["run"] == ["InvoiceTest"] and plan["cached"] == []
+    assert plan["covers"]["InvoiceTest"] == ["Invoice", "OrderTrigger"]
+    assert plan["level"] == "RunSpecifiedTests"
+
+
+def test_cached_green_tests_downgrade_to_no_test_run(tmp_path):
+    inner = RecordingTransport()
+    transport = _sandbox(ApexTestTransport(inner, path=str(tmp_path / "cache")))
+    root = _root(tmp_path, _sources())
+
+    first = transport.deploy(root, "sim")
+    assert inner.requests[0] == {"level": "RunSpecifiedTests", "classes": ["InvoiceTest"]}
+    assert first["tests"]["passed"] == ["InvoiceTest"] and first["tests"]["cache_misses"] == 1
+
+    second = transport.deploy(root, "sim")
+    assert inner.requests[1] == {"level": "NoTestRun", "classes": []}
+    assert second["tests"]["cached"] == ["InvoiceTest"] and second["tests"]["cache_hits"] == 1
+    assert second["tests"]["seconds_saved"] == TEST_SECONDS
+
+    # the cache is kept on disk for the org
+    again = _sandbox(ApexTestTransport(RecordingTransport(), path=str(tmp_path / "cache")))
+    assert again.plan(root, "sim")["level"] == "NoTestRun"
+    assert _sandbox(again, "other").plan(root, "other")["level"] == "RunSpecifiedTests"
+
+
+def test_changed_class_runs_its_test_again(tmp_path):
+    inner = RecordingTransport()
+    transport = _sandbox(ApexTestTransport(inner, path=str(tmp_path / "cache")))
+    transport.deploy(_root(tmp_path, _sources(), "before"), "sim")
+    asyncio.run(transport.adeploy(_root(tmp_path, _sources(invoice="Integer x;"), "after"), "sim"))
+    assert inner.requests[1] == {"level": "RunSpecifiedTests", "classes": ["InvoiceTest"]}
+
+
+def test_cache_off_runs_every_test(tmp_path):
+    inner = RecordingTransport()
+    transport = _sandbox(ApexTestTransport(inner, path=str(tmp_path / "cache"), use_cache=False))
+    root = _root(tmp_path, _sources())
+    transport.deploy(root, "sim")
+    transport.deploy(root, "sim")
+    assert [r["level"] for r in inner.requests] == ["RunSpecifiedTests", "RunSpecifiedTests"]
+
+
+def test_production_org_keeps_its_test_level(tmp_path, monkeypatch):
+    inner = RecordingTransport()
+    transport = ApexTestTransport(inner, path=str(tmp_path / "cache"))
+    monkeypatch.setattr(transport, "is_production", lambda alias: True)
+
+    outcome = transport.deploy(_root(tmp_path, _sources()), "prod")
+    assert inner.requests == [None]
+    assert outcome["success"] and "tests" not in outcome
+    assert not (tmp_path / "cache").exists()
+
+
+def test_listed_production_org_is_not_queried(tmp_path):
+    transport = ApexTestTransport(SimulatedTransport(), path=str(tmp_path / "cache"), production_orgs=["prod"])
+    assert transport.is_production("prod")
+    assert transport.plan(_root(tmp_path, _sources()), "prod") is None
+    assert "prod" not in transport._sandboxes
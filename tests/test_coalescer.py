@@ -0,0 +1,92 @@
+from src.deploy.coalescer import DeployCoalescer, get_coalescer
+from src.deploy.results import component_matches_file
+from src.deploy.transports import SimulatedTransport
+
+CLASSES = "force-app/main/default/classes"
+
+
+def _cls(name, body=None):
+    return [{"fileName": f"{name}.cls", "filePath": CLASSES,
+             "content": body or f"public class {name} {{ }}"},
+            {"fileName": f"{name}.cls-meta.xml", "filePath": CLASSES,
+             "content": "<ApexClass><apiVersion>61.0</apiVersion></ApexClass>"}]
+
+
+def _coalescer(tmp_path, fail_files=()):
+    # a long window: the tests flush by hand
+    return DeployCoalescer(SimulatedTransport(fail_files=fail_files), alias="sim", window_seconds=60,
+                           deploy_dir=str(tmp_path))
+
+
+def _names(components):
+    return sorted(c["fullName"] for c in components)
+
+
+def test_runs_share_one_deployment(tmp_path):
+    coalescer = _coalescer(tmp_path)
+    first = coalescer.submit("run-1", _cls("AccountService") + _cls("Shared"))
+    second = coalescer.submit("run-2", _cls("ContactService") + _cls("Shared"))
+    assert coalescer.pending_runs() == 2
+
+    statuses = coalescer.flush()
+    assert set(statuses) == {"run-1", "run-2"}
+    assert first.result() is statuses["run-1"] and second.result() is statuses["run-2"]
+    one, two = statuses["run-1"], statuses["run-2"]
+    assert one["success"] and two["success"]
+    assert one["batch_id"] == two["batch_id"] and one["batch_runs"] == ["run-1", "run-2"]
+    # the shared file is deployed once and reported to both runs
+    assert _names(one["component_successes"]) == ["AccountService", "Shared"]
+    assert _names(two["component_successes"]) == ["ContactService", "Shared"]
+    assert all(p.startswith(str(tmp_path)) for p in one["written_files"])
+
+
+def test_conflicting_run_is_rejected(tmp_path):
+    coalescer = _coalescer(tmp_path)
+    coalescer.submit("run-1", _cls("Shared"))
+    coalescer.submit("run-2", _cls("Other") + _cls("Shared", "public class Shared { Integer x; }"))
+    statuses = coalescer.flush()
+
+    assert statuses["run-1"]["success"]
+    rejected = statuses["run-2"]
+    assert not rejected["success"] and rejected["returncode"] is None
+    assert rejected["conflicts"] == [{"file": f"{CLASSES}/Shared.cls", "conflictsWith": ["run-1"]}]
+    # the rejected run's other files were not deployed
+    assert statuses["run-1"]["batch_runs"] == ["run-1"]
+
+
+def test_failures_are_attributed_to_their_runs(tmp_path):
+    coalescer = _coalescer(tmp_path, fail_files={"Broken.cls"})
+    coalescer.submit("run-1", _cls("Broken"))
+    coalescer.submit("run-2", _cls("Fine"))
+    statuses = coalescer.flush()
+
+    broken, fine = statuses["run-1"], statuses["run-2"]
+    assert _names(broken["component_failures"]) == ["Broken"]
+    assert broken["message"] == "Deployment validation failed"
+    # the batch failed as a whole, but none of run-2's components did
+    assert not fine["success"] and fine["component_failures"] == []
+    assert _names(fine["component_successes"]) == ["Fine"]
+    assert "other runs" in fine["message"]
+
+
+def test_flush_when_batch_is_full(tmp_path):
+    coalescer = DeployCoalescer(SimulatedTransport(), alias="sim", window_seconds=60, max_runs=2,
+                                deploy_dir=str(tmp_path))
+    first = coalescer.submit("run-1", _cls("A"))
+    assert not first.done()
+    coalescer.submit("run-2", _cls("B"))
+    assert first.done() and coalescer.pending_runs() == 0
+
+
+def test_get_coalescer_is_off_by_default():
+    assert get_coalescer(SimulatedTransport(), enabled=False) is None
+    assert isinstance(get_coalescer(SimulatedTransport(), enabled=True), DeployCoalescer)
+
+
+def test_component_matches_file_on_path_boundaries():
+    written = ".instaforce/batches/b1/force-app/main/default/classes/MyFoo.cls"
+    assert component_matches_file("classes/MyFoo.cls", written)
+    assert component_matches_file("MyFoo.cls-meta.xml", written)
+    assert component_matches_file(written, "force-app/main/default/classes/MyFoo.cls")
+    assert not component_matches_file("Foo.cls", written)
+    assert not component_matches_file("classes/Foo.cls", written)
@@ -0,0 +1,75 @@
+import json
+
+import pytest
+
+from src.agents.design_agent import component_defaults
+from src.utils.compact_codec import decode, encode, encode_payload
+
+DEFAULTS = {"components": component_defaults("Track invoices")}
+
+
+def _roundtrip(obj, list_defaults=None, min_len=4):
+    encoded = encode(obj, list_defaults, min_len=min_len)
+    # what the LLM sees went through JSON
+    assert decode(json.loads(json.dumps(encoded))) == obj
+    return encoded
+
+
+def _component(**extra):
+    return {**component_defaults("Track invoices"), **extra}
+
+
+def test_defaults_are_stripped_and_restored():
+    obj = {"components": [_component(apiName="InvoiceService"), _component(apiName="InvoiceTrigger", type="ApexTrigger")]}
+    encoded = _roundtrip(obj, DEFAULTS)
+    assert set(encoded["components"][0]) == {"apiName"}
+
+
+def test_nested_lists():
+    obj = {
+        "components": [_component(apiName="A", fields=[{"name": "Amount__c", "values": [[1, 2], []]}],
+                                  actions=[["nested", ["deeper"]], {"components": [{"apiName": "inner"}]}])],
+        "matrix": [[{"components": [_component(apiName="B")]}], [], [[]]],
+    }
+    _roundtrip(obj, DEFAULTS)
+
+
+@pytest.mark.parametrize("value", ["", [], {}, None, 0, False])
+def test_empty_values_are_kept(value):
+    obj = {"components": [_component(apiName="A", description=value, label=value), {"apiName": "B", "extra": value}]}
+    _roundtrip(obj, DEFAULTS)
+
+
+def test_absent_keys():
+    item = _component(apiName="A")
+    del item["description"], item["dependencies"]["requiresApex"]
+    encoded = _roundtrip({"components": [item, {}]}, DEFAULTS, min_len=16)
+    assert encoded["components"][0]["$absent"] == ["description"]
+    assert encoded["components"][0]["dependencies"]["$absent"] == ["requiresApex"]
+
+
+def test_item_with_absent_marker_key():
+    item = _component(apiName="A", **{"$absent": ["label"]})
+    del item["object"]
+    _roundtrip({"components": [item, {"$absent": "x", "$$absent": 1}]}, DEFAULTS)
+    _roundtrip({"components": [{"$absent": []}]}, {"components": {"$absent": ["y"], "label": ""}})
+
+
+def test_dollar_keys_and_strings():
+    obj = {"$strings": ["a"], "$defaults": {}, "$0": "$0", "text": "$$literal", "nested": {"$key": ["$1", "$"]}}
+    _roundtrip(obj)
+    _roundtrip(obj, DEFAULTS)
+
+
+def test_shared_strings():
+    text = "Invoices above the approval limit need a manager"
+    obj = {"components": [_component(apiName=f"C{i}", description=text) for i in range(3)]}
+    encoded = _roundtrip(obj, DEFAULTS, min_len=16)
+    assert encoded["$strings"] == [text]
+
+
+def test_encode_payload_counts_tokens():
+    obj = {"components": [_component(apiName=f"C{i}") for i in range(10)]}
+    text, stats = encode_payload(obj, DEFAULTS)
+    assert decode(json.loads(text)) == obj
+    assert stats["tokens_after"] < stats["tokens_before"]
@@ -0,0 +1,49 @@
+import asyncio
+import json
+
+from src.llm.fake import FakeLLM
+from src.utils.compact_codec import encode
+
+REQ_SYSTEM = "You are a Salesforce Solution Architect."
+DESIGN_SYSTEM = "Technical Architect Intelligence Core"
+CODEGEN_SYSTEM = "Metadata Code Generation Core"
+
+
+def _messages(system, user):
+    return [{"role": "system", "content": system}, {"role": "user", "content": user}]
+
+
+def test_breakdown_names_mentioned_objects():
+    llm = FakeLLM()
+    breakdown = json.loads(llm.invoke(_messages(REQ_SYSTEM, "Notify the owner when an opportunity or case closes")).content)
+    assert breakdown["objects"] == ["Opportunity", "Case"]
+    assert llm.calls["req"] == 1
+
+
+def test_design_and_codegen_of_compact_payloads():
+    llm = FakeLLM()
+    design = json.loads(llm.invoke(_messages(DESIGN_SYSTEM, json.dumps({"objects": ["Account"]}))).content)
+    assert [c["apiName"] for c in design["components"]] == ["AccountService", "AccountTrigger"]
+
+    payload = encode({"components": design["components"]}, {"components": {"estimatedHours": 1}})
+    files = json.loads(llm.invoke(_messages(CODEGEN_SYSTEM, json.dumps(payload))).content)["files"]
+    assert [f["fileName"] for f in files] == ["AccountService.cls", "AccountService.cls-meta.xml",
+                                              "AccountTrigger.trigger", "AccountTrigger.trigger-meta.xml"]
+    assert "AccountService.handle(Trigger.new);" in files[2]["content"]
+
+
+def test_recorded_responses_and_streaming():
+    llm = FakeLLM(responses={"req": '{"objects": ["Invoice__c"]}'})
+    messages = _messages(REQ_SYSTEM, "anything")
+    assert "".join(chunk.content for chunk in llm.stream(messages)) == '{"objects": ["Invoice__c"]}'
+
+    async def collect():
+        return "".join([chunk.content async for chunk in llm.astream(messages)]), (await llm.ainvoke(messages)).content
+
+    streamed, invoked = asyncio.run(collect())
+    assert streamed == invoked == '{"objects": ["Invoice__c"]}'
+    assert llm.calls["req"] == 3
+
+
+def test_unknown_stage():
+    assert FakeLLM().invoke(_messages("Something else", "{}")).content == "{}"
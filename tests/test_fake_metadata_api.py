@@ -0,0 +1,127 @@
+import os
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from src.deploy.fake_metadata_api import FakeMetadataApi
+from src.deploy.metadata_api import MDAPI_NS, MetadataApiClient, MetadataApiTransport, MetadataPackage
+from src.deploy.transports import SimulatedTransport
+
+CLASSES = os.path.join("force-app", "main", "default", "classes")
+META = ('<?xml version="1.0" encoding="UTF-8"?>\n<ApexClass xmlns="http://soap.sforce.com/2006/04/metadata">'
+        "<apiVersion>59.0</apiVersion><status>Active</status></ApexClass>")
+
+
+@pytest.fixture
+def deploy_root(tmp_path):
+    classes = tmp_path / CLASSES
+    classes.mkdir(parents=True)
+    for name in ("AccountService", "ContactService"):
+        (classes / f"{name}.cls").write_text(f"public class {name} {{}}")
+        (classes / f"{name}.cls-meta.xml").write_text(META)
+    return str(tmp_path / "force-app")
+
+
+@pytest.fixture
+def fake():
+    with FakeMetadataApi(polls=2, fail={"ContactService"}) as fake:
+        yield fake
+
+
+def _transport(fake, session_id=None):
+    client = MetadataApiClient(fake.endpoint, session_id or fake.session_id)
+    return MetadataApiTransport(client, poll_seconds=0.01)
+
+
+def test_deploy_reports_component_failures(fake, deploy_root):
+    status = _transport(fake).deploy(deploy_root, "fake")
+    assert not status["success"]
+    failures = status["parsed_response"]["result"]["details"]["componentFailures"]
+    assert [f["fullName"] for f in failures] == ["ContactService"]
+    assert failures[0]["fileName"].endswith("classes/ContactService.cls")
+    assert fake.calls == ["deploy", "checkDeployStatus", "checkDeployStatus", "checkDeployStatus"]
+
+
+def test_deploy_succeeds(fake, deploy_root):
+    fake.fail.clear()
+    status = _transport(fake).deploy(deploy_root, "fake", check_only=True)
+    assert status["success"]
+    members = next(iter(fake.deployments.values()))["members"]
+    assert sorted(members) == [("ApexClass", "AccountService"), ("ApexClass", "ContactService")]
+
+
+def test_invalid_session(fake, deploy_root):
+    status = _transport(fake, session_id="wrong").deploy(deploy_root, "fake")
+    assert not status["success"]
+    assert "INVALID_SESSION_ID" in status["message"]
+
+
+def test_malformed_request(fake):
+    status, body = fake.handle(b"<not xml")
+    assert status == 500 and "INVALID_XML" in body
+
+
+OBJECT = ('<?xml version="1.0" encoding="UTF-8"?>\n<CustomObject xmlns="http://soap.sforce.com/2006/04/metadata">'
+          "<label>Invoice</label><pluralLabel>Invoices</pluralLabel></CustomObject>")
+FIELD = ('<?xml version="1.0" encoding="UTF-8"?>\n<CustomField xmlns="http://soap.sforce.com/2006/04/metadata">'
+         "<fullName>Amount__c</fullName><label>Amount</label><type>Currency</type></CustomField>")
+
+
+@pytest.fixture
+def object_root(tmp_path):
+    invoice = tmp_path / "force-app" / "main" / "default" / "objects" / "Invoice__c"
+    (invoice / "fields").mkdir(parents=True)
+    (invoice / "Invoice__c.object-meta.xml").write_text(OBJECT)
+    (invoice / "fields" / "Amount__c.field-meta.xml").write_text(FIELD)
+    return str(tmp_path / "force-app")
+
+
+def test_object_children_are_recomposed(object_root):
+    package = MetadataPackage(object_root)
+    assert package.members == {"CustomObject": ["Invoice__c"], "CustomField": ["Invoice__c.Amount__c"]}
+    assert set(package.entries) == {"objects/Invoice__c.object", "package.xml"}
+
+    root = ET.fromstring(package.entries["objects/Invoice__c.object"])
+    ns = {"md": MDAPI_NS}
+    assert root.findtext("md:label", namespaces=ns) == "Invoice"
+    fields = root.findall("md:fields", ns)
+    assert [f.findtext("md:fullName", namespaces=ns) for f in fields] == ["Amount__c"]
+    assert fields[0].findtext("md:type", namespaces=ns) == "Currency"
+    # results for the field point at its own source file
+    assert package.source_of({"componentType": "CustomField", "fullName": "Invoice__c.Amount__c"}) == \
+        "main/default/objects/Invoice__c/fields/Amount__c.field-meta.xml"
+
+
+def test_field_failure_reported_on_field_file(object_root):
+    with FakeMetadataApi(fail={"Invoice__c.Amount__c"}) as fake:
+        status = _transport(fake).deploy(object_root, "fake")
+        deployed = next(iter(fake.deployments.values()))["members"]
+    assert sorted(deployed) == [("CustomField", "Invoice__c.Amount__c"), ("CustomObject", "Invoice__c")]
+    failures = status["parsed_response"]["result"]["details"]["componentFailures"]
+    assert [f["fileName"] for f in failures] == ["main/default/objects/Invoice__c/fields/Amount__c.field-meta.xml"]
+
+
+@pytest.fixture
+def unsupported_root(deploy_root):
+    things = os.path.join(deploy_root, "main", "default", "customThings")
+    os.makedirs(things)
+    with open(os.path.join(things, "Thing.thing-meta.xml"), "w") as fh:
+        fh.write("<Thing/>")
+    return deploy_root
+
+
+def test_unsupported_metadata_falls_back_to_the_cli(fake, unsupported_root):
+    fallback = SimulatedTransport()
+    transport = MetadataApiTransport(MetadataApiClient(fake.endpoint, fake.session_id), fallback=fallback,
+                                     poll_seconds=0.01)
+    status = transport.deploy(unsupported_root, "fake")
+    assert status["success"]
+    assert status["deploy_command"].startswith("simulated deploy -o fake")
+    assert fake.calls == []
+
+
+def test_unsupported_metadata_without_fallback_fails(fake, unsupported_root):
+    status = _transport(fake).deploy(unsupported_root, "fake")
+    assert not status["success"] and status["returncode"] is None
+    assert "Unsupported metadata location" in status["message"]
+    assert fake.calls == []
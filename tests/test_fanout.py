@@ -0,0 +1,108 @@
+import asyncio
+
+import pytest
+
+from src.deploy.fanout import MultiOrgDeployer, target_orgs
+from src.deploy.files import write_file
+from src.deploy.transports import SimulatedTransport
+
+CLASSES = "force-app/main/default/classes"
+
+
+class OrgTransport:
+    """One SimulatedTransport per org alias; `unreachable` orgs raise instead of answering."""
+
+    def __init__(self, fail_files=None, unreachable=()):
+        self.orgs = {alias: SimulatedTransport(fail_files=files) for alias, files in (fail_files or {}).items()}
+        self.unreachable = set(unreachable)
+        self.calls = []
+
+    def _org(self, alias):
+        self.calls.append(alias)
+        if alias in self.unreachable:
+            raise ConnectionError("org unreachable")
+        return self.orgs.get(alias) or SimulatedTransport()
+
+    def deploy(self, deploy_root, alias, tests=None, check_only=False):
+        return self._org(alias).deploy(deploy_root, alias, tests, check_only)
+
+    async def adeploy(self, deploy_root, alias, tests=None, check_only=False):
+        return await self._org(alias).adeploy(deploy_root, alias, tests, check_only)
+
+
+@pytest.fixture
+def deploy_root(tmp_path):
+    for name in ("Broken", "Other", "Fine"):
+        write_file({"fileName": f"{name}.cls", "filePath": CLASSES, "content": f"public class {name} {{ }}"},
+                   str(tmp_path))
+    return str(tmp_path)
+
+
+def _failures(status):
+    return {c["fullName"]: c["orgs"] for c in status["component_failures"]}
+
+
+def test_all_orgs_succeed(deploy_root):
+    status = MultiOrgDeployer(OrgTransport()).deploy(deploy_root, ["dev", "qa"])
+    assert status["success"]
+    assert status["message"] == "Deployment validation successful on 2 orgs"
+    assert set(status["orgs"]) == {"dev", "qa"} and status["component_failures"] == []
+
+
+def test_continue_deploys_every_org_and_merges_failures(deploy_root):
+    transport = OrgTransport(fail_files={"dev": {"Broken.cls"}, "qa": {"Broken.cls", "Other.cls"}})
+    status = MultiOrgDeployer(transport, policy="continue").deploy(deploy_root, ["dev", "qa", "uat"])
+
+    assert sorted(transport.calls) == ["dev", "qa", "uat"]
+    assert not status["success"]
+    assert status["failed_orgs"] == ["dev", "qa"] and status["skipped_orgs"] == []
+    assert status["message"] == "Deployment validation failed on dev, qa"
+    assert status["orgs"]["uat"]["success"]
+    # one entry per failing component, tagged with every org reporting it
+    assert _failures(status) == {"Broken": ["dev", "qa"], "Other": ["qa"]}
+    assert status["deploy_command"] == status["orgs"]["dev"]["deploy_command"]
+
+
+def test_fail_fast_skips_the_remaining_orgs(deploy_root):
+    transport = OrgTransport(fail_files={"dev": {"Broken.cls"}})
+    status = MultiOrgDeployer(transport, max_parallel=1, policy="fail_fast").deploy(deploy_root, ["dev", "qa", "uat"])
+
+    assert transport.calls == ["dev"]
+    assert not status["success"]
+    assert status["failed_orgs"] == ["dev"] and status["skipped_orgs"] == ["qa", "uat"]
+    assert status["message"] == "Deployment validation failed on dev (2 skipped)"
+    skipped = status["orgs"]["qa"]
+    assert skipped["skipped"] and skipped["org"] == "qa" and "fail_fast" in skipped["message"]
+    # skipped orgs report no component failures of their own
+    assert _failures(status) == {"Broken": ["dev"]}
+
+
+def test_adeploy_fail_fast(deploy_root):
+    transport = OrgTransport(unreachable={"dev"})
+    deployer = MultiOrgDeployer(transport, max_parallel=1, policy="fail_fast")
+    status = asyncio.run(deployer.adeploy(deploy_root, ["dev", "qa"]))
+
+    assert transport.calls == ["dev"]
+    assert status["failed_orgs"] == ["dev"] and status["skipped_orgs"] == ["qa"]
+    assert status["orgs"]["dev"]["message"] == "Deployment to dev failed: org unreachable"
+
+
+def test_adeploy_continue(deploy_root):
+    transport = OrgTransport(fail_files={"qa": {"Other.cls"}}, unreachable={"dev"})
+    status = asyncio.run(MultiOrgDeployer(transport).adeploy(deploy_root, ["dev", "qa", "uat"]))
+    assert status["failed_orgs"] == ["dev", "qa"] and status["skipped_orgs"] == []
+    assert _failures(status) == {"Other": ["qa"]}
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        MultiOrgDeployer(OrgTransport(), policy="sometimes")
+
+
+def test_target_orgs(monkeypatch):
+    monkeypatch.setenv("SF_USERNAME_ALIAS", "dev")
+    monkeypatch.delenv("INSTAFORCE_TARGET_ORGS", raising=False)
+    assert target_orgs({}) == ["dev"]
+    monkeypatch.setenv("INSTAFORCE_TARGET_ORGS", "qa, uat,qa")
+    assert target_orgs() == ["qa", "uat"]
+    assert target_orgs({"target_orgs": ["prod"]}) == ["prod"]
@@ -0,0 +1,142 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from src.jobs.scheduler import RunScheduler, estimate_cost, parse_priority, rank
+
+
+def test_rank_orders_by_cost_priority_and_age():
+    small, large = estimate_cost(200), estimate_cost(0, components=30)
+    assert rank(small, 0, 0) < rank(large, 0, 0)
+    # a priority level is worth priority_weight cost units
+    assert rank(large, 1, 0, priority_weight=40) < rank(small, 0, 0, priority_weight=40)
+    # waiting ages a large run forward
+    assert rank(large, 0, 200, aging_seconds=5) < rank(small, 0, 0, aging_seconds=5)
+
+
+def test_parse_priority():
+    assert parse_priority(None) == 0
+    assert parse_priority("Urgent") == 2
+    assert parse_priority("-3") == -3
+    with pytest.raises(ValueError):
+        parse_priority("soon")
+
+
+def _wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def _grant_order(scheduler, runs):
+    """Queue one "llm" request per (state, enqueue delay) behind a held slot; the order they are served in."""
+    order, threads = [], []
+
+    def request(state):
+        with scheduler.bind(state):
+            with scheduler.slot("llm"):
+                order.append(state["run_id"])
+
+    with scheduler.slot("llm"):
+        for waiting, (state, delay) in enumerate(runs, start=1):
+            time.sleep(delay)
+            threads.append(threading.Thread(target=request, args=(state,)))
+            threads[-1].start()
+            _wait_for(lambda: scheduler.snapshot()["llm"]["waiting"] == waiting)
+    for t in threads:
+        t.join()
+    return order
+
+
+def _state(run_id, requirement_chars=100, components=None, priority=None):
+    state = {"run_id": run_id, "requirement": "x" * requirement_chars}
+    if components is not None:
+        state["components"] = {"components": [{}] * components}
+    if priority is not None:
+        state["priority"] = priority
+    return state
+
+
+def test_shortest_job_first():
+    scheduler = RunScheduler({"llm": 1}, aging_seconds=1e6)
+    order = _grant_order(scheduler, [(_state("large", components=40), 0), (_state("medium", components=10), 0),
+                                     (_state("small", components=1), 0)])
+    assert order == ["small", "medium", "large"]
+    assert scheduler.run_stats("large")["slots_granted"] == {"llm": 1}
+
+
+def test_priority_before_size():
+    scheduler = RunScheduler({"llm": 1}, aging_seconds=1e6)
+    order = _grant_order(scheduler, [(_state("small", components=1), 0),
+                                     (_state("urgent", components=20, priority="urgent"), 0),
+                                     (_state("low", components=1, priority="low"), 0)])
+    assert order == ["urgent", "small", "low"]
+
+
+def test_aging_moves_a_waiting_large_run_forward():
+    # one cost unit per 10 ms waited: the large run queued 0.3 s earlier outranks 2 components
+    scheduler = RunScheduler({"llm": 1}, aging_seconds=0.01)
+    order = _grant_order(scheduler, [(_state("large", components=3), 0), (_state("small", components=1), 0.3)])
+    assert order == ["large", "small"]
+
+
+def test_aslot_cancelled_while_waiting():
+    scheduler = RunScheduler({"llm": 1})
+
+    async def main():
+        async with scheduler.aslot("llm"):
+            waiter = asyncio.create_task(_hold(scheduler))
+            await _until(lambda: scheduler.snapshot()["llm"]["waiting"] == 1)
+            waiter.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await waiter
+            assert scheduler.snapshot()["llm"] == {"slots": 1, "in_use": 1, "waiting": 0}
+        assert scheduler.snapshot()["llm"]["in_use"] == 0
+
+    asyncio.run(main())
+
+
+def test_aslot_cancelled_after_grant_releases_the_slot():
+    scheduler = RunScheduler({"llm": 1})
+
+    async def main():
+        held = scheduler.slot("llm")
+        held.__enter__()
+        waiter = asyncio.create_task(_hold(scheduler))
+        await _until(lambda: scheduler.snapshot()["llm"]["waiting"] == 1)
+        # the freed slot goes to the waiter, which is cancelled before it can resume
+        held.__exit__(None, None, None)
+        assert scheduler.snapshot()["llm"] == {"slots": 1, "in_use": 1, "waiting": 0}
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert scheduler.snapshot()["llm"]["in_use"] == 0
+
+    asyncio.run(main())
+
+
+def test_aslot_releases_after_use():
+    scheduler = RunScheduler({"llm": 2})
+
+    async def main():
+        await asyncio.gather(*(_hold(scheduler, 0.01) for _ in range(5)))
+
+    asyncio.run(main())
+    assert scheduler.snapshot()["llm"] == {"slots": 2, "in_use": 0, "waiting": 0}
+    assert scheduler.run_stats("unbound")["slots_granted"] == {"llm": 5}
+
+
+async def _hold(scheduler, seconds=10.0):
+    async with scheduler.aslot("llm"):
+        await asyncio.sleep(seconds)
+
+
+async def _until(predicate):
+    for _ in range(1000):
+        if predicate():
+            return
+        await asyncio.sleep(0.005)
+    raise AssertionError("timed out")
@@ -0,0 +1,83 @@
+import asyncio
+import json
+
+from server import PipelineServer
+from src.deploy.transports import SimulatedTransport
+from src.llm.fake import FakeLLM
+from src.state.checkpoint import get_async_checkpointer
+from src.state.workflow import WorkflowBuilder
+
+
+async def _request(port, raw: bytes) -> bytes:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(raw)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    return response
+
+
+def _post(path: str, body: dict) -> bytes:
+    data = json.dumps(body).encode("utf-8")
+    return (f"POST {path} HTTP/1.1\r\nHost: test\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(data)}\r\n\r\n").encode("latin-1") + data
+
+
+def _events(response: bytes):
+    _, _, stream = response.decode("utf-8").partition("\r\n\r\n")
+    events = []
+    for block in stream.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def _serve(tmp_path, exercise):
+    async def main():
+        builder = WorkflowBuilder(FakeLLM(), transport=SimulatedTransport())
+        async with get_async_checkpointer(str(tmp_path / "checkpoints.sqlite")) as checkpointer:
+            server = PipelineServer(builder.setup_graph(checkpointer=checkpointer), port=0)
+            task = asyncio.create_task(server.serve())
+            await server.ready.wait()
+            try:
+                return await exercise(server.port)
+            finally:
+                task.cancel()
+    return asyncio.run(main())
+
+
+def test_run_streams_node_updates(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # per-run deploy roots
+    monkeypatch.setenv("SF_USERNAME_ALIAS", "simulated")
+
+    async def exercise(port):
+        return await _request(port, _post("/runs", {"requirement": "Create an Account service", "thread_id": "t1"}))
+
+    response = _serve(tmp_path, exercise)
+    assert response.startswith(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream")
+    events = _events(response)
+    kinds = [kind for kind, _ in events]
+    assert kinds[0] == "run" and kinds[-1] == "end"
+    assert set(kinds[1:-1]) == {"update"}
+    assert events[0][1] == {"thread_id": "t1"}
+    nodes = [data["node"] for kind, data in events if kind == "update"]
+    assert nodes[-1] == "deploy_agent" and "req_agent" in nodes
+    assert events[-1][1]["thread_id"] == "t1" and events[-1][1]["success"] is True
+
+
+def test_bad_requests(tmp_path):
+    async def exercise(port):
+        return [
+            await _request(port, b"POST /runs HTTP/1.1\r\nContent-Length: ten\r\n\r\n"),
+            await _request(port, b"POST /runs HTTP/1.1\r\nContent-Length: -1\r\n\r\n"),
+            await _request(port, _post("/runs", {"requirement": ""})),
+            await _request(port, b"GET /health HTTP/1.1\r\n\r\n"),
+        ]
+
+    bad_length, negative_length, no_requirement, health = _serve(tmp_path, exercise)
+    assert bad_length.startswith(b"HTTP/1.1 400 Bad Request")
+    assert b"Malformed Content-Length" in bad_length
+    assert negative_length.startswith(b"HTTP/1.1 400 Bad Request")
+    assert no_requirement.startswith(b"HTTP/1.1 400 Bad Request")
+    assert health.startswith(b"HTTP/1.1 200 OK")
+    assert json.loads(health.partition(b"\r\n\r\n")[2])["status"] == "ok"
@@ -0,0 +1,94 @@
+from src.deploy.symbols import check_symbols
+
+CLASSES = "force-app/main/default/classes"
+
+
+def _cls(name, content):
+    return {"fileName": f"{name}.cls", "filePath": CLASSES, "content": content}
+
+
+def _generated(handler_call="InvoiceTriggerHandler.handle(Trigger.new);", lwc_method="getOpenInvoices"):
+    """A design's worth of files: an enum, a trigger and its handler, a service and an LWC."""
+    return [
+        _cls("InvoiceStatus", "public enum InvoiceStatus { OPEN, PAID, VOID }"),
+        _cls("InvoiceTriggerHandler", """
+public with sharing class InvoiceTriggerHandler {
+    public static void handle(List<Invoice__c> invoices) {
+        for (Invoice__c inv : invoices) {
+            InvoiceStatus status = InvoiceStatus.valueOf(inv.Status__c);
+            if (status.ordinal() > InvoiceStatus.OPEN.ordinal()) {
+                inv.Closed__c = true;
+            }
+            inv.Label__c = status.name();
+        }
+    }
+}"""),
+        _cls("InvoiceService", """
+public with sharing class InvoiceService {
+    @AuraEnabled(cacheable=true)
+    public static List<Invoice__c> getOpenInvoices() {
+        List<String> names = new List<String>();
+        for (InvoiceStatus s : InvoiceStatus.values()) {
+            names.add(s.name());
+        }
+        return [SELECT Id FROM Invoice__c WHERE Status__c IN :names];
+    }
+
+    public Integer count() { return 0; }
+}"""),
+        {"fileName": "InvoiceTrigger.trigger", "filePath": "force-app/main/default/triggers",
+         "content": f"trigger InvoiceTrigger on Invoice__c (before insert, before update) {{\n    {handler_call}\n}}"},
+        {"fileName": "invoiceList.js", "filePath": "force-app/main/default/lwc/invoiceList",
+         "content": f"import {{ LightningElement, wire }} from 'lwc';\n"
+                    f"import {lwc_method} from '@salesforce/apex/InvoiceService.{lwc_method}';\n"
+                    f"export default class InvoiceList extends LightningElement {{}}\n"},
+    ]
+
+
+def test_generated_set_resolves():
+    assert check_symbols(_generated()) == []
+
+
+def test_enum_builtins_on_variables_and_type():
+    files = [
+        _cls("Status", "public enum Status { OPEN, CLOSED }"),
+        _cls("Caller", """
+public class Caller {
+    public static void run() {
+        Status s = Status.valueOf('OPEN');
+        List<Status> all = Status.values();
+        System.debug(s.name() + s.ordinal());
+    }
+}"""),
+    ]
+    assert check_symbols(files) == []
+
+
+def test_unknown_enum_method_is_reported():
+    files = [
+        _cls("Status", "public enum Status { OPEN, CLOSED }"),
+        _cls("Caller", "public class Caller { void run() { Status.valuOf('OPEN'); } }"),
+    ]
+    problems = check_symbols(files)
+    assert [p["problem"] for p in problems] == ["Method Status.valuOf does not exist (did you mean valueOf?)"]
+
+
+def test_misspelled_handler_in_trigger():
+    problems = check_symbols(_generated(handler_call="InvoiceTriggerHandlr.handle(Trigger.new);"))
+    assert len(problems) == 1
+    assert problems[0]["fileName"] == "force-app/main/default/triggers/InvoiceTrigger.trigger"
+    assert problems[0]["componentType"] == "ApexTrigger"
+    assert "did you mean InvoiceTriggerHandler?" in problems[0]["problem"]
+
+
+def test_missing_handler_method():
+    problems = check_symbols(_generated(handler_call="InvoiceTriggerHandler.onBeforeInsert(Trigger.new);"))
+    assert [p["problem"] for p in problems] == ["Method InvoiceTriggerHandler.onBeforeInsert does not exist"]
+
+
+def test_lwc_import_must_be_static_aura_enabled():
+    problems = check_symbols(_generated(lwc_method="count"))
+    assert len(problems) == 1
+    assert problems[0]["componentType"] == "LightningComponentBundle"
+    assert problems[0]["lineNumber"] == 2
+    assert "must be static and @AuraEnabled" in problems[0]["problem"]
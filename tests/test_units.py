@@ -0,0 +1,198 @@
+import asyncio
+import os
+
+import pytest
+
+from src.deploy.files import file_key, write_file
+from src.deploy.transports import SimulatedTransport
+from src.deploy.units import UnitDeployer, get_unit_deployer, plan_units
+
+CLASSES = "force-app/main/default/classes"
+
+
+def _cls(name, body=None):
+    return [{"fileName": f"{name}.cls", "filePath": CLASSES,
+             "content": body or f"public class {name} {{ }}"},
+            {"fileName": f"{name}.cls-meta.xml", "filePath": CLASSES,
+             "content": "<ApexClass><apiVersion>61.0</apiVersion></ApexClass>"}]
+
+
+def _by_name(units):
+    return {u["name"]: u for u in units}
+
+
+class RecordingTransport(SimulatedTransport):
+    """SimulatedTransport that remembers the source files of every deployment."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.calls = []
+
+    def _record(self, deploy_root, check_only):
+        names = sorted(name for _, _, filenames in os.walk(deploy_root) for name in filenames
+                       if not name.endswith("-meta.xml"))
+        self.calls.append((check_only, names))
+
+    def deploy(self, deploy_root, alias, tests=None, check_only=False):
+        self._record(deploy_root, check_only)
+        return super().deploy(deploy_root, alias, tests, check_only)
+
+    async def adeploy(self, deploy_root, alias, tests=None, check_only=False):
+        self._record(deploy_root, check_only)
+        return await super().adeploy(deploy_root, alias, tests, check_only)
+
+
+def test_referencing_components_form_one_unit():
+    files = (_cls("AccountService") + _cls("AccountServiceTest", "@isTest class AccountServiceTest { "
+                                           "static void run() { AccountService s; } }")
+             + _cls("ContactService"))
+    units = _by_name(plan_units(files))
+    assert set(units) == {"AccountService (+1)", "ContactService"}
+    assert units["AccountService (+1)"]["files"] == sorted(
+        file_key(f) for f in files if f["fileName"].startswith("AccountService"))
+    assert units["ContactService"]["support"] == []
+
+
+def test_test_class_joins_the_trigger_on_its_object():
+    files = _cls("OrderTest", "@isTest class OrderTest { static void run() { insert new Order__c(); } }") + [
+        {"fileName": "OrderTrigger.trigger", "filePath": "force-app/main/default/triggers",
+         "content": "trigger OrderTrigger on Order__c (before insert) { }"}]
+    assert [u["name"] for u in plan_units(files)] == ["OrderTest (+1)"]
+
+
+def test_design_dependencies_join_units():
+    files = _cls("Billing") + _cls("Ledger")
+    assert len(plan_units(files)) == 2
+    components = [{"apiName": "Billing", "dependencies": {"requiredApexClasses": ["Ledger"]}}]
+    assert [u["name"] for u in plan_units(files, components)] == ["Billing (+1)"]
+
+
+def test_hubs_get_units_of_their_own():
+    handler = _cls("TriggerHandlerBase", "public virtual class TriggerHandlerBase { }")
+    files = (handler
+             + _cls("AccountHandler", "public class AccountHandler extends TriggerHandlerBase { }")
+             + _cls("ContactHandler", "public class ContactHandler extends TriggerHandlerBase { }")
+             + [{"fileName": "Handlers.permissionset-meta.xml",
+                 "filePath": "force-app/main/default/permissionsets",
+                 "content": "<PermissionSet><classAccesses><apexClass>AccountHandler</apexClass></classAccesses>"
+                            "<classAccesses><apexClass>ContactHandler</apexClass></classAccesses></PermissionSet>"}])
+    units = _by_name(plan_units(files))
+    assert set(units) == {"TriggerHandlerBase", "AccountHandler", "ContactHandler", "Handlers"}
+
+    # a unit is validated alone: what it depends on is packaged alongside
+    handler_keys = sorted(file_key(f) for f in handler)
+    assert units["AccountHandler"]["support"] == handler_keys
+    assert units["TriggerHandlerBase"]["support"] == []
+    assert len(units["Handlers"]["support"]) == 6
+    package = [file_key(f) for f in units["AccountHandler"]["package"]]
+    assert package == units["AccountHandler"]["files"] + handler_keys
+
+
+def test_unit_id_follows_content():
+    before = _by_name(plan_units(_cls("Billing") + _cls("Ledger")))
+    after = _by_name(plan_units(_cls("Billing") + _cls("Ledger", "public class Ledger { Integer x; }")))
+    assert before["Billing"]["id"] == after["Billing"]["id"]
+    assert before["Ledger"]["id"] != after["Ledger"]["id"]
+
+
+def _deploy(tmp_path, transport, files, previous=None, atomic=False):
+    deploy_root = tmp_path / "run"
+    for f in files:
+        write_file(f, str(deploy_root))
+    deployer = UnitDeployer(transport, atomic=atomic, units_dir=str(tmp_path / "units"))
+    return deployer.deploy(str(deploy_root), files, "sim", "run-1", previous=previous)
+
+
+def _change(broken_body=None):
+    return _cls("AccountService") + _cls("ContactService") + _cls("Broken", broken_body)
+
+
+def test_first_attempt_that_deploys_is_not_split(tmp_path):
+    transport = RecordingTransport()
+    status = _deploy(tmp_path, transport, _change())
+    assert status["success"] and "units" not in status
+    assert len(transport.calls) == 1
+
+
+def test_rejected_unit_does_not_hold_back_the_rest(tmp_path):
+    transport = RecordingTransport(fail_files={"Broken.cls"})
+    status = _deploy(tmp_path, transport, _change())
+
+    assert not status["success"]
+    assert status["message"] == "Deployed 2 of 3 units; failed: Broken"
+    units = _by_name(status["units"])
+    assert units["AccountService"]["deployed"] and units["ContactService"]["validated"]
+    assert not units["Broken"]["validated"] and not units["Broken"]["deployed"]
+    assert status["failed_units"] == [units["Broken"]["id"]]
+    failure, = status["component_failures"]
+    assert failure["fileName"].endswith("Broken.cls") and failure["units"] == [units["Broken"]["id"]]
+
+    combined, *validations, landing = transport.calls
+    assert combined == (False, ["AccountService.cls", "Broken.cls", "ContactService.cls"])
+    assert sorted(validations) == [(True, ["AccountService.cls"]), (True, ["Broken.cls"]),
+                                   (True, ["ContactService.cls"])]
+    assert landing == (False, ["AccountService.cls", "ContactService.cls"])
+    # the unit roots are removed once the deploy is done
+    assert not (tmp_path / "units" / "run-1").exists()
+
+
+def test_deployed_units_are_left_out_of_the_next_attempt(tmp_path):
+    first = _deploy(tmp_path, RecordingTransport(fail_files={"Broken.cls"}), _change())
+    deployed = {u["id"] for u in first["units"] if u["deployed"]}
+
+    transport = RecordingTransport()
+    status = _deploy(tmp_path, transport, _change("public class Broken { Integer fixed; }"), previous=first)
+
+    assert status["success"]
+    assert status["message"] == "Deployment successful (3 units, 2 deployed earlier)"
+    assert set(status["reused_units"]) == deployed
+    assert transport.calls == [(False, ["Broken.cls"])]
+    units = _by_name(status["units"])
+    assert units["AccountService"]["reused"] and units["Broken"]["deployed"]
+
+
+def test_still_failing_unit_on_the_next_attempt(tmp_path):
+    first = _deploy(tmp_path, RecordingTransport(fail_files={"Broken.cls"}), _change())
+    transport = RecordingTransport(fail_files={"Broken.cls"})
+    status = _deploy(tmp_path, transport, _change(), previous=first)
+
+    # one unit left: nothing to split, the failed deployment is its result
+    assert transport.calls == [(False, ["Broken.cls"])]
+    assert not status["success"]
+    assert _by_name(status["units"])["Broken"]["message"] == "Deployment failed"
+    assert len(status["reused_units"]) == 2
+
+
+def test_atomic_deploys_nothing_unless_every_unit_validates(tmp_path):
+    transport = RecordingTransport(fail_files={"Broken.cls"})
+    status = _deploy(tmp_path, transport, _change(), atomic=True)
+
+    assert not status["success"] and status["atomic"]
+    assert status["message"] == "Deployment failed, nothing deployed (atomic); units failing validation: Broken"
+    units = _by_name(status["units"])
+    assert units["AccountService"]["validated"] and not units["AccountService"]["deployed"]
+    assert "atomic" in units["AccountService"]["message"]
+    # the combined deployment and the validations; no landing
+    assert [check_only for check_only, _ in transport.calls] == [False, True, True, True]
+
+
+def test_adeploy_splits_like_deploy(tmp_path):
+    files = _change()
+    deploy_root = tmp_path / "run"
+    for f in files:
+        write_file(f, str(deploy_root))
+    transport = RecordingTransport(fail_files={"Broken.cls"})
+    deployer = UnitDeployer(transport, max_parallel=2, units_dir=str(tmp_path / "units"))
+
+    status = asyncio.run(deployer.adeploy(str(deploy_root), files, "sim", "run-1"))
+    assert status["message"] == "Deployed 2 of 3 units; failed: Broken"
+    assert transport.calls[-1] == (False, ["AccountService.cls", "ContactService.cls"])
+
+
+def test_get_unit_deployer_modes():
+    transport = SimulatedTransport()
+    assert get_unit_deployer(transport, "off") is None
+    assert not get_unit_deployer(transport, "on").atomic
+    assert get_unit_deployer(transport, "atomic").atomic
+    with pytest.raises(ValueError):
+        get_unit_deployer(transport, "sometimes")
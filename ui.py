@@ -55,18 +55,33 @@
 #         st.json(final_state)
 
 
+import os
 import json
 import time
 import traceback
 import streamlit as st
-from typing import Any, Dict
+from typing import Any, Dict, Optional
 
 # Use your existing imports / classes
 from src.state.workflow import WorkflowBuilder
 from src.llm.model import LLMModel
+from src.state.checkpoint import get_checkpointer
+from src.cache.semantic_cache import get_requirement_cache
+from src.org.schema_cache import get_schema_cache
+from src.deploy.coalescer import get_coalescer
+from src.jobs.runner import get_job_runner
+from src.jobs.store import ACTIVE_STATUSES
+from src.deploy.files import file_key, files_zip
 
 # Local uploaded image (from developer note)
 PROJECT_IMAGE_PATH = "/mnt/data/af72e198-500e-402d-b9d6-76fecee9bd55.png"
+JOB_POLL_SECONDS = 2
+# per agent, only the newest log entries are kept and drawn; long node outputs are cut
+LOG_TAIL = 20
+LOG_MESSAGE_CHARS = 2000
+FILES_PAGE_SIZE = 25
+CODE_LANGUAGES = {".cls": "java", ".trigger": "java", ".js": "javascript", ".html": "html", ".css": "css",
+                  ".xml": "xml", ".json": "json"}
 
 st.set_page_config(page_title="InstaForce - AI powered Salesforce deployment engine", layout="wide")
 
@@ -146,8 +161,79 @@ def safe_serialize(obj: Any) -> str:
     except Exception:
         return str(obj)
 
-def append_log(agent_logs: Dict[str, list], agent_name: str, message: str, level: str = "info"):
-    agent_logs.setdefault(agent_name, []).append({"t": time.time(), "level": level, "msg": message})
+def append_log(agent_logs: Dict[str, list], agent_name: str, message: str, level: str = "info",
+               t: Optional[float] = None):
+    if len(message) > LOG_MESSAGE_CHARS:
+        message = f"{message[:LOG_MESSAGE_CHARS]}… ({len(message) - LOG_MESSAGE_CHARS} more chars)"
+    logs = agent_logs.setdefault(agent_name, [])
+    logs.append({"t": t or time.time(), "level": level, "msg": message})
+    del logs[:-LOG_TAIL]
+
+def format_size(n: int) -> str:
+    return f"{n} B" if n < 1024 else f"{n / 1024:.1f} KB"
+
+def state_preview(final_state: Dict[str, Any]) -> Dict[str, Any]:
+    """Final state without file bodies (shown in the file browser) or binary payloads."""
+    preview = {k: v for k, v in final_state.items() if k not in ("files", "package_zip")}
+    files = final_state.get("files") or []
+    preview["files"] = [f"{file_key(f)} ({format_size(len(f.get('content') or ''))})" for f in files]
+    return preview
+
+@st.cache_resource(show_spinner=False)
+def load_graph():
+    """LLM and compiled workflow, built once per server process and reused across reruns."""
+    llm = LLMModel().get_llm()
+    # the job runner's slots deploy concurrently, so their deployments may be coalesced
+    workflow_builder = WorkflowBuilder(
+        llm, requirement_cache=get_requirement_cache(), schema_cache=get_schema_cache(),
+        coalescer=get_coalescer()
+    )
+    return workflow_builder.setup_graph(checkpointer=get_checkpointer())
+
+@st.cache_resource(show_spinner=False)
+def load_job_runner():
+    """One worker pool per server process, shared by every browser session."""
+    return get_job_runner(load_graph())
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def load_final_state(job_id: str, finished_at: Optional[float]) -> Dict[str, Any]:
+    """Final state of a finished job, read and parsed once rather than on every rerun."""
+    job = load_job_runner().store.get(job_id)
+    return (job or {}).get("final_state") or {}
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def build_download(job_id: str, finished_at: Optional[float], kind: str) -> bytes:
+    """A download of a finished job, built the first time it is requested."""
+    final_state = load_final_state(job_id, finished_at)
+    if kind == "zip":
+        return files_zip(final_state.get("files") or [])
+    return safe_serialize(final_state).encode("utf-8")
+
+def attach_job(job_id: str):
+    """Follow a job in this session; the id is kept in the URL so a refresh reattaches."""
+    st.query_params["job"] = job_id
+    st.session_state.job_id = job_id
+    st.session_state.last_thread_id = job_id
+    st.session_state.agent_logs = {}
+    st.session_state.last_event_id = 0
+    st.session_state.job_status = None
+
+# ---- session / job state ----
+runner = load_job_runner()
+if "agent_logs" not in st.session_state:
+    st.session_state.agent_logs = {}
+st.session_state.node_order = [n for n in runner.graph.nodes if not n.startswith("__")]
+if "job_id" not in st.session_state:
+    st.session_state.job_id = None
+    if st.query_params.get("job"):
+        attach_job(st.query_params["job"])
+
+# A job paused by the requirement cache waits for the user's decision
+st.session_state.pop("pending_cache_confirm", None)
+if st.session_state.job_id:
+    current_job = runner.store.get(st.session_state.job_id, with_state=False)
+    if current_job and current_job["status"] == "waiting" and current_job["interrupt"]:
+        st.session_state.pending_cache_confirm = dict(current_job["interrupt"], thread_id=current_job["job_id"])
 
 # ---- UI layout ----
 st.markdown(
@@ -180,8 +266,42 @@ with left_col:
     with st.expander("Advanced options", expanded=False):
         max_runtime = st.slider("Simulated step delay (s) — used for nicer UX", min_value=0.0, max_value=2.0, value=0.2, step=0.1)
         show_project_image = st.checkbox("Show project screenshot", value=True)
+        target_orgs_text = st.text_input(
+            "Target orgs (comma-separated aliases, deployed concurrently)",
+            value=os.environ.get("INSTAFORCE_TARGET_ORGS", ""),
+        )
+        run_priority = st.selectbox("Priority", ["normal", "high", "urgent", "low"])
+        run_thread_id = st.text_input(
+            "Run ID (to resume or replay a previous run)",
+            value=st.session_state.get("last_thread_id", ""),
+        )
+        replay_node = st.selectbox(
+            "Replay from node",
+            ["req_agent", "design_agent", "codegen_agent", "deploy_agent"],
+            index=3,
+        )
     
     go_live = st.button("🚀 Go Live", type="primary")
+    resume_col, replay_col, attach_col = st.columns(3)
+    with resume_col:
+        resume_run_btn = st.button("⏯ Resume run")
+    with replay_col:
+        replay_run_btn = st.button("🔁 Replay from node")
+    with attach_col:
+        attach_run_btn = st.button("📡 Attach")
+
+    accept_cache_btn = decline_cache_btn = False
+    pending_cache_confirm = st.session_state.get("pending_cache_confirm")
+    if pending_cache_confirm:
+        st.info(
+            f"Similar requirement found (score {pending_cache_confirm['score']:.3f}):\n\n"
+            f"{pending_cache_confirm['cached_requirement']}"
+        )
+        accept_col, decline_col = st.columns(2)
+        with accept_col:
+            accept_cache_btn = st.button("♻️ Reuse cached design")
+        with decline_col:
+            decline_cache_btn = st.button("🧠 Call the LLM")
 
     # if show_project_image:
     #     try:
@@ -203,7 +323,7 @@ with right_col:
     with download_col1:
         download_json_btn = st.empty()
     with download_col2:
-        download_txt_btn = st.empty()
+        download_zip_btn = st.empty()
     st.markdown("---")
     st.subheader("Graph")
     graph_preview = st.empty()
@@ -211,240 +331,199 @@ with right_col:
     st.subheader("Run Summary")
     summary_area = st.empty()
 
-# Session storage for persistent logs between reruns
-if "agent_logs" not in st.session_state:
-    st.session_state.agent_logs = {}
-if "node_order" not in st.session_state:
-    st.session_state.node_order = []
-
 # ---- Execution ----
-if go_live:
-    if not requirement or not requirement.strip():
+# Runs execute on the job runner's worker pool; this script only queues them and
+# polls their persisted progress, so a refresh or reconnect does not stop a run.
+cache_decision = accept_cache_btn or decline_cache_btn
+if go_live or resume_run_btn or replay_run_btn or attach_run_btn or cache_decision:
+    if go_live and (not requirement or not requirement.strip()):
         st.warning("Please enter a valid requirement before clicking Go Live.")
+    elif not go_live and not cache_decision and not run_thread_id.strip():
+        st.warning("Enter the Run ID of a previous run under Advanced options.")
     else:
-        # Reset logs/state
-        st.session_state.agent_logs = {}
-        st.session_state.node_order = []
-
-        # Show processing
-        with st.spinner("Booting LLM and building workflow..."):
-            try:
-                # Initialize LLM and workflow builder (your classes)
-                groqllm = LLMModel()
-                llm = groqllm.get_llm()
-
-                workflow_builder = WorkflowBuilder(llm)
-                graph = workflow_builder.setup_graph()
-
-                # Try to extract node names for progress & preview
-                node_names = []
-                try:
-                    # langgraph StateGraph compiled object may expose nodes; try common attributes
-                    if hasattr(graph, "nodes"):
-                        node_names = list(graph.nodes.keys()) if isinstance(graph.nodes, dict) else list(graph.nodes)
-                    elif hasattr(graph, "_nodes"):
-                        node_names = list(graph._nodes)
-                except Exception:
-                    node_names = []
-
-                # fallback if none found (we expect req_agent, design_agent, codegen_agent)
-                if not node_names:
-                    node_names = ["req_agent", "design_agent", "codegen_agent","deploy_agent"]
-
-                st.session_state.node_order = node_names
-
-            except Exception as e:
-                st.error("Failed building workflow or initializing LLM.")
-                st.exception(e)
-                raise
-
-        # Show graph preview (simple)
-        with graph_preview:
-            st.write("**Nodes**:", ", ".join(st.session_state.node_order))
-            st.write("**Start →** " + " → ".join(st.session_state.node_order) + " → **END**")
-# -------------------------
-# BEFORE run: create placeholders for each agent expander
-# -------------------------
-    agent_placeholders = {}
-    for n in st.session_state.node_order:
-        # create a placeholder for each agent; initially show the waiting message inside an expander
-        ph = agents_expanders.empty()
-        with ph:
-            exp = st.expander(f"{n}", expanded=False)
-            with exp:
+        if go_live:
+            target_orgs = [a.strip() for a in target_orgs_text.split(",") if a.strip()]
+            job_id = runner.submit(requirement, target_orgs=target_orgs or None, priority=run_priority)
+        elif cache_decision:
+            job_id = runner.resume(st.session_state.pop("pending_cache_confirm")["thread_id"], bool(accept_cache_btn))
+        elif resume_run_btn:
+            job_id = runner.resume(run_thread_id.strip())
+        elif replay_run_btn:
+            job_id = runner.replay(run_thread_id.strip(), replay_node)
+        else:
+            job_id = run_thread_id.strip()
+        attach_job(job_id)
+        st.rerun()
+
+job_id = st.session_state.get("job_id")
+
+with summary_area.container():
+    depth = runner.queue_depth()
+    st.write(f"**Queue:** {depth['queued']} waiting · {depth['running']} running on {depth['slots']} slots")
+    if job_id:
+        st.caption(f"Run ID: `{job_id}`")
+
+with graph_preview.container():
+    st.write("**Nodes**:", ", ".join(st.session_state.node_order))
+    st.write("**Start →** " + " → ".join(st.session_state.node_order) + " → **END**")
+
+
+def job_progress(job_id: str):
+    """Per-node logs of a job, read incrementally from the job store."""
+    job = runner.store.get(job_id, with_state=False)
+    if job is None:
+        st.warning(f"Unknown run `{job_id}`")
+        return
+
+    for event in runner.store.events(job_id, st.session_state.last_event_id):
+        append_log(st.session_state.agent_logs, event["node"], event["message"], level=event["level"], t=event["t"])
+        st.session_state.last_event_id = event["id"]
+
+    node_order = st.session_state.node_order
+    done = [n for n in node_order if st.session_state.agent_logs.get(n)]
+    st.progress(1.0 if job["status"] == "completed" else len(done) / max(len(node_order), 1))
+    st.write(f"**Status:** {job['status']}")
+
+    for agent_name in ["system"] + node_order:
+        logs = st.session_state.agent_logs.get(agent_name, [])
+        with st.expander(f"{agent_name}", expanded=bool(logs) and agent_name != "system"):
+            if not logs:
                 st.write("Waiting for output...")
-        agent_placeholders[n] = ph  # store the container placeholder
+                continue
+            # one element per agent rather than one per line keeps each poll cheap
+            st.code("\n".join(
+                f"[{time.strftime('%H:%M:%S', time.localtime(entry['t']))}] {entry['msg']}" for entry in logs
+            ), language="text")
+
+    # status changes rerun the whole page so the result and cache prompt update
+    if job["status"] != st.session_state.job_status:
+        st.session_state.job_status = job["status"]
+        st.rerun()
+
+
+def render_files(job_id: str, files: list):
+    """Paged list of generated files; a file's content is only sent to the browser when opened."""
+    total = sum(len(f.get("content") or "") for f in files)
+    st.subheader(f"Generated Files ({len(files)}, {format_size(total)})")
+    query = st.text_input("Filter files", key=f"file_filter_{job_id}").strip().lower()
+    matched = [i for i, f in enumerate(files) if query in file_key(f).lower()]
+    pages = max(1, -(-len(matched) // FILES_PAGE_SIZE))
+    page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1,
+                           key=f"file_page_{job_id}") if pages > 1 else 1
+    for i in matched[(page - 1) * FILES_PAGE_SIZE:page * FILES_PAGE_SIZE]:
+        f = files[i]
+        content = f.get("content") or ""
+        if st.toggle(f"{file_key(f)} · {format_size(len(content))}", key=f"file_{job_id}_{i}"):
+            ext = os.path.splitext(f.get("fileName") or "")[1].lower()
+            st.code(content, language=CODE_LANGUAGES.get(ext, "text"))
+
+
+def render_downloads(job: Dict[str, Any]):
+    """Download buttons, built on request and once per finished run."""
+    job_id, finished_at = job["job_id"], job["finished_at"]
+    if st.session_state.get("downloads_for") != job_id:
+        if download_json_btn.button("📦 Prepare downloads"):
+            st.session_state.downloads_for = job_id
+            st.rerun()
+        return
+    download_json_btn.download_button(
+        label="Download JSON",
+        data=build_download(job_id, finished_at, "json"),
+        file_name="pipeline_result.json",
+        mime="application/json",
+    )
+    download_zip_btn.download_button(
+        label="Download files (.zip)",
+        data=build_download(job_id, finished_at, "zip"),
+        file_name="force-app.zip",
+        mime="application/zip",
+    )
 
-    # Ensure a session counter is present (avoid nonlocal)
-    if "current_index" not in st.session_state:
-        st.session_state.current_index = 0
 
-    progress = st.progress(0)
-    total_nodes = len(st.session_state.node_order)
+def render_result(job: Dict[str, Any]):
+    final_state = load_final_state(job["job_id"], job["finished_at"])
+    if job["status"] == "failed":
+        st.error(f"Run failed: {job['error']}")
+    elif job["status"] == "waiting":
+        st.info("Run paused: confirm the cached design in the Input column.")
+    else:
+        st.success("🎉 Pipeline completed")
 
-    # -------------------------
-    # Streaming callback (used if graph supports stream)
-    initial_state = {"requirement": requirement}
+    # Display deployment status prominently
+    if final_state and isinstance(final_state, dict) and "deploy_status" in final_state:
+        deploy_status = final_state["deploy_status"]
 
-    # -------------------------
-    def stream_callback(update):
-        """
-        Called when the graph emits streaming updates.
-        The update shape may vary; try to infer agent name and message.
-        """
-        # infer agent name and message
-        agent_name = None
-        message = update
-
-        if isinstance(update, dict):
-            agent_name = update.get("agent") or update.get("node") or update.get("node_name")
-            message = update.get("msg") or update.get("output") or update.get("result") or update
-
-        # fallback: guess current agent if not provided
-        if not agent_name:
-            # pick by current index if available
-            idx = st.session_state.current_index
-            agent_name = st.session_state.node_order[idx] if idx < total_nodes else st.session_state.node_order[-1]
-
-        # record into session logs
-        append_log(st.session_state.agent_logs, agent_name, safe_serialize(message))
-
-        # update the specific agent placeholder (replace its contents)
-        ph = agent_placeholders.get(agent_name)
-        if ph:
-            ph.empty()  # clear prior contents
-            with ph:
-                exp = st.expander(f"{agent_name}", expanded=True)
-                with exp:
-                    logs = st.session_state.agent_logs.get(agent_name, [])
-                    # show last N logs
-                    for entry in logs[-20:]:
-                        t = time.strftime("%H:%M:%S", time.localtime(entry["t"]))
-                        st.text(f"[{t}] {entry['msg']}")
-
-        # increment progress smartly (first message from an agent increments)
-        if len(st.session_state.agent_logs.get(agent_name, [])) == 1:
-            st.session_state.current_index = min(total_nodes, st.session_state.current_index + 1)
-            progress.progress(st.session_state.current_index / total_nodes)
-
-    # -------------------------
-    # Invoke the graph (try streaming; fallback to sync)
-    # -------------------------
-    final_state = None
-    try:
-        # Try native streaming via graph.stream if available
-        if hasattr(graph, "stream"):
-            try:
-                for update in graph.stream(initial_state):
-                    stream_callback(update)
-                # After streaming completes, get final state if supported
-                if hasattr(graph, "get_state"):
-                    final_state = graph.get_state()
-                else:
-                    # Fallback: invoke once to fetch final snapshot
-                    final_state = graph.invoke(initial_state)
-            except Exception:
-                # If stream fails, fallback to invoke
-                final_state = graph.invoke(initial_state)
+        st.subheader("Deployment Status")
+
+        if deploy_status.get("success"):
+            st.success(f" {deploy_status.get('message', 'Deployment successful')}")
         else:
-            # preferred streaming call if invoke supports stream kw
-            try:
-                final_state = graph.invoke(initial_state, stream=stream_callback)
-            except TypeError:
-                # graph.invoke doesn't accept stream parameter — do sync run
-                final_state = graph.invoke(initial_state)
-
-        # Populate placeholders from final_state when no streaming per-agent outputs
-        if isinstance(final_state, dict):
-            any_updates = any(len(st.session_state.agent_logs.get(n, [])) > 0 for n in st.session_state.node_order)
-            if not any_updates:
-                for node in st.session_state.node_order:
-                    node_output = final_state.get(node) or final_state.get(node + "_output")
-                    ph = agent_placeholders.get(node)
-                    if ph:
-                        ph.empty()
-                        with ph:
-                            exp = st.expander(f"{node}", expanded=True)
-                            with exp:
-                                if node_output is None:
-                                    st.write("No node-specific output available. Run completed.")
-                                else:
-                                    try:
-                                        st.json(node_output)
-                                    except Exception:
-                                        st.text(safe_serialize(node_output))
-        progress.progress(1.0)
-
-    except Exception as e:
-        tb = traceback.format_exc()
-        append_log(st.session_state.agent_logs, "system", str(e), level="error")
-        append_log(st.session_state.agent_logs, "system", tb, level="error")
-        st.exception(e)
-        final_state = {"error": str(e), "traceback": tb}
-
-    # -------------------------
-    # Final: show final_state in UI (right column)
-    # -------------------------
-    with result_area.container():
-        st.success("🎉 Pipeline completed")
-        
-        # Display deployment status prominently
-        if final_state and isinstance(final_state, dict) and "deploy_status" in final_state:
-            deploy_status = final_state["deploy_status"]
-            
-            st.subheader("Deployment Status")
-            
-            if deploy_status.get("success"):
-                st.success(f" {deploy_status.get('message', 'Deployment successful')}")
-            else:
-                st.error(f" {deploy_status.get('message', 'Deployment failed')}")
-            
-            # Show files deployed
-            if deploy_status.get("written_files"):
-                with st.expander("📄 Files Deployed", expanded=True):
-                    for file in deploy_status["written_files"]:
-                        st.code(file, language="text")
-            
-            # Show deployment details
-            with st.expander(" Deployment Details", expanded=False):
-                st.write(f"**Return Code:** {deploy_status.get('returncode')}")
-                st.write(f"**Command:** `{deploy_status.get('deploy_command', 'N/A')}`")
-                
-                if deploy_status.get("parsed_response"):
-                    st.write("**Salesforce CLI Response:**")
-                    st.json(deploy_status["parsed_response"])
-                
-                if deploy_status.get("stdout"):
-                    with st.expander("📋 CLI Output (stdout)", expanded=False):
-                        st.code(deploy_status["stdout"], language="json")
-                
-                if deploy_status.get("stderr"):
-                    with st.expander("⚠️ CLI Errors (stderr)", expanded=False):
-                        st.code(deploy_status["stderr"], language="text")
-            
-            st.markdown("---")
-        
-        st.subheader("Final State (preview)")
-        try:
-            st.json(final_state)
-        except Exception:
-            st.text(safe_serialize(final_state))
-
-        # provide downloads
-        serialized = safe_serialize(final_state)
-        download_json_btn.download_button(
-            label="Download JSON",
-            data=serialized,
-            file_name="pipeline_result.json",
-            mime="application/json",
-        )
-        download_txt_btn.download_button(
-            label="Download raw text",
-            data=str(serialized),
-            file_name="pipeline_result.txt",
-            mime="text/plain",
-        )
+            st.error(f" {deploy_status.get('message', 'Deployment failed')}")
+
+        # Per-org results of a multi-org rollout
+        for alias, org_status in (deploy_status.get("orgs") or {}).items():
+            icon = "✅" if org_status.get("success") else ("⏭️" if org_status.get("skipped") else "❌")
+            st.write(f"{icon} **{alias}**: {org_status.get('message', '')}")
+
+        # Per-unit results of a deployment split into independent units
+        for unit in deploy_status.get("units") or []:
+            icon = "✅" if unit.get("success") else "❌"
+            st.write(f"{icon} **{unit.get('name')}** ({len(unit.get('files') or [])} files): {unit.get('message', '')}")
+
+        # Apex tests run with the deploy, and those skipped as cached green
+        tests = deploy_status.get("tests")
+        if tests:
+            st.caption(f"Apex tests ({tests['level']}): {tests['cache_misses']} run, {tests['cache_hits']} cached green, "
+                       f"~{tests['seconds_saved']:.1f}s saved")
+
+        # Show files deployed
+        if deploy_status.get("written_files"):
+            with st.expander(f"📄 Files Deployed ({len(deploy_status['written_files'])})", expanded=False):
+                st.code("\n".join(deploy_status["written_files"]), language="text")
+
+        # Show deployment details
+        with st.expander(" Deployment Details", expanded=False):
+            st.write(f"**Return Code:** {deploy_status.get('returncode')}")
+            st.write(f"**Command:** `{deploy_status.get('deploy_command', 'N/A')}`")
+
+            if deploy_status.get("parsed_response"):
+                st.write("**Salesforce CLI Response:**")
+                st.json(deploy_status["parsed_response"])
 
+            if deploy_status.get("stdout"):
+                with st.expander("📋 CLI Output (stdout)", expanded=False):
+                    st.code(deploy_status["stdout"], language="json")
 
+            if deploy_status.get("stderr"):
+                with st.expander("⚠️ CLI Errors (stderr)", expanded=False):
+                    st.code(deploy_status["stderr"], language="text")
+
+        st.markdown("---")
+
+    if final_state.get("files"):
+        render_files(job["job_id"], final_state["files"])
+        st.markdown("---")
+
+    st.subheader("Final State (preview)")
+    try:
+        st.json(state_preview(final_state), expanded=False)
+    except Exception:
+        st.text(safe_serialize(state_preview(final_state)))
+
+    if final_state:
+        render_downloads(job)
+
+    if job["status"] == "completed" and st.session_state.get("celebrated") != job_id:
+        st.session_state.celebrated = job_id
         st.balloons()
-        # st.snow()
+
+
+if job_id:
+    job = runner.store.get(job_id, with_state=False)
+    active = job is not None and job["status"] in ACTIVE_STATUSES
+    with agents_expanders:
+        # poll while the job is queued or running
+        st.fragment(job_progress, run_every=JOB_POLL_SECONDS if active else None)(job_id)
+    if job is not None and not active:
+        with result_area.container():
+            render_result(job)